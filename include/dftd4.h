@@ -47,6 +47,9 @@ typedef struct _dftd4_model* dftd4_model;
 /// Damping parameter class
 typedef struct _dftd4_param* dftd4_param;
 
+/// Electronegativity equilibration solver class
+typedef struct _dftd4_eeq_solver* dftd4_eeq_solver;
+
 /*
  * Type generic macro for convenience
 **/
@@ -55,7 +58,8 @@ typedef struct _dftd4_param* dftd4_param;
                        dftd4_error: dftd4_delete_error, \
                    dftd4_structure: dftd4_delete_structure, \
                        dftd4_model: dftd4_delete_model, \
-                       dftd4_param: dftd4_delete_param \
+                       dftd4_param: dftd4_delete_param, \
+                  dftd4_eeq_solver: dftd4_delete_eeq_solver \
                                   )(&ptr)
 
 /*
@@ -147,6 +151,15 @@ dftd4_custom_d4s_model(dftd4_error /* error */,
 DFTD4_API_ENTRY void DFTD4_API_CALL
 dftd4_delete_model(dftd4_model* /* disp */) DFTD4_API_SUFFIX__V_3_0;
 
+/// Precompute reference C6 coefficients for all pairs of elements,
+/// later dispersion models for these elements only gather the data
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_prewarm_reference_cache(dftd4_error /* error */,
+                              int /* nelem */,
+                              const int* /* numbers [nelem] */,
+                              double /* ga */,
+                              double /* gc */) DFTD4_API_SUFFIX__V_4_3;
+
 /// Set realspace cutoffs (quantities in Bohr)
 ///
 /// deprecated: removed with the v5 API, use dftd4_set_model_realspace_cutoff_smooth
@@ -170,15 +183,64 @@ dftd4_set_model_realspace_cutoff_smooth(dftd4_error /* error */,
 /// Assign an externally managed part of the interaction loops to this model.
 ///
 /// The part index is zero based and must be smaller than nparts. Summing the
-/// results of all parts reproduces the complete calculation. Structure-
-/// dependent quantities are evaluated for the full system on every part; only
-/// the pairwise and ATM interaction loops are partitioned.
+/// results of all parts reproduces the complete calculation. The pairwise and
+/// ATM interaction loops and the two-body C6 coefficients are partitioned,
+/// coordination numbers, partial charges, the three-body C6 coefficients and
+/// the assembly of their derivatives are evaluated for the full system on every
+/// part.
 DFTD4_API_ENTRY void DFTD4_API_CALL
 dftd4_set_model_work_partition(dftd4_error /* error */,
                                dftd4_model /* model */,
                                int /* part */,
                                int /* nparts */) DFTD4_API_SUFFIX__V_4_3;
 
+/// Assign an externally managed part of the interaction loops to this model,
+/// balanced by the estimated cost of the atoms in the given structure.
+///
+/// The scheme selects the cyclic assignment of the atom pairs (0), a spatial
+/// domain decomposition (1) or contiguous blocks of atoms with equal cost (2).
+/// The cost is estimated from the neighbor counts within the realspace cutoffs
+/// currently set for the model. The assignment is kept for updated structures
+/// and can be rebalanced by calling this function again.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_set_model_work_partition_scheme(dftd4_error /* error */,
+                                      dftd4_structure /* mol */,
+                                      dftd4_model /* model */,
+                                      int /* part */,
+                                      int /* nparts */,
+                                      int /* scheme */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Enable the long-range tail correction of the two-body dispersion beyond the
+/// realspace cutoff, the correction is only applied to 3D periodic systems.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_set_model_tail_correction(dftd4_error /* error */,
+                                dftd4_model /* model */,
+                                bool /* tail */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Derive the realspace cutoffs for each pair of species from a tolerance for the
+/// estimated dispersion energy error per atom. The realspace cutoffs set for the
+/// model act as upper limit, a non-positive tolerance disables the derived cutoffs.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_set_model_realspace_cutoff_tolerance(dftd4_error /* error */,
+                                           dftd4_model /* model */,
+                                           double /* tolerance */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate distances, damping and switching functions of the interaction kernels
+/// in single precision, energies and derivatives are accumulated in double precision.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_set_model_mixed_precision(dftd4_error /* error */,
+                                dftd4_model /* model */,
+                                bool /* mixed */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate the interaction kernels only for the symmetry-unique atoms and obtain
+/// the contributions of all other atoms by symmetry. The space group is detected
+/// on every evaluation for 3D periodic systems, the kernels are evaluated in double
+/// precision in this mode.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_set_model_symmetry(dftd4_error /* error */,
+                         dftd4_model /* model */,
+                         bool /* symmetry */) DFTD4_API_SUFFIX__V_4_3;
+
 /*
  * Damping parameter class
 **/
@@ -203,11 +265,46 @@ dftd4_load_rational_damping(dftd4_error /* error */,
 DFTD4_API_ENTRY void DFTD4_API_CALL
 dftd4_delete_param(dftd4_param* /* param */) DFTD4_API_SUFFIX__V_3_0;
 
+/*
+ * Electronegativity equilibration solver class
+**/
+
+/// Create new solver for the electronegativity equilibration with the real space
+/// cutoff of the Coulomb interaction, the convergence threshold and the maximum
+/// number of iterations. The solver is a standalone utility for charges from
+/// caller supplied parameters, it is not used by the dispersion models.
+DFTD4_API_ENTRY dftd4_eeq_solver DFTD4_API_CALL
+dftd4_new_eeq_solver(dftd4_error /* error */,
+                     double /* cutoff */,
+                     double /* conv */,
+                     int /* max_iter */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Delete electronegativity equilibration solver
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_delete_eeq_solver(dftd4_eeq_solver* /* solver */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Solve the electronegativity equilibration iteratively for the current structure,
+/// using the charges of the previous call as starting guess. With the derivative of
+/// an energy w.r.t. the charges, the gradient and virial of this energy due to the
+/// response of the charges are returned.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_solve_eeq(dftd4_error /* error */,
+                dftd4_eeq_solver /* solver */,
+                dftd4_structure /* mol */,
+                const double* /* chi[n] */,
+                const double* /* eta[n] */,
+                const double* /* rad[n] */,
+                double* /* charges[n] */,
+                const double* /* dEdq[n] */,
+                double* /* gradient[n][3] */,
+                double* /* sigma[3][3] */) DFTD4_API_SUFFIX__V_4_3;
+
 /*
  * Perform dispersion calculations
 **/
 
-/// Evaluate properties related to the dispersion model
+/// Evaluate properties related to the dispersion model, only properties with
+/// non-null pointers are evaluated
 DFTD4_API_ENTRY void DFTD4_API_CALL
 dftd4_get_properties(dftd4_error /* error */,
                      dftd4_structure /* mol */,
@@ -217,6 +314,48 @@ dftd4_get_properties(dftd4_error /* error */,
                      double* /* c6[n*n] */,
                      double* /* alpha[n] */) DFTD4_API_SUFFIX__V_3_1;
 
+/// Evaluate properties related to the dispersion model with externally supplied
+/// partial charges
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_properties_with_charges(dftd4_error /* error */,
+                                  dftd4_structure /* mol */,
+                                  dftd4_model /* disp */,
+                                  const double* /* charges[n] */,
+                                  double* /* cn[n] */,
+                                  double* /* c6[n*n] */,
+                                  double* /* alpha[n] */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate the C6 coefficients only for atom pairs within a real space cutoff,
+/// the partial charges are optional. The pairs are kept in the dispersion model,
+/// only the number of pairs is returned
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_sparse_c6(dftd4_error /* error */,
+                    dftd4_structure /* mol */,
+                    dftd4_model /* disp */,
+                    const double* /* charges[n] */,
+                    double /* cutoff */,
+                    int* /* npair */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Retrieve the atom pairs and C6 coefficients from the last sparse C6 evaluation,
+/// all arrays are optional
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_sparse_c6_pairs(dftd4_error /* error */,
+                          dftd4_model /* disp */,
+                          int* /* index[npair][2] */,
+                          double* /* c6[npair] */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate the damping parameter independent pair data of the dispersion model,
+/// the C6 coefficients of the two-body and three-body terms and the products of
+/// the r4/r2 expectation values, the partial charges are optional
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_pair_data(dftd4_error /* error */,
+                    dftd4_structure /* mol */,
+                    dftd4_model /* disp */,
+                    const double* /* charges[n] */,
+                    double* /* c6[n*n] */,
+                    double* /* c6_3b[n*n] */,
+                    double* /* rrij[n*n] */) DFTD4_API_SUFFIX__V_4_3;
+
 /// Evaluate the dispersion energy and its derivative
 DFTD4_API_ENTRY void DFTD4_API_CALL
 dftd4_get_dispersion(dftd4_error /* error */,
@@ -227,6 +366,21 @@ dftd4_get_dispersion(dftd4_error /* error */,
                      double* /* gradient[n][3] */,
                      double* /* sigma[3][3] */) DFTD4_API_SUFFIX__V_3_0;
 
+/// Evaluate the dispersion energy and its derivative with externally supplied
+/// partial charges, the derivatives of the charges are optional and their
+/// contribution is neglected in the gradient and virial if not provided
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_dispersion_with_charges(dftd4_error /* error */,
+                                  dftd4_structure /* mol */,
+                                  dftd4_model /* disp */,
+                                  dftd4_param /* param */,
+                                  const double* /* charges[n] */,
+                                  const double* /* dqdr[n][n][3] */,
+                                  const double* /* dqdL[n][3][3] */,
+                                  double* /* energy */,
+                                  double* /* gradient[n][3] */,
+                                  double* /* sigma[3][3] */) DFTD4_API_SUFFIX__V_4_3;
+
 /// Evaluate the dispersion hessian numerically
 DFTD4_API_ENTRY void DFTD4_API_CALL
 dftd4_get_numerical_hessian(dftd4_error /* error */,
@@ -235,6 +389,32 @@ dftd4_get_numerical_hessian(dftd4_error /* error */,
                             dftd4_param /* param */,
                             double* /* hess[n][3][n][3] */) DFTD4_API_SUFFIX__V_3_5;
 
+/// Evaluate the dispersion hessian numerically for a selection of atoms.
+///
+/// Only the k selected atoms (zero based indices) are displaced, the hessian
+/// block contains the derivatives of the gradient of all atoms.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_numerical_hessian_atoms(dftd4_error /* error */,
+                                  dftd4_structure /* mol */,
+                                  dftd4_model /* disp */,
+                                  dftd4_param /* param */,
+                                  int /* k */,
+                                  const int* /* atoms[k] */,
+                                  double* /* hess[k][3][n][3] */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate a range of columns of the dispersion hessian numerically.
+///
+/// Columns are the cartesian displacements of all atoms in the order
+/// 3*atom + direction, the range starts at the zero based column first.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_numerical_hessian_columns(dftd4_error /* error */,
+                                    dftd4_structure /* mol */,
+                                    dftd4_model /* disp */,
+                                    dftd4_param /* param */,
+                                    int /* first */,
+                                    int /* ncol */,
+                                    double* /* hess[ncol][n][3] */) DFTD4_API_SUFFIX__V_4_3;
+
 /// Evaluate the pairwise representation of the dispersion energy
 DFTD4_API_ENTRY void DFTD4_API_CALL
 dftd4_get_pairwise_dispersion(dftd4_error /* error */,
@@ -243,3 +423,196 @@ dftd4_get_pairwise_dispersion(dftd4_error /* error */,
                               dftd4_param /* param */,
                               double* /* pair_energy2[n][n] */,
                               double* /* pair_energy3[n][n] */) DFTD4_API_SUFFIX__V_3_2;
+
+/// Evaluate the pairwise representation of the dispersion energy with externally
+/// supplied partial charges
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_pairwise_dispersion_with_charges(dftd4_error /* error */,
+                                           dftd4_structure /* mol */,
+                                           dftd4_model /* disp */,
+                                           dftd4_param /* param */,
+                                           const double* /* charges[n] */,
+                                           double* /* pair_energy2[n][n] */,
+                                           double* /* pair_energy3[n][n] */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate the pairwise representation of the dispersion energy accumulated for
+/// pairs of fragments, fragments are given by a zero-based index for every atom.
+/// If only the interaction is requested pairs within a fragment are skipped and
+/// the diagonal of the fragment energies is zero
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_fragment_dispersion(dftd4_error /* error */,
+                              dftd4_structure /* mol */,
+                              dftd4_model /* disp */,
+                              dftd4_param /* param */,
+                              int /* nfrag */,
+                              const int* /* fragment[n] */,
+                              bool /* interaction */,
+                              double* /* frag_energy2[nfrag][nfrag] */,
+                              double* /* frag_energy3[nfrag][nfrag] */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate the pairwise representation of the dispersion energy as sparse lists
+/// of atom pairs within the real space cutoffs, pairs with an absolute energy below
+/// the threshold are dropped. The lists are kept in the dispersion model, only the
+/// number of pairs is returned
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_sparse_pairwise_dispersion(dftd4_error /* error */,
+                                     dftd4_structure /* mol */,
+                                     dftd4_model /* disp */,
+                                     dftd4_param /* param */,
+                                     double /* threshold */,
+                                     int* /* npair2 */,
+                                     int* /* npair3 */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Retrieve the sparse lists of atom pairs from the last sparse pairwise evaluation,
+/// all arrays are optional
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_sparse_pairs(dftd4_error /* error */,
+                       dftd4_model /* disp */,
+                       int* /* index2[npair2][2] */,
+                       int* /* image2[npair2][3] */,
+                       double* /* energy2[npair2] */,
+                       int* /* index3[npair3][2] */,
+                       int* /* image3[npair3][3] */,
+                       double* /* energy3[npair3] */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate any combination of energies, derivatives, properties and pairwise
+/// energies in a single pass, all outputs except the energy are optional.
+/// The atomic energies and virials share each interaction equally between
+/// the atoms involved and sum up to the total energy and virial
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_dispersion_results(dftd4_error /* error */,
+                             dftd4_structure /* mol */,
+                             dftd4_model /* disp */,
+                             dftd4_param /* param */,
+                             double* /* energy */,
+                             double* /* grad[n][3] */,
+                             double* /* sigma[3][3] */,
+                             double* /* energy2b */,
+                             double* /* energy3b */,
+                             double* /* energies[n] */,
+                             double* /* cn[n] */,
+                             double* /* charges[n] */,
+                             double* /* c6[n*n] */,
+                             double* /* alpha[n] */,
+                             double* /* pair_energy2[n][n] */,
+                             double* /* pair_energy3[n][n] */,
+                             double* /* sigmas[n][3][3] */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate the dispersion energy and its derivative for several sets of damping
+/// parameters, sharing all work which does not depend on the damping parameters
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_dispersion_multi(dftd4_error /* error */,
+                           dftd4_structure /* mol */,
+                           dftd4_model /* disp */,
+                           int /* nparam */,
+                           const dftd4_param* /* param[nparam] */,
+                           double* /* energy[nparam] */,
+                           double* /* grad[nparam][n][3] */,
+                           double* /* sigma[nparam][3][3] */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate the dispersion energy and its derivative for several images of the
+/// same structure, like the images of a reaction path, in a single call. The
+/// images are distributed over the available threads, the lattice of the
+/// structure is used for all images if no lattices are provided.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_dispersion_images(dftd4_error /* error */,
+                            dftd4_structure /* mol */,
+                            dftd4_model /* disp */,
+                            dftd4_param /* param */,
+                            int /* nimg */,
+                            const double* /* xyz[nimg][n][3] */,
+                            const double* /* lattice[nimg][3][3] */,
+                            double* /* energy[nimg] */,
+                            double* /* grad[nimg][n][3] */,
+                            double* /* sigma[nimg][3][3] */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Estimate the two-body and three-body dispersion energy per atom neglected by the
+/// realspace cutoffs of the model
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_realspace_cutoff_error(dftd4_error /* error */,
+                                 dftd4_structure /* mol */,
+                                 dftd4_model /* disp */,
+                                 dftd4_param /* param */,
+                                 double* /* error2 */,
+                                 double* /* error3 */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Initialize incremental energy updates for trial moves of the structure.
+///
+/// The state is stored in the model, proposed moves are evaluated with respect
+/// to the last accepted state.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_new_incremental(dftd4_error /* error */,
+                      dftd4_structure /* mol */,
+                      dftd4_model /* disp */,
+                      dftd4_param /* param */,
+                      double* /* energy */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Propose new positions for k atoms (zero based indices) and obtain the change
+/// of the dispersion energy, optionally keeping all coordination numbers and charges
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_propose_displacement(dftd4_error /* error */,
+                           dftd4_model /* disp */,
+                           dftd4_param /* param */,
+                           int /* k */,
+                           const int* /* atoms[k] */,
+                           const double* /* positions[k][3] */,
+                           bool /* frozen */,
+                           double* /* delta */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Propose the insertion of k atoms, appended after the existing atoms, and obtain
+/// the change of the dispersion energy
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_propose_insertion(dftd4_error /* error */,
+                        dftd4_model /* disp */,
+                        dftd4_param /* param */,
+                        int /* k */,
+                        const int* /* numbers[k] */,
+                        const double* /* positions[k][3] */,
+                        bool /* frozen */,
+                        double* /* delta */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Propose the deletion of k atoms (zero based indices) and obtain the change
+/// of the dispersion energy
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_propose_deletion(dftd4_error /* error */,
+                       dftd4_model /* disp */,
+                       dftd4_param /* param */,
+                       int /* k */,
+                       const int* /* atoms[k] */,
+                       bool /* frozen */,
+                       double* /* delta */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Accept or reject the proposed move, accepting commits the trial state
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_finish_move(dftd4_error /* error */,
+                  dftd4_model /* disp */,
+                  bool /* accept */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Select k atoms (zero based indices) as moving region embedded in a frozen
+/// environment and cache the environment, the cached environment is refreshed
+/// automatically after interval evaluations, never if zero.
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_set_model_embedding(dftd4_error /* error */,
+                          dftd4_structure /* mol */,
+                          dftd4_model /* disp */,
+                          dftd4_param /* param */,
+                          int /* k */,
+                          const int* /* region[k] */,
+                          int /* interval */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Recompute the cached environment of the embedded region for the current structure
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_refresh_embedding(dftd4_error /* error */,
+                        dftd4_structure /* mol */,
+                        dftd4_model /* disp */,
+                        dftd4_param /* param */) DFTD4_API_SUFFIX__V_4_3;
+
+/// Evaluate the dispersion energy of the embedded region, the gradient (optional)
+/// is only evaluated for the atoms of the region and zero for the environment
+DFTD4_API_ENTRY void DFTD4_API_CALL
+dftd4_get_embedded_dispersion(dftd4_error /* error */,
+                              dftd4_structure /* mol */,
+                              dftd4_model /* disp */,
+                              dftd4_param /* param */,
+                              double* /* energy */,
+                              double* /* grad[n][3] */) DFTD4_API_SUFFIX__V_4_3;
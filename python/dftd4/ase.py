@@ -29,8 +29,24 @@ the ``SumCalculator``.
 Supported properties by this calculator are:
 
 - energy (free_energy)
+- energies
 - forces
 - stress
+- stresses
+
+The atom-resolved ``energies`` and ``stresses`` share every interaction equally
+between the atoms involved and sum up to the total energy and stress. They are
+only evaluated if requested and do not use the ``symmetry`` and
+``mixed_precision`` settings.
+
+Only the requested properties are evaluated, an energy is available at the cost
+of an energy-only calculation, while forces and stress require the derivatives.
+The damping parameters and model settings are kept until they are changed with
+``set``.
+
+The images of a nudged elastic band or an ensemble of replicas can be evaluated
+in a single library call with the :class:`DFTD4Batch` coordinator, which attaches
+a calculator to every image and distributes the results.
 
 Supported keywords are
 
@@ -42,6 +58,10 @@ Supported keywords are
  cache_api                True         Reuse generate API objects (recommended)
  model                    d4           Used dispersion Model (D4S or D4 (default))
  realspace_cutoff         None         Optional realspace cutoff settings
+ tail_correction          False        Add long-range tail beyond the disp2 cutoff
+ mixed_precision          False        Single precision kernels with double accumulation
+ symmetry                 False        Evaluate only symmetry-unique atoms of crystals
+ nprocs                   1            Number of worker processes for the evaluation
 ======================== ============ ============================================
 
 Example
@@ -93,15 +113,16 @@ Example
 The realspace_cutoff option defines all cutoff values used for computing
 realspace summations.
 
-======== ============= ===================================================
- Name     Default       Description
-======== ============= ===================================================
- disp2    60.0 * Bohr   Cutoff for the pairwise dispersion energy
- disp3    40.0 * Bohr   Cutoff for the three-body dispersion energy
- cn       30.0 * Bohr   Cutoff for the coordination number calculation
- width2   0.0           Smooth cutoff width for the pairwise dispersion
- width3   0.0           Smooth cutoff width for the three-body dispersion
-======== ============= ===================================================
+========= ============= ===================================================
+ Name      Default       Description
+========= ============= ===================================================
+ disp2     60.0 * Bohr   Cutoff for the pairwise dispersion energy
+ disp3     40.0 * Bohr   Cutoff for the three-body dispersion energy
+ cn        30.0 * Bohr   Cutoff for the coordination number calculation
+ width2    0.0           Smooth cutoff width for the pairwise dispersion
+ width3    0.0           Smooth cutoff width for the three-body dispersion
+ tolerance 0.0           Energy error per atom for selecting pair cutoffs
+========= ============= ===================================================
 
 The realspace_cutoff dict can contain ``disp2``, ``disp3``, and ``cn`` cutoffs,
 as well as smooth cutoff widths ``width2`` and ``width3``. Values are expected
@@ -111,6 +132,12 @@ for converting them. By multiplying with Bohr the values are converted to Angstr
 An empty dict will reset the cutoff values to the library defaults.
 The smooth cutoff widths are optional but highly recommended to avoid discontinuities
 especially for small cutoff values or periodic systems (recommended are 0.05 Bohr).
+A positive ``tolerance`` in eV selects shorter cutoffs for each pair of species,
+such that the estimated truncation error of the energy per atom stays below the
+tolerance; the ``disp2`` and ``disp3`` cutoffs remain the upper limits.
+For 3D periodic systems the tail_correction option adds the pairwise dispersion
+beyond the ``disp2`` cutoff, which allows to use shorter cutoffs of 20 to 25 Bohr
+while keeping converged energies and stresses.
 
 Example
 -------
@@ -121,10 +148,14 @@ Example
 {'realspace_cutoff': {'width2': 0.02645886052819206, 'width3': 0.02645886052819206}}
 >>> calc.set(realspace_cutoff={})  # reset to library defaults
 {'realspace_cutoff': {}}
+>>> calc.set(realspace_cutoff={"disp2": 20.0 * Bohr}, tail_correction=True)
+{'realspace_cutoff': {'disp2': 10.583544211276823}, 'tail_correction': True}
 """
 
 from typing import List, Optional
 
+import numpy as np
+
 try:
     from ase.atoms import Atoms
     from ase.calculators.calculator import (
@@ -139,15 +170,19 @@ except ModuleNotFoundError as e:
     raise ModuleNotFoundError("This submodule requires ASE installed") from e
 
 from .interface import DampingParam, DispersionModel
+from .parallel import ParallelDispersion
 
 
-# Fallbacks for incomplete realspace_cutoff dictionaries; an empty dict keeps
-# the library defaults untouched. Values match the Fortran realspace_cutoff
-# defaults and are stored in Angstrom for ASE inputs.
+# Fallbacks for incomplete realspace_cutoff dictionaries; an empty dict restores
+# the library defaults. Values match the Fortran realspace_cutoff defaults and
+# are stored in Angstrom for ASE inputs.
 DEFAULT_DISP2_CUTOFF = 60.0 * Bohr
 DEFAULT_DISP3_CUTOFF = 40.0 * Bohr
 DEFAULT_CN_CUTOFF = 30.0 * Bohr
 
+# Parameters applied to the API calculator, which are only set again if changed
+_MODEL_SETTINGS = ("realspace_cutoff", "tail_correction", "mixed_precision", "symmetry")
+
 
 class DFTD4(Calculator):
     """
@@ -166,8 +201,10 @@ class DFTD4(Calculator):
 
     implemented_properties = [
         "energy",
+        "energies",
         "forces",
         "stress",
+        "stresses",
     ]
 
     default_parameters = {
@@ -176,9 +213,15 @@ class DFTD4(Calculator):
         "cache_api": True,
         "model": "d4",
         "realspace_cutoff": {},
+        "tail_correction": False,
+        "mixed_precision": False,
+        "symmetry": False,
+        "nprocs": 1,
     }
 
     _disp = None
+    _dpar = None
+    _configured = False
 
     def __init__(
         self,
@@ -217,6 +260,16 @@ class DFTD4(Calculator):
         if changed_parameters:
             self.reset()
 
+        # A different model or number of worker processes requires a new API calculator
+        if "model" in changed_parameters or "nprocs" in changed_parameters:
+            self._disp = None
+
+        # Damping parameters and model settings are kept until they are changed
+        if "method" in changed_parameters or "params_tweaks" in changed_parameters:
+            self._dpar = None
+        if any(key in changed_parameters for key in _MODEL_SETTINGS):
+            self._configured = False
+
         return changed_parameters
 
     def reset(self) -> None:
@@ -225,6 +278,7 @@ class DFTD4(Calculator):
 
         if not self.parameters.cache_api:
             self._disp = None
+            self._dpar = None
 
     def _check_api_calculator(self, system_changes: List[str]) -> None:
         """Check state of API calculator and reset if necessary"""
@@ -260,14 +314,28 @@ class DFTD4(Calculator):
             _periodic = self.atoms.pbc
             _charge = self.atoms.get_initial_charges().sum()
 
-            disp = DispersionModel(
-                self.atoms.numbers,
-                self.atoms.positions / Bohr,
-                _charge,
-                _cell / Bohr,
-                _periodic,
-                model=self.parameters.get("model"),
-            )
+            _nprocs = self.parameters.get("nprocs", 1)
+
+            if _nprocs > 1:
+                disp = ParallelDispersion(
+                    self.atoms.numbers,
+                    self.atoms.positions / Bohr,
+                    _charge,
+                    _cell / Bohr,
+                    _periodic,
+                    model=self.parameters.get("model"),
+                    nprocs=_nprocs,
+                    threads=1,
+                )
+            else:
+                disp = DispersionModel(
+                    self.atoms.numbers,
+                    self.atoms.positions / Bohr,
+                    _charge,
+                    _cell / Bohr,
+                    _periodic,
+                    model=self.parameters.get("model"),
+                )
 
         except RuntimeError:
             raise InputError("Cannot construct dispersion model for dftd4")
@@ -277,9 +345,7 @@ class DFTD4(Calculator):
     def _apply_realspace_cutoff(self, disp: DispersionModel) -> None:
         """Apply optional realspace cutoff settings to the API calculator."""
 
-        cutoff = self.parameters.get("realspace_cutoff")
-        if not cutoff:
-            return
+        cutoff = self.parameters.get("realspace_cutoff") or {}
 
         try:
             disp.set_realspace_cutoff(
@@ -289,6 +355,7 @@ class DFTD4(Calculator):
                 width2=cutoff.get("width2", 0.0) / Bohr,
                 width3=cutoff.get("width3", 0.0) / Bohr,
             )
+            disp.set_realspace_cutoff_tolerance(cutoff.get("tolerance", 0.0) / Hartree)
         except RuntimeError:
             raise InputError("Cannot update realspace cutoff for dftd4")
 
@@ -306,6 +373,27 @@ class DFTD4(Calculator):
 
         return dpar
 
+    def _prepare_api_calculator(self) -> None:
+        """Create API calculator and damping parameters if necessary and apply
+        changed model settings"""
+
+        if self._disp is None:
+            self._disp = self._create_api_calculator()
+            self._configured = False
+        if not self._configured:
+            self._apply_realspace_cutoff(self._disp)
+            self._disp.set_tail_correction(
+                self.parameters.get("tail_correction", False)
+            )
+            self._disp.set_mixed_precision(
+                self.parameters.get("mixed_precision", False)
+            )
+            self._disp.set_symmetry(self.parameters.get("symmetry", False))
+            self._configured = True
+
+        if self._dpar is None:
+            self._dpar = self._create_damping_param()
+
     def calculate(
         self,
         atoms: Optional[Atoms] = None,
@@ -319,23 +407,215 @@ class DFTD4(Calculator):
         Calculator.calculate(self, atoms, properties, system_changes)
 
         self._check_api_calculator(system_changes)
+        self._prepare_api_calculator()
 
-        if self._disp is None:
-            self._disp = self._create_api_calculator()
-        self._apply_realspace_cutoff(self._disp)
-
-        _dpar = self._create_damping_param()
+        # Only evaluate derivatives if they are requested, stress tensors are only
+        # available for periodic systems
+        _periodic = self.atoms.pbc.any()
+        _atomic = "energies" in properties or "stresses" in properties
+        _virial = _periodic and ("stress" in properties or "stresses" in properties)
+        _grad = "forces" in properties or _virial
 
         try:
-            _res = self._disp.get_dispersion(param=_dpar, grad=True)
+            _res = self._disp.get_dispersion(
+                param=self._dpar, grad=_grad, atomic=_atomic
+            )
         except RuntimeError:
             raise CalculationFailed("dftd4 could not evaluate input")
 
         # These properties are guaranteed to exist for all implemented calculators
         self.results["energy"] = _res.get("energy") * Hartree
         self.results["free_energy"] = self.results["energy"]
-        self.results["forces"] = -_res.get("gradient") * Hartree / Bohr
+        if _grad:
+            self.results["forces"] = -_res.get("gradient") * Hartree / Bohr
         # stress tensor is only returned for periodic systems
-        if self.atoms.pbc.any():
+        if _grad and _periodic:
             _stress = _res.get("virial") * Hartree / self.atoms.get_volume()
             self.results["stress"] = _stress.flat[[0, 4, 8, 5, 2, 1]]
+        if _atomic:
+            self.results["energies"] = _res.get("energies") * Hartree
+            if _grad and _periodic:
+                _stresses = _res.get("virials") * Hartree / self.atoms.get_volume()
+                self.results["stresses"] = _stresses.reshape(-1, 9)[
+                    :, [0, 4, 8, 5, 2, 1]
+                ]
+
+
+class DFTD4Batch(DFTD4):
+    """
+    Coordinator for evaluating several images of the same system, like the images
+    of a nudged elastic band or an ensemble of replicas, in a single library call.
+
+    A :class:`DFTD4Image` calculator is attached to every image. The first request
+    of a property from any image evaluates all images at once, and the results
+    are distributed to the calculators of the images. All images must share their
+    composition, charge and periodicity, which allows them to share one
+    dispersion model. The images are distributed over the threads of the library.
+
+    The coordinator supports the same keywords as :class:`DFTD4`, changing them
+    with ``set`` applies to all images. Worker processes (``nprocs``) and the
+    ``symmetry`` setting are not used for images, and atom-resolved properties
+    are not available.
+
+    Example
+    -------
+    >>> from ase.build import molecule
+    >>> from dftd4.ase import DFTD4Batch
+    >>> images = [molecule("H2O") for _ in range(4)]
+    >>> for ii, atoms in enumerate(images):
+    ...     atoms.positions *= 1.0 + 0.02 * ii
+    >>> batch = DFTD4Batch(images, method="PBE")
+    >>> energies = [atoms.get_potential_energy() for atoms in images]
+    """
+
+    implemented_properties = [
+        "energy",
+        "forces",
+        "stress",
+    ]
+
+    def __init__(
+        self,
+        images: List[Atoms],
+        **kwargs,
+    ):
+        """Attach a calculator to every image, sharing this coordinator."""
+
+        self.images = list(images)
+        if not self.images:
+            raise InputError("At least one image is required for dftd4")
+
+        self._image_results = [None] * len(self.images)
+        self.calculators = [
+            DFTD4Image(self, index) for index in range(len(self.images))
+        ]
+
+        DFTD4.__init__(self, **kwargs)
+
+        for atoms, calc in zip(self.images, self.calculators):
+            atoms.calc = calc
+
+    def set(self, **kwargs) -> dict:
+        """Set new parameters to dftd4 for all images"""
+
+        changed_parameters = DFTD4.set(self, **kwargs)
+
+        # Results of all images are invalid if parameters change
+        if changed_parameters:
+            self._image_results = [None] * len(self.images)
+            for calc in self.calculators:
+                calc.reset()
+
+        return changed_parameters
+
+    def get_image_results(self, index: int, properties: List[str]) -> dict:
+        """Obtain the results of an image, all images are evaluated if the results
+        are not available for the current geometry of the image"""
+
+        atoms = self.images[index]
+        _grad = "forces" in properties or ("stress" in properties and atoms.pbc.any())
+
+        cached = self._image_results[index]
+        if (
+            cached is None
+            or not np.array_equal(cached[0], atoms.positions)
+            or not np.array_equal(cached[1], atoms.cell.array)
+            or (_grad and "forces" not in cached[2])
+        ):
+            self.calculate(properties=properties)
+            cached = self._image_results[index]
+
+        return dict(cached[2])
+
+    def calculate(
+        self,
+        atoms: Optional[Atoms] = None,
+        properties: List[str] = None,
+        system_changes: List[str] = all_changes,
+    ) -> None:
+        """Evaluate all images in a single call of the dftd4 API"""
+
+        if not properties:
+            properties = ["energy"]
+
+        first = self.images[0]
+        _charge = first.get_initial_charges().sum()
+        for other in self.images[1:]:
+            if (
+                not np.array_equal(other.numbers, first.numbers)
+                or not np.array_equal(other.pbc, first.pbc)
+                or other.get_initial_charges().sum() != _charge
+            ):
+                raise InputError("All images must share composition, charge and pbc")
+        if self.parameters.get("nprocs", 1) > 1:
+            raise InputError("Worker processes are not supported for images")
+
+        # The dispersion model is kept for the first image, which defines the
+        # composition of all images
+        _changes = self.check_state(first)
+        Calculator.calculate(self, first, properties, system_changes)
+        self._check_api_calculator(_changes)
+        self._prepare_api_calculator()
+
+        _periodic = first.pbc.any()
+        _grad = "forces" in properties or (_periodic and "stress" in properties)
+
+        _positions = np.array([image.positions for image in self.images]) / Bohr
+        _lattices = None
+        if _periodic:
+            _lattices = np.array([image.cell.array for image in self.images]) / Bohr
+
+        try:
+            _res = self._disp.get_dispersion_images(
+                self._dpar, _positions, _lattices, grad=_grad
+            )
+        except RuntimeError:
+            raise CalculationFailed("dftd4 could not evaluate input")
+
+        for index, image in enumerate(self.images):
+            results = {"energy": _res["energy"][index] * Hartree}
+            results["free_energy"] = results["energy"]
+            if _grad:
+                results["forces"] = -_res["gradient"][index] * Hartree / Bohr
+                if _periodic:
+                    _stress = _res["virial"][index] * Hartree / image.get_volume()
+                    results["stress"] = _stress.flat[[0, 4, 8, 5, 2, 1]]
+            self._image_results[index] = (
+                image.positions.copy(),
+                image.cell.array.copy(),
+                results,
+            )
+
+
+class DFTD4Image(Calculator):
+    """
+    Calculator for a single image, which obtains its results from a shared
+    :class:`DFTD4Batch` coordinator. It is created and attached by the coordinator.
+    """
+
+    implemented_properties = [
+        "energy",
+        "forces",
+        "stress",
+    ]
+
+    def __init__(self, batch: DFTD4Batch, index: int):
+        """Connect the calculator to its image in the coordinator."""
+
+        Calculator.__init__(self)
+        self.batch = batch
+        self.index = index
+
+    def calculate(
+        self,
+        atoms: Optional[Atoms] = None,
+        properties: List[str] = None,
+        system_changes: List[str] = all_changes,
+    ) -> None:
+        """Obtain the results of this image from the coordinator"""
+
+        if not properties:
+            properties = ["energy"]
+        Calculator.calculate(self, atoms, properties, system_changes)
+
+        self.results = self.batch.get_image_results(self.index, properties)
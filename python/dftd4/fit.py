@@ -0,0 +1,352 @@
+# This file is part of dftd4.
+# SPDX-Identifier: LGPL-3.0-or-later
+#
+# dftd4 is free software: you can redistribute it and/or modify it under
+# the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# dftd4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Damping parameter fitting
+-------------------------
+
+Refit the rational damping parameters against reference data. The dispersion
+model is evaluated only once per structure to obtain the data which does not
+depend on the damping parameters, i.e. the C6 coefficients, the products of the
+r4/r2 expectation values, the interatomic distances and the geometric factors
+of the Axilrod-Teller-Muto term. Energies and their analytic derivatives with
+respect to s6, s8, s9, a1 and a2 are evaluated from this data with NumPy for all
+structures at once, which allows a least-squares fit to run over thousands of
+structures in seconds.
+
+The pair and triple lists are built with sharp real space cutoffs and without
+periodic images, therefore only molecular structures are supported. The
+exponent of the three-body damping function is kept fixed.
+
+Example
+-------
+>>> from dftd4.fit import FitStructure, fit_damping_param, format_parameters
+>>> import numpy as np
+>>> dimer = FitStructure(
+...     numbers=np.array([18, 18]),
+...     positions=np.array([[0.0, 0.0, -3.5], [0.0, 0.0, 3.5]]),
+... )
+>>> monomer = FitStructure(numbers=np.array([18]), positions=np.zeros((1, 3)))
+>>> param = fit_damping_param(
+...     [dimer, monomer],
+...     reference=np.array([-0.0004]),
+...     stoichiometry=np.array([[1.0, -2.0]]),
+...     fit=("a2",),
+...     initial={"s8": 1.0, "a1": 0.4, "a2": 5.0},
+... )
+>>> print(format_parameters("my-functional", param))  # doctest: +SKIP
+[parameter.my-functional]
+d4.bj-eeq-atm = { s8=1.00000000, a1=0.40000000, a2=... }
+"""
+
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from .interface import DispersionModel
+
+PARAMETERS = ("s6", "s8", "s9", "a1", "a2")
+"""Damping parameters with analytic derivatives, in the order of the derivatives"""
+
+_DEFAULTS = {
+    "bj-eeq-two": {"s6": 1.0, "s9": 0.0, "alp": 16.0},
+    "bj-eeq-atm": {"s6": 1.0, "s9": 1.0, "alp": 16.0},
+    "bj-eeq-mbd": {"s6": 1.0, "s9": 1.0, "alp": 16.0},
+}
+
+
+class FitStructure:
+    """
+    Damping parameter independent pair and triple data of a molecular structure.
+
+    The dispersion model is created for the structure, evaluated once and
+    discarded afterwards, only the pairs within the two-body cutoff and the
+    triples within the three-body cutoff are kept.
+    """
+
+    def __init__(
+        self,
+        numbers: np.ndarray,
+        positions: np.ndarray,
+        charge: Optional[float] = None,
+        charges: Optional[np.ndarray] = None,
+        model: str = "d4",
+        cutoff2: float = 60.0,
+        cutoff3: float = 40.0,
+        **kwargs,
+    ):
+        """Evaluate the pair and triple data of a structure"""
+
+        disp = DispersionModel(numbers, positions, charge, model=model, **kwargs)
+        data = disp.get_pair_data(charges)
+        c6 = data["c6 coefficients"]
+        c6_3b = data["three-body c6 coefficients"]
+        rrij = data["r4r2 products"]
+        del disp
+
+        xyz = np.asarray(positions, dtype=float)
+        nat = len(xyz)
+        r2 = np.sum((xyz[:, np.newaxis, :] - xyz[np.newaxis, :, :]) ** 2, axis=-1)
+        eps = np.finfo(float).eps
+
+        iat, jat = np.triu_indices(nat, 1)
+        sel = (r2[iat, jat] <= cutoff2**2) & (r2[iat, jat] >= eps)
+        iat, jat = iat[sel], jat[sel]
+        self.pair_c6 = c6[iat, jat]
+        self.pair_rr = rrij[iat, jat]
+        self.pair_r2 = r2[iat, jat]
+
+        within = (r2 <= cutoff3**2) & (r2 >= eps)
+        triples = []
+        for iat in range(nat):
+            neighbors = np.nonzero(within[iat, iat + 1 :])[0] + iat + 1
+            jj, kk = np.triu_indices(len(neighbors), 1)
+            jat, kat = neighbors[jj], neighbors[kk]
+            sel = within[jat, kat]
+            triples.append(
+                np.stack([np.full(np.count_nonzero(sel), iat), jat[sel], kat[sel]])
+            )
+        iat, jat, kat = np.concatenate(triples, axis=1)
+
+        r2ij, r2ik, r2jk = r2[iat, jat], r2[iat, kat], r2[jat, kat]
+        r2ijk = r2ij * r2ik * r2jk
+        r1 = np.sqrt(r2ijk)
+        r3 = r2ijk * r1
+        r5 = r3 * r2ijk
+        ang = (
+            0.375
+            * (r2ij + r2jk - r2ik)
+            * (r2ij - r2jk + r2ik)
+            * (-r2ij + r2jk + r2ik)
+            / r5
+            + 1.0 / r3
+        )
+        c9 = np.sqrt(np.abs(c6_3b[iat, jat] * c6_3b[iat, kat] * c6_3b[jat, kat]))
+        self.triple_c9ang = c9 * ang
+        self.triple_r = r1
+        self.triple_rr = np.stack(
+            [np.sqrt(rrij[iat, jat]), np.sqrt(rrij[iat, kat]), np.sqrt(rrij[jat, kat])],
+            axis=-1,
+        )
+
+
+class FitSet:
+    """
+    Collection of structures for damping parameter fits. The pair and triple data
+    of all structures is concatenated to evaluate all energies at once.
+    """
+
+    def __init__(self, structures: Sequence[FitStructure]):
+        """Concatenate the data of all structures"""
+
+        self._nstruct = len(structures)
+
+        def _join(attr, shape=(0,)):
+            arrays = [getattr(struc, attr) for struc in structures]
+            return np.concatenate(arrays) if arrays else np.zeros(shape)
+
+        self.pair_index = np.repeat(
+            np.arange(self._nstruct), [len(struc.pair_c6) for struc in structures]
+        )
+        self.pair_c6 = _join("pair_c6")
+        self.pair_rr = _join("pair_rr")
+        self.pair_r2 = _join("pair_r2")
+        self.triple_index = np.repeat(
+            np.arange(self._nstruct), [len(struc.triple_r) for struc in structures]
+        )
+        self.triple_c9ang = _join("triple_c9ang")
+        self.triple_r = _join("triple_r")
+        self.triple_rr = _join("triple_rr", (0, 3))
+
+    def __len__(self):
+        return self._nstruct
+
+    def get_energy(self, param: dict, grad: bool = False) -> dict:
+        """
+        Evaluate the dispersion energy of all structures for a set of rational damping
+        parameters. Missing values of s6, s9 and alp default to 1.0, 1.0 and 16.0.
+        With ``grad`` the derivatives of the energies with respect to the parameters
+        are returned as well, ordered as in ``PARAMETERS``.
+        """
+
+        s6 = param.get("s6", 1.0)
+        s8 = param["s8"]
+        s9 = param.get("s9", 1.0)
+        a1 = param["a1"]
+        a2 = param["a2"]
+        alp3 = param.get("alp", 16.0) / 3.0
+        nstruct = len(self)
+
+        # Two-body term
+        sqrr = np.sqrt(self.pair_rr)
+        r0 = a1 * sqrr + a2
+        r6 = self.pair_r2**3
+        r8 = r6 * self.pair_r2
+        d6 = 1.0 / (r6 + r0**6)
+        d8 = 1.0 / (r8 + r0**8)
+        e6 = -self.pair_c6 * d6
+        e8 = -self.pair_c6 * self.pair_rr * d8
+        energy = np.bincount(
+            self.pair_index, weights=s6 * e6 + s8 * e8, minlength=nstruct
+        )
+
+        # Three-body term
+        r0ijk = a1 * self.triple_rr + a2
+        x = (np.prod(r0ijk, axis=-1) / self.triple_r) ** alp3
+        fdmp = 1.0 / (1.0 + 6.0 * x)
+        e9 = self.triple_c9ang * fdmp
+        energy += np.bincount(self.triple_index, weights=s9 * e9, minlength=nstruct)
+
+        if not grad:
+            return {"energy": energy}
+
+        dEdr0 = self.pair_c6 * (
+            6.0 * s6 * r0**5 * d6**2 + 8.0 * s8 * self.pair_rr * r0**7 * d8**2
+        )
+        dfdr0 = -6.0 * alp3 * fdmp * x * s9 * e9
+        derivs = np.zeros((nstruct, len(PARAMETERS)))
+        derivs[:, 0] = np.bincount(self.pair_index, weights=e6, minlength=nstruct)
+        derivs[:, 1] = np.bincount(self.pair_index, weights=e8, minlength=nstruct)
+        derivs[:, 2] = np.bincount(self.triple_index, weights=e9, minlength=nstruct)
+        derivs[:, 3] = np.bincount(
+            self.pair_index, weights=dEdr0 * sqrr, minlength=nstruct
+        ) + np.bincount(
+            self.triple_index,
+            weights=dfdr0 * np.sum(self.triple_rr / r0ijk, axis=-1),
+            minlength=nstruct,
+        )
+        derivs[:, 4] = np.bincount(
+            self.pair_index, weights=dEdr0, minlength=nstruct
+        ) + np.bincount(
+            self.triple_index,
+            weights=dfdr0 * np.sum(1.0 / r0ijk, axis=-1),
+            minlength=nstruct,
+        )
+
+        return {"energy": energy, "derivatives": derivs}
+
+
+def fit_damping_param(
+    structures: Union[FitSet, Sequence[FitStructure]],
+    reference: np.ndarray,
+    stoichiometry: Optional[np.ndarray] = None,
+    weights: Optional[np.ndarray] = None,
+    initial: Optional[dict] = None,
+    fit: Sequence[str] = ("s8", "a1", "a2"),
+    maxiter: int = 100,
+    tol: float = 1.0e-10,
+) -> dict:
+    """
+    Fit rational damping parameters with a Levenberg-Marquardt least-squares
+    optimization. The dispersion energies of the reactions, obtained by contracting
+    the energies of the structures with the stoichiometry matrix, are fitted to the
+    reference values, usually the difference between reference and uncorrected
+    reaction energies. Without stoichiometry every structure is its own reaction.
+    Only the parameters listed in ``fit`` are optimized, the others are kept at
+    their initial values.
+
+    Raises
+    ------
+    ValueError
+        on unknown parameters or inconsistent dimensions
+    """
+
+    data = structures if isinstance(structures, FitSet) else FitSet(structures)
+
+    for name in fit:
+        if name not in PARAMETERS:
+            raise ValueError(f"Unknown damping parameter '{name}'")
+    index = [PARAMETERS.index(name) for name in fit]
+
+    param = {"s6": 1.0, "s8": 1.0, "s9": 1.0, "a1": 0.4, "a2": 5.0, "alp": 16.0}
+    if initial is not None:
+        param.update(initial)
+
+    _reference = np.asarray(reference, dtype=float)
+    _stoich = (
+        np.eye(len(data))
+        if stoichiometry is None
+        else np.asarray(stoichiometry, dtype=float)
+    )
+    if _stoich.shape != (len(_reference), len(data)):
+        raise ValueError("Dimension mismatch for stoichiometry and reference values")
+    _weights = (
+        np.ones(len(_reference))
+        if weights is None
+        else np.sqrt(np.asarray(weights, dtype=float))
+    )
+    if _weights.shape != _reference.shape:
+        raise ValueError("Dimension mismatch for weights and reference values")
+
+    def _residual(par, grad):
+        res = data.get_energy(par, grad=grad)
+        resid = _weights * (_stoich @ res["energy"] - _reference)
+        if not grad:
+            return resid
+        return resid, _weights[:, np.newaxis] * (_stoich @ res["derivatives"][:, index])
+
+    resid, jac = _residual(param, True)
+    cost = resid @ resid
+    damp = 1.0e-3
+    for _ in range(maxiter):
+        jtj = jac.T @ jac
+        jtr = jac.T @ resid
+        step = np.linalg.solve(jtj + damp * np.diag(np.diag(jtj) + tol), -jtr)
+        if np.max(np.abs(step), initial=0.0) < tol:
+            break
+        trial = param.copy()
+        for ip, name in enumerate(fit):
+            trial[name] = param[name] + step[ip]
+        trial_resid = _residual(trial, False)
+        trial_cost = trial_resid @ trial_resid
+        if trial_cost < cost:
+            param = trial
+            resid, jac = _residual(param, True)
+            cost = trial_cost
+            damp = max(damp / 10.0, 1.0e-12)
+        else:
+            damp *= 10.0
+            if damp > 1.0e12:
+                break
+
+    return {name: float(value) for name, value in param.items()}
+
+
+def format_parameters(
+    method: str,
+    param: dict,
+    variant: str = "bj-eeq-atm",
+    doi: Optional[str] = None,
+) -> str:
+    """
+    Format damping parameters as entry of the ``parameters.toml`` data base.
+    The parameters s6, s9 and alp are only written if they differ from the
+    defaults of the variant.
+    """
+
+    if variant not in _DEFAULTS:
+        raise ValueError(f"Unknown damping parameter variant '{variant}'")
+
+    values = []
+    if param.get("s6", 1.0) != _DEFAULTS[variant]["s6"]:
+        values.append(f"s6={param['s6']:.8f}")
+    values += [f"{name}={param[name]:.8f}" for name in ("s8", "a1", "a2")]
+    for name in ("s9", "alp"):
+        if name in param and param[name] != _DEFAULTS[variant][name]:
+            values.append(f"{name}={param[name]:.8f}")
+    if doi is not None:
+        values.append(f'doi="{doi}"')
+
+    return f"[parameter.{method.lower()}]\nd4.{variant} = {{ {', '.join(values)} }}\n"
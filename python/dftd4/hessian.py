@@ -0,0 +1,227 @@
+# This file is part of dftd4.
+# SPDX-Identifier: LGPL-3.0-or-later
+#
+# dftd4 is free software: you can redistribute it and/or modify it under
+# the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# dftd4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Out-of-core hessian
+-------------------
+
+Chunked evaluation of the numerical dispersion hessian for systems where the
+complete hessian does not fit into memory. The displacement columns are
+evaluated in ranges and streamed into a memory-mapped ``.npy`` file of shape
+(N, 3, N, 3). Finished chunks are recorded in a progress file next to the
+hessian, an interrupted calculation is resumed from the last finished chunk
+when called again with the same arguments. The progress file stores a fingerprint
+of the structure, dispersion model and damping parameters, resuming a different
+calculation is refused. If the hessian file does not exist anymore, a previous
+progress file is discarded and all chunks are evaluated again.
+
+Chunks are assigned cyclically to zero-based parts, chunk k of the displacement
+columns is evaluated by part k modulo the number of parts. The parts are numbered
+like the work partition of the dispersion model, but distribute chunks of columns
+instead of atom pairs. Independent processes can therefore evaluate the parts of
+one hessian and write into the same file.
+
+Example
+-------
+>>> from dftd4.hessian import compute_hessian
+>>> from dftd4.interface import DampingParam, DispersionModel
+>>> import numpy as np
+>>> import os, tempfile
+>>> model = DispersionModel(
+...     numbers=np.array([8, 1, 1]),
+...     positions=np.array([
+...         [+0.00000000000000, +0.00000000000000, -0.73578586109551],
+...         [+1.44183152868459, +0.00000000000000, +0.36789293054775],
+...         [-1.44183152868459, +0.00000000000000, +0.36789293054775],
+...     ]),
+... )
+>>> with tempfile.TemporaryDirectory() as tmpdir:
+...     filename = os.path.join(tmpdir, "hessian.npy")
+...     hessian = compute_hessian(model, DampingParam(method="pbe"), filename)
+...     print(hessian.shape)
+...     del hessian
+(3, 3, 3, 3)
+"""
+
+import hashlib
+import json
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+from .interface import DampingParam, DispersionModel
+
+
+def get_hessian_chunks(
+    natoms: int,
+    chunk_size: int,
+    part: int = 0,
+    nparts: int = 1,
+) -> List[Tuple[int, int]]:
+    """
+    Return the ranges of hessian columns owned by a part, each range is given
+    as start and stop (exclusive) index of the displacement columns.
+    """
+
+    if nparts < 1 or part < 0 or part >= nparts:
+        raise ValueError("Invalid dispersion work partition")
+    if chunk_size < 1:
+        raise ValueError("Number of columns per chunk must be positive")
+
+    ncol = 3 * natoms
+    return [
+        (start, min(start + chunk_size, ncol))
+        for ichunk, start in enumerate(range(0, ncol, chunk_size))
+        if ichunk % nparts == part
+    ]
+
+
+def get_progress_file(filename: str, part: int = 0, nparts: int = 1) -> str:
+    """Return the name of the file recording the finished chunks of a part."""
+
+    return f"{filename}.{part}-{nparts}.progress"
+
+
+def compute_hessian(
+    model: DispersionModel,
+    param: DampingParam,
+    filename: str,
+    chunk_size: int = 30,
+    part: int = 0,
+    nparts: int = 1,
+) -> np.memmap:
+    """
+    Evaluate the numerical dispersion hessian in chunks of displacement columns
+    and write them to a memory-mapped ``.npy`` file.
+
+    Only the chunks owned by the given part are evaluated. If a progress file
+    for this part exists, the chunks recorded as finished are skipped, provided
+    it was written for the same calculation and the hessian file was not created
+    anew.
+
+    Raises
+    ------
+    ValueError
+        in case the existing hessian or progress file do not match the calculation
+    RuntimeError
+        in case the calculation fails in the library
+    """
+
+    natoms = len(model)
+    shape = (natoms, 3, natoms, 3)
+    chunks = get_hessian_chunks(natoms, chunk_size, part, nparts)
+
+    hessian, created = _open_hessian(filename, shape)
+    columns = hessian.reshape(3 * natoms, natoms, 3)
+
+    progress = get_progress_file(filename, part, nparts)
+    fingerprint = _get_fingerprint(model, param)
+    if created and os.path.exists(progress):
+        # Chunks recorded for a previous hessian file are missing in the new one
+        os.remove(progress)
+    finished = _read_progress(progress, natoms, chunk_size, fingerprint)
+
+    for start, stop in chunks:
+        if start in finished:
+            continue
+        columns[start:stop] = model.get_hessian_columns(param, start, stop)
+        hessian.flush()
+
+        finished.add(start)
+        _write_progress(progress, natoms, chunk_size, fingerprint, finished)
+
+    return hessian
+
+
+def _get_fingerprint(model: DispersionModel, param: DampingParam) -> str:
+    """Hash of the structure, dispersion model and damping parameters"""
+
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(model._numbers, dtype="i4").tobytes())
+    digest.update(np.ascontiguousarray(model._positions, dtype=float).tobytes())
+    if model._lattice is not None:
+        digest.update(np.ascontiguousarray(model._lattice, dtype=float).tobytes())
+    digest.update(
+        json.dumps(
+            [model._charge, model._model, param._kwargs], sort_keys=True, default=str
+        ).encode()
+    )
+    return digest.hexdigest()
+
+
+def _open_hessian(filename: str, shape: Tuple[int, ...]) -> Tuple[np.memmap, bool]:
+    """
+    Open the memory-mapped hessian, the file is created if it does not exist yet.
+    Returns whether the file was created by this call.
+    """
+
+    created = False
+    if not os.path.exists(filename):
+        # Create the file under a temporary name and link it into place, if another
+        # process created the hessian in the meantime we open theirs instead
+        tmpname = f"{filename}.{os.getpid()}.tmp"
+        np.lib.format.open_memmap(tmpname, mode="w+", dtype=float, shape=shape).flush()
+        try:
+            os.link(tmpname, filename)
+            created = True
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmpname)
+
+    hessian = np.lib.format.open_memmap(filename, mode="r+")
+    if hessian.shape != shape or hessian.dtype != np.dtype(float):
+        raise ValueError(f"Hessian in '{filename}' does not match the structure")
+    return hessian, created
+
+
+def _read_progress(
+    progress: str, natoms: int, chunk_size: int, fingerprint: str
+) -> set:
+    """Read the finished chunks of a previous run of the same calculation"""
+
+    if not os.path.exists(progress):
+        return set()
+
+    with open(progress) as fd:
+        data = json.load(fd)
+
+    if (
+        data.get("natoms") != natoms
+        or data.get("chunk_size") != chunk_size
+        or data.get("fingerprint") != fingerprint
+    ):
+        raise ValueError(f"Progress in '{progress}' does not match the calculation")
+    return set(data.get("finished", []))
+
+
+def _write_progress(
+    progress: str, natoms: int, chunk_size: int, fingerprint: str, finished: set
+) -> None:
+    """Record the finished chunks, replacing the previous record atomically"""
+
+    tmpname = f"{progress}.tmp"
+    with open(tmpname, "w") as fd:
+        json.dump(
+            {
+                "natoms": natoms,
+                "chunk_size": chunk_size,
+                "fingerprint": fingerprint,
+                "finished": sorted(finished),
+            },
+            fd,
+        )
+    os.replace(tmpname, progress)
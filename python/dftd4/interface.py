@@ -22,12 +22,14 @@ The classes defined here allow a more Pythonic usage of the API object provided
 library in actual workflows than the low-level access provided in the CFFI generated wrappers.
 """
 
-from typing import Optional
+from typing import Iterable, Optional
 
 import numpy as np
 
 from . import library
 
+_PARTITION_SCHEMES = {"cyclic": 0, "spatial": 1, "cost": 2}
+
 
 class Structure:
     """
@@ -95,6 +97,12 @@ class Structure:
         else:
             _periodic = None
 
+        # Keep a copy of the input, identifying the structure for cached results
+        self._numbers = _numbers.copy()
+        self._positions = _positions.copy()
+        self._charge = charge
+        self._lattice = None if _lattice is None else _lattice.copy()
+
         self._mol = library.new_structure(
             self._natoms,
             _cast("int*", _numbers),
@@ -144,6 +152,10 @@ class Structure:
             _cast("double*", _lattice),
         )
 
+        self._positions = _positions.copy()
+        if _lattice is not None:
+            self._lattice = _lattice.copy()
+
 
 class DampingParam:
     """
@@ -187,6 +199,7 @@ class DampingParam:
         if not kwargs:
             raise TypeError("Method name or complete damping parameter set required")
 
+        self._kwargs = kwargs
         if "method" in kwargs:
             self._param = self.load_param(**kwargs)
         else:
@@ -282,6 +295,7 @@ class DispersionModel(Structure):
         """Create new dispersion model"""
 
         Structure.__init__(self, numbers, positions, charge, lattice, periodic)
+        self._model = dict(model=model.lower().replace(" ", ""), **kwargs)
 
         if model.lower().replace(" ", "") == "d4":
             if "ga" in kwargs or "gc" in kwargs or "wf" in kwargs:
@@ -317,22 +331,137 @@ class DispersionModel(Structure):
 
         library.set_model_realspace_cutoff(self._disp, disp2, disp3, cn, width2, width3)
 
-    def set_work_partition(self, part: int, nparts: int) -> None:
+    def set_work_partition(
+        self, part: int, nparts: int, scheme: str = "cyclic"
+    ) -> None:
         """
         Assign an externally managed part of the interaction loops to this model.
 
         Parts are zero based, and summing the results of all parts reproduces
-        the complete calculation. Structure-dependent quantities are evaluated
-        for the full system on every part; only the pairwise and ATM interaction
-        loops are partitioned.
+        the complete calculation. The pairwise and ATM interaction loops and the
+        two-body C6 coefficients are partitioned, coordination numbers, partial
+        charges, the three-body C6 coefficients and the assembly of their
+        derivatives are evaluated for the full system on every part.
+
+        The atom pairs are assigned cyclically by default. The ``"spatial"``
+        scheme decomposes the structure into domains and the ``"cost"`` scheme
+        into contiguous blocks of atoms, both balanced by the neighbor counts
+        within the current realspace cutoffs. Their assignment is kept on
+        updates and can be rebalanced by calling this method again.
+
+        Raises
+        ------
+        ValueError
+            on an unknown partition scheme
+        """
+
+        if scheme not in _PARTITION_SCHEMES:
+            raise ValueError(f"Unknown work partition scheme '{scheme}'")
+
+        if scheme == "cyclic":
+            library.set_model_work_partition(self._disp, part, nparts)
+        else:
+            library.set_model_work_partition_scheme(
+                self._mol, self._disp, part, nparts, _PARTITION_SCHEMES[scheme]
+            )
+
+    def set_tail_correction(self, tail: bool = True) -> None:
+        """
+        Add the two-body dispersion beyond the realspace cutoff as long-range
+        tail correction.
+
+        The tail is integrated over a homogeneous distribution of lattice images,
+        which allows shorter two-body cutoffs for 3D periodic systems. Molecules
+        and lower-dimensional systems are not affected.
+        """
+
+        library.set_model_tail_correction(self._disp, tail)
+
+    def set_realspace_cutoff_tolerance(self, tolerance: float) -> None:
+        """
+        Select the realspace cutoffs per species pair from a tolerance for the
+        truncation error of the energy per atom in Hartree.
+
+        The global realspace cutoffs act as upper limits, a tolerance of zero
+        disables the selection and uses the global cutoffs for all pairs.
+        """
+
+        library.set_model_realspace_cutoff_tolerance(self._disp, tolerance)
+
+    def set_mixed_precision(self, mixed: bool = True) -> None:
+        """
+        Evaluate distances, damping and switching functions of the interaction
+        kernels in single precision.
+
+        Energies, gradients and virial are still accumulated in double precision,
+        the relative error of the energy is of the order of 1e-6. Recommended for
+        screening and molecular dynamics, but not for numerical derivatives.
         """
 
-        library.set_model_work_partition(self._disp, part, nparts)
+        library.set_model_mixed_precision(self._disp, mixed)
+
+    def set_symmetry(self, symmetry: bool = True) -> None:
+        """
+        Evaluate the interaction kernels only for symmetry-unique atoms.
 
-    def get_dispersion(self, param: DampingParam, grad: bool) -> dict:
+        The space group of 3D periodic systems is detected on every evaluation,
+        gradient and virial of all other atoms are reconstructed by symmetry.
+        Molecules and lower-dimensional systems are evaluated without symmetry.
+        """
+
+        library.set_model_symmetry(self._disp, symmetry)
+
+    def get_realspace_cutoff_error(self, param: DampingParam) -> dict:
+        """
+        Estimate the truncation error of the two- and three-body dispersion
+        energy per atom for the current realspace cutoffs.
+
+        Raises
+        ------
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        _error2 = np.array(0.0)
+        _error3 = np.array(0.0)
+
+        library.get_realspace_cutoff_error(
+            self._mol,
+            self._disp,
+            param._param,
+            _cast("double*", _error2),
+            _cast("double*", _error3),
+        )
+
+        return {
+            "two-body error": _error2,
+            "three-body error": _error3,
+        }
+
+    def get_dispersion(
+        self,
+        param: DampingParam,
+        grad: bool,
+        charges: Optional[np.ndarray] = None,
+        dqdr: Optional[np.ndarray] = None,
+        dqdL: Optional[np.ndarray] = None,
+        atomic: bool = False,
+    ) -> dict:
         """
         Perform actual evaluation of the dispersion correction.
 
+        Partial charges from another source can be provided to skip the
+        electronegativity equilibration model, together with their derivatives
+        w.r.t. the positions (nat, nat, 3) and strain deformations (nat, 3, 3).
+        Without derivatives the charges are considered fixed in the gradient
+        and virial.
+
+        With ``atomic`` the atom-resolved ``energies`` and, if the gradient is
+        requested, the atom-resolved ``virials`` (nat, 3, 3) are returned as well,
+        every interaction is shared equally between the atoms involved.
+        The work partition, mixed precision and symmetry settings of the model
+        are not used for atom-resolved results.
+
         Example
         -------
         >>> from dftd4.interface import DampingParam, DispersionModel
@@ -363,10 +492,30 @@ class DispersionModel(Structure):
 
         Raises
         ------
+        ValueError
+            in case atom-resolved results are requested with external charges
         RuntimeError
             in case the calculation fails in the library
         """
 
+        if atomic:
+            if charges is not None:
+                raise ValueError(
+                    "Atom-resolved results are not available with external charges"
+                )
+            outputs = {"atomic energies"}
+            if grad:
+                outputs |= {"gradient", "virial", "atomic virials"}
+            res = self.evaluate(param, outputs)
+            results = dict(energy=res["energy"], energies=res["atomic energies"])
+            if grad:
+                results.update(
+                    gradient=res["gradient"],
+                    virial=res["virial"],
+                    virials=res["atomic virials"],
+                )
+            return results
+
         _energy = np.array(0.0)
         if grad:
             _gradient = np.zeros((len(self), 3))
@@ -375,27 +524,240 @@ class DispersionModel(Structure):
             _gradient = None
             _sigma = None
 
-        library.get_dispersion(
+        if charges is not None:
+            _charges = self._charges_array(charges, ())
+            _dqdr = self._charges_array(dqdr, (len(self), 3))
+            _dqdL = self._charges_array(dqdL, (3, 3))
+            library.get_dispersion_with_charges(
+                self._mol,
+                self._disp,
+                param._param,
+                _cast("double*", _charges),
+                _cast("double*", _dqdr),
+                _cast("double*", _dqdL),
+                _cast("double*", _energy),
+                _cast("double*", _gradient),
+                _cast("double*", _sigma),
+            )
+        else:
+            library.get_dispersion(
+                self._mol,
+                self._disp,
+                param._param,
+                _cast("double*", _energy),
+                _cast("double*", _gradient),
+                _cast("double*", _sigma),
+            )
+
+        results = dict(energy=_energy)
+        if _gradient is not None:
+            results.update(gradient=_gradient)
+        if _sigma is not None:
+            results.update(virial=_sigma)
+        return results
+
+    def new_incremental(self, param: DampingParam) -> float:
+        """
+        Initialize incremental energy updates for Monte Carlo moves and return
+        the dispersion energy of the current structure.
+
+        Moves are proposed with respect to the last accepted state and have to be
+        accepted or rejected afterwards. The structure of the model itself is not
+        changed by the moves, in particular the number of atoms can differ from
+        the model after an insertion or deletion.
+
+        Raises
+        ------
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        _energy = np.array(0.0)
+        library.new_incremental(
+            self._mol,
+            self._disp,
+            param._param,
+            _cast("double*", _energy),
+        )
+        return float(_energy)
+
+    def propose_displacement(
+        self,
+        param: DampingParam,
+        atoms: np.ndarray,
+        positions: np.ndarray,
+        frozen: bool = False,
+    ) -> float:
+        """
+        Propose new positions (Bohr) for a set of atoms (zero-based indices) and
+        return the change of the dispersion energy. With frozen coordination
+        numbers and partial charges only the interactions of the displaced atoms
+        are evaluated.
+        """
+
+        _atoms = np.ascontiguousarray(atoms, dtype="i4")
+        _positions = np.ascontiguousarray(positions, dtype="float")
+        if 3 * _atoms.size != _positions.size:
+            raise ValueError("Dimension mismatch between atoms and positions")
+
+        _delta = np.array(0.0)
+        library.propose_displacement(
+            self._disp,
+            param._param,
+            _atoms.size,
+            _cast("int*", _atoms),
+            _cast("double*", _positions),
+            frozen,
+            _cast("double*", _delta),
+        )
+        return float(_delta)
+
+    def propose_insertion(
+        self,
+        param: DampingParam,
+        numbers: np.ndarray,
+        positions: np.ndarray,
+        frozen: bool = False,
+    ) -> float:
+        """
+        Propose the insertion of atoms at the given positions (Bohr), appended
+        after the existing atoms, and return the change of the dispersion energy.
+        Only species present in the model can be inserted.
+        """
+
+        _numbers = np.ascontiguousarray(numbers, dtype="i4")
+        _positions = np.ascontiguousarray(positions, dtype="float")
+        if 3 * _numbers.size != _positions.size:
+            raise ValueError("Dimension mismatch between numbers and positions")
+
+        _delta = np.array(0.0)
+        library.propose_insertion(
+            self._disp,
+            param._param,
+            _numbers.size,
+            _cast("int*", _numbers),
+            _cast("double*", _positions),
+            frozen,
+            _cast("double*", _delta),
+        )
+        return float(_delta)
+
+    def propose_deletion(
+        self,
+        param: DampingParam,
+        atoms: np.ndarray,
+        frozen: bool = False,
+    ) -> float:
+        """
+        Propose the deletion of a set of atoms (zero-based indices) and return
+        the change of the dispersion energy.
+        """
+
+        _atoms = np.ascontiguousarray(atoms, dtype="i4")
+
+        _delta = np.array(0.0)
+        library.propose_deletion(
+            self._disp,
+            param._param,
+            _atoms.size,
+            _cast("int*", _atoms),
+            frozen,
+            _cast("double*", _delta),
+        )
+        return float(_delta)
+
+    def accept_move(self) -> None:
+        """Commit the last proposed move"""
+
+        library.finish_move(self._disp, True)
+
+    def reject_move(self) -> None:
+        """Discard the last proposed move"""
+
+        library.finish_move(self._disp, False)
+
+    def set_embedding(
+        self,
+        param: DampingParam,
+        region: np.ndarray,
+        interval: int = 0,
+    ) -> None:
+        """
+        Select a moving region (zero-based indices) embedded in a frozen environment.
+        Coordination numbers, partial charges, C6 coefficients and the dispersion
+        energy of the environment are cached for the current structure and refreshed
+        every interval evaluations, never if zero.
+
+        Raises
+        ------
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        _region = np.ascontiguousarray(region, dtype="i4")
+
+        library.set_model_embedding(
+            self._mol,
+            self._disp,
+            param._param,
+            _region.size,
+            _cast("int*", _region),
+            interval,
+        )
+
+    def refresh_embedding(self, param: DampingParam) -> None:
+        """Recompute the cached environment of the embedded region"""
+
+        library.refresh_embedding(self._mol, self._disp, param._param)
+
+    def get_embedded_dispersion(self, param: DampingParam, grad: bool) -> dict:
+        """
+        Evaluate the dispersion correction of the embedded region, only the
+        interactions involving region atoms are recomputed. The gradient is
+        only evaluated for the region atoms and zero for the environment.
+
+        Raises
+        ------
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        _energy = np.array(0.0)
+        if grad:
+            _gradient = np.zeros((len(self), 3))
+        else:
+            _gradient = None
+
+        library.get_embedded_dispersion(
             self._mol,
             self._disp,
             param._param,
             _cast("double*", _energy),
             _cast("double*", _gradient),
-            _cast("double*", _sigma),
         )
 
         results = dict(energy=_energy)
         if _gradient is not None:
             results.update(gradient=_gradient)
-        if _sigma is not None:
-            results.update(virial=_sigma)
         return results
 
-    def get_properties(self) -> dict:
+    def get_properties(
+        self,
+        charges: Optional[np.ndarray] = None,
+        properties: Optional[Iterable[str]] = None,
+        c6_cutoff: Optional[float] = None,
+    ) -> dict:
         """
         Evaluate dispersion related properties, like polarizabilities and C6 coefficients.
         Will also return the coordination numbers and partial charges used to derive
         the polarizabilities. Only the static polarizability is return at the moment.
+        Partial charges from another source can be provided to skip the
+        electronegativity equilibration model.
+
+        The returned properties can be selected by their name, only the work needed
+        for the selected properties is performed. With a cutoff for the C6
+        coefficients only atom pairs within the cutoff are evaluated and returned
+        in sparse form as zero-based pair indices (i, j), i >= j, and coefficients.
 
         Example
         -------
@@ -422,30 +784,108 @@ class DispersionModel(Structure):
         158.748605606818
         """
 
+        _available = (
+            "coordination numbers",
+            "partial charges",
+            "c6 coefficients",
+            "polarizabilities",
+        )
+        _selected = set(_available if properties is None else properties)
+        _unknown = _selected.difference(_available)
+        if _unknown:
+            raise ValueError(f"Unknown properties: {', '.join(sorted(_unknown))}")
+
+        _sparse_c6 = "c6 coefficients" in _selected and c6_cutoff is not None
+        _c6 = (
+            np.zeros((len(self), len(self)))
+            if "c6 coefficients" in _selected and not _sparse_c6
+            else None
+        )
+        _cn = np.zeros((len(self))) if "coordination numbers" in _selected else None
+        _charges = np.zeros((len(self))) if "partial charges" in _selected else None
+        _alpha = np.zeros((len(self))) if "polarizabilities" in _selected else None
+
+        if charges is not None:
+            _charges = self._charges_array(charges, ())
+            library.get_properties_with_charges(
+                self._mol,
+                self._disp,
+                _cast("double*", _charges),
+                _cast("double*", _cn),
+                _cast("double*", _c6),
+                _cast("double*", _alpha),
+            )
+        else:
+            library.get_properties(
+                self._mol,
+                self._disp,
+                _cast("double*", _cn),
+                _cast("double*", _charges),
+                _cast("double*", _c6),
+                _cast("double*", _alpha),
+            )
+
+        if _sparse_c6:
+            _npair = library.ffi.new("int*")
+            library.get_sparse_c6(
+                self._mol,
+                self._disp,
+                _cast("double*", self._charges_array(charges, ())),
+                c6_cutoff,
+                _npair,
+            )
+            _index = np.zeros((_npair[0], 2), dtype=np.int32)
+            _c6 = np.zeros((_npair[0]))
+            library.get_sparse_c6_pairs(
+                self._disp,
+                _cast("int*", _index),
+                _cast("double*", _c6),
+            )
+
+        results = {
+            name: value
+            for name, value in zip(_available, (_cn, _charges, _c6, _alpha))
+            if name in _selected
+        }
+        if _sparse_c6:
+            results["c6 pair indices"] = _index
+        return results
+
+    def get_pair_data(self, charges: Optional[np.ndarray] = None) -> dict:
+        """
+        Evaluate the pair data of the dispersion model which does not depend on the
+        damping parameters. Returns the C6 coefficients of the two-body and three-body
+        dispersion and the products of the r4/r2 expectation values entering the
+        critical radii of the damping function. Partial charges from another source
+        can be provided to skip the electronegativity equilibration model.
+        """
+
         _c6 = np.zeros((len(self), len(self)))
-        _cn = np.zeros((len(self)))
-        _charges = np.zeros((len(self)))
-        _alpha = np.zeros((len(self)))
+        _c6_3b = np.zeros((len(self), len(self)))
+        _rrij = np.zeros((len(self), len(self)))
 
-        library.get_properties(
+        library.get_pair_data(
             self._mol,
             self._disp,
-            _cast("double*", _cn),
-            _cast("double*", _charges),
+            _cast("double*", self._charges_array(charges, ())),
             _cast("double*", _c6),
-            _cast("double*", _alpha),
+            _cast("double*", _c6_3b),
+            _cast("double*", _rrij),
         )
 
         return {
-            "coordination numbers": _cn,
-            "partial charges": _charges,
             "c6 coefficients": _c6,
-            "polarizabilities": _alpha,
+            "three-body c6 coefficients": _c6_3b,
+            "r4r2 products": _rrij,
         }
 
-    def get_pairwise_dispersion(self, param: DampingParam) -> dict:
+    def get_pairwise_dispersion(
+        self, param: DampingParam, charges: Optional[np.ndarray] = None
+    ) -> dict:
         """
-        Evaluate pairwise representation of the dispersion energy
+        Evaluate pairwise representation of the dispersion energy, partial charges
+        from another source can be provided to skip the electronegativity
+        equilibration model.
 
         >>> from dftd4.interface import DispersionModel, DampingParam
         >>> import numpy as np
@@ -472,19 +912,513 @@ class DispersionModel(Structure):
         _pair_disp2 = np.zeros((len(self), len(self)))
         _pair_disp3 = np.zeros((len(self), len(self)))
 
-        library.get_pairwise_dispersion(
+        if charges is not None:
+            _charges = self._charges_array(charges, ())
+            library.get_pairwise_dispersion_with_charges(
+                self._mol,
+                self._disp,
+                param._param,
+                _cast("double*", _charges),
+                _cast("double*", _pair_disp2),
+                _cast("double*", _pair_disp3),
+            )
+        else:
+            library.get_pairwise_dispersion(
+                self._mol,
+                self._disp,
+                param._param,
+                _cast("double*", _pair_disp2),
+                _cast("double*", _pair_disp3),
+            )
+
+        return {
+            "additive pairwise energy": _pair_disp2,
+            "non-additive pairwise energy": _pair_disp3,
+        }
+
+    def get_fragment_dispersion(
+        self, param: DampingParam, fragment: np.ndarray, interaction: bool = False
+    ) -> dict:
+        """
+        Evaluate pairwise representation of the dispersion energy for pairs of
+        fragments. The fragment is given as zero-based index for every atom, the
+        energies are accumulated during the evaluation without forming the atom
+        pairwise matrices. If only the interaction is requested, pairs within the
+        same fragment are skipped and the diagonal of the result is zero.
+        """
+
+        _fragment = np.ascontiguousarray(fragment, dtype="i4")
+        if _fragment.shape != (len(self),):
+            raise ValueError("Dimension mismatch for fragment indices")
+        _nfrag = int(_fragment.max()) + 1
+
+        _frag_disp2 = np.zeros((_nfrag, _nfrag))
+        _frag_disp3 = np.zeros((_nfrag, _nfrag))
+
+        library.get_fragment_dispersion(
             self._mol,
             self._disp,
             param._param,
-            _cast("double*", _pair_disp2),
-            _cast("double*", _pair_disp3),
+            _nfrag,
+            _cast("int*", _fragment),
+            interaction,
+            _cast("double*", _frag_disp2),
+            _cast("double*", _frag_disp3),
         )
 
         return {
-            "additive pairwise energy": _pair_disp2,
-            "non-additive pairwise energy": _pair_disp3,
+            "additive fragment energy": _frag_disp2,
+            "non-additive fragment energy": _frag_disp3,
+        }
+
+    def get_sparse_pairwise_dispersion(
+        self, param: DampingParam, threshold: float = 0.0
+    ) -> dict:
+        """
+        Evaluate pairwise representation of the dispersion energy as sparse lists of
+        atom pairs in coordinate format. Only pairs within the real space cutoffs are
+        included and pairs with an absolute energy below the threshold are dropped.
+        Each pair is stored once with zero-based atom indices (i, j), i >= j, the
+        periodic image of atom j in units of the lattice vectors and the full pair
+        energy, such that the energies add up to the total dispersion energy.
+        """
+
+        _npair2 = library.ffi.new("int*")
+        _npair3 = library.ffi.new("int*")
+        library.get_sparse_pairwise_dispersion(
+            self._mol,
+            self._disp,
+            param._param,
+            threshold,
+            _npair2,
+            _npair3,
+        )
+
+        _index2 = np.zeros((_npair2[0], 2), dtype=np.int32)
+        _image2 = np.zeros((_npair2[0], 3), dtype=np.int32)
+        _energy2 = np.zeros((_npair2[0]))
+        _index3 = np.zeros((_npair3[0], 2), dtype=np.int32)
+        _image3 = np.zeros((_npair3[0], 3), dtype=np.int32)
+        _energy3 = np.zeros((_npair3[0]))
+        library.get_sparse_pairs(
+            self._disp,
+            _cast("int*", _index2),
+            _cast("int*", _image2),
+            _cast("double*", _energy2),
+            _cast("int*", _index3),
+            _cast("int*", _image3),
+            _cast("double*", _energy3),
+        )
+
+        return {
+            "additive pair indices": _index2,
+            "additive pair images": _image2,
+            "additive pair energies": _energy2,
+            "non-additive pair indices": _index3,
+            "non-additive pair images": _image3,
+            "non-additive pair energies": _energy3,
+        }
+
+    def get_dispersion_multi(
+        self, params: Iterable[DampingParam], grad: bool = False
+    ) -> dict:
+        """
+        Evaluate the dispersion correction for several sets of damping parameters.
+        Coordination numbers, partial charges and C6 coefficients do not depend on
+        the damping parameters and are only computed once, which makes this suitable
+        for benchmarking or fitting damping parameters on a fixed geometry.
+        Energies are returned with shape (K), gradients with shape (K, N, 3) and
+        virials with shape (K, 3, 3) for K parameter sets.
+
+        Example
+        -------
+        >>> from dftd4.interface import DampingParam, DispersionModel
+        >>> import numpy as np
+        >>> disp = DispersionModel(
+        ...     numbers=np.array([7, 7, 1, 1, 1, 1, 1, 1]),
+        ...     positions=np.array([
+        ...         [-2.983345508575, -0.088082052767, +0.000000000000],
+        ...         [+2.983345508575, +0.088082052767, +0.000000000000],
+        ...         [-4.079203605652, +0.257751166821, +1.529856562614],
+        ...         [-1.605268001556, +1.243804812431, +0.000000000000],
+        ...         [-4.079203605652, +0.257751166821, -1.529856562614],
+        ...         [+4.079203605652, -0.257751166821, -1.529856562614],
+        ...         [+1.605268001556, -1.243804812431, +0.000000000000],
+        ...         [+4.079203605652, -0.257751166821, +1.529856562614],
+        ...     ]),
+        ... )
+        >>> methods = ["pbe", "tpss", "b3lyp"]
+        >>> res = disp.get_dispersion_multi(
+        ...     [DampingParam(method=method) for method in methods]
+        ... )
+        >>> energies = dict(zip(methods, res["energy"]))
+
+        Raises
+        ------
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        _params = list(params)
+        _handles = library.ffi.new("dftd4_param[]", [par._param for par in _params])
+
+        _energy = np.zeros((len(_params)))
+        if grad:
+            _gradient = np.zeros((len(_params), len(self), 3))
+            _sigma = np.zeros((len(_params), 3, 3))
+        else:
+            _gradient = None
+            _sigma = None
+
+        library.get_dispersion_multi(
+            self._mol,
+            self._disp,
+            len(_params),
+            _handles,
+            _cast("double*", _energy),
+            _cast("double*", _gradient),
+            _cast("double*", _sigma),
+        )
+
+        results = dict(energy=_energy)
+        if _gradient is not None:
+            results.update(gradient=_gradient)
+        if _sigma is not None:
+            results.update(virial=_sigma)
+        return results
+
+    def get_dispersion_images(
+        self,
+        param: DampingParam,
+        positions: np.ndarray,
+        lattices: Optional[np.ndarray] = None,
+        grad: bool = False,
+    ) -> dict:
+        """
+        Evaluate the dispersion correction for several images of this structure,
+        like the images of a nudged elastic band, in a single library call.
+        Positions of K images are provided with shape (K, N, 3) and lattices with
+        shape (K, 3, 3), all in atomic units (Bohr). The lattice of the structure is
+        used for all images if no lattices are provided. Energies are returned
+        with shape (K), gradients with shape (K, N, 3) and virials with shape
+        (K, 3, 3).
+
+        Raises
+        ------
+        ValueError
+            on invalid input, like incorrect shape / type of the passed arrays
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        _positions = np.ascontiguousarray(positions, dtype=float)
+        if _positions.ndim != 3 or _positions.shape[1:] != (len(self), 3):
+            raise ValueError("Dimension mismatch for positions of images")
+        nimg = _positions.shape[0]
+
+        if lattices is not None:
+            _lattices = np.ascontiguousarray(lattices, dtype=float)
+            if _lattices.shape != (nimg, 3, 3):
+                raise ValueError("Dimension mismatch for lattices of images")
+        else:
+            _lattices = None
+
+        _energy = np.zeros((nimg))
+        if grad:
+            _gradient = np.zeros((nimg, len(self), 3))
+            _sigma = np.zeros((nimg, 3, 3))
+        else:
+            _gradient = None
+            _sigma = None
+
+        library.get_dispersion_images(
+            self._mol,
+            self._disp,
+            param._param,
+            nimg,
+            _cast("double*", _positions),
+            _cast("double*", _lattices),
+            _cast("double*", _energy),
+            _cast("double*", _gradient),
+            _cast("double*", _sigma),
+        )
+
+        results = dict(energy=_energy)
+        if _gradient is not None:
+            results.update(gradient=_gradient, virial=_sigma)
+        return results
+
+    def evaluate(
+        self, param: DampingParam, outputs: Optional[Iterable[str]] = None
+    ) -> dict:
+        """
+        Evaluate any combination of dispersion energy, derivatives, properties and
+        pairwise energies in a single pass, coordination numbers, partial charges
+        and C6 coefficients are only computed once for all requested outputs.
+        The energy is always returned, further outputs are ``gradient``,
+        ``virial``, ``two-body energy``, ``three-body energy``, ``atomic energies``,
+        ``coordination numbers``, ``partial charges``, ``c6 coefficients``,
+        ``polarizabilities``, ``additive pairwise energy``,
+        ``non-additive pairwise energy`` and ``atomic virials``.
+
+        Example
+        -------
+        >>> from dftd4.interface import DampingParam, DispersionModel
+        >>> import numpy as np
+        >>> disp = DispersionModel(
+        ...     numbers=np.array([7, 7, 1, 1, 1, 1, 1, 1]),
+        ...     positions=np.array([
+        ...         [-2.983345508575, -0.088082052767, +0.000000000000],
+        ...         [+2.983345508575, +0.088082052767, +0.000000000000],
+        ...         [-4.079203605652, +0.257751166821, +1.529856562614],
+        ...         [-1.605268001556, +1.243804812431, +0.000000000000],
+        ...         [-4.079203605652, +0.257751166821, -1.529856562614],
+        ...         [+4.079203605652, -0.257751166821, -1.529856562614],
+        ...         [+1.605268001556, -1.243804812431, +0.000000000000],
+        ...         [+4.079203605652, -0.257751166821, +1.529856562614],
+        ...     ]),
+        ... )
+        >>> res = disp.evaluate(
+        ...     DampingParam(method="tpss"),
+        ...     outputs={"atomic energies", "additive pairwise energy"},
+        ... )
+        >>> res["additive pairwise energy"].sum()
+        -0.0023605238432524104
+
+        Raises
+        ------
+        ValueError
+            in case an unknown output is requested
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        nat = len(self)
+        shapes = {
+            "gradient": (nat, 3),
+            "virial": (3, 3),
+            "two-body energy": (),
+            "three-body energy": (),
+            "atomic energies": (nat,),
+            "coordination numbers": (nat,),
+            "partial charges": (nat,),
+            "c6 coefficients": (nat, nat),
+            "polarizabilities": (nat,),
+            "additive pairwise energy": (nat, nat),
+            "non-additive pairwise energy": (nat, nat),
+            "atomic virials": (nat, 3, 3),
         }
 
+        requested = set(outputs) if outputs is not None else set()
+        unknown = requested - set(shapes) - {"energy"}
+        if unknown:
+            raise ValueError(f"Unknown output '{sorted(unknown)[0]}' requested")
+
+        results = {key: np.zeros(shapes[key]) for key in shapes if key in requested}
+        _energy = np.array(0.0)
+
+        library.get_dispersion_results(
+            self._mol,
+            self._disp,
+            param._param,
+            _cast("double*", _energy),
+            *(_cast("double*", results.get(key)) for key in shapes),
+        )
+
+        return dict(energy=_energy, **results)
+
+    def get_hessian(
+        self,
+        param: DampingParam,
+        atoms: Optional[np.ndarray] = None,
+        compact: bool = False,
+    ) -> np.ndarray:
+        """
+        Evaluate the dispersion hessian by numerical differentiation of the gradient.
+
+        Without a selection the full hessian of shape (N, 3, N, 3) is returned.
+        If zero-based atom indices are provided, only those k atoms are displaced
+        and a block of shape (k, 3, N, 3) is returned, or (k, 3, k, 3) if only
+        the rows of the selected atoms are requested with ``compact``.
+
+        Raises
+        ------
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        if atoms is None:
+            _hessian = np.zeros((len(self), 3, len(self), 3))
+            library.get_numerical_hessian(
+                self._mol,
+                self._disp,
+                param._param,
+                _cast("double*", _hessian),
+            )
+            return _hessian
+
+        _atoms = np.ascontiguousarray(atoms, dtype="i4").reshape(-1)
+        _hessian = np.zeros((_atoms.size, 3, len(self), 3))
+        library.get_numerical_hessian_atoms(
+            self._mol,
+            self._disp,
+            param._param,
+            _atoms.size,
+            _cast("int*", _atoms),
+            _cast("double*", _hessian),
+        )
+
+        if compact:
+            return np.ascontiguousarray(_hessian[:, :, _atoms, :])
+        return _hessian
+
+    def get_hessian_columns(
+        self, param: DampingParam, start: int, stop: int
+    ) -> np.ndarray:
+        """
+        Evaluate a range of columns of the dispersion hessian numerically.
+
+        Columns enumerate the cartesian displacements of all atoms as
+        ``3 * atom + direction``, the columns ``start`` to ``stop`` (exclusive)
+        are returned as array of shape (stop - start, N, 3).
+
+        Raises
+        ------
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        _hessian = np.zeros((max(stop - start, 0), len(self), 3))
+        library.get_numerical_hessian_columns(
+            self._mol,
+            self._disp,
+            param._param,
+            start,
+            stop - start,
+            _cast("double*", _hessian),
+        )
+        return _hessian
+
+    def _charges_array(self, array: Optional[np.ndarray], shape: tuple):
+        """Check externally supplied partial charges or their derivatives"""
+
+        if array is None:
+            return None
+        _array = np.ascontiguousarray(array, dtype="float")
+        if _array.shape != (len(self), *shape):
+            raise ValueError("Dimension mismatch for partial charges")
+        return _array
+
+
+class EEQSolver:
+    """
+    .. Electronegativity equilibration solver
+
+    Standalone iterative solver for partial charges from the electronegativity
+    equilibration of Gaussian charge distributions. Electronegativity, hardness
+    and Gaussian width are supplied by the user, the solver is not used by the
+    dispersion models, which obtain their default charges with coordination number
+    dependent electronegativities.
+    The charges of the previous call are used as starting guess.
+
+    Raises
+    ------
+    RuntimeError
+        on invalid solver parameters
+    """
+
+    _solver = library.ffi.NULL
+
+    def __init__(
+        self, cutoff: float = 40.0, conv: float = 1.0e-10, max_iter: int = 1000
+    ):
+        """Create new electronegativity equilibration solver"""
+
+        self._solver = library.new_eeq_solver(cutoff, conv, max_iter)
+
+    def solve(
+        self,
+        mol: Structure,
+        chi: np.ndarray,
+        eta: np.ndarray,
+        rad: np.ndarray,
+        dedq: Optional[np.ndarray] = None,
+    ) -> dict:
+        """
+        Solve the electronegativity equilibration for the current geometry of
+        a structure. Electronegativity, hardness and Gaussian width are given for
+        each atom, hardness and width must be equal for atoms of the same species.
+        With the derivative of an energy w.r.t. the charges, the gradient and virial
+        of this energy due to the response of the charges are returned as well,
+        the electronegativities are considered fixed.
+
+        Raises
+        ------
+        ValueError
+            on dimension mismatch of the passed arrays
+        RuntimeError
+            in case the solver does not converge
+        """
+
+        _chi = _atomic_array(chi, len(mol))
+        _eta = _atomic_array(eta, len(mol))
+        _rad = _atomic_array(rad, len(mol))
+        _dedq = _atomic_array(dedq, len(mol))
+
+        _charges = np.zeros((len(mol)))
+        if _dedq is not None:
+            _gradient = np.zeros((len(mol), 3))
+            _sigma = np.zeros((3, 3))
+        else:
+            _gradient = None
+            _sigma = None
+
+        library.solve_eeq(
+            self._solver,
+            mol._mol,
+            _cast("double*", _chi),
+            _cast("double*", _eta),
+            _cast("double*", _rad),
+            _cast("double*", _charges),
+            _cast("double*", _dedq),
+            _cast("double*", _gradient),
+            _cast("double*", _sigma),
+        )
+
+        results = dict(charges=_charges)
+        if _dedq is not None:
+            results.update(gradient=_gradient, virial=_sigma)
+        return results
+
+
+def prewarm_reference_cache(
+    numbers: np.ndarray, ga: float = 3.0, gc: float = 2.0
+) -> None:
+    """
+    Precompute the reference C6 coefficients for all pairs of the given elements.
+    The reference data is kept in a process wide cache, dispersion models created
+    afterwards with the same charge scaling parameters only gather the data.
+
+    Raises
+    ------
+    RuntimeError
+        in case an invalid atomic number is provided
+    """
+
+    _numbers = np.ascontiguousarray(np.unique(numbers), dtype="i4")
+    library.prewarm_reference_cache(_numbers, ga, gc)
+
+
+def _atomic_array(array: Optional[np.ndarray], natoms: int):
+    """Check an array with one entry per atom"""
+
+    if array is None:
+        return None
+    _array = np.ascontiguousarray(array, dtype="float")
+    if _array.shape != (natoms,):
+        raise ValueError("Dimension mismatch for atomic array")
+    return _array
+
 
 def _cast(ctype, array):
     """Cast a numpy array to a FFI pointer"""
@@ -132,6 +132,13 @@ def custom_d4s_model(mol, ga, gc):
     return ffi.gc(error_check(lib.dftd4_custom_d4s_model)(mol, ga, gc), _delete_model)
 
 
+def prewarm_reference_cache(numbers, ga: float, gc: float) -> None:
+    """Precompute reference C6 coefficients for all pairs of elements"""
+    error_check(lib.dftd4_prewarm_reference_cache)(
+        len(numbers), ffi.cast("int*", numbers.ctypes.data), ga, gc
+    )
+
+
 def _delete_param(error) -> None:
     """Delete a dftd4 damping parameter object"""
     ptr = ffi.new("dftd4_param *")
@@ -155,6 +162,21 @@ def load_rational_damping(method, mbd):
     )
 
 
+def _delete_eeq_solver(solver) -> None:
+    """Delete a dftd4 electronegativity equilibration solver object"""
+    ptr = ffi.new("dftd4_eeq_solver *")
+    ptr[0] = solver
+    lib.dftd4_delete_eeq_solver(ptr)
+
+
+def new_eeq_solver(cutoff: float, conv: float, max_iter: int):
+    """Create new dftd4 electronegativity equilibration solver object"""
+    return ffi.gc(
+        error_check(lib.dftd4_new_eeq_solver)(cutoff, conv, max_iter),
+        _delete_eeq_solver,
+    )
+
+
 def set_model_realspace_cutoff(disp, disp2, disp3, cn, width2=0.0, width3=0.0) -> None:
     """Set the realspace cutoff for the dispersion model"""
     return error_check(lib.dftd4_set_model_realspace_cutoff_smooth)(
@@ -167,10 +189,66 @@ def set_model_work_partition(disp, part: int, nparts: int) -> None:
     error_check(lib.dftd4_set_model_work_partition)(disp, part, nparts)
 
 
+def set_model_work_partition_scheme(
+    mol, disp, part: int, nparts: int, scheme: int
+) -> None:
+    """Assign a part of the interaction loops balanced by the cost of the atoms"""
+    error_check(lib.dftd4_set_model_work_partition_scheme)(
+        mol, disp, part, nparts, scheme
+    )
+
+
+def set_model_tail_correction(disp, tail: bool) -> None:
+    """Enable the long-range tail correction beyond the two-body cutoff"""
+    error_check(lib.dftd4_set_model_tail_correction)(disp, tail)
+
+
+def set_model_realspace_cutoff_tolerance(disp, tolerance: float) -> None:
+    """Select the realspace cutoffs per species pair from an energy error per atom"""
+    error_check(lib.dftd4_set_model_realspace_cutoff_tolerance)(disp, tolerance)
+
+
+def set_model_mixed_precision(disp, mixed: bool) -> None:
+    """Evaluate the interaction kernels in mixed precision"""
+    error_check(lib.dftd4_set_model_mixed_precision)(disp, mixed)
+
+
+def set_model_symmetry(disp, symmetry: bool) -> None:
+    """Evaluate the interaction kernels only for symmetry-unique atoms"""
+    error_check(lib.dftd4_set_model_symmetry)(disp, symmetry)
+
+
 update_structure = error_check(lib.dftd4_update_structure)
 get_dispersion = error_check(lib.dftd4_get_dispersion)
+get_dispersion_with_charges = error_check(lib.dftd4_get_dispersion_with_charges)
 get_pairwise_dispersion = error_check(lib.dftd4_get_pairwise_dispersion)
+get_pairwise_dispersion_with_charges = error_check(
+    lib.dftd4_get_pairwise_dispersion_with_charges
+)
+get_fragment_dispersion = error_check(lib.dftd4_get_fragment_dispersion)
+get_sparse_pairwise_dispersion = error_check(lib.dftd4_get_sparse_pairwise_dispersion)
+get_sparse_pairs = error_check(lib.dftd4_get_sparse_pairs)
 get_properties = error_check(lib.dftd4_get_properties)
+get_properties_with_charges = error_check(lib.dftd4_get_properties_with_charges)
+get_pair_data = error_check(lib.dftd4_get_pair_data)
+get_sparse_c6 = error_check(lib.dftd4_get_sparse_c6)
+get_sparse_c6_pairs = error_check(lib.dftd4_get_sparse_c6_pairs)
+get_realspace_cutoff_error = error_check(lib.dftd4_get_realspace_cutoff_error)
+solve_eeq = error_check(lib.dftd4_solve_eeq)
+get_dispersion_results = error_check(lib.dftd4_get_dispersion_results)
+get_dispersion_multi = error_check(lib.dftd4_get_dispersion_multi)
+get_dispersion_images = error_check(lib.dftd4_get_dispersion_images)
+get_numerical_hessian = error_check(lib.dftd4_get_numerical_hessian)
+get_numerical_hessian_atoms = error_check(lib.dftd4_get_numerical_hessian_atoms)
+get_numerical_hessian_columns = error_check(lib.dftd4_get_numerical_hessian_columns)
+new_incremental = error_check(lib.dftd4_new_incremental)
+propose_displacement = error_check(lib.dftd4_propose_displacement)
+propose_insertion = error_check(lib.dftd4_propose_insertion)
+propose_deletion = error_check(lib.dftd4_propose_deletion)
+finish_move = error_check(lib.dftd4_finish_move)
+set_model_embedding = error_check(lib.dftd4_set_model_embedding)
+refresh_embedding = error_check(lib.dftd4_refresh_embedding)
+get_embedded_dispersion = error_check(lib.dftd4_get_embedded_dispersion)
 
 
 def _ref(ctype, value):
@@ -0,0 +1,436 @@
+# This file is part of dftd4.
+# SPDX-Identifier: LGPL-3.0-or-later
+#
+# dftd4 is free software: you can redistribute it and/or modify it under
+# the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# dftd4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Process parallel driver
+-----------------------
+
+Distribute a dispersion calculation over a persistent pool of worker processes
+on a single node. Every worker holds its own dispersion model, which evaluates
+one part of the work partition, see :meth:`DispersionModel.set_work_partition`.
+
+The geometry and the partial results are exchanged through one shared memory
+block. Updates of positions and lattice are written to the shared block and
+only a short command is sent to the workers. Every worker writes its energy,
+gradient and virial into its own slot of the shared block, which are summed up
+by the driver without pickling any arrays. The pool is kept alive between
+evaluations, which makes the driver suitable for geometry optimizations and
+molecular dynamics.
+
+Each worker runs the OpenMP parallel kernels of the library, therefore the
+number of threads per worker should be limited with the ``threads`` argument
+to avoid oversubscribing the cores.
+
+Example
+-------
+>>> from dftd4.interface import DampingParam
+>>> from dftd4.parallel import ParallelDispersion
+>>> import numpy as np
+>>> numbers = np.array([8, 1, 1])
+>>> positions = np.array([
+...     [+0.00000000000000, +0.00000000000000, -0.73578586109551],
+...     [+1.44183152868459, +0.00000000000000, +0.36789293054775],
+...     [-1.44183152868459, +0.00000000000000, +0.36789293054775],
+... ])
+>>> with ParallelDispersion(numbers, positions, nprocs=2, threads=1) as disp:
+...     res = disp.get_dispersion(DampingParam(method="pbe"), grad=True)
+...     disp.update(positions * 1.01)
+...     res = disp.get_dispersion(DampingParam(method="pbe"), grad=True)
+"""
+
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from .interface import DampingParam, DispersionModel
+
+_SETTINGS = (
+    "set_realspace_cutoff",
+    "set_realspace_cutoff_tolerance",
+    "set_tail_correction",
+    "set_mixed_precision",
+    "set_symmetry",
+)
+
+
+def _slot_size(natoms: int) -> int:
+    """Size of the result slot of a worker: energy, gradient, virial, atomic
+    energies and atomic virials"""
+    return 1 + 3 * natoms + 9 + natoms + 9 * natoms
+
+
+def _buffer_views(
+    buffer, natoms: int, nprocs: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Map positions, lattice and result slots onto the shared memory block"""
+
+    data = np.ndarray(
+        (3 * natoms + 9 + nprocs * _slot_size(natoms),), dtype=float, buffer=buffer
+    )
+    positions = data[: 3 * natoms].reshape(natoms, 3)
+    lattice = data[3 * natoms : 3 * natoms + 9].reshape(3, 3)
+    results = data[3 * natoms + 9 :].reshape(nprocs, _slot_size(natoms))
+    return positions, lattice, results
+
+
+def _store_results(slot: np.ndarray, res: dict, natoms: int) -> None:
+    """Write the results of a worker into its slot of the shared memory block"""
+
+    n3 = 3 * natoms
+    slot[:] = 0.0
+    slot[0] = res["energy"]
+    if "gradient" in res:
+        slot[1 : 1 + n3] = res["gradient"].reshape(-1)
+        slot[1 + n3 : 10 + n3] = res["virial"].reshape(-1)
+    if "energies" in res:
+        slot[10 + n3 : 10 + n3 + natoms] = res["energies"]
+    if "virials" in res:
+        slot[10 + n3 + natoms :] = res["virials"].reshape(-1)
+
+
+def _worker(
+    conn,
+    name: str,
+    part: int,
+    nprocs: int,
+    numbers: np.ndarray,
+    charge: Optional[float],
+    periodic: Optional[np.ndarray],
+    has_lattice: bool,
+    model: str,
+    scheme: str,
+    kwargs: dict,
+) -> None:
+    """Event loop of a worker process, every command is answered with either
+    None or the exception raised while handling it"""
+
+    natoms = len(numbers)
+    shm = shared_memory.SharedMemory(name=name)
+    positions, lattice, results = _buffer_views(shm.buf, natoms, nprocs)
+    try:
+        try:
+            disp = DispersionModel(
+                numbers,
+                positions.copy(),
+                charge,
+                lattice.copy() if has_lattice else None,
+                periodic,
+                model=model,
+                **kwargs,
+            )
+            disp.set_work_partition(part, nprocs, scheme)
+        except Exception as e:  # pylint: disable=broad-except
+            conn.send(e)
+            return
+        conn.send(None)
+
+        params = {}
+        while True:
+            command, args = conn.recv()
+            if command == "close":
+                break
+            try:
+                if command == "update":
+                    disp.update(positions, lattice if args[0] else None)
+                elif command == "rebalance":
+                    disp.set_work_partition(part, nprocs, scheme)
+                elif command == "get_dispersion":
+                    param, grad, atomic = args
+                    key = tuple(sorted(param.items()))
+                    if key not in params:
+                        params[key] = DampingParam(**param)
+                    res = disp.get_dispersion(params[key], grad, atomic=atomic)
+                    _store_results(results[part], res, natoms)
+                elif command in _SETTINGS:
+                    getattr(disp, command)(*args)
+                else:
+                    raise ValueError(f"Unknown command '{command}'")
+                conn.send(None)
+            except Exception as e:  # pylint: disable=broad-except
+                conn.send(e)
+    finally:
+        del positions, lattice, results
+        shm.close()
+        conn.close()
+
+
+class ParallelDispersion:
+    """
+    Dispersion model evaluated by a persistent pool of worker processes.
+
+    The driver provides the evaluation and update methods of
+    :class:`~dftd4.interface.DispersionModel` and can be used in its place.
+    Every worker evaluates one part of the work partition and the partial
+    results are summed up in shared memory. Atom-resolved results are not
+    partitioned and are evaluated by the first worker only.
+
+    The work is assigned to the workers with the given partition scheme, see
+    :meth:`DispersionModel.set_work_partition <dftd4.interface.DispersionModel.set_work_partition>`.
+    The spatial and cost-weighted schemes are balanced for the initial structure
+    and can be rebalanced with :meth:`rebalance` during long simulations.
+
+    The pool is shut down with :meth:`close`, or when used as context manager.
+
+    Raises
+    ------
+    ValueError
+        on invalid input, like incorrect shape / type of the passed arrays
+    RuntimeError
+        in case a worker cannot construct its dispersion model or terminates
+    """
+
+    _shm = None
+
+    def __init__(
+        self,
+        numbers: np.ndarray,
+        positions: np.ndarray,
+        charge: Optional[float] = None,
+        lattice: Optional[np.ndarray] = None,
+        periodic: Optional[np.ndarray] = None,
+        model: str = "d4",
+        nprocs: Optional[int] = None,
+        threads: Optional[int] = None,
+        scheme: str = "cyclic",
+        **kwargs,
+    ):
+        """Start the worker processes and create their dispersion models"""
+
+        if 3 * numbers.size != positions.size:
+            raise ValueError("Dimension mismatch for positions")
+        if lattice is not None and lattice.size != 9:
+            raise ValueError("Invalid lattice provided")
+
+        self._natoms = numbers.size
+        self._nprocs = nprocs if nprocs is not None else os.cpu_count() or 1
+        if self._nprocs < 1:
+            raise ValueError("At least one worker process is required")
+
+        size = 3 * self._natoms + 9 + self._nprocs * _slot_size(self._natoms)
+        self._shm = shared_memory.SharedMemory(create=True, size=8 * size)
+        self._positions, self._lattice, self._results = _buffer_views(
+            self._shm.buf, self._natoms, self._nprocs
+        )
+        self._positions[:, :] = positions.reshape(-1, 3)
+        self._lattice[:, :] = lattice.reshape(3, 3) if lattice is not None else 0.0
+
+        # The OpenMP runtime reads the number of threads when the library is
+        # loaded in the worker, which inherits the environment at start up
+        context = multiprocessing.get_context("spawn")
+        environ = os.environ.get("OMP_NUM_THREADS")
+        if threads is not None:
+            os.environ["OMP_NUM_THREADS"] = str(threads)
+        self._conns, self._procs = [], []
+        try:
+            for part in range(self._nprocs):
+                conn, child = context.Pipe()
+                proc = context.Process(
+                    target=_worker,
+                    args=(
+                        child,
+                        self._shm.name,
+                        part,
+                        self._nprocs,
+                        numbers,
+                        charge,
+                        periodic,
+                        lattice is not None,
+                        model,
+                        scheme,
+                        kwargs,
+                    ),
+                    daemon=True,
+                )
+                proc.start()
+                child.close()
+                self._conns.append(conn)
+                self._procs.append(proc)
+        finally:
+            if threads is not None:
+                if environ is None:
+                    del os.environ["OMP_NUM_THREADS"]
+                else:
+                    os.environ["OMP_NUM_THREADS"] = environ
+
+        try:
+            self._wait(range(self._nprocs))
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return self._natoms
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _wait(self, parts: Iterable[int]) -> None:
+        """Collect the answers of the workers and raise the first error"""
+
+        error = None
+        for part in parts:
+            try:
+                answer = self._conns[part].recv()
+            except EOFError:
+                answer = RuntimeError("Worker process terminated unexpectedly")
+            if error is None and answer is not None:
+                error = answer
+        if error is not None:
+            raise error
+
+    def _broadcast(self, command: str, *args) -> None:
+        """Send a command to all workers and wait for its completion"""
+
+        if self._shm is None:
+            raise RuntimeError("Worker processes are already shut down")
+        for conn in self._conns:
+            conn.send((command, args))
+        self._wait(range(self._nprocs))
+
+    def close(self) -> None:
+        """Shut down the worker processes and release the shared memory"""
+
+        if self._shm is None:
+            return
+
+        for conn in self._conns:
+            try:
+                conn.send(("close", ()))
+            except OSError:
+                pass
+        for proc in self._procs:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+        for conn in self._conns:
+            conn.close()
+
+        del self._positions, self._lattice, self._results
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def update(
+        self,
+        positions: np.ndarray,
+        lattice: Optional[np.ndarray] = None,
+    ) -> None:
+        """Update coordinates and lattice parameters of all workers, both provided
+        in atomic units (Bohr).
+
+        Raises
+        ------
+        ValueError
+            on invalid input, like incorrect shape / type of the passed arrays
+        """
+
+        if 3 * len(self) != positions.size:
+            raise ValueError("Dimension mismatch for positions")
+        if lattice is not None and lattice.size != 9:
+            raise ValueError("Invalid lattice provided")
+        if self._shm is None:
+            raise RuntimeError("Worker processes are already shut down")
+
+        self._positions[:, :] = positions.reshape(-1, 3)
+        if lattice is not None:
+            self._lattice[:, :] = lattice.reshape(3, 3)
+        self._broadcast("update", lattice is not None)
+
+    def rebalance(self) -> None:
+        """Recompute the assignment of the atoms for the current structure and
+        cutoffs, only effective for the spatial and cost-weighted schemes."""
+
+        self._broadcast("rebalance")
+
+    def set_realspace_cutoff(
+        self,
+        disp2: float,
+        disp3: float,
+        cn: float,
+        width2: float = 0.0,
+        width3: float = 0.0,
+    ) -> None:
+        """Set realspace cutoffs and optional smoothing widths for all workers."""
+
+        self._broadcast("set_realspace_cutoff", disp2, disp3, cn, width2, width3)
+
+    def set_realspace_cutoff_tolerance(self, tolerance: float) -> None:
+        """Select the realspace cutoffs per species pair from a tolerance for the
+        truncation error of the energy per atom in Hartree for all workers."""
+
+        self._broadcast("set_realspace_cutoff_tolerance", tolerance)
+
+    def set_tail_correction(self, tail: bool = True) -> None:
+        """Add the long-range tail correction in all workers."""
+
+        self._broadcast("set_tail_correction", tail)
+
+    def set_mixed_precision(self, mixed: bool = True) -> None:
+        """Evaluate the interaction kernels in single precision in all workers."""
+
+        self._broadcast("set_mixed_precision", mixed)
+
+    def set_symmetry(self, symmetry: bool = True) -> None:
+        """Evaluate only symmetry-unique atoms in all workers."""
+
+        self._broadcast("set_symmetry", symmetry)
+
+    def get_dispersion(
+        self,
+        param: DampingParam,
+        grad: bool,
+        atomic: bool = False,
+    ) -> dict:
+        """
+        Evaluate the dispersion correction with all workers and sum up their
+        results, the returned dictionary has the same entries as for
+        :meth:`DispersionModel.get_dispersion <dftd4.interface.DispersionModel.get_dispersion>`.
+
+        Raises
+        ------
+        RuntimeError
+            in case the calculation fails in the library
+        """
+
+        if self._shm is None:
+            raise RuntimeError("Worker processes are already shut down")
+
+        parts = [0] if atomic else list(range(self._nprocs))
+        for part in parts:
+            self._conns[part].send(("get_dispersion", (param._kwargs, grad, atomic)))
+        self._wait(parts)
+
+        nat, n3 = self._natoms, 3 * self._natoms
+        total = np.add.reduce(self._results[parts], axis=0)
+        results = dict(energy=np.array(total[0]))
+        if grad:
+            results.update(
+                gradient=total[1 : 1 + n3].reshape(nat, 3),
+                virial=total[1 + n3 : 10 + n3].reshape(3, 3),
+            )
+        if atomic:
+            results.update(energies=total[10 + n3 : 10 + n3 + nat])
+            if grad:
+                results.update(virials=total[10 + n3 + nat :].reshape(nat, 3, 3))
+        return results
@@ -256,12 +256,21 @@ def run_qcschema(input_data):
         )
 
         driver = input_driver
-        res = disp.get_dispersion(
-            param=param,
-            grad=driver == "gradient",
-        )
+        outputs = set()
+        if driver == "gradient":
+            outputs.update(("gradient", "virial"))
         if input_keywords.get("property", False):
-            res.update(**disp.get_properties())
+            outputs.update(
+                (
+                    "coordination numbers",
+                    "partial charges",
+                    "c6 coefficients",
+                    "polarizabilities",
+                )
+            )
+        if input_keywords.get("pair_resolved", False):
+            outputs.update(("additive pairwise energy", "non-additive pairwise energy"))
+        res = disp.evaluate(param=param, outputs=outputs)
         extras = {"dftd4": res}
 
         if driver == "gradient":
@@ -274,10 +283,6 @@ def run_qcschema(input_data):
 
         properties.update(return_energy=res.get("energy"))
 
-        if input_keywords.get("pair_resolved", False):
-            res = disp.get_pairwise_dispersion(param=param)
-            extras["dftd4"].update(res)
-
         success = driver in _supported_drivers
         if driver == "energy":
             return_result = properties["return_energy"]
@@ -21,9 +21,9 @@ import numpy as np
 from pytest import approx, mark
 
 try:
-    from ase.build import molecule
+    from ase.build import bulk, molecule
     from ase.calculators.emt import EMT
-    from dftd4.ase import DFTD4
+    from dftd4.ase import DFTD4, DFTD4Batch
 
     has_ase = True
 except ModuleNotFoundError:
@@ -149,3 +149,66 @@ def test_ase_tpssd4() -> None:
         -0.24206732765720396,
         5.106083814008478,
     ]
+
+
+def test_ase_atomic_stresses() -> None:
+    thr = 1.0e-10
+
+    atoms = bulk("Si", cubic=True)
+    atoms.calc = DFTD4(method="PBE")
+
+    energies = atoms.get_potential_energies()
+    stresses = atoms.get_stresses()
+    assert stresses.shape == (len(atoms), 6)
+    assert approx(energies.sum(), abs=thr) == atoms.get_potential_energy()
+    assert approx(stresses.sum(axis=0), abs=thr) == atoms.get_stress()
+
+
+def test_ase_lazy_properties() -> None:
+    thr = 1.0e-10
+
+    atoms = molecule("H2O")
+    atoms.calc = DFTD4(method="PBE")
+
+    energy = atoms.get_potential_energy()
+    assert "forces" not in atoms.calc.results
+    assert "stress" not in atoms.calc.results
+
+    forces = atoms.get_forces()
+    assert approx(atoms.get_potential_energy(), abs=thr) == energy
+    assert "stress" not in atoms.calc.results
+
+    atoms.calc.set(method="TPSS")
+    assert approx(atoms.get_potential_energy(), abs=thr) != energy
+
+    atoms.calc.set(method="PBE")
+    assert approx(atoms.get_potential_energy(), abs=thr) == energy
+    assert approx(atoms.get_forces(), abs=thr) == forces
+
+
+def test_ase_batch_images() -> None:
+    thr = 1.0e-10
+
+    images = [bulk("Si", cubic=True) for _ in range(3)]
+    for ii, atoms in enumerate(images):
+        atoms.set_cell(atoms.cell * (1.0 + 0.01 * ii), scale_atoms=True)
+        atoms.positions[0] += 0.05 * ii
+    batch = DFTD4Batch(images, method="PBE")
+
+    for atoms in images:
+        ref = atoms.copy()
+        ref.calc = DFTD4(method="PBE")
+        energy = ref.get_potential_energy()
+        assert approx(atoms.get_potential_energy(), abs=thr) == energy
+        assert approx(atoms.get_forces(), abs=thr) == ref.get_forces()
+        assert approx(atoms.get_stress(), abs=thr) == ref.get_stress()
+
+    images[1].positions[1] -= 0.05
+    ref = images[1].copy()
+    ref.calc = DFTD4(method="PBE")
+    assert approx(images[1].get_forces(), abs=thr) == ref.get_forces()
+
+    batch.set(method="TPSS")
+    ref.calc = DFTD4(method="TPSS")
+    energy = ref.get_potential_energy()
+    assert approx(images[1].get_potential_energy(), abs=thr) == energy
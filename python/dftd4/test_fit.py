@@ -0,0 +1,114 @@
+# This file is part of dftd4.
+# SPDX-Identifier: LGPL-3.0-or-later
+#
+# dftd4 is free software: you can redistribute it and/or modify it under
+# the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# dftd4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+from pytest import approx, raises
+
+from dftd4.fit import (
+    PARAMETERS,
+    FitSet,
+    FitStructure,
+    fit_damping_param,
+    format_parameters,
+)
+from dftd4.interface import DampingParam, DispersionModel
+
+numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+positions = np.array(
+    [
+        [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+        [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+        [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+        [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+        [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+        [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+        [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+    ]
+)
+
+param = {"s6": 0.9, "s8": 1.3, "s9": 1.0, "a1": 0.45, "a2": 3.1}
+
+
+def test_fit_energy() -> None:
+    """Energies from the pair data must match the dispersion model"""
+
+    data = FitSet([FitStructure(numbers, positions * scale) for scale in (0.9, 1.2)])
+    res = data.get_energy(param)
+
+    for ii, scale in enumerate((0.9, 1.2)):
+        model = DispersionModel(numbers, positions * scale)
+        ref = model.get_dispersion(DampingParam(**param), grad=False)
+        assert res["energy"][ii] == approx(ref["energy"], abs=1.0e-12)
+
+
+def test_fit_derivatives() -> None:
+    """Analytic parameter derivatives must match finite differences"""
+
+    step = 1.0e-6
+    data = FitSet([FitStructure(numbers, positions)])
+    res = data.get_energy(param, grad=True)
+
+    for ip, name in enumerate(PARAMETERS):
+        pp, pm = param.copy(), param.copy()
+        pp[name] += step
+        pm[name] -= step
+        num = (data.get_energy(pp)["energy"] - data.get_energy(pm)["energy"]) / (
+            2 * step
+        )
+        assert res["derivatives"][:, ip] == approx(num, abs=1.0e-9)
+
+
+def test_fit_recover() -> None:
+    """Parameters used to generate the reference values must be recovered"""
+
+    structures = [FitStructure(numbers, positions * scale) for scale in (0.9, 1.0, 1.2)]
+    reference = FitSet(structures).get_energy(param)["energy"]
+
+    res = fit_damping_param(
+        structures,
+        reference,
+        initial={"s6": 0.9, "s8": 1.0, "a1": 0.4, "a2": 4.0},
+    )
+    for name in ("s8", "a1", "a2"):
+        assert res[name] == approx(param[name], abs=1.0e-6)
+    assert res["s6"] == param["s6"]
+
+    with raises(ValueError, match="Unknown damping parameter"):
+        fit_damping_param(structures, reference, fit=("s10",))
+
+    with raises(ValueError, match="Dimension mismatch"):
+        fit_damping_param(structures, reference[:2])
+
+
+def test_format_parameters() -> None:
+    """Fitted parameters are written in the format of the parameter data base"""
+
+    entry = format_parameters("Test", {"s8": 1.0, "a1": 0.4, "a2": 5.0, "s9": 1.0})
+    assert entry == (
+        "[parameter.test]\n"
+        "d4.bj-eeq-atm = { s8=1.00000000, a1=0.40000000, a2=5.00000000 }\n"
+    )
+
+    entry = format_parameters(
+        "test", {"s6": 0.64, "s8": 1.0, "a1": 0.4, "a2": 5.0}, variant="bj-eeq-two"
+    )
+    assert entry == (
+        "[parameter.test]\n"
+        "d4.bj-eeq-two = { s6=0.64000000, s8=1.00000000, a1=0.40000000, a2=5.00000000 }\n"
+    )
+
+    with raises(ValueError, match="Unknown damping parameter variant"):
+        format_parameters("test", param, variant="zero")
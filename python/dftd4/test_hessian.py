@@ -0,0 +1,121 @@
+# This file is part of dftd4.
+# SPDX-Identifier: LGPL-3.0-or-later
+#
+# dftd4 is free software: you can redistribute it and/or modify it under
+# the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# dftd4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+
+import numpy as np
+from pytest import approx, raises
+
+from dftd4.hessian import compute_hessian, get_hessian_chunks, get_progress_file
+from dftd4.interface import DampingParam, DispersionModel
+
+numbers = np.array([6, 1, 1, 1, 1])
+positions = np.array(
+    [
+        [+0.0000000, -0.0000000, +0.0000000],
+        [-1.1922080, +1.1922080, +1.1922080],
+        [+1.1922080, -1.1922080, +1.1922080],
+        [-1.1922080, -1.1922080, -1.1922080],
+        [+1.1922080, +1.1922080, -1.1922080],
+    ]
+)
+
+
+def test_hessian_chunks() -> None:
+    """Parts must cover all columns exactly once."""
+    chunks = [get_hessian_chunks(5, 4, part, 3) for part in range(3)]
+    assert chunks[0] == [(0, 4), (12, 15)]
+    assert chunks[1] == [(4, 8)]
+    assert chunks[2] == [(8, 12)]
+
+    with raises(ValueError, match="Invalid dispersion work partition"):
+        get_hessian_chunks(5, 4, 3, 3)
+
+
+def test_hessian_parts(tmp_path) -> None:
+    """Independent parts must assemble the complete hessian in one file."""
+    thr = 1.0e-10
+    filename = str(tmp_path / "hessian.npy")
+    param = DampingParam(method="pbe0", atm=True)
+    model = DispersionModel(numbers, positions)
+    ref = model.get_hessian(param)
+
+    for part in range(2):
+        compute_hessian(model, param, filename, chunk_size=4, part=part, nparts=2)
+
+    hessian = np.load(filename)
+    assert hessian == approx(ref, abs=thr)
+
+
+def test_hessian_resume(tmp_path) -> None:
+    """Only unfinished chunks are evaluated when resuming a calculation."""
+    thr = 1.0e-10
+    filename = str(tmp_path / "hessian.npy")
+    param = DampingParam(method="pbe0", atm=True)
+    model = DispersionModel(numbers, positions)
+    ref = model.get_hessian(param)
+
+    compute_hessian(model, param, filename, chunk_size=4)
+
+    # Pretend the last chunk was never finished, the zeroed first chunk is still
+    # recorded as finished and must not be evaluated again
+    progress = get_progress_file(filename)
+    with open(progress) as fd:
+        data = json.load(fd)
+    data["finished"].remove(12)
+    with open(progress, "w") as fd:
+        json.dump(data, fd)
+    hessian = np.lib.format.open_memmap(filename, mode="r+")
+    hessian.reshape(15, 5, 3)[0:4] = 0.0
+    hessian.reshape(15, 5, 3)[12:15] = 0.0
+    hessian.flush()
+    del hessian
+
+    hessian = compute_hessian(model, param, filename, chunk_size=4)
+    assert hessian.reshape(15, 5, 3)[0:4] == approx(0.0, abs=thr)
+    assert hessian.reshape(15, 5, 3)[4:] == approx(ref.reshape(15, 5, 3)[4:], abs=thr)
+
+    with raises(ValueError, match="does not match the calculation"):
+        compute_hessian(model, param, filename, chunk_size=5)
+
+
+def test_hessian_restart(tmp_path) -> None:
+    """Progress of another calculation or of a removed hessian must not be reused."""
+    thr = 1.0e-10
+    filename = str(tmp_path / "hessian.npy")
+    param = DampingParam(method="pbe0", atm=True)
+    model = DispersionModel(numbers, positions)
+    ref = model.get_hessian(param)
+
+    compute_hessian(model, param, filename, chunk_size=4)
+
+    model.update(positions * 1.01)
+    with raises(ValueError, match="does not match the calculation"):
+        compute_hessian(model, param, filename, chunk_size=4)
+    with raises(ValueError, match="does not match the calculation"):
+        compute_hessian(
+            DispersionModel(numbers, positions),
+            DampingParam(method="pbe", atm=True),
+            filename,
+            chunk_size=4,
+        )
+
+    # A new hessian file is evaluated completely, despite the previous progress
+    model.update(positions)
+    os.remove(filename)
+    hessian = compute_hessian(model, param, filename, chunk_size=4)
+    assert hessian == approx(ref, abs=thr)
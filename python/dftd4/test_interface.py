@@ -14,10 +14,18 @@
 # You should have received a copy of the Lesser GNU General Public License
 # along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
 
+import math
+
 import numpy as np
 from pytest import approx, raises
 
-from dftd4.interface import DampingParam, DispersionModel, Structure
+from dftd4.interface import (
+    DampingParam,
+    DispersionModel,
+    EEQSolver,
+    Structure,
+    prewarm_reference_cache,
+)
 
 
 def test_rational_damping_noargs() -> None:
@@ -296,6 +304,60 @@ def test_smooth_realspace_cutoff() -> None:
     assert res != approx(ref)
 
 
+def test_tail_correction() -> None:
+    """Long-range tail correction recovers the converged energy for short cutoffs"""
+
+    numbers = np.array(4 * [7] + 12 * [1])
+    positions = np.array(
+        [
+            [1.97420621099560, 1.97415497783241, 1.97424596974304],
+            [6.82182427659395, 2.87346383480995, 7.72099517560089],
+            [7.72104957181201, 6.82177051521773, 2.87336561318016],
+            [2.87343220660781, 7.72108897828386, 6.82187093171878],
+            [3.51863272100286, 2.63865333484548, 1.00652979981286],
+            [2.63877594964754, 1.00647313885594, 3.51882748086447],
+            [1.00639728563189, 3.51850454450845, 2.63869202592387],
+            [8.36624975982697, 2.20896711017229, 8.68870955681018],
+            [7.48639684558259, 3.84114715917956, 6.17640982573725],
+            [5.85401675167715, 1.32911569888797, 7.05654606696031],
+            [7.05646299938990, 5.85409590282274, 1.32879923864813],
+            [8.68882633853582, 8.36611541129785, 2.20894120662207],
+            [3.84121223226912, 6.17673669892998, 7.48629723649480],
+            [1.32897854262127, 7.05658604099926, 5.85414031368096],
+            [2.20884896069885, 8.68875820985799, 8.36643568423387],
+            [6.17659142004652, 7.48627051643848, 3.84109594690835],
+        ]
+    )
+    lattice = np.array(
+        [
+            [9.69523775911749, 0.00000000000000, 0.00000000000000],
+            [0.00000000000000, 9.69523775911749, 0.00000000000000],
+            [0.00000000000000, 0.00000000000000, 9.69523775911749],
+        ]
+    )
+    param = DampingParam(method="pbe")
+    model = DispersionModel(numbers, positions, lattice=lattice)
+    ref = model.get_dispersion(param, grad=True)
+
+    model.set_realspace_cutoff(disp2=20.0, disp3=40.0, cn=30.0)
+    short = model.get_dispersion(param, grad=True)
+
+    model.set_tail_correction(True)
+    tail = model.get_dispersion(param, grad=True)
+
+    # The tail correction recovers most of the error of the short cutoff
+    for key in ("energy", "virial"):
+        short_error = np.max(abs(short[key] - ref[key]))
+        assert np.max(abs(tail[key] - ref[key])) < 0.1 * short_error
+
+    # Molecular systems are not affected by the tail correction
+    model = DispersionModel(numbers, positions)
+    model.set_realspace_cutoff(disp2=20.0, disp3=40.0, cn=30.0)
+    ref = model.get_dispersion(param, grad=False).get("energy")
+    model.set_tail_correction(True)
+    assert model.get_dispersion(param, grad=False).get("energy") == approx(ref)
+
+
 def test_work_partition() -> None:
     """Summing all parts must reproduce the complete dispersion calculation."""
     thr = 1.0e-12
@@ -313,21 +375,56 @@ def test_work_partition() -> None:
     param = DampingParam(method="pbe0", atm=True)
 
     ref = DispersionModel(numbers, positions).get_dispersion(param, grad=True)
-    energy = 0.0
-    gradient = np.zeros_like(ref["gradient"])
-    virial = np.zeros_like(ref["virial"])
 
-    for part in range(nparts):
-        model = DispersionModel(numbers, positions)
-        model.set_work_partition(part, nparts)
-        res = model.get_dispersion(param, grad=True)
-        energy += res["energy"]
-        gradient += res["gradient"]
-        virial += res["virial"]
+    for scheme in ("cyclic", "spatial", "cost"):
+        energy = 0.0
+        gradient = np.zeros_like(ref["gradient"])
+        virial = np.zeros_like(ref["virial"])
 
-    assert energy == approx(ref["energy"], abs=thr)
-    assert gradient == approx(ref["gradient"], abs=thr)
-    assert virial == approx(ref["virial"], abs=thr)
+        for part in range(nparts):
+            model = DispersionModel(numbers, positions)
+            model.set_work_partition(part, nparts, scheme=scheme)
+            res = model.get_dispersion(param, grad=True)
+            energy += res["energy"]
+            gradient += res["gradient"]
+            virial += res["virial"]
+
+        assert energy == approx(ref["energy"], abs=thr)
+        assert gradient == approx(ref["gradient"], abs=thr)
+        assert virial == approx(ref["virial"], abs=thr)
+
+
+def test_dispersion_images() -> None:
+    """Batched images must match the evaluation of each image."""
+    thr = 1.0e-12
+    numbers = np.array([6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.0000000, -0.0000000, +0.0000000],
+            [-1.1922080, +1.1922080, +1.1922080],
+            [+1.1922080, -1.1922080, +1.1922080],
+            [-1.1922080, -1.1922080, -1.1922080],
+            [+1.1922080, +1.1922080, -1.1922080],
+        ]
+    )
+    images = np.array([positions * (1.0 + 0.05 * ii) for ii in range(4)])
+    param = DampingParam(method="pbe0", atm=True)
+    model = DispersionModel(numbers, positions)
+
+    res = model.get_dispersion_images(param, images, grad=True)
+    assert res["energy"].shape == (4,)
+    assert res["gradient"].shape == (4, 5, 3)
+    assert res["virial"].shape == (4, 3, 3)
+
+    for ii, image in enumerate(images):
+        model.update(image)
+        ref = model.get_dispersion(param, grad=True)
+        assert res["energy"][ii] == approx(ref["energy"], abs=thr)
+        assert res["gradient"][ii] == approx(ref["gradient"], abs=thr)
+        assert res["virial"][ii] == approx(ref["virial"], abs=thr)
+
+    with raises(ValueError, match="Dimension mismatch"):
+        model.get_dispersion_images(param, images[:, :3])
 
 
 def test_work_partition_invalid() -> None:
@@ -338,6 +435,41 @@ def test_work_partition_invalid() -> None:
     with raises(RuntimeError, match="Invalid dispersion work partition"):
         model.set_work_partition(3, 3)
 
+    with raises(ValueError, match="Unknown work partition scheme"):
+        model.set_work_partition(0, 3, scheme="random")
+
+
+def test_hessian_atoms() -> None:
+    """Hessian blocks for a selection must match the complete hessian."""
+    thr = 1.0e-10
+    numbers = np.array([6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.0000000, -0.0000000, +0.0000000],
+            [-1.1922080, +1.1922080, +1.1922080],
+            [+1.1922080, -1.1922080, +1.1922080],
+            [-1.1922080, -1.1922080, -1.1922080],
+            [+1.1922080, +1.1922080, -1.1922080],
+        ]
+    )
+    param = DampingParam(method="pbe0", atm=True)
+    model = DispersionModel(numbers, positions)
+    atoms = np.array([3, 0])
+
+    ref = model.get_hessian(param)
+    assert ref.shape == (5, 3, 5, 3)
+
+    block = model.get_hessian(param, atoms=atoms)
+    assert block.shape == (2, 3, 5, 3)
+    assert block == approx(ref[atoms], abs=thr)
+
+    compact = model.get_hessian(param, atoms=atoms, compact=True)
+    assert compact.shape == (2, 3, 2, 3)
+    assert compact == approx(ref[atoms][:, :, atoms, :], abs=thr)
+
+    with raises(RuntimeError, match="Invalid atom index in hessian selection"):
+        model.get_hessian(param, atoms=[5])
+
 
 def test_r2scan3c() -> None:
     """Use r2SCAN-3c for a mindless molecule"""
@@ -595,6 +727,91 @@ def test_pair_resolved() -> None:
     assert approx(res.get("non-additive pairwise energy"), abs=thr) == pair_disp3
 
 
+def test_sparse_pair_resolved() -> None:
+    """Sparse pair lists must reproduce the dense pairwise resolved energies"""
+    thr = 1.0e-12
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+    lattice = np.array(
+        [
+            [+8.20000000000000, +0.00000000000000, +0.00000000000000],
+            [+0.40000000000000, +8.60000000000000, +0.00000000000000],
+            [+0.20000000000000, +0.30000000000000, +9.90000000000000],
+        ]
+    )
+
+    param = DampingParam(method="tpss")
+    for cell in (None, lattice):
+        model = DispersionModel(numbers, positions, lattice=cell)
+        model.set_realspace_cutoff(30.0, 20.0, 30.0)
+        ref = model.get_pairwise_dispersion(param)
+        res = model.get_sparse_pairwise_dispersion(param)
+
+        for key in ("additive", "non-additive"):
+            index = res[f"{key} pair indices"]
+            energy = res[f"{key} pair energies"]
+            assert np.all(index[:, 0] >= index[:, 1])
+            if cell is None:
+                assert np.all(res[f"{key} pair images"] == 0)
+
+            pair_disp = np.zeros((len(numbers), len(numbers)))
+            np.add.at(pair_disp, (index[:, 0], index[:, 1]), 0.5 * energy)
+            np.add.at(pair_disp, (index[:, 1], index[:, 0]), 0.5 * energy)
+            assert pair_disp == approx(ref[f"{key} pairwise energy"], abs=thr)
+
+        res = model.get_sparse_pairwise_dispersion(param, threshold=1.0e-6)
+        assert np.all(np.abs(res["additive pair energies"]) >= 1.0e-6)
+
+
+def test_fragment_resolved() -> None:
+    """Fragment energies must reproduce the summed pairwise resolved energies"""
+    thr = 1.0e-12
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+    fragment = np.array([0, 1, 2, 0, 0, 0, 2])
+    proj = np.eye(3)[fragment]
+
+    param = DampingParam(method="tpss")
+    model = DispersionModel(numbers, positions)
+    ref = model.get_pairwise_dispersion(param)
+
+    res = model.get_fragment_dispersion(param, fragment)
+    for key in ("additive", "non-additive"):
+        frag_disp = proj.T @ ref[f"{key} pairwise energy"] @ proj
+        assert res[f"{key} fragment energy"] == approx(frag_disp, abs=thr)
+
+    res = model.get_fragment_dispersion(param, fragment, interaction=True)
+    for key in ("additive", "non-additive"):
+        frag_disp = proj.T @ ref[f"{key} pairwise energy"] @ proj
+        np.fill_diagonal(frag_disp, 0.0)
+        assert res[f"{key} fragment energy"] == approx(frag_disp, abs=thr)
+
+    with raises(ValueError, match="Dimension mismatch"):
+        model.get_fragment_dispersion(param, fragment[:3])
+
+
 def test_properties() -> None:
     """Calculate dispersion related properties for a molecule"""
     thr = 1.0e-7
@@ -697,6 +914,47 @@ def test_properties() -> None:
     assert approx(res.get("polarizabilities"), abs=thr) == alpha
 
 
+def test_selected_properties() -> None:
+    """Selected and sparse properties must match the full evaluation"""
+    thr = 1.0e-10
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+
+    model = DispersionModel(numbers, positions)
+    ref = model.get_properties()
+
+    res = model.get_properties(properties=("coordination numbers", "polarizabilities"))
+    assert set(res) == {"coordination numbers", "polarizabilities"}
+    assert res["coordination numbers"] == approx(ref["coordination numbers"], abs=thr)
+    assert res["polarizabilities"] == approx(ref["polarizabilities"], abs=thr)
+
+    res = model.get_properties(properties=("c6 coefficients",), c6_cutoff=5.0)
+    index = res["c6 pair indices"]
+    dist = np.linalg.norm(positions[index[:, 0]] - positions[index[:, 1]], axis=1)
+    assert np.all(index[:, 0] >= index[:, 1])
+    assert np.all(dist <= 5.0)
+    assert len(index) == np.count_nonzero(
+        np.tril(np.linalg.norm(positions[:, None] - positions, axis=2) <= 5.0)
+    )
+    assert res["c6 coefficients"] == approx(
+        ref["c6 coefficients"][index[:, 0], index[:, 1]], abs=thr
+    )
+
+    with raises(ValueError, match="Unknown properties"):
+        model.get_properties(properties=("dipole moment",))
+
+
 def test_error_model() -> None:
     """Test the error for unknown dispersion model"""
     numbers = np.array(
@@ -718,3 +976,445 @@ def test_error_model() -> None:
         DispersionModel(numbers, positions, model="D42")
 
     assert "Unknown dispersion model" in str(exc)
+
+
+def test_realspace_cutoff_tolerance() -> None:
+    """Pair cutoffs from a tolerance stay within the estimated truncation error"""
+
+    numbers = np.array(4 * [7] + 12 * [1])
+    positions = np.array(
+        [
+            [1.97420621099560, 1.97415497783241, 1.97424596974304],
+            [6.82182427659395, 2.87346383480995, 7.72099517560089],
+            [7.72104957181201, 6.82177051521773, 2.87336561318016],
+            [2.87343220660781, 7.72108897828386, 6.82187093171878],
+            [3.51863272100286, 2.63865333484548, 1.00652979981286],
+            [2.63877594964754, 1.00647313885594, 3.51882748086447],
+            [1.00639728563189, 3.51850454450845, 2.63869202592387],
+            [8.36624975982697, 2.20896711017229, 8.68870955681018],
+            [7.48639684558259, 3.84114715917956, 6.17640982573725],
+            [5.85401675167715, 1.32911569888797, 7.05654606696031],
+            [7.05646299938990, 5.85409590282274, 1.32879923864813],
+            [8.68882633853582, 8.36611541129785, 2.20894120662207],
+            [3.84121223226912, 6.17673669892998, 7.48629723649480],
+            [1.32897854262127, 7.05658604099926, 5.85414031368096],
+            [2.20884896069885, 8.68875820985799, 8.36643568423387],
+            [6.17659142004652, 7.48627051643848, 3.84109594690835],
+        ]
+    )
+    lattice = np.array(
+        [
+            [9.69523775911749, 0.00000000000000, 0.00000000000000],
+            [0.00000000000000, 9.69523775911749, 0.00000000000000],
+            [0.00000000000000, 0.00000000000000, 9.69523775911749],
+        ]
+    )
+    param = DampingParam(method="pbe")
+    model = DispersionModel(numbers, positions, lattice=lattice)
+    ref = model.get_dispersion(param, grad=False).get("energy")
+
+    tolerance = 1.0e-4
+    model.set_realspace_cutoff_tolerance(tolerance)
+    error = model.get_realspace_cutoff_error(param)
+    assert error["two-body error"] <= tolerance
+    assert error["three-body error"] <= tolerance
+
+    energy = model.get_dispersion(param, grad=False).get("energy")
+    assert abs(energy - ref) <= len(numbers) * (
+        error["two-body error"] + error["three-body error"]
+    )
+
+
+def test_mixed_precision() -> None:
+    """Mixed precision kernels agree with the double precision results"""
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+
+    param = DampingParam(method="pbe")
+    model = DispersionModel(numbers, positions)
+    ref = model.get_dispersion(param, grad=True)
+
+    model.set_mixed_precision(True)
+    res = model.get_dispersion(param, grad=True)
+
+    assert res["energy"] == approx(ref["energy"], rel=1.0e-5)
+    assert res["gradient"] == approx(ref["gradient"], abs=1.0e-7)
+    assert res["virial"] == approx(ref["virial"], abs=1.0e-7)
+
+
+def test_symmetry() -> None:
+    """Symmetry-reduced evaluation agrees with the complete evaluation"""
+
+    # Two orbits of atoms on general positions of an orthorhombic mmm cell
+    lattice = np.diag([8.1, 9.3, 10.7])
+    signs = np.array(
+        [[sx, sy, sz] for sx in (1, -1) for sy in (1, -1) for sz in (1, -1)]
+    )
+    fractional = np.concatenate(
+        [signs * np.array([0.12, 0.21, 0.33]), signs * np.array([0.30, 0.15, 0.20])]
+    )
+    numbers = np.array([6] * 8 + [1] * 8)
+    positions = fractional @ lattice
+
+    param = DampingParam(method="pbe")
+    model = DispersionModel(numbers, positions, lattice=lattice)
+    ref = model.get_dispersion(param, grad=True)
+
+    model.set_symmetry(True)
+    res = model.get_dispersion(param, grad=True)
+
+    assert res["energy"] == approx(ref["energy"], abs=1.0e-12)
+    assert res["gradient"] == approx(ref["gradient"], abs=1.0e-12)
+    assert res["virial"] == approx(ref["virial"], abs=1.0e-12)
+
+
+def test_incremental() -> None:
+    """Incremental energy updates of Monte Carlo moves"""
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+    moved = positions.copy()
+    moved[6] += np.array([0.2, -0.1, 0.3])
+
+    param = DampingParam(method="tpss")
+    model = DispersionModel(numbers, positions)
+    ref = model.get_dispersion(param, grad=False)
+    assert model.new_incremental(param) == approx(ref["energy"], abs=1.0e-12)
+
+    # Without frozen environment the energy change is exact
+    delta = model.propose_displacement(param, [6], moved[6], frozen=False)
+    model.update(moved)
+    res = model.get_dispersion(param, grad=False)
+    assert delta == approx(res["energy"] - ref["energy"], abs=1.0e-12)
+    model.update(positions)
+
+    # Reverting a frozen move restores the energy
+    delta = model.propose_displacement(param, [6], moved[6], frozen=True)
+    model.accept_move()
+    reverse = model.propose_displacement(param, [6], positions[6], frozen=True)
+    assert reverse == approx(-delta, abs=1.0e-12)
+    model.reject_move()
+
+    inserted = positions[6] + np.array([0.0, 0.0, 2.0])
+    delta = model.propose_insertion(param, [1], inserted, frozen=True)
+    model.accept_move()
+    reverse = model.propose_deletion(param, [7], frozen=True)
+    assert reverse == approx(-delta, abs=1.0e-12)
+    model.accept_move()
+
+    with raises(RuntimeError, match="No proposed move to accept"):
+        model.accept_move()
+    with raises(RuntimeError, match="Inserted species is not available"):
+        model.propose_insertion(param, [8], inserted, frozen=True)
+
+
+def test_embedding() -> None:
+    """Dispersion energy of a moving region in a frozen environment"""
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+    region = np.array([2, 6])
+    step = 1.0e-5
+
+    param = DampingParam(method="tpss")
+    model = DispersionModel(numbers, positions)
+    ref = model.get_dispersion(param, grad=False)
+    model.set_embedding(param, region)
+
+    res = model.get_embedded_dispersion(param, grad=True)
+    assert res["energy"] == approx(ref["energy"], abs=1.0e-12)
+    assert np.all(np.delete(res["gradient"], region, axis=0) == 0.0)
+
+    # Gradient of the region atoms from finite differences
+    for iat in region:
+        for ic in range(3):
+            displaced = positions.copy()
+            displaced[iat, ic] += step
+            model.update(displaced)
+            er = model.get_embedded_dispersion(param, grad=False)["energy"]
+            displaced[iat, ic] -= 2 * step
+            model.update(displaced)
+            el = model.get_embedded_dispersion(param, grad=False)["energy"]
+            assert res["gradient"][iat, ic] == approx(
+                0.5 * (er - el) / step, abs=1.0e-10
+            )
+
+    with raises(RuntimeError, match="Invalid atom index in embedded region"):
+        model.set_embedding(param, [7])
+
+
+def test_external_charges() -> None:
+    """Dispersion correction with externally supplied partial charges"""
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+
+    param = DampingParam(method="tpss")
+    model = DispersionModel(numbers, positions)
+    ref = model.get_dispersion(param, grad=False)
+    charges = model.get_properties()["partial charges"]
+
+    res = model.get_dispersion(param, grad=False, charges=charges)
+    assert res["energy"] == approx(ref["energy"], abs=1.0e-12)
+
+    charges = 0.5 * charges
+    res = model.get_dispersion(param, grad=True, charges=charges)
+    pair = model.get_pairwise_dispersion(param, charges=charges)
+    assert res["energy"] == approx(
+        pair["additive pairwise energy"].sum()
+        + pair["non-additive pairwise energy"].sum(),
+        abs=1.0e-12,
+    )
+    prop = model.get_properties(charges=charges)
+    assert prop["partial charges"] == approx(charges, abs=1.0e-12)
+
+    with raises(ValueError, match="Dimension mismatch for partial charges"):
+        model.get_dispersion(param, grad=True, charges=charges, dqdr=np.zeros((7, 3)))
+
+
+def test_evaluate() -> None:
+    """Fused evaluation of energies, derivatives, properties and pairwise energies"""
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+
+    param = DampingParam(method="tpss")
+    model = DispersionModel(numbers, positions)
+    ref = model.get_dispersion(param, grad=True)
+    ref.update(model.get_properties())
+    ref.update(model.get_pairwise_dispersion(param))
+
+    # Charges solved together with their derivatives can differ in the last digits
+    charge_derived = {"partial charges", "c6 coefficients", "polarizabilities"}
+    res = model.evaluate(param, outputs=set(ref) | {"atomic energies"})
+    for key in ref:
+        thr = 1.0e-8 if key in charge_derived else 1.0e-12
+        assert res[key] == approx(ref[key], abs=thr)
+    assert res["atomic energies"].sum() == approx(ref["energy"], abs=1.0e-12)
+
+    res = model.evaluate(param, outputs={"two-body energy", "three-body energy"})
+    assert set(res) == {"energy", "two-body energy", "three-body energy"}
+    assert res["two-body energy"] == approx(
+        ref["additive pairwise energy"].sum(), abs=1.0e-12
+    )
+    assert res["three-body energy"] == approx(
+        ref["non-additive pairwise energy"].sum(), abs=1.0e-12
+    )
+
+    with raises(ValueError, match="Unknown output"):
+        model.evaluate(param, outputs={"hessian"})
+
+
+def test_atomic_dispersion() -> None:
+    """Atom-resolved energies and virials sum up to the total values"""
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+    lattice = np.diag([9.0, 9.0, 12.0])
+
+    param = DampingParam(method="tpss")
+    model = DispersionModel(numbers, positions, lattice=lattice)
+    ref = model.get_dispersion(param, grad=True)
+
+    res = model.get_dispersion(param, grad=True, atomic=True)
+    assert res["energy"] == approx(ref["energy"], abs=1.0e-12)
+    assert res["gradient"] == approx(ref["gradient"], abs=1.0e-12)
+    assert res["virial"] == approx(ref["virial"], abs=1.0e-12)
+    assert res["energies"].sum() == approx(ref["energy"], abs=1.0e-12)
+    assert res["virials"].shape == (len(numbers), 3, 3)
+    assert res["virials"].sum(axis=0) == approx(ref["virial"], abs=1.0e-12)
+
+    res = model.get_dispersion(param, grad=False, atomic=True)
+    assert set(res) == {"energy", "energies"}
+
+    with raises(ValueError, match="external charges"):
+        model.get_dispersion(param, grad=True, charges=np.zeros(7), atomic=True)
+
+
+def test_dispersion_multi() -> None:
+    """Dispersion correction for several sets of damping parameters"""
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+
+    params = [
+        DampingParam(method="tpss"),
+        DampingParam(method="b3lyp", atm=False),
+        DampingParam(s6=1.0, s8=1.2, s9=1.0, a1=0.4, a2=4.5),
+    ]
+    model = DispersionModel(numbers, positions)
+
+    res = model.get_dispersion_multi(params, grad=True)
+    assert res["energy"].shape == (3,)
+    assert res["gradient"].shape == (3, 7, 3)
+    assert res["virial"].shape == (3, 3, 3)
+    for k, param in enumerate(params):
+        ref = model.get_dispersion(param, grad=True)
+        assert res["energy"][k] == approx(ref["energy"], abs=1.0e-12)
+        assert res["gradient"][k] == approx(ref["gradient"], abs=1.0e-12)
+        assert res["virial"][k] == approx(ref["virial"], abs=1.0e-12)
+
+
+def test_reference_cache() -> None:
+    """Dispersion models created after prewarming the reference cache"""
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+
+    param = DampingParam(method="tpss")
+    ref = DispersionModel(numbers, positions).get_dispersion(param, grad=False)
+
+    prewarm_reference_cache(numbers)
+    prewarm_reference_cache([1, 6, 7, 8], ga=2.5, gc=1.5)
+    res = DispersionModel(numbers, positions).get_dispersion(param, grad=False)
+    assert res["energy"] == approx(ref["energy"], abs=1.0e-14)
+
+    with raises(RuntimeError, match="Invalid atomic number for reference data"):
+        prewarm_reference_cache([0, 6])
+
+
+def test_eeq_solver() -> None:
+    """Standalone iterative electronegativity equilibration"""
+
+    numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+            [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+            [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+            [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+            [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+            [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+            [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+        ]
+    )
+    chi = np.where(numbers == 6, 1.22, 1.23)
+    eta = np.where(numbers == 6, 1.06, 1.14)
+    rad = np.where(numbers == 6, 0.87, 0.55)
+    dedq = 0.01 * np.cos(numbers)
+
+    param = DampingParam(method="tpss")
+    model = DispersionModel(numbers, positions)
+    solver = EEQSolver(cutoff=40.0, conv=1.0e-12)
+    res = solver.solve(model, chi, eta, rad, dedq=dedq)
+    assert np.sum(res["charges"]) == approx(0.0, abs=1.0e-10)
+    assert res["gradient"].shape == (7, 3)
+    assert res["virial"].shape == (3, 3)
+
+    # Dense solution with the complete Coulomb interaction
+    gam = 1.0 / np.sqrt(rad[:, np.newaxis] ** 2 + rad[np.newaxis, :] ** 2)
+    dist = np.linalg.norm(positions[:, np.newaxis] - positions[np.newaxis, :], axis=-1)
+    np.fill_diagonal(dist, 1.0)
+    amat = np.ones((8, 8))
+    amat[:7, :7] = np.vectorize(math.erf)(gam * dist) / dist
+    np.fill_diagonal(amat[:7, :7], eta + 2.0 * np.diag(gam) / np.sqrt(np.pi))
+    amat[7, 7] = 0.0
+    qref = np.linalg.solve(amat, np.append(-chi, 0.0))[:7]
+    assert res["charges"] == approx(qref, abs=1.0e-10)
+
+    # Response of the charges against finite differences
+    step = 1.0e-4
+    numgrad = np.zeros((7, 3))
+    displaced = EEQSolver(cutoff=40.0, conv=1.0e-12)
+    for iat in range(7):
+        for ic in range(3):
+            xyz = positions.copy()
+            xyz[iat, ic] += step
+            model.update(xyz)
+            er = np.dot(dedq, displaced.solve(model, chi, eta, rad)["charges"])
+            xyz[iat, ic] -= 2 * step
+            model.update(xyz)
+            el = np.dot(dedq, displaced.solve(model, chi, eta, rad)["charges"])
+            numgrad[iat, ic] = 0.5 * (er - el) / step
+    assert res["gradient"] == approx(numgrad, abs=1.0e-8)
+
+    model.update(positions + 0.01)
+    ref = solver.solve(model, chi, eta, rad)
+    assert ref["charges"] == approx(res["charges"], abs=1.0e-2)
+
+    disp = model.get_dispersion(param, grad=True, charges=ref["charges"])
+    assert disp["energy"] < 0.0
+
+    with raises(ValueError, match="Dimension mismatch"):
+        solver.solve(model, chi[:6], eta, rad)
@@ -0,0 +1,95 @@
+# This file is part of dftd4.
+# SPDX-Identifier: LGPL-3.0-or-later
+#
+# dftd4 is free software: you can redistribute it and/or modify it under
+# the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# dftd4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+from pytest import approx, raises
+
+from dftd4.interface import DampingParam, DispersionModel
+from dftd4.parallel import ParallelDispersion
+
+numbers = np.array([6, 6, 6, 1, 1, 1, 1])
+positions = np.array(
+    [
+        [+0.00000000000000, +0.00000000000000, -1.79755622305860],
+        [+0.00000000000000, +0.00000000000000, +0.95338756106749],
+        [+0.00000000000000, +0.00000000000000, +3.22281255790261],
+        [-0.96412815539807, -1.66991895015711, -2.53624948351102],
+        [-0.96412815539807, +1.66991895015711, -2.53624948351102],
+        [+1.92825631079613, +0.00000000000000, -2.53624948351102],
+        [+0.00000000000000, +0.00000000000000, +5.23010455462158],
+    ]
+)
+
+
+def test_parallel_molecule() -> None:
+    """Summed results of all workers must match the serial dispersion model"""
+
+    thr = 1.0e-12
+    param = DampingParam(method="pbe")
+    model = DispersionModel(numbers, positions)
+
+    with ParallelDispersion(numbers, positions, nprocs=3, threads=1) as disp:
+        for scale in (1.0, 1.05):
+            model.update(positions * scale)
+            disp.update(positions * scale)
+
+            ref = model.get_dispersion(param, grad=True)
+            res = disp.get_dispersion(param, grad=True)
+            assert approx(res["energy"], abs=thr) == ref["energy"]
+            assert approx(res["gradient"], abs=thr) == ref["gradient"]
+            assert approx(res["virial"], abs=thr) == ref["virial"]
+
+        ref = model.get_dispersion(param, grad=True, atomic=True)
+        res = disp.get_dispersion(param, grad=True, atomic=True)
+        assert approx(res["energies"], abs=thr) == ref["energies"]
+        assert approx(res["virials"], abs=thr) == ref["virials"]
+
+    with raises(RuntimeError, match="shut down"):
+        disp.get_dispersion(param, grad=False)
+
+
+def test_parallel_periodic() -> None:
+    """Settings are forwarded to all workers of a periodic calculation"""
+
+    thr = 1.0e-12
+    lattice = np.diag([8.0, 8.0, 12.0])
+    param = DampingParam(s8=1.2, a1=0.4, a2=5.0)
+    model = DispersionModel(numbers, positions, lattice=lattice)
+    model.set_realspace_cutoff(40.0, 20.0, 20.0)
+    model.set_tail_correction()
+
+    with ParallelDispersion(
+        numbers, positions, lattice=lattice, nprocs=2, threads=1, scheme="spatial"
+    ) as disp:
+        disp.set_realspace_cutoff(40.0, 20.0, 20.0)
+        disp.set_tail_correction()
+        disp.rebalance()
+
+        ref = model.get_dispersion(param, grad=True)
+        res = disp.get_dispersion(param, grad=True)
+        assert approx(res["energy"], abs=thr) == ref["energy"]
+        assert approx(res["gradient"], abs=thr) == ref["gradient"]
+        assert approx(res["virial"], abs=thr) == ref["virial"]
+
+        with raises(ValueError, match="Dimension mismatch"):
+            disp.update(positions[:2])
+
+
+def test_parallel_invalid() -> None:
+    """Errors during the construction in the workers are raised by the driver"""
+
+    with raises(RuntimeError, match="Too close interatomic distances found"):
+        ParallelDispersion(numbers, np.zeros((7, 3)), nprocs=2, threads=1)
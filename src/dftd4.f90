@@ -15,17 +15,26 @@
 ! along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
 
 module dftd4
+   use dftd4_charge, only : eeq_solver, new_eeq_solver
    use dftd4_cutoff, only : realspace_cutoff, get_lattice_points
    use dftd4_damping, only : damping_param
    use dftd4_damping_rational, only : rational_damping_param
-   use dftd4_disp, only : get_dispersion, get_properties, get_pairwise_dispersion
+   use dftd4_disp, only : get_dispersion, get_properties, get_pairwise_dispersion, &
+      & get_pair_cutoffs, get_dispersion_results, get_dispersion_multi, get_pair_data, &
+      & get_sparse_pairwise_dispersion, get_sparse_c6, get_dispersion_images
+   use dftd4_embedding, only : embedding_dispersion, new_embedding_dispersion
+   use dftd4_incremental, only : incremental_dispersion, new_incremental_dispersion
    use dftd4_model, only : dispersion_model, new_dispersion_model, d4_qmod
+   use dftd4_model_cache, only : prewarm_reference_cache, clear_reference_cache
    use dftd4_model_d4, only : d4_model, new_d4_model
    use dftd4_model_d4s, only : d4s_model, new_d4s_model
    use dftd4_ncoord, only : get_coordination_number
-   use dftd4_numdiff, only : get_dispersion_hessian
+   use dftd4_pairlist, only : pair_list
+   use dftd4_numdiff, only : get_dispersion_hessian, get_dispersion_hessian_columns
    use dftd4_param, only : get_rational_damping
-   use dftd4_partition, only : new_work_partition, serial_work_partition, work_partition
+   use dftd4_partition, only : new_work_partition, partition_scheme, serial_work_partition, &
+      & work_partition
+   use dftd4_symmetry, only : symmetry_type, new_symmetry, detect_symmetry
    use dftd4_version, only : get_dftd4_version
    use mctc_io, only : structure_type, new
    implicit none
@@ -22,16 +22,23 @@
 module dftd4_api
    use, intrinsic :: iso_c_binding, only : c_associated, c_bool, c_char, c_double, &
       & c_f_pointer, c_int, c_loc, c_null_char, c_null_ptr, c_ptr
+   use dftd4_charge, only : eeq_solver, new_eeq_solver
    use dftd4_cutoff, only : realspace_cutoff
    use dftd4_damping, only : damping_param
    use dftd4_damping_rational, only : rational_damping_param
-   use dftd4_disp, only : get_dispersion, get_pairwise_dispersion, get_properties
-   use dftd4_model, only : dispersion_model
+   use dftd4_disp, only : get_dispersion, get_pairwise_dispersion, get_properties, &
+      & get_pair_cutoffs, get_dispersion_results, get_dispersion_multi, get_pair_data, &
+      & get_sparse_pairwise_dispersion, get_sparse_c6, get_dispersion_images
+   use dftd4_embedding, only : embedding_dispersion, new_embedding_dispersion
+   use dftd4_incremental, only : incremental_dispersion, new_incremental_dispersion
+   use dftd4_model, only : dispersion_model, prewarm_reference_cache
    use dftd4_model_d4, only : d4_model, new_d4_model
    use dftd4_model_d4s, only : d4s_model, new_d4s_model
-   use dftd4_numdiff, only: get_dispersion_hessian
+   use dftd4_numdiff, only: get_dispersion_hessian, get_dispersion_hessian_columns
+   use dftd4_pairlist, only : pair_list
    use dftd4_param, only : get_rational_damping
    use dftd4_partition, only : new_work_partition, work_partition
+   use dftd4_symmetry, only : symmetry_type, detect_symmetry
    use dftd4_utils, only : wrap_to_central_cell
    use dftd4_version, only : get_dftd4_version
    use mctc_env, only : wp, error_type, fatal_error
@@ -49,9 +56,12 @@ module dftd4_api
 
    public :: vp_model
    public :: new_d4_model_api, custom_d4_model_api, delete_model_api
-   public :: new_d4s_model_api, custom_d4s_model_api
+   public :: new_d4s_model_api, custom_d4s_model_api, prewarm_reference_cache_api
    public :: set_model_realspace_cutoff_api, set_model_realspace_cutoff_smooth_api
-   public :: set_model_work_partition_api
+   public :: set_model_work_partition_api, set_model_work_partition_scheme_api
+   public :: set_model_tail_correction_api
+   public :: set_model_realspace_cutoff_tolerance_api, set_model_mixed_precision_api
+   public :: set_model_symmetry_api
 
    public :: vp_param
    public :: new_rational_damping_api , load_rational_damping_api
@@ -59,6 +69,20 @@ module dftd4_api
 
    public :: get_dispersion_api
    public :: get_pairwise_dispersion_api, get_properties_api, get_numerical_hessian_api
+   public :: get_numerical_hessian_atoms_api, get_numerical_hessian_columns_api
+   public :: get_realspace_cutoff_error_api
+   public :: get_dispersion_with_charges_api, get_pairwise_dispersion_with_charges_api
+   public :: get_properties_with_charges_api, get_dispersion_results_api
+   public :: get_dispersion_multi_api, get_dispersion_images_api, get_pair_data_api
+   public :: get_sparse_pairwise_dispersion_api, get_sparse_pairs_api
+   public :: get_fragment_dispersion_api, get_sparse_c6_api, get_sparse_c6_pairs_api
+
+   public :: vp_eeq_solver
+   public :: new_eeq_solver_api, delete_eeq_solver_api, solve_eeq_api
+
+   public :: new_incremental_api, propose_displacement_api, propose_insertion_api
+   public :: propose_deletion_api, finish_move_api
+   public :: set_model_embedding_api, refresh_embedding_api, get_embedded_dispersion_api
 
    !> Namespace for C routines
    character(len=*), parameter :: namespace = "dftd4_"
@@ -85,6 +109,30 @@ module dftd4_api
 
       !> Work partition of the interaction loops
       type(work_partition) :: partition
+
+      !> Evaluate the interaction kernels in mixed precision
+      logical :: mixed = .false.
+
+      !> Evaluate only the symmetry-unique atoms in the interaction kernels
+      logical :: symmetry = .false.
+
+      !> Cached state for incremental energy updates of trial moves
+      type(incremental_dispersion), allocatable :: incremental
+
+      !> Cached environment for the dispersion energy of an embedded region
+      type(embedding_dispersion), allocatable :: embedding
+
+      !> Sparse pairwise additive energies of the last evaluation
+      type(pair_list), allocatable :: pairs2
+
+      !> Sparse pairwise non-additive energies of the last evaluation
+      type(pair_list), allocatable :: pairs3
+
+      !> Atom pairs of the last sparse C6 evaluation
+      integer, allocatable :: c6_pairs(:, :)
+
+      !> C6 coefficients of the last sparse C6 evaluation
+      real(wp), allocatable :: c6_sparse(:)
    end type vp_model
 
    !> Void pointer to damping parameters
@@ -93,6 +141,12 @@ module dftd4_api
       class(damping_param), allocatable :: ptr
    end type vp_param
 
+   !> Void pointer to electronegativity equilibration solver
+   type :: vp_eeq_solver
+      !> Actual payload
+      type(eeq_solver) :: ptr
+   end type vp_eeq_solver
+
 
    logical, parameter :: debug = .false.
 
@@ -478,6 +532,32 @@ function custom_d4s_model_api(verror, vmol, ga, gc) &
 end function custom_d4s_model_api
 
 
+!> Precompute the reference C6 coefficients for all pairs of the given elements
+subroutine prewarm_reference_cache_api(verror, nelem, numbers, ga, gc) &
+      & bind(C, name=namespace//"prewarm_reference_cache")
+   !DEC$ ATTRIBUTES DLLEXPORT :: prewarm_reference_cache_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   integer(c_int), value, intent(in) :: nelem
+   integer(c_int), intent(in) :: numbers(nelem)
+   real(c_double), value, intent(in) :: ga
+   real(c_double), value, intent(in) :: gc
+
+   if (debug) print'("[Info]",1x, a)', "prewarm_reference_cache"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (any(numbers < 1 .or. numbers > 118)) then
+      call fatal_error(error%ptr, "Invalid atomic number for reference data")
+      return
+   end if
+
+   call prewarm_reference_cache(numbers, ga=ga, gc=gc)
+
+end subroutine prewarm_reference_cache_api
+
+
 !> Delete dispersion model
 subroutine delete_model_api(vdisp) &
       & bind(C, name=namespace//"delete_model")
@@ -518,7 +598,8 @@ subroutine set_model_realspace_cutoff_api(verror, vdisp, disp2, disp3, cn) &
    end if
    call c_f_pointer(vdisp, disp)
 
-   disp%cutoff = realspace_cutoff(disp2=disp2, disp3=disp3, cn=cn)
+   disp%cutoff = realspace_cutoff(disp2=disp2, disp3=disp3, cn=cn, &
+      & tail=disp%cutoff%tail, tolerance=disp%cutoff%tolerance)
 end subroutine set_model_realspace_cutoff_api
 
 
@@ -546,7 +627,8 @@ subroutine set_model_realspace_cutoff_smooth_api(verror, vdisp, disp2, disp3, cn
    call c_f_pointer(vdisp, disp)
 
    disp%cutoff = realspace_cutoff(disp2=disp2, disp3=disp3, cn=cn, &
-      & width2=width2, width3=width3)
+      & width2=width2, width3=width3, tail=disp%cutoff%tail, &
+      & tolerance=disp%cutoff%tolerance)
 end subroutine set_model_realspace_cutoff_smooth_api
 
 
@@ -578,6 +660,145 @@ subroutine set_model_work_partition_api(verror, vdisp, part, nparts) &
 end subroutine set_model_work_partition_api
 
 
+!> Assign an externally managed part of the interaction loops to this model,
+!> balanced by the estimated cost of the atoms in the given structure.
+!>
+!> The cost is estimated from the neighbor counts within the realspace cutoffs
+!> currently set for the model.
+subroutine set_model_work_partition_scheme_api(verror, vmol, vdisp, part, nparts, scheme) &
+      & bind(C, name=namespace//"set_model_work_partition_scheme")
+   !DEC$ ATTRIBUTES DLLEXPORT :: set_model_work_partition_scheme_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   integer(c_int), value, intent(in) :: part
+   integer(c_int), value, intent(in) :: nparts
+   integer(c_int), value, intent(in) :: scheme
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   call new_work_partition(error%ptr, disp%partition, int(part), int(nparts), &
+      & int(scheme), mol%ptr, disp%cutoff)
+
+end subroutine set_model_work_partition_scheme_api
+
+
+!> Enable or disable the long-range tail correction beyond the two-body cutoff
+subroutine set_model_tail_correction_api(verror, vdisp, tail) &
+      & bind(C, name=namespace//"set_model_tail_correction")
+   !DEC$ ATTRIBUTES DLLEXPORT :: set_model_tail_correction_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   logical(c_bool), value, intent(in) :: tail
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   disp%cutoff%tail = logical(tail)
+
+end subroutine set_model_tail_correction_api
+
+
+!> Derive the realspace cutoffs for each pair of species from an error tolerance
+!>
+!> The current realspace cutoffs act as upper limit, a non-positive tolerance
+!> disables the derived cutoffs.
+subroutine set_model_realspace_cutoff_tolerance_api(verror, vdisp, tolerance) &
+      & bind(C, name=namespace//"set_model_realspace_cutoff_tolerance")
+   !DEC$ ATTRIBUTES DLLEXPORT :: set_model_realspace_cutoff_tolerance_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   real(c_double), value, intent(in) :: tolerance
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   disp%cutoff%tolerance = max(tolerance, 0.0_wp)
+
+end subroutine set_model_realspace_cutoff_tolerance_api
+
+
+!> Enable or disable the mixed precision evaluation of the interaction kernels
+subroutine set_model_mixed_precision_api(verror, vdisp, mixed) &
+      & bind(C, name=namespace//"set_model_mixed_precision")
+   !DEC$ ATTRIBUTES DLLEXPORT :: set_model_mixed_precision_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   logical(c_bool), value, intent(in) :: mixed
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   disp%mixed = logical(mixed)
+
+end subroutine set_model_mixed_precision_api
+
+
+!> Enable or disable the symmetry-reduced evaluation of the interaction kernels,
+!> the space group is detected for 3D periodic systems on every evaluation
+subroutine set_model_symmetry_api(verror, vdisp, symmetry) &
+      & bind(C, name=namespace//"set_model_symmetry")
+   !DEC$ ATTRIBUTES DLLEXPORT :: set_model_symmetry_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   logical(c_bool), value, intent(in) :: symmetry
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   disp%symmetry = logical(symmetry)
+
+end subroutine set_model_symmetry_api
+
+
 !> Create new rational damping parameters
 function new_rational_damping_api(verror, s6, s8, s9, a1, a2, alp) &
       & result(vparam) &
@@ -692,6 +913,7 @@ subroutine get_dispersion_api(verror, vmol, vdisp, vparam, &
    real(wp), allocatable :: gradient(:, :)
    real(c_double), intent(out), optional :: c_sigma(3, 3)
    real(wp), allocatable :: sigma(:, :)
+   type(symmetry_type) :: sym
    logical :: has_grad, has_sigma
 
 
@@ -740,8 +962,15 @@ subroutine get_dispersion_api(verror, vmol, vdisp, vparam, &
    end if
 
    ! Evaluate energy, gradient (optional), and sigma (optional) analytically
-   call get_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
-      & energy, gradient, sigma, partition=disp%partition)
+   if (disp%symmetry) then
+      call detect_symmetry(error%ptr, sym, mol%ptr)
+      if (allocated(error%ptr)) return
+      call get_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
+         & energy, gradient, sigma, partition=disp%partition, symmetry=sym)
+   else
+      call get_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
+         & energy, gradient, sigma, partition=disp%partition, mixed=disp%mixed)
+   end if
 
    if (has_grad) then
       c_gradient(:3, :mol%ptr%nat) = gradient
@@ -753,6 +982,105 @@ subroutine get_dispersion_api(verror, vmol, vdisp, vparam, &
 
 end subroutine get_dispersion_api
 
+
+!> Calculate dispersion with externally supplied partial charges
+subroutine get_dispersion_with_charges_api(verror, vmol, vdisp, vparam, &
+      & c_charges, c_dqdr, c_dqdL, energy, c_gradient, c_sigma) &
+      & bind(C, name=namespace//"get_dispersion_with_charges")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion_with_charges_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   real(c_double), intent(in) :: c_charges(*)
+   real(c_double), intent(in), optional :: c_dqdr(3, *)
+   real(wp), allocatable :: dqdr(:, :, :)
+   real(c_double), intent(in), optional :: c_dqdL(3, 3, *)
+   real(wp), allocatable :: dqdL(:, :, :)
+   real(c_double), intent(out) :: energy
+   real(c_double), intent(out), optional :: c_gradient(3, *)
+   real(wp), allocatable :: gradient(:, :)
+   real(c_double), intent(out), optional :: c_sigma(3, 3)
+   real(wp), allocatable :: sigma(:, :)
+   type(symmetry_type) :: sym
+   logical :: has_grad, has_sigma
+   integer :: nat
+
+   if (debug) print'("[Info]",1x, a)', "get_dispersion_with_charges"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+   nat = mol%ptr%nat
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+   call c_f_pointer(vparam, param)
+
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
+   end if
+
+   has_grad = present(c_gradient)
+   if (has_grad) then
+      gradient = c_gradient(:3, :nat)
+   end if
+
+   has_sigma = present(c_sigma)
+   if (has_sigma) then
+      sigma = c_sigma(:3, :3)
+   else if (has_grad) then
+      allocate(sigma(3,3))
+   end if
+
+   if (present(c_dqdr)) then
+      dqdr = reshape(c_dqdr(:3, :nat*nat), [3, nat, nat])
+   end if
+
+   if (present(c_dqdL)) then
+      dqdL = c_dqdL(:3, :3, :nat)
+   end if
+
+   if (disp%symmetry) then
+      call detect_symmetry(error%ptr, sym, mol%ptr)
+      if (allocated(error%ptr)) return
+      call get_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
+         & energy, gradient, sigma, partition=disp%partition, symmetry=sym, &
+         & charges=c_charges(:nat), dqdr=dqdr, dqdL=dqdL)
+   else
+      call get_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
+         & energy, gradient, sigma, partition=disp%partition, mixed=disp%mixed, &
+         & charges=c_charges(:nat), dqdr=dqdr, dqdL=dqdL)
+   end if
+
+   if (has_grad) then
+      c_gradient(:3, :nat) = gradient
+   end if
+
+   if (has_sigma) then
+      c_sigma(:3, :3) = sigma
+   end if
+
+end subroutine get_dispersion_with_charges_api
+
 !> Calculate hessian numerically
 subroutine get_numerical_hessian_api(verror, vmol, vdisp, &
                                    & vparam, c_hessian) &
@@ -809,11 +1137,11 @@ subroutine get_numerical_hessian_api(verror, vmol, vdisp, &
 
 end subroutine get_numerical_hessian_api
 
-!> Calculate pairwise representation of dispersion energy
-subroutine get_pairwise_dispersion_api(verror, vmol, vdisp, vparam, &
-      & c_pair_energy2, c_pair_energy3) &
-      & bind(C, name=namespace//"get_pairwise_dispersion")
-   !DEC$ ATTRIBUTES DLLEXPORT :: get_pairwise_dispersion_api
+!> Calculate hessian numerically for a selection of displaced atoms
+subroutine get_numerical_hessian_atoms_api(verror, vmol, vdisp, &
+      & vparam, natoms, c_atoms, c_hessian) &
+      & bind(C, name=namespace//"get_numerical_hessian_atoms")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_numerical_hessian_atoms_api
    type(c_ptr), value :: verror
    type(vp_error), pointer :: error
    type(c_ptr), value :: vmol
@@ -822,12 +1150,15 @@ subroutine get_pairwise_dispersion_api(verror, vmol, vdisp, vparam, &
    type(vp_model), pointer :: disp
    type(c_ptr), value :: vparam
    type(vp_param), pointer :: param
-   type(c_ptr), value, intent(in) :: c_pair_energy2
-   real(wp), pointer :: pair_energy2(:, :)
-   type(c_ptr), value, intent(in) :: c_pair_energy3
-   real(wp), pointer :: pair_energy3(:, :)
+   integer(c_int), value, intent(in) :: natoms
+   integer(c_int), intent(in) :: c_atoms(*)
+   real(c_double), intent(out) :: c_hessian(*)
+   real(wp), allocatable :: hessian(:, :, :, :)
+   integer, allocatable :: atoms(:)
+   integer :: nat, nsel
 
-   if (debug) print'("[Info]",1x, a)', "get_pairwise_dispersion"
+
+   if (debug) print'("[Info]",1x, a)', "get_numerical_hessian_atoms"
 
    if (.not.c_associated(verror)) return
    call c_f_pointer(verror, error)
@@ -837,6 +1168,7 @@ subroutine get_pairwise_dispersion_api(verror, vmol, vdisp, vparam, &
       return
    end if
    call c_f_pointer(vmol, mol)
+   nat = mol%ptr%nat
 
    if (.not.c_associated(vdisp)) then
       call fatal_error(error%ptr, "Dispersion model is missing")
@@ -855,36 +1187,48 @@ subroutine get_pairwise_dispersion_api(verror, vmol, vdisp, vparam, &
       return
    end if
 
-   call c_f_pointer(c_pair_energy2, pair_energy2, [mol%ptr%nat, mol%ptr%nat])
-   call c_f_pointer(c_pair_energy3, pair_energy3, [mol%ptr%nat, mol%ptr%nat])
+   nsel = natoms
+   if (nsel < 0) then
+      call fatal_error(error%ptr, "Invalid number of atoms in hessian selection")
+      return
+   end if
 
-   call get_pairwise_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
-      & pair_energy2, pair_energy3)
+   ! Selection is zero based in C
+   atoms = c_atoms(:nsel) + 1
+   if (any(atoms < 1 .or. atoms > nat)) then
+      call fatal_error(error%ptr, "Invalid atom index in hessian selection")
+      return
+   end if
 
-end subroutine get_pairwise_dispersion_api
+   ! Evaluate hessian numerically
+   allocate(hessian(3, nat, 3, nsel))
+   call get_dispersion_hessian(mol%ptr, disp%ptr, param%ptr, &
+      & disp%cutoff, hessian, disp%partition, atoms)
+   c_hessian(:9*nat*nsel) = reshape(hessian, [9*nat*nsel])
 
+end subroutine get_numerical_hessian_atoms_api
 
-!> Calculate dispersion
-subroutine get_properties_api(verror, vmol, vdisp, &
-      & c_cn, c_charges, c_c6, c_alpha) &
-      & bind(C, name=namespace//"get_properties")
-   !DEC$ ATTRIBUTES DLLEXPORT :: get_properties_api
+!> Calculate a range of hessian columns numerically
+subroutine get_numerical_hessian_columns_api(verror, vmol, vdisp, &
+      & vparam, first, ncol, c_hessian) &
+      & bind(C, name=namespace//"get_numerical_hessian_columns")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_numerical_hessian_columns_api
    type(c_ptr), value :: verror
    type(vp_error), pointer :: error
    type(c_ptr), value :: vmol
    type(vp_structure), pointer :: mol
    type(c_ptr), value :: vdisp
    type(vp_model), pointer :: disp
-   real(c_double), intent(out), optional :: c_cn(*)
-   real(wp), allocatable :: cn(:)
-   real(c_double), intent(out), optional :: c_charges(*)
-   real(wp), allocatable :: charges(:)
-   real(c_double), intent(out), optional :: c_c6(*)
-   real(wp), allocatable :: c6(:, :)
-   real(c_double), intent(out), optional :: c_alpha(*)
-   real(wp), allocatable :: alpha(:)
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   integer(c_int), value, intent(in) :: first
+   integer(c_int), value, intent(in) :: ncol
+   real(c_double), intent(out) :: c_hessian(*)
+   real(wp), allocatable :: hessian(:, :, :)
+   integer :: nat
 
-   if (debug) print'("[Info]",1x, a)', "get_properties"
+
+   if (debug) print'("[Info]",1x, a)', "get_numerical_hessian_columns"
 
    if (.not.c_associated(verror)) return
    call c_f_pointer(verror, error)
@@ -894,6 +1238,7 @@ subroutine get_properties_api(verror, vmol, vdisp, &
       return
    end if
    call c_f_pointer(vmol, mol)
+   nat = mol%ptr%nat
 
    if (.not.c_associated(vdisp)) then
       call fatal_error(error%ptr, "Dispersion model is missing")
@@ -901,27 +1246,1350 @@ subroutine get_properties_api(verror, vmol, vdisp, &
    end if
    call c_f_pointer(vdisp, disp)
 
-   allocate(cn(mol%ptr%nat), charges(mol%ptr%nat), alpha(mol%ptr%nat), &
-      & c6(mol%ptr%nat, mol%ptr%nat))
-   call get_properties(mol%ptr, disp%ptr, disp%cutoff, cn, charges, c6, alpha)
-
-   if (present(c_cn)) then
-      c_cn(:size(cn)) = cn
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
    end if
+   call c_f_pointer(vparam, param)
 
-   if (present(c_charges)) then
-      c_charges(:size(charges)) = charges
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
    end if
 
-   if (present(c_c6)) then
-      c_c6(:size(c6)) = reshape(c6, [size(c6)])
+   if (first < 0 .or. ncol < 0 .or. first + ncol > 3*nat) then
+      call fatal_error(error%ptr, "Invalid range of hessian columns")
+      return
    end if
 
-   if (present(c_alpha)) then
+   ! Evaluate hessian columns numerically, column range is zero based in C
+   allocate(hessian(3, nat, ncol))
+   call get_dispersion_hessian_columns(mol%ptr, disp%ptr, param%ptr, &
+      & disp%cutoff, first + 1, hessian, disp%partition)
+   c_hessian(:3*nat*ncol) = reshape(hessian, [3*nat*ncol])
+
+end subroutine get_numerical_hessian_columns_api
+
+!> Calculate pairwise representation of dispersion energy
+subroutine get_pairwise_dispersion_api(verror, vmol, vdisp, vparam, &
+      & c_pair_energy2, c_pair_energy3) &
+      & bind(C, name=namespace//"get_pairwise_dispersion")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_pairwise_dispersion_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   type(c_ptr), value, intent(in) :: c_pair_energy2
+   real(wp), pointer :: pair_energy2(:, :)
+   type(c_ptr), value, intent(in) :: c_pair_energy3
+   real(wp), pointer :: pair_energy3(:, :)
+
+   if (debug) print'("[Info]",1x, a)', "get_pairwise_dispersion"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+   call c_f_pointer(vparam, param)
+
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
+   end if
+
+   call c_f_pointer(c_pair_energy2, pair_energy2, [mol%ptr%nat, mol%ptr%nat])
+   call c_f_pointer(c_pair_energy3, pair_energy3, [mol%ptr%nat, mol%ptr%nat])
+
+   call get_pairwise_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
+      & pair_energy2, pair_energy3)
+
+end subroutine get_pairwise_dispersion_api
+
+
+!> Calculate pairwise representation of dispersion energy with externally
+!> supplied partial charges
+subroutine get_pairwise_dispersion_with_charges_api(verror, vmol, vdisp, vparam, &
+      & c_charges, c_pair_energy2, c_pair_energy3) &
+      & bind(C, name=namespace//"get_pairwise_dispersion_with_charges")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_pairwise_dispersion_with_charges_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   real(c_double), intent(in) :: c_charges(*)
+   type(c_ptr), value, intent(in) :: c_pair_energy2
+   real(wp), pointer :: pair_energy2(:, :)
+   type(c_ptr), value, intent(in) :: c_pair_energy3
+   real(wp), pointer :: pair_energy3(:, :)
+
+   if (debug) print'("[Info]",1x, a)', "get_pairwise_dispersion_with_charges"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+   call c_f_pointer(vparam, param)
+
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
+   end if
+
+   call c_f_pointer(c_pair_energy2, pair_energy2, [mol%ptr%nat, mol%ptr%nat])
+   call c_f_pointer(c_pair_energy3, pair_energy3, [mol%ptr%nat, mol%ptr%nat])
+
+   call get_pairwise_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
+      & pair_energy2, pair_energy3, charges=c_charges(:mol%ptr%nat))
+
+end subroutine get_pairwise_dispersion_with_charges_api
+
+
+!> Calculate pairwise representation of dispersion energy accumulated for pairs
+!> of fragments
+subroutine get_fragment_dispersion_api(verror, vmol, vdisp, vparam, &
+      & nfrag, c_fragment, interaction, c_frag_energy2, c_frag_energy3) &
+      & bind(C, name=namespace//"get_fragment_dispersion")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_fragment_dispersion_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   integer(c_int), value, intent(in) :: nfrag
+   integer(c_int), intent(in) :: c_fragment(*)
+   logical(c_bool), value, intent(in) :: interaction
+   type(c_ptr), value, intent(in) :: c_frag_energy2
+   real(wp), pointer :: frag_energy2(:, :)
+   type(c_ptr), value, intent(in) :: c_frag_energy3
+   real(wp), pointer :: frag_energy3(:, :)
+   integer, allocatable :: fragment(:)
+
+   if (debug) print'("[Info]",1x, a)', "get_fragment_dispersion"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+   call c_f_pointer(vparam, param)
+
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
+   end if
+
+   fragment = c_fragment(:mol%ptr%nat) + 1
+   if (nfrag < 1 .or. any(fragment < 1) .or. any(fragment > nfrag)) then
+      call fatal_error(error%ptr, "Fragment indices must be between zero and the number of fragments")
+      return
+   end if
+
+   call c_f_pointer(c_frag_energy2, frag_energy2, [nfrag, nfrag])
+   call c_f_pointer(c_frag_energy3, frag_energy3, [nfrag, nfrag])
+
+   call get_pairwise_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
+      & frag_energy2, frag_energy3, fragment=fragment, &
+      & interaction=logical(interaction))
+
+end subroutine get_fragment_dispersion_api
+
+
+!> Calculate pairwise representation of dispersion energy as sparse lists of atom
+!> pairs, the lists are stored in the dispersion model and retrieved separately
+subroutine get_sparse_pairwise_dispersion_api(verror, vmol, vdisp, vparam, &
+      & threshold, npair2, npair3) &
+      & bind(C, name=namespace//"get_sparse_pairwise_dispersion")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_sparse_pairwise_dispersion_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   real(c_double), value, intent(in) :: threshold
+   integer(c_int), intent(out) :: npair2
+   integer(c_int), intent(out) :: npair3
+
+   if (debug) print'("[Info]",1x, a)', "get_sparse_pairwise_dispersion"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+   call c_f_pointer(vparam, param)
+
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
+   end if
+
+   if (allocated(disp%pairs2)) deallocate(disp%pairs2)
+   if (allocated(disp%pairs3)) deallocate(disp%pairs3)
+   allocate(disp%pairs2, disp%pairs3)
+   call get_sparse_pairwise_dispersion(mol%ptr, disp%ptr, param%ptr, disp%cutoff, &
+      & threshold, disp%pairs2, disp%pairs3)
+
+   npair2 = disp%pairs2%npair
+   npair3 = disp%pairs3%npair
+
+end subroutine get_sparse_pairwise_dispersion_api
+
+
+!> Retrieve the sparse lists of atom pairs of the last sparse pairwise evaluation,
+!> atom indices are zero-based and images are given in units of the lattice vectors
+subroutine get_sparse_pairs_api(verror, vdisp, c_index2, c_image2, c_energy2, &
+      & c_index3, c_image3, c_energy3) &
+      & bind(C, name=namespace//"get_sparse_pairs")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_sparse_pairs_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   integer(c_int), intent(out), optional :: c_index2(2, *)
+   integer(c_int), intent(out), optional :: c_image2(3, *)
+   real(c_double), intent(out), optional :: c_energy2(*)
+   integer(c_int), intent(out), optional :: c_index3(2, *)
+   integer(c_int), intent(out), optional :: c_image3(3, *)
+   real(c_double), intent(out), optional :: c_energy3(*)
+
+   if (debug) print'("[Info]",1x, a)', "get_sparse_pairs"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.(allocated(disp%pairs2) .and. allocated(disp%pairs3))) then
+      call fatal_error(error%ptr, "Sparse pairwise dispersion has not been evaluated")
+      return
+   end if
+
+   call copy_pairs(disp%pairs2, c_index2, c_image2, c_energy2)
+   call copy_pairs(disp%pairs3, c_index3, c_image3, c_energy3)
+
+contains
+
+   subroutine copy_pairs(pairs, c_index, c_image, c_energy)
+      type(pair_list), intent(in) :: pairs
+      integer(c_int), intent(out), optional :: c_index(2, *)
+      integer(c_int), intent(out), optional :: c_image(3, *)
+      real(c_double), intent(out), optional :: c_energy(*)
+
+      integer :: iat, ip
+
+      do iat = 1, size(pairs%rowptr) - 1
+         do ip = pairs%rowptr(iat) + 1, pairs%rowptr(iat+1)
+            if (present(c_index)) then
+               c_index(:, ip) = [iat - 1, pairs%jat(ip) - 1]
+            end if
+            if (present(c_image)) then
+               c_image(:, ip) = pairs%image(:, pairs%jtr(ip))
+            end if
+         end do
+      end do
+      if (present(c_energy)) then
+         c_energy(:pairs%npair) = pairs%energy
+      end if
+   end subroutine copy_pairs
+
+end subroutine get_sparse_pairs_api
+
+
+!> Evaluate any combination of energies, derivatives, properties and pairwise
+!> energies in a single pass
+subroutine get_dispersion_results_api(verror, vmol, vdisp, vparam, energy, &
+      & c_gradient, c_sigma, c_energy2b, c_energy3b, c_energies, c_cn, c_charges, &
+      & c_c6, c_alpha, c_pair_energy2, c_pair_energy3, c_sigmas) &
+      & bind(C, name=namespace//"get_dispersion_results")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion_results_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   real(c_double), intent(out) :: energy
+   real(c_double), intent(out), optional :: c_gradient(3, *)
+   real(wp), allocatable :: gradient(:, :)
+   real(c_double), intent(out), optional :: c_sigma(3, 3)
+   real(wp), allocatable :: sigma(:, :)
+   real(c_double), intent(out), optional :: c_energy2b
+   real(c_double), intent(out), optional :: c_energy3b
+   real(c_double), intent(out), optional :: c_energies(*)
+   real(wp), allocatable :: energies(:)
+   real(c_double), intent(out), optional :: c_cn(*)
+   real(wp), allocatable :: cn(:)
+   real(c_double), intent(out), optional :: c_charges(*)
+   real(wp), allocatable :: charges(:)
+   real(c_double), intent(out), optional :: c_c6(*)
+   real(wp), allocatable :: c6(:, :)
+   real(c_double), intent(out), optional :: c_alpha(*)
+   real(wp), allocatable :: alpha(:)
+   real(c_double), intent(out), optional :: c_pair_energy2(*)
+   real(wp), allocatable :: pair_energy2(:, :)
+   real(c_double), intent(out), optional :: c_pair_energy3(*)
+   real(wp), allocatable :: pair_energy3(:, :)
+   real(c_double), intent(out), optional :: c_sigmas(3, 3, *)
+   real(wp), allocatable :: sigmas(:, :, :)
+   integer :: nat
+
+   if (debug) print'("[Info]",1x, a)', "get_dispersion_results"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+   nat = mol%ptr%nat
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+   call c_f_pointer(vparam, param)
+
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
+   end if
+
+   if (present(c_gradient)) allocate(gradient(3, nat))
+   if (present(c_sigma)) allocate(sigma(3, 3))
+   if (present(c_energies)) allocate(energies(nat))
+   if (present(c_cn)) allocate(cn(nat))
+   if (present(c_charges)) allocate(charges(nat))
+   if (present(c_c6)) allocate(c6(nat, nat))
+   if (present(c_alpha)) allocate(alpha(nat))
+   if (present(c_pair_energy2)) allocate(pair_energy2(nat, nat))
+   if (present(c_pair_energy3)) allocate(pair_energy3(nat, nat))
+   if (present(c_sigmas)) allocate(sigmas(3, 3, nat))
+
+   call get_dispersion_results(mol%ptr, disp%ptr, param%ptr, disp%cutoff, energy, &
+      & gradient, sigma, c_energy2b, c_energy3b, energies, cn, charges, c6, alpha, &
+      & pair_energy2, pair_energy3, sigmas=sigmas)
+
+   if (present(c_gradient)) c_gradient(:3, :nat) = gradient
+   if (present(c_sigma)) c_sigma(:3, :3) = sigma
+   if (present(c_energies)) c_energies(:nat) = energies
+   if (present(c_cn)) c_cn(:nat) = cn
+   if (present(c_charges)) c_charges(:nat) = charges
+   if (present(c_c6)) c_c6(:nat*nat) = reshape(c6, [nat*nat])
+   if (present(c_alpha)) c_alpha(:nat) = alpha
+   if (present(c_pair_energy2)) c_pair_energy2(:nat*nat) = reshape(pair_energy2, [nat*nat])
+   if (present(c_pair_energy3)) c_pair_energy3(:nat*nat) = reshape(pair_energy3, [nat*nat])
+   if (present(c_sigmas)) c_sigmas(:3, :3, :nat) = sigmas
+
+end subroutine get_dispersion_results_api
+
+
+!> Calculate dispersion for several sets of damping parameters
+subroutine get_dispersion_multi_api(verror, vmol, vdisp, nparam, vparam, &
+      & c_energy, c_gradient, c_sigma) &
+      & bind(C, name=namespace//"get_dispersion_multi")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion_multi_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   integer(c_int), value, intent(in) :: nparam
+   type(c_ptr), intent(in) :: vparam(nparam)
+   type(vp_param), pointer :: param
+   real(c_double), intent(out) :: c_energy(nparam)
+   real(wp), allocatable :: energy(:)
+   real(c_double), intent(out), optional :: c_gradient(3, *)
+   real(wp), allocatable :: gradient(:, :, :)
+   real(c_double), intent(out), optional :: c_sigma(3, 3, *)
+   real(wp), allocatable :: sigma(:, :, :)
+   type(rational_damping_param), allocatable :: rational(:)
+   integer :: nat, iparam
+
+   if (debug) print'("[Info]",1x, a)', "get_dispersion_multi"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+   nat = mol%ptr%nat
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   allocate(rational(nparam))
+   do iparam = 1, nparam
+      if (.not.c_associated(vparam(iparam))) then
+         call fatal_error(error%ptr, "Damping parameters are missing")
+         return
+      end if
+      call c_f_pointer(vparam(iparam), param)
+
+      if (.not.allocated(param%ptr)) then
+         call fatal_error(error%ptr, "Damping parameters are not initialized")
+         return
+      end if
+      select type(par => param%ptr)
+      type is(rational_damping_param)
+         rational(iparam) = par
+      class default
+         call fatal_error(error%ptr, "Unsupported damping parameters for multiple evaluation")
+         return
+      end select
+   end do
+
+   allocate(energy(nparam))
+   if (present(c_gradient)) allocate(gradient(3, nat, nparam))
+   if (present(c_sigma)) allocate(sigma(3, 3, nparam))
+
+   call get_dispersion_multi(mol%ptr, disp%ptr, rational, disp%cutoff, energy, &
+      & gradient, sigma)
+
+   c_energy(:nparam) = energy
+   if (present(c_gradient)) then
+      c_gradient(:3, :nat*nparam) = reshape(gradient, [3, nat*nparam])
+   end if
+   if (present(c_sigma)) then
+      c_sigma(:3, :3, :nparam) = sigma
+   end if
+
+end subroutine get_dispersion_multi_api
+
+
+!> Calculate dispersion for several images of the same structure
+subroutine get_dispersion_images_api(verror, vmol, vdisp, vparam, nimg, c_xyz, &
+      & c_lattice, c_energy, c_gradient, c_sigma) &
+      & bind(C, name=namespace//"get_dispersion_images")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion_images_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   integer(c_int), value, intent(in) :: nimg
+   real(c_double), intent(in) :: c_xyz(3, *)
+   real(wp), allocatable :: xyz(:, :, :)
+   real(c_double), intent(in), optional :: c_lattice(3, 3, *)
+   real(wp), allocatable :: lattice(:, :, :)
+   real(c_double), intent(out) :: c_energy(*)
+   real(wp), allocatable :: energy(:)
+   real(c_double), intent(out), optional :: c_gradient(3, *)
+   real(wp), allocatable :: gradient(:, :, :)
+   real(c_double), intent(out), optional :: c_sigma(3, 3, *)
+   real(wp), allocatable :: sigma(:, :, :)
+   integer :: nat
+
+   if (debug) print'("[Info]",1x, a)', "get_dispersion_images"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+   nat = mol%ptr%nat
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+   call c_f_pointer(vparam, param)
+
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
+   end if
+
+   if (nimg < 0) then
+      call fatal_error(error%ptr, "Invalid number of images")
+      return
+   end if
+
+   xyz = reshape(c_xyz(:3, :nat*nimg), [3, nat, int(nimg)])
+   if (present(c_lattice)) lattice = c_lattice(:3, :3, :nimg)
+   allocate(energy(nimg))
+   if (present(c_gradient)) allocate(gradient(3, nat, nimg))
+   if (present(c_sigma)) allocate(sigma(3, 3, nimg))
+
+   call get_dispersion_images(mol%ptr, disp%ptr, param%ptr, disp%cutoff, xyz, lattice, &
+      & energy, gradient, sigma, partition=disp%partition, mixed=disp%mixed)
+
+   c_energy(:nimg) = energy
+   if (present(c_gradient)) then
+      c_gradient(:3, :nat*nimg) = reshape(gradient, [3, nat*nimg])
+   end if
+   if (present(c_sigma)) then
+      c_sigma(:3, :3, :nimg) = sigma
+   end if
+
+end subroutine get_dispersion_images_api
+
+
+!> Estimate the dispersion energy per atom neglected by the realspace cutoffs
+subroutine get_realspace_cutoff_error_api(verror, vmol, vdisp, vparam, &
+      & error2, error3) &
+      & bind(C, name=namespace//"get_realspace_cutoff_error")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_realspace_cutoff_error_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   real(c_double), intent(out) :: error2
+   real(c_double), intent(out) :: error3
+   real(wp), allocatable :: disp2(:, :), disp3(:, :)
+
+   if (debug) print'("[Info]",1x, a)', "get_realspace_cutoff_error"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+   call c_f_pointer(vparam, param)
+
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
+   end if
+
+   allocate(disp2(mol%ptr%nid, mol%ptr%nid), disp3(mol%ptr%nid, mol%ptr%nid))
+   call get_pair_cutoffs(mol%ptr, disp%ptr, param%ptr, disp%cutoff, disp2, disp3, &
+      & error2, error3)
+
+end subroutine get_realspace_cutoff_error_api
+
+
+!> Calculate dispersion
+subroutine get_properties_api(verror, vmol, vdisp, &
+      & c_cn, c_charges, c_c6, c_alpha) &
+      & bind(C, name=namespace//"get_properties")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_properties_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   real(c_double), intent(out), optional :: c_cn(*)
+   real(wp), allocatable :: cn(:)
+   real(c_double), intent(out), optional :: c_charges(*)
+   real(wp), allocatable :: charges(:)
+   real(c_double), intent(out), optional :: c_c6(*)
+   real(wp), allocatable :: c6(:, :)
+   real(c_double), intent(out), optional :: c_alpha(*)
+   real(wp), allocatable :: alpha(:)
+
+   if (debug) print'("[Info]",1x, a)', "get_properties"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (present(c_cn)) allocate(cn(mol%ptr%nat))
+   if (present(c_charges)) allocate(charges(mol%ptr%nat))
+   if (present(c_c6)) allocate(c6(mol%ptr%nat, mol%ptr%nat))
+   if (present(c_alpha)) allocate(alpha(mol%ptr%nat))
+   call get_properties(mol%ptr, disp%ptr, disp%cutoff, cn, charges, c6, alpha)
+
+   if (present(c_cn)) then
+      c_cn(:size(cn)) = cn
+   end if
+
+   if (present(c_charges)) then
+      c_charges(:size(charges)) = charges
+   end if
+
+   if (present(c_c6)) then
+      c_c6(:size(c6)) = reshape(c6, [size(c6)])
+   end if
+
+   if (present(c_alpha)) then
+      c_alpha(:size(alpha)) = alpha
+   end if
+
+end subroutine get_properties_api
+
+
+!> Calculate dispersion related properties with externally supplied partial charges
+subroutine get_properties_with_charges_api(verror, vmol, vdisp, &
+      & c_charges, c_cn, c_c6, c_alpha) &
+      & bind(C, name=namespace//"get_properties_with_charges")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_properties_with_charges_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   real(c_double), intent(in) :: c_charges(*)
+   real(wp), allocatable :: q(:)
+   real(c_double), intent(out), optional :: c_cn(*)
+   real(wp), allocatable :: cn(:)
+   real(c_double), intent(out), optional :: c_c6(*)
+   real(wp), allocatable :: c6(:, :)
+   real(c_double), intent(out), optional :: c_alpha(*)
+   real(wp), allocatable :: alpha(:)
+
+   if (debug) print'("[Info]",1x, a)', "get_properties_with_charges"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (present(c_cn)) allocate(cn(mol%ptr%nat))
+   if (present(c_c6)) allocate(c6(mol%ptr%nat, mol%ptr%nat))
+   if (present(c_alpha)) allocate(alpha(mol%ptr%nat))
+   call get_properties(mol%ptr, disp%ptr, disp%cutoff, cn, q, c6, alpha, &
+      & charges=c_charges(:mol%ptr%nat))
+
+   if (present(c_cn)) then
+      c_cn(:size(cn)) = cn
+   end if
+
+   if (present(c_c6)) then
+      c_c6(:size(c6)) = reshape(c6, [size(c6)])
+   end if
+
+   if (present(c_alpha)) then
       c_alpha(:size(alpha)) = alpha
    end if
 
-end subroutine get_properties_api
+end subroutine get_properties_with_charges_api
+
+
+!> Calculate C6 coefficients only for atom pairs within a real space cutoff, the
+!> pairs are stored in the dispersion model and retrieved separately
+subroutine get_sparse_c6_api(verror, vmol, vdisp, c_charges, c6_cutoff, npair) &
+      & bind(C, name=namespace//"get_sparse_c6")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_sparse_c6_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   real(c_double), intent(in), optional :: c_charges(*)
+   real(c_double), value, intent(in) :: c6_cutoff
+   integer(c_int), intent(out) :: npair
+
+   if (debug) print'("[Info]",1x, a)', "get_sparse_c6"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (present(c_charges)) then
+      call get_sparse_c6(mol%ptr, disp%ptr, disp%cutoff, c6_cutoff, disp%c6_pairs, &
+         & disp%c6_sparse, charges=c_charges(:mol%ptr%nat))
+   else
+      call get_sparse_c6(mol%ptr, disp%ptr, disp%cutoff, c6_cutoff, disp%c6_pairs, &
+         & disp%c6_sparse)
+   end if
+
+   npair = size(disp%c6_sparse)
+
+end subroutine get_sparse_c6_api
+
+
+!> Retrieve the atom pairs and C6 coefficients of the last sparse C6 evaluation,
+!> atom indices are zero-based
+subroutine get_sparse_c6_pairs_api(verror, vdisp, c_index, c_c6) &
+      & bind(C, name=namespace//"get_sparse_c6_pairs")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_sparse_c6_pairs_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   integer(c_int), intent(out), optional :: c_index(2, *)
+   real(c_double), intent(out), optional :: c_c6(*)
+   integer :: npair
+
+   if (debug) print'("[Info]",1x, a)', "get_sparse_c6_pairs"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.(allocated(disp%c6_pairs) .and. allocated(disp%c6_sparse))) then
+      call fatal_error(error%ptr, "Sparse C6 coefficients have not been evaluated")
+      return
+   end if
+
+   npair = size(disp%c6_sparse)
+   if (present(c_index)) then
+      c_index(:, :npair) = disp%c6_pairs - 1
+   end if
+
+   if (present(c_c6)) then
+      c_c6(:npair) = disp%c6_sparse
+   end if
+
+end subroutine get_sparse_c6_pairs_api
+
+
+!> Evaluate the damping parameter independent pair data of the dispersion model
+subroutine get_pair_data_api(verror, vmol, vdisp, c_charges, c_c6, c_c6_3, c_rrij) &
+      & bind(C, name=namespace//"get_pair_data")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_pair_data_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   real(c_double), intent(in), optional :: c_charges(*)
+   real(c_double), intent(out), optional :: c_c6(*)
+   real(wp), allocatable :: c6(:, :)
+   real(c_double), intent(out), optional :: c_c6_3(*)
+   real(wp), allocatable :: c6_3(:, :)
+   real(c_double), intent(out), optional :: c_rrij(*)
+   real(wp), allocatable :: rrij(:, :)
+
+   if (debug) print'("[Info]",1x, a)', "get_pair_data"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   allocate(c6(mol%ptr%nat, mol%ptr%nat), c6_3(mol%ptr%nat, mol%ptr%nat), &
+      & rrij(mol%ptr%nat, mol%ptr%nat))
+   if (present(c_charges)) then
+      call get_pair_data(mol%ptr, disp%ptr, disp%cutoff, c6, c6_3, rrij, &
+         & charges=c_charges(:mol%ptr%nat))
+   else
+      call get_pair_data(mol%ptr, disp%ptr, disp%cutoff, c6, c6_3, rrij)
+   end if
+
+   if (present(c_c6)) then
+      c_c6(:size(c6)) = reshape(c6, [size(c6)])
+   end if
+
+   if (present(c_c6_3)) then
+      c_c6_3(:size(c6_3)) = reshape(c6_3, [size(c6_3)])
+   end if
+
+   if (present(c_rrij)) then
+      c_rrij(:size(rrij)) = reshape(rrij, [size(rrij)])
+   end if
+
+end subroutine get_pair_data_api
+
+
+!> Create new electronegativity equilibration solver
+function new_eeq_solver_api(verror, cutoff, conv, max_iter) &
+      & result(vsolver) &
+      & bind(C, name=namespace//"new_eeq_solver")
+   !DEC$ ATTRIBUTES DLLEXPORT :: new_eeq_solver_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   real(c_double), value, intent(in) :: cutoff
+   real(c_double), value, intent(in) :: conv
+   integer(c_int), value, intent(in) :: max_iter
+   type(c_ptr) :: vsolver
+   type(vp_eeq_solver), pointer :: solver
+
+   if (debug) print'("[Info]",1x, a)', "new_eeq_solver"
+
+   vsolver = c_null_ptr
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (cutoff <= 0.0_wp .or. conv <= 0.0_wp .or. max_iter < 1) then
+      call fatal_error(error%ptr, "Invalid parameters for the charge solver")
+      return
+   end if
+
+   allocate(solver)
+   call new_eeq_solver(solver%ptr, cutoff, conv, max_iter)
+   vsolver = c_loc(solver)
+
+end function new_eeq_solver_api
+
+
+!> Delete electronegativity equilibration solver
+subroutine delete_eeq_solver_api(vsolver) &
+      & bind(C, name=namespace//"delete_eeq_solver")
+   !DEC$ ATTRIBUTES DLLEXPORT :: delete_eeq_solver_api
+   type(c_ptr), intent(inout) :: vsolver
+   type(vp_eeq_solver), pointer :: solver
+
+   if (debug) print'("[Info]",1x, a)', "delete_eeq_solver"
+
+   if (c_associated(vsolver)) then
+      call c_f_pointer(vsolver, solver)
+
+      deallocate(solver)
+      vsolver = c_null_ptr
+   end if
+
+end subroutine delete_eeq_solver_api
+
+
+!> Solve the electronegativity equilibration iteratively, starting from the
+!> charges of the previous call
+subroutine solve_eeq_api(verror, vsolver, vmol, c_chi, c_eta, c_rad, c_charges, &
+      & c_dEdq, c_gradient, c_sigma) &
+      & bind(C, name=namespace//"solve_eeq")
+   !DEC$ ATTRIBUTES DLLEXPORT :: solve_eeq_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vsolver
+   type(vp_eeq_solver), pointer :: solver
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   real(c_double), intent(in) :: c_chi(*)
+   real(c_double), intent(in) :: c_eta(*)
+   real(c_double), intent(in) :: c_rad(*)
+   real(c_double), intent(out) :: c_charges(*)
+   real(c_double), intent(in), optional :: c_dEdq(*)
+   real(c_double), intent(out), optional :: c_gradient(3, *)
+   real(wp), allocatable :: gradient(:, :)
+   real(c_double), intent(out), optional :: c_sigma(3, 3)
+   real(wp), allocatable :: sigma(:, :)
+   real(wp), allocatable :: eta(:), rad(:)
+   integer :: nat, iat
+
+   if (debug) print'("[Info]",1x, a)', "solve_eeq"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vsolver)) then
+      call fatal_error(error%ptr, "Charge solver is missing")
+      return
+   end if
+   call c_f_pointer(vsolver, solver)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+   nat = mol%ptr%nat
+
+   if ((present(c_gradient) .or. present(c_sigma)) .and. .not.present(c_dEdq)) then
+      call fatal_error(error%ptr, "Energy derivative w.r.t. the charges is missing")
+      return
+   end if
+
+   ! Hardness and width are given per atom in C, but are parameters of the species
+   allocate(eta(mol%ptr%nid), rad(mol%ptr%nid))
+   do iat = 1, nat
+      eta(mol%ptr%id(iat)) = c_eta(iat)
+      rad(mol%ptr%id(iat)) = c_rad(iat)
+   end do
+
+   if (present(c_gradient)) allocate(gradient(3, nat), source=0.0_wp)
+   if (present(c_sigma)) allocate(sigma(3, 3), source=0.0_wp)
+
+   if (present(c_dEdq)) then
+      call solver%ptr%solve(error%ptr, mol%ptr, c_chi(:nat), eta, rad, &
+         & c_charges(:nat), dEdq=c_dEdq(:nat), gradient=gradient, sigma=sigma)
+   else
+      call solver%ptr%solve(error%ptr, mol%ptr, c_chi(:nat), eta, rad, &
+         & c_charges(:nat))
+   end if
+   if (allocated(error%ptr)) return
+
+   if (present(c_gradient)) then
+      c_gradient(:3, :nat) = gradient
+   end if
+
+   if (present(c_sigma)) then
+      c_sigma(:3, :3) = sigma
+   end if
+
+end subroutine solve_eeq_api
+
+
+!> Initialize incremental energy updates for trial moves of a structure
+subroutine new_incremental_api(verror, vmol, vdisp, vparam, c_energy) &
+      & bind(C, name=namespace//"new_incremental")
+   !DEC$ ATTRIBUTES DLLEXPORT :: new_incremental_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   real(c_double), intent(out) :: c_energy
+
+   if (debug) print'("[Info]",1x, a)', "new_incremental"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+   call c_f_pointer(vparam, param)
+
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      return
+   end if
+
+   if (allocated(disp%incremental)) deallocate(disp%incremental)
+   allocate(disp%incremental)
+   call new_incremental_dispersion(error%ptr, disp%incremental, mol%ptr, disp%ptr, &
+      & param%ptr, disp%cutoff)
+   if (allocated(error%ptr)) then
+      deallocate(disp%incremental)
+      return
+   end if
+
+   c_energy = disp%incremental%get_energy()
+
+end subroutine new_incremental_api
+
+
+!> Propose new positions for a set of atoms and obtain the energy change
+subroutine propose_displacement_api(verror, vdisp, vparam, natoms, c_atoms, &
+      & c_positions, frozen, c_delta) &
+      & bind(C, name=namespace//"propose_displacement")
+   !DEC$ ATTRIBUTES DLLEXPORT :: propose_displacement_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   integer(c_int), value, intent(in) :: natoms
+   integer(c_int), intent(in) :: c_atoms(*)
+   real(c_double), intent(in) :: c_positions(3, *)
+   logical(c_bool), value, intent(in) :: frozen
+   real(c_double), intent(out) :: c_delta
+   real(wp) :: delta
+
+   if (debug) print'("[Info]",1x, a)', "propose_displacement"
+
+   call get_incremental(verror, vdisp, vparam, error, disp, param)
+   if (.not.associated(param)) return
+
+   if (natoms < 0) then
+      call fatal_error(error%ptr, "Invalid number of atoms in move")
+      return
+   end if
+
+   ! Selection is zero based in C
+   call disp%incremental%propose_displacement(error%ptr, disp%ptr, param%ptr, &
+      & disp%cutoff, c_atoms(:natoms) + 1, c_positions(:, :natoms), logical(frozen), delta)
+   if (allocated(error%ptr)) return
+
+   c_delta = delta
+
+end subroutine propose_displacement_api
+
+
+!> Propose the insertion of a set of atoms and obtain the energy change
+subroutine propose_insertion_api(verror, vdisp, vparam, natoms, c_numbers, &
+      & c_positions, frozen, c_delta) &
+      & bind(C, name=namespace//"propose_insertion")
+   !DEC$ ATTRIBUTES DLLEXPORT :: propose_insertion_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   integer(c_int), value, intent(in) :: natoms
+   integer(c_int), intent(in) :: c_numbers(*)
+   real(c_double), intent(in) :: c_positions(3, *)
+   logical(c_bool), value, intent(in) :: frozen
+   real(c_double), intent(out) :: c_delta
+   real(wp) :: delta
+
+   if (debug) print'("[Info]",1x, a)', "propose_insertion"
+
+   call get_incremental(verror, vdisp, vparam, error, disp, param)
+   if (.not.associated(param)) return
+
+   if (natoms < 0) then
+      call fatal_error(error%ptr, "Invalid number of atoms in move")
+      return
+   end if
+
+   call disp%incremental%propose_insertion(error%ptr, disp%ptr, param%ptr, &
+      & disp%cutoff, c_numbers(:natoms), c_positions(:, :natoms), logical(frozen), delta)
+   if (allocated(error%ptr)) return
+
+   c_delta = delta
+
+end subroutine propose_insertion_api
+
+
+!> Propose the deletion of a set of atoms and obtain the energy change
+subroutine propose_deletion_api(verror, vdisp, vparam, natoms, c_atoms, frozen, &
+      & c_delta) &
+      & bind(C, name=namespace//"propose_deletion")
+   !DEC$ ATTRIBUTES DLLEXPORT :: propose_deletion_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   integer(c_int), value, intent(in) :: natoms
+   integer(c_int), intent(in) :: c_atoms(*)
+   logical(c_bool), value, intent(in) :: frozen
+   real(c_double), intent(out) :: c_delta
+   real(wp) :: delta
+
+   if (debug) print'("[Info]",1x, a)', "propose_deletion"
+
+   call get_incremental(verror, vdisp, vparam, error, disp, param)
+   if (.not.associated(param)) return
+
+   if (natoms < 0) then
+      call fatal_error(error%ptr, "Invalid number of atoms in move")
+      return
+   end if
+
+   ! Selection is zero based in C
+   call disp%incremental%propose_deletion(error%ptr, disp%ptr, param%ptr, &
+      & disp%cutoff, c_atoms(:natoms) + 1, logical(frozen), delta)
+   if (allocated(error%ptr)) return
+
+   c_delta = delta
+
+end subroutine propose_deletion_api
+
+
+!> Accept or reject the proposed move, accepting commits the trial state
+subroutine finish_move_api(verror, vdisp, accept) &
+      & bind(C, name=namespace//"finish_move")
+   !DEC$ ATTRIBUTES DLLEXPORT :: finish_move_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   logical(c_bool), value, intent(in) :: accept
+
+   if (debug) print'("[Info]",1x, a)', "finish_move"
+
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.allocated(disp%incremental)) then
+      call fatal_error(error%ptr, "Incremental energy updates are not initialized")
+      return
+   end if
+
+   if (accept) then
+      call disp%incremental%accept_move(error%ptr)
+   else
+      call disp%incremental%reject_move()
+   end if
+
+end subroutine finish_move_api
+
+
+!> Select a moving region embedded in a frozen environment and cache the environment
+subroutine set_model_embedding_api(verror, vmol, vdisp, vparam, natoms, c_region, &
+      & interval) &
+      & bind(C, name=namespace//"set_model_embedding")
+   !DEC$ ATTRIBUTES DLLEXPORT :: set_model_embedding_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   integer(c_int), value, intent(in) :: natoms
+   integer(c_int), intent(in) :: c_region(*)
+   integer(c_int), value, intent(in) :: interval
+
+   if (debug) print'("[Info]",1x, a)', "set_model_embedding"
+
+   call get_embedding_handles(verror, vmol, vdisp, vparam, error, mol, disp, param)
+   if (.not.associated(param)) return
+
+   if (natoms < 0) then
+      call fatal_error(error%ptr, "Invalid number of atoms in embedded region")
+      return
+   end if
+
+   if (interval < 0) then
+      call fatal_error(error%ptr, "Invalid refresh interval for embedded region")
+      return
+   end if
+
+   if (allocated(disp%embedding)) deallocate(disp%embedding)
+   allocate(disp%embedding)
+   ! Selection is zero based in C
+   call new_embedding_dispersion(error%ptr, disp%embedding, mol%ptr, disp%ptr, &
+      & param%ptr, disp%cutoff, c_region(:natoms) + 1, interval)
+   if (allocated(error%ptr)) then
+      deallocate(disp%embedding)
+   end if
+
+end subroutine set_model_embedding_api
+
+
+!> Recompute the cached environment of the embedded region
+subroutine refresh_embedding_api(verror, vmol, vdisp, vparam) &
+      & bind(C, name=namespace//"refresh_embedding")
+   !DEC$ ATTRIBUTES DLLEXPORT :: refresh_embedding_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+
+   if (debug) print'("[Info]",1x, a)', "refresh_embedding"
+
+   call get_embedding_handles(verror, vmol, vdisp, vparam, error, mol, disp, param)
+   if (.not.associated(param)) return
+
+   if (.not.allocated(disp%embedding)) then
+      call fatal_error(error%ptr, "Embedded region is not initialized")
+      return
+   end if
+
+   call disp%embedding%refresh(error%ptr, mol%ptr, disp%ptr, param%ptr, disp%cutoff)
+
+end subroutine refresh_embedding_api
+
+
+!> Evaluate the dispersion energy and the gradient w.r.t. the region atoms
+!> of the embedded region
+subroutine get_embedded_dispersion_api(verror, vmol, vdisp, vparam, &
+      & energy, c_gradient) &
+      & bind(C, name=namespace//"get_embedded_dispersion")
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_embedded_dispersion_api
+   type(c_ptr), value :: verror
+   type(vp_error), pointer :: error
+   type(c_ptr), value :: vmol
+   type(vp_structure), pointer :: mol
+   type(c_ptr), value :: vdisp
+   type(vp_model), pointer :: disp
+   type(c_ptr), value :: vparam
+   type(vp_param), pointer :: param
+   real(c_double), intent(out) :: energy
+   real(c_double), intent(out), optional :: c_gradient(3, *)
+   real(wp), allocatable :: gradient(:, :)
+
+   if (debug) print'("[Info]",1x, a)', "get_embedded_dispersion"
+
+   call get_embedding_handles(verror, vmol, vdisp, vparam, error, mol, disp, param)
+   if (.not.associated(param)) return
+
+   if (.not.allocated(disp%embedding)) then
+      call fatal_error(error%ptr, "Embedded region is not initialized")
+      return
+   end if
+
+   if (present(c_gradient)) then
+      allocate(gradient(3, mol%ptr%nat))
+      call disp%embedding%get_dispersion(error%ptr, mol%ptr, disp%ptr, param%ptr, &
+         & disp%cutoff, energy, gradient)
+      if (allocated(error%ptr)) return
+      c_gradient(:3, :mol%ptr%nat) = gradient
+   else
+      call disp%embedding%get_dispersion(error%ptr, mol%ptr, disp%ptr, param%ptr, &
+         & disp%cutoff, energy)
+   end if
+
+end subroutine get_embedded_dispersion_api
+
 
 
 subroutine f_c_character(rhs, lhs, len)
@@ -971,4 +2639,85 @@ subroutine verify_structure(error, mol)
 end subroutine verify_structure
 
 
+!> Resolve the handles of the entry points for incremental energy updates,
+!> the damping parameters are only associated if all handles are valid
+subroutine get_incremental(verror, vdisp, vparam, error, disp, param)
+   type(c_ptr), intent(in) :: verror
+   type(vp_error), pointer, intent(out) :: error
+   type(c_ptr), intent(in) :: vdisp
+   type(vp_model), pointer, intent(out) :: disp
+   type(c_ptr), intent(in) :: vparam
+   type(vp_param), pointer, intent(out) :: param
+
+   nullify(error, disp, param)
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.allocated(disp%incremental)) then
+      call fatal_error(error%ptr, "Incremental energy updates are not initialized")
+      return
+   end if
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+
+   call c_f_pointer(vparam, param)
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      nullify(param)
+   end if
+
+end subroutine get_incremental
+
+
+!> Resolve the handles of the entry points for the embedded region,
+!> the damping parameters are only associated if all handles are valid
+subroutine get_embedding_handles(verror, vmol, vdisp, vparam, error, mol, disp, param)
+   type(c_ptr), intent(in) :: verror
+   type(vp_error), pointer, intent(out) :: error
+   type(c_ptr), intent(in) :: vmol
+   type(vp_structure), pointer, intent(out) :: mol
+   type(c_ptr), intent(in) :: vdisp
+   type(vp_model), pointer, intent(out) :: disp
+   type(c_ptr), intent(in) :: vparam
+   type(vp_param), pointer, intent(out) :: param
+
+   nullify(error, mol, disp, param)
+   if (.not.c_associated(verror)) return
+   call c_f_pointer(verror, error)
+
+   if (.not.c_associated(vmol)) then
+      call fatal_error(error%ptr, "Molecular structure data is missing")
+      return
+   end if
+   call c_f_pointer(vmol, mol)
+
+   if (.not.c_associated(vdisp)) then
+      call fatal_error(error%ptr, "Dispersion model is missing")
+      return
+   end if
+   call c_f_pointer(vdisp, disp)
+
+   if (.not.c_associated(vparam)) then
+      call fatal_error(error%ptr, "Damping parameters are missing")
+      return
+   end if
+
+   call c_f_pointer(vparam, param)
+   if (.not.allocated(param%ptr)) then
+      call fatal_error(error%ptr, "Damping parameters are not initialized")
+      nullify(param)
+   end if
+
+end subroutine get_embedding_handles
+
+
 end module dftd4_api
@@ -0,0 +1,639 @@
+! This file is part of dftd4.
+! SPDX-Identifier: LGPL-3.0-or-later
+!
+! dftd4 is free software: you can redistribute it and/or modify it under
+! the terms of the Lesser GNU General Public License as published by
+! the Free Software Foundation, either version 3 of the License, or
+! (at your option) any later version.
+!
+! dftd4 is distributed in the hope that it will be useful,
+! but WITHOUT ANY WARRANTY; without even the implied warranty of
+! MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+! Lesser GNU General Public License for more details.
+!
+! You should have received a copy of the Lesser GNU General Public License
+! along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+
+!> Generic iterative solver for electronegativity equilibration charges.
+!>
+!> The charges minimize the electrostatic energy of Gaussian charge distributions
+!>
+!>   E(q) = sum_i chi_i q_i + 1/2 sum_ij q_i A_ij q_j
+!>
+!> under the constraint of a fixed total charge. The Coulomb interaction is
+!> truncated and shifted at a real space cutoff, which keeps the Coulomb matrix
+!> sparse for large systems. The shift is applied to all pairs including the self
+!> interaction, such that the charges of a system within the cutoff are the ones
+!> of the complete Coulomb interaction. The constrained linear system is solved with a
+!> projected conjugate gradient method using a diagonal preconditioner, the
+!> response equations for the derivatives of the charges are solved the same way.
+!>
+!> Instead of the dense derivatives of the charges, the gradient of an energy
+!> depending on the charges can be obtained from a single adjoint linear system,
+!> which keeps the memory linear in the number of atoms.
+!>
+!> Charges and their derivatives of the previous solve are used as starting guess,
+!> such that subsequent steps of a geometry optimization or molecular dynamics
+!> converge in a few iterations.
+!>
+!> This is a standalone utility, electronegativities, hardnesses and widths are
+!> input of the solver. It is not used by the dispersion models, which obtain their
+!> default charges with coordination number dependent electronegativities from the
+!> multicharge library.
+module dftd4_charge
+   use dftd4_cutoff, only : get_lattice_points
+   use mctc_env, only : wp, error_type, fatal_error
+   use mctc_io, only : structure_type
+   implicit none
+   private
+
+   public :: eeq_solver, new_eeq_solver
+
+
+   !> Square root of pi
+   real(wp), parameter :: sqrtpi = sqrt(acos(-1.0_wp))
+
+   !> Self interaction of a Gaussian charge distribution in units of its width
+   real(wp), parameter :: sqrt2pi = sqrt(2.0_wp/acos(-1.0_wp))
+
+
+   !> Sparse Coulomb matrix in compressed row storage
+   type :: coulomb_matrix
+      !> First entry of each row
+      integer, allocatable :: ptr(:)
+      !> Column of each entry
+      integer, allocatable :: col(:)
+      !> Value of each entry
+      real(wp), allocatable :: val(:)
+      !> Inverse diagonal used for preconditioning
+      real(wp), allocatable :: pinv(:)
+   end type coulomb_matrix
+
+
+   !> Iterative electronegativity equilibration with warm starts
+   type :: eeq_solver
+      !> Real space cutoff of the Coulomb interaction
+      real(wp) :: cutoff = 40.0_wp
+      !> Convergence threshold for the norm of the residual
+      real(wp) :: conv = 1.0e-10_wp
+      !> Maximum number of iterations for each linear system
+      integer :: max_iter = 1000
+      !> Number of iterations in the last solve, including the response equations
+      integer :: iterations = 0
+      !> Charges of the last solve
+      real(wp), allocatable, private :: qvec(:)
+      !> Derivative of the charges w.r.t. the cartesian coordinates of the last solve
+      real(wp), allocatable, private :: dqdr(:, :, :)
+      !> Derivative of the charges w.r.t. strain deformations of the last solve
+      real(wp), allocatable, private :: dqdL(:, :, :)
+      !> Solution of the adjoint linear system of the last solve
+      real(wp), allocatable, private :: lvec(:)
+   contains
+      !> Solve for the charges and optionally their derivatives
+      procedure :: solve
+      !> Discard the starting guess from the last solve
+      procedure :: reset
+   end type eeq_solver
+
+
+contains
+
+
+!> Create a new iterative electronegativity equilibration solver
+subroutine new_eeq_solver(self, cutoff, conv, max_iter)
+
+   !> Instance of the solver
+   type(eeq_solver), intent(out) :: self
+
+   !> Real space cutoff of the Coulomb interaction
+   real(wp), intent(in), optional :: cutoff
+
+   !> Convergence threshold for the norm of the residual
+   real(wp), intent(in), optional :: conv
+
+   !> Maximum number of iterations for each linear system
+   integer, intent(in), optional :: max_iter
+
+   if (present(cutoff)) self%cutoff = cutoff
+   if (present(conv)) self%conv = conv
+   if (present(max_iter)) self%max_iter = max_iter
+
+end subroutine new_eeq_solver
+
+
+!> Discard the starting guess from the last solve
+subroutine reset(self)
+
+   !> Instance of the solver
+   class(eeq_solver), intent(inout) :: self
+
+   if (allocated(self%qvec)) deallocate(self%qvec)
+   if (allocated(self%dqdr)) deallocate(self%dqdr)
+   if (allocated(self%dqdL)) deallocate(self%dqdL)
+   if (allocated(self%lvec)) deallocate(self%lvec)
+   self%iterations = 0
+
+end subroutine reset
+
+
+!> Solve the electronegativity equilibration for the charges and their derivatives.
+!>
+!> With the derivative of an energy w.r.t. the charges, its gradient and virial
+!> due to the response of the charges are added, requiring only a single adjoint
+!> linear system instead of the dense derivatives of the charges.
+subroutine solve(self, error, mol, chi, eta, rad, qvec, dchidr, dchidL, dqdr, dqdL, &
+      & dEdq, gradient, sigma)
+
+   !> Instance of the solver
+   class(eeq_solver), intent(inout) :: self
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Electronegativity of each atom
+   real(wp), intent(in) :: chi(:)
+
+   !> Chemical hardness of each species
+   real(wp), intent(in) :: eta(:)
+
+   !> Width of the Gaussian charge distribution of each species
+   real(wp), intent(in) :: rad(:)
+
+   !> Atomic partial charges
+   real(wp), intent(out) :: qvec(:)
+
+   !> Derivative of the electronegativities w.r.t. the cartesian coordinates
+   real(wp), intent(in), optional :: dchidr(:, :, :)
+
+   !> Derivative of the electronegativities w.r.t. strain deformations
+   real(wp), intent(in), optional :: dchidL(:, :, :)
+
+   !> Derivative of the charges w.r.t. the cartesian coordinates
+   real(wp), intent(out), optional :: dqdr(:, :, :)
+
+   !> Derivative of the charges w.r.t. strain deformations
+   real(wp), intent(out), optional :: dqdL(:, :, :)
+
+   !> Derivative of an energy w.r.t. the charges
+   real(wp), intent(in), optional :: dEdq(:)
+
+   !> Gradient of the energy, the response of the charges is added
+   real(wp), intent(inout), optional :: gradient(:, :)
+
+   !> Virial of the energy, the response of the charges is added
+   real(wp), intent(inout), optional :: sigma(:, :)
+
+   type(coulomb_matrix) :: amat
+   integer :: iat, ic, jc, iter, stat, nfail, total
+   real(wp), allocatable :: trans(:, :), rhs(:), dadr(:, :, :), dadL(:, :, :)
+
+   call get_lattice_points(mol%periodic, mol%lattice, self%cutoff, trans)
+   call get_coulomb_matrix(mol, trans, self%cutoff, eta, rad, amat)
+
+   if (allocated(self%qvec)) then
+      if (size(self%qvec) /= mol%nat) call self%reset
+   end if
+
+   if (allocated(self%qvec)) then
+      qvec(:) = self%qvec
+   else
+      qvec(:) = mol%charge / mol%nat
+   end if
+   call solve_constrained(amat, -chi, qvec, mol%charge, self%conv, self%max_iter, &
+      & iter, stat)
+   self%iterations = iter
+   if (stat /= 0) then
+      call fatal_error(error, "Iterative charge solver did not converge")
+      return
+   end if
+   self%qvec = qvec
+
+   if (present(dEdq)) then
+      if (.not.allocated(self%lvec)) allocate(self%lvec(mol%nat), source=0.0_wp)
+      call solve_constrained(amat, dEdq, self%lvec, 0.0_wp, self%conv, &
+         & self%max_iter, iter, stat)
+      self%iterations = self%iterations + iter
+      if (stat /= 0) then
+         call fatal_error(error, "Iterative charge solver did not converge")
+         return
+      end if
+      call add_coulomb_response(mol, trans, self%cutoff, rad, qvec, self%lvec, &
+         & gradient, sigma)
+      if (present(gradient) .and. present(dchidr)) then
+         do iat = 1, mol%nat
+            gradient(:, :) = gradient - self%lvec(iat) * dchidr(:, :, iat)
+         end do
+      end if
+      if (present(sigma) .and. present(dchidL)) then
+         do iat = 1, mol%nat
+            sigma(:, :) = sigma - self%lvec(iat) * dchidL(:, :, iat)
+         end do
+      end if
+   end if
+
+   if (.not.(present(dqdr) .or. present(dqdL))) return
+
+   allocate(dadr(3, mol%nat, mol%nat), dadL(3, 3, mol%nat))
+   call get_coulomb_derivs(mol, trans, self%cutoff, rad, qvec, dadr, dadL)
+   if (present(dchidr)) dadr(:, :, :) = dadr + dchidr
+   if (present(dchidL)) dadL(:, :, :) = dadL + dchidL
+
+   nfail = 0
+   total = 0
+   if (present(dqdr)) then
+      if (.not.allocated(self%dqdr)) then
+         allocate(self%dqdr(3, mol%nat, mol%nat), source=0.0_wp)
+      end if
+
+      !$omp parallel do default(none) schedule(dynamic) collapse(2) &
+      !$omp shared(self, mol, amat, dadr) private(iat, ic, rhs, iter, stat) &
+      !$omp reduction(+:nfail, total)
+      do iat = 1, mol%nat
+         do ic = 1, 3
+            rhs = -dadr(ic, iat, :)
+            call solve_constrained(amat, rhs, self%dqdr(ic, iat, :), 0.0_wp, &
+               & self%conv, self%max_iter, iter, stat)
+            total = total + iter
+            nfail = nfail + stat
+         end do
+      end do
+      dqdr(:, :, :) = self%dqdr
+   end if
+
+   if (present(dqdL)) then
+      if (.not.allocated(self%dqdL)) then
+         allocate(self%dqdL(3, 3, mol%nat), source=0.0_wp)
+      end if
+
+      !$omp parallel do default(none) schedule(dynamic) collapse(2) &
+      !$omp shared(self, amat, dadL) private(ic, jc, rhs, iter, stat) &
+      !$omp reduction(+:nfail, total)
+      do jc = 1, 3
+         do ic = 1, 3
+            rhs = -dadL(ic, jc, :)
+            call solve_constrained(amat, rhs, self%dqdL(ic, jc, :), 0.0_wp, &
+               & self%conv, self%max_iter, iter, stat)
+            total = total + iter
+            nfail = nfail + stat
+         end do
+      end do
+      dqdL(:, :, :) = self%dqdL
+   end if
+
+   self%iterations = self%iterations + total
+   if (nfail > 0) then
+      call fatal_error(error, "Iterative charge solver did not converge")
+      return
+   end if
+
+end subroutine solve
+
+
+!> Shifted Coulomb interaction between Gaussian charge distributions
+elemental function get_coulomb(gam, r, cutoff) result(coulomb)
+
+   !> Inverse width of the combined charge distributions
+   real(wp), intent(in) :: gam
+
+   !> Distance between the charges
+   real(wp), intent(in) :: r
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Coulomb interaction
+   real(wp) :: coulomb
+
+   coulomb = erf(gam*r)/r - erf(gam*cutoff)/cutoff
+
+end function get_coulomb
+
+
+!> Assemble the sparse Coulomb matrix including the chemical hardness
+subroutine get_coulomb_matrix(mol, trans, cutoff, eta, rad, amat)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Chemical hardness of each species
+   real(wp), intent(in) :: eta(:)
+
+   !> Width of the Gaussian charge distribution of each species
+   real(wp), intent(in) :: rad(:)
+
+   !> Sparse Coulomb matrix
+   type(coulomb_matrix), intent(out) :: amat
+
+   integer :: iat, jat, izp, jzp, itr, nnz, ij
+   real(wp) :: vec(3), r2, cutoff2, gam, aij
+   integer, allocatable :: nrow(:)
+
+   cutoff2 = cutoff**2
+   allocate(nrow(mol%nat), source=0)
+
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(mol, trans, cutoff2, nrow) private(iat, jat, itr, vec, r2)
+   do iat = 1, mol%nat
+      do jat = 1, mol%nat
+         do itr = 1, size(trans, 2)
+            vec(:) = mol%xyz(:, iat) - mol%xyz(:, jat) - trans(:, itr)
+            r2 = sum(vec**2)
+            if (iat == jat .or. r2 <= cutoff2) then
+               nrow(iat) = nrow(iat) + 1
+               exit
+            end if
+         end do
+      end do
+   end do
+
+   allocate(amat%ptr(mol%nat + 1), amat%pinv(mol%nat))
+   amat%ptr(1) = 1
+   do iat = 1, mol%nat
+      amat%ptr(iat + 1) = amat%ptr(iat) + nrow(iat)
+   end do
+   nnz = amat%ptr(mol%nat + 1) - 1
+   allocate(amat%col(nnz), amat%val(nnz))
+
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(mol, trans, cutoff, cutoff2, eta, rad, amat) &
+   !$omp private(iat, jat, izp, jzp, itr, ij, vec, r2, gam, aij)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      ij = amat%ptr(iat)
+      do jat = 1, mol%nat
+         jzp = mol%id(jat)
+         gam = 1.0_wp / sqrt(rad(izp)**2 + rad(jzp)**2)
+         aij = 0.0_wp
+         do itr = 1, size(trans, 2)
+            vec(:) = mol%xyz(:, iat) - mol%xyz(:, jat) - trans(:, itr)
+            r2 = sum(vec**2)
+            if (r2 > cutoff2 .or. r2 < epsilon(1.0_wp)) cycle
+            aij = aij + get_coulomb(gam, sqrt(r2), cutoff)
+         end do
+         if (iat == jat) then
+            ! Self interaction with the same shift as all other pairs, a uniform
+            ! shift of the Coulomb matrix is absorbed by the charge constraint
+            aij = aij + eta(izp) + sqrt2pi / rad(izp) - erf(gam*cutoff)/cutoff
+            amat%pinv(iat) = 1.0_wp / aij
+         else if (abs(aij) <= 0.0_wp) then
+            cycle
+         end if
+         amat%col(ij) = jat
+         amat%val(ij) = aij
+         ij = ij + 1
+      end do
+      ! Pairs exactly at the cutoff do not contribute
+      amat%col(ij:amat%ptr(iat + 1) - 1) = iat
+      amat%val(ij:amat%ptr(iat + 1) - 1) = 0.0_wp
+   end do
+
+end subroutine get_coulomb_matrix
+
+
+!> Derivative of the Coulomb matrix contracted with the charges
+subroutine get_coulomb_derivs(mol, trans, cutoff, rad, qvec, dadr, dadL)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of the Gaussian charge distribution of each species
+   real(wp), intent(in) :: rad(:)
+
+   !> Atomic partial charges
+   real(wp), intent(in) :: qvec(:)
+
+   !> Derivative of the Coulomb potential w.r.t. the cartesian coordinates
+   real(wp), intent(out) :: dadr(:, :, :)
+
+   !> Derivative of the Coulomb potential w.r.t. strain deformations
+   real(wp), intent(out) :: dadL(:, :, :)
+
+   integer :: iat, jat, izp, jzp, itr
+   real(wp) :: vec(3), dG(3), dS(3, 3), r1, r2, cutoff2, gam, dcoul
+
+   cutoff2 = cutoff**2
+   dadr(:, :, :) = 0.0_wp
+   dadL(:, :, :) = 0.0_wp
+
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(mol, trans, cutoff2, rad, qvec) reduction(+:dadr, dadL) &
+   !$omp private(iat, jat, izp, jzp, itr, vec, dG, dS, r1, r2, gam, dcoul)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      do jat = 1, iat
+         jzp = mol%id(jat)
+         gam = 1.0_wp / sqrt(rad(izp)**2 + rad(jzp)**2)
+         do itr = 1, size(trans, 2)
+            vec(:) = mol%xyz(:, iat) - mol%xyz(:, jat) - trans(:, itr)
+            r2 = sum(vec**2)
+            if (r2 > cutoff2 .or. r2 < epsilon(1.0_wp)) cycle
+            r1 = sqrt(r2)
+            dcoul = (2*gam*exp(-gam**2*r2)/(sqrtpi*r1) - erf(gam*r1)/r2) / r1
+            dG(:) = dcoul * vec
+            dS(:, :) = spread(dG, 1, 3) * spread(vec, 2, 3)
+
+            dadr(:, iat, iat) = dadr(:, iat, iat) + dG * qvec(jat)
+            dadr(:, jat, iat) = dadr(:, jat, iat) - dG * qvec(jat)
+            dadL(:, :, iat) = dadL(:, :, iat) + dS * qvec(jat)
+            if (iat /= jat) then
+               dadr(:, iat, jat) = dadr(:, iat, jat) + dG * qvec(iat)
+               dadr(:, jat, jat) = dadr(:, jat, jat) - dG * qvec(iat)
+               dadL(:, :, jat) = dadL(:, :, jat) + dS * qvec(iat)
+            end if
+         end do
+      end do
+   end do
+
+end subroutine get_coulomb_derivs
+
+
+!> Add the response of the charges to gradient and virial, contracting the derivative
+!> of the Coulomb matrix with the charges and the solution of the adjoint system
+subroutine add_coulomb_response(mol, trans, cutoff, rad, qvec, lvec, gradient, sigma)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of the Gaussian charge distribution of each species
+   real(wp), intent(in) :: rad(:)
+
+   !> Atomic partial charges
+   real(wp), intent(in) :: qvec(:)
+
+   !> Solution of the adjoint linear system
+   real(wp), intent(in) :: lvec(:)
+
+   !> Molecular gradient
+   real(wp), intent(inout), optional :: gradient(:, :)
+
+   !> Virial
+   real(wp), intent(inout), optional :: sigma(:, :)
+
+   integer :: iat, jat, izp, jzp, itr
+   real(wp) :: vec(3), dG(3), dS(3, 3), r1, r2, cutoff2, gam, dcoul, scale
+   real(wp), allocatable :: gtmp(:, :)
+
+   cutoff2 = cutoff**2
+   allocate(gtmp(3, mol%nat), source=0.0_wp)
+   dS(:, :) = 0.0_wp
+
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(mol, trans, cutoff2, rad, qvec, lvec) reduction(+:gtmp, dS) &
+   !$omp private(iat, jat, izp, jzp, itr, vec, dG, r1, r2, gam, dcoul, scale)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      do jat = 1, iat
+         jzp = mol%id(jat)
+         gam = 1.0_wp / sqrt(rad(izp)**2 + rad(jzp)**2)
+         scale = lvec(iat) * qvec(jat)
+         if (iat /= jat) scale = scale + lvec(jat) * qvec(iat)
+         do itr = 1, size(trans, 2)
+            vec(:) = mol%xyz(:, iat) - mol%xyz(:, jat) - trans(:, itr)
+            r2 = sum(vec**2)
+            if (r2 > cutoff2 .or. r2 < epsilon(1.0_wp)) cycle
+            r1 = sqrt(r2)
+            dcoul = (2*gam*exp(-gam**2*r2)/(sqrtpi*r1) - erf(gam*r1)/r2) / r1
+            dG(:) = scale * dcoul * vec
+
+            gtmp(:, iat) = gtmp(:, iat) - dG
+            gtmp(:, jat) = gtmp(:, jat) + dG
+            dS(:, :) = dS - spread(dG, 1, 3) * spread(vec, 2, 3)
+         end do
+      end do
+   end do
+
+   if (present(gradient)) gradient(:, :) = gradient + gtmp
+   if (present(sigma)) sigma(:, :) = sigma + dS
+
+end subroutine add_coulomb_response
+
+
+!> Solve the linear system with a constraint on the sum of the solution using
+!> a projected and preconditioned conjugate gradient method
+subroutine solve_constrained(amat, rhs, x, total, conv, max_iter, iter, stat)
+
+   !> Sparse Coulomb matrix
+   type(coulomb_matrix), intent(in) :: amat
+
+   !> Right hand side of the linear system
+   real(wp), intent(in) :: rhs(:)
+
+   !> Solution, contains the starting guess on entry
+   real(wp), intent(inout) :: x(:)
+
+   !> Constraint for the sum of the solution
+   real(wp), intent(in) :: total
+
+   !> Convergence threshold for the norm of the projected residual
+   real(wp), intent(in) :: conv
+
+   !> Maximum number of iterations
+   integer, intent(in) :: max_iter
+
+   !> Number of iterations performed
+   integer, intent(out) :: iter
+
+   !> Status, non-zero if not converged
+   integer, intent(out) :: stat
+
+   real(wp) :: rz, rz_new, alpha
+   real(wp), allocatable :: r(:), z(:), p(:), ap(:)
+
+   x(:) = x + (total - sum(x)) / size(x)
+   allocate(r(size(x)), z(size(x)), ap(size(x)))
+   call matvec(amat, x, ap)
+   ! The uniform part of the residual is the Lagrange multiplier of the constraint,
+   ! keeping only the projected residual avoids cancellation close to convergence
+   r(:) = rhs - ap
+   r(:) = r - sum(r) / size(r)
+
+   iter = 0
+   stat = 0
+   if (norm2(r) < conv) return
+
+   call precondition(amat, r, z)
+   p = z
+   rz = dot_product(r, z)
+   do while (iter < max_iter)
+      iter = iter + 1
+      call matvec(amat, p, ap)
+      alpha = rz / dot_product(p, ap)
+      x(:) = x + alpha * p
+      r(:) = r - alpha * ap
+      r(:) = r - sum(r) / size(r)
+      if (norm2(r) < conv) return
+
+      call precondition(amat, r, z)
+      rz_new = dot_product(r, z)
+      p(:) = z + (rz_new / rz) * p
+      rz = rz_new
+   end do
+   stat = 1
+
+end subroutine solve_constrained
+
+
+!> Apply the diagonal preconditioner and project onto the constraint
+pure subroutine precondition(amat, r, z)
+
+   !> Sparse Coulomb matrix
+   type(coulomb_matrix), intent(in) :: amat
+
+   !> Residual
+   real(wp), intent(in) :: r(:)
+
+   !> Preconditioned residual with vanishing sum
+   real(wp), intent(out) :: z(:)
+
+   z(:) = amat%pinv * r
+   z(:) = z - amat%pinv * (sum(z) / sum(amat%pinv))
+
+end subroutine precondition
+
+
+!> Product of the sparse Coulomb matrix with a vector
+pure subroutine matvec(amat, x, y)
+
+   !> Sparse Coulomb matrix
+   type(coulomb_matrix), intent(in) :: amat
+
+   !> Input vector
+   real(wp), intent(in) :: x(:)
+
+   !> Product vector
+   real(wp), intent(out) :: y(:)
+
+   integer :: iat, ij
+
+   do iat = 1, size(y)
+      y(iat) = 0.0_wp
+      do ij = amat%ptr(iat), amat%ptr(iat + 1) - 1
+         y(iat) = y(iat) + amat%val(ij) * x(amat%col(ij))
+      end do
+   end do
+
+end subroutine matvec
+
+
+end module dftd4_charge
@@ -16,11 +16,12 @@
 
 !> Realspace cutoff and lattice point generator utilities
 module dftd4_cutoff
-   use mctc_env, only : wp
+   use mctc_env, only : sp, wp
    implicit none
    private
 
-   public :: realspace_cutoff, get_lattice_points, smooth_cutoff
+   public :: realspace_cutoff, get_lattice_points, smooth_cutoff, select_cutoff
+   public :: smoothstep3, smoothstep4, smoothstep5, smoothstep_deriv
 
 
    !> Coordination number cutoff
@@ -58,9 +59,23 @@ module dftd4_cutoff
       !> Width of smooth three-body interaction cutoff
       real(wp) :: width3 = 0.0_wp
 
+      !> Add the long-range tail of the two-body interaction beyond the cutoff
+      logical :: tail = .false.
+
+      !> Target for the estimated energy error per atom, cutoffs are derived for
+      !> each pair of species if positive and the above cutoffs act as upper limit
+      real(wp) :: tolerance = 0.0_wp
+
    end type realspace_cutoff
 
 
+   !> Smooth polynomial switch for realspace cutoffs
+   interface smooth_cutoff
+      module procedure :: smooth_cutoff_dp
+      module procedure :: smooth_cutoff_sp
+   end interface smooth_cutoff
+
+
    interface get_lattice_points
       module procedure :: get_lattice_points_cutoff
       module procedure :: get_lattice_points_rep_3d
@@ -70,8 +85,32 @@ module dftd4_cutoff
 contains
 
 
+!> Select the real space cutoff for a pair of species
+pure function select_cutoff(cutoff, izp, jzp, pair_cutoff) result(cut)
+
+   !> Global real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Species of both atoms
+   integer, intent(in) :: izp, jzp
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Real space cutoff for this pair
+   real(wp) :: cut
+
+   if (present(pair_cutoff)) then
+      cut = pair_cutoff(jzp, izp)
+   else
+      cut = cutoff
+   end if
+
+end function select_cutoff
+
+
 !> Smooth polynomial switch for realspace cutoffs
-pure subroutine smooth_cutoff(r, cutoff, width, sw, dswdr)
+pure subroutine smooth_cutoff_dp(r, cutoff, width, sw, dswdr)
 
    !> Interatomic distance
    real(wp), intent(in) :: r
@@ -111,7 +150,53 @@ pure subroutine smooth_cutoff(r, cutoff, width, sw, dswdr)
       end if
    end if
 
-end subroutine smooth_cutoff
+end subroutine smooth_cutoff_dp
+
+
+!> Smooth polynomial switch for realspace cutoffs in single precision
+pure subroutine smooth_cutoff_sp(r, cutoff, width, sw, dswdr)
+
+   !> Interatomic distance
+   real(sp), intent(in) :: r
+
+   !> Real space cutoff
+   real(sp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(sp), intent(in) :: width
+
+   !> Switching function value
+   real(sp), intent(out) :: sw
+
+   !> Derivative of the switching function with respect to distance
+   real(sp), intent(out) :: dswdr
+
+   real(sp), parameter :: step3 = smoothstep3, step4 = smoothstep4, step5 = smoothstep5
+   real(sp), parameter :: step_deriv = smoothstep_deriv
+   real(sp) :: inner, effective_width, x
+
+   if (width <= 0.0_sp .or. cutoff <= 0.0_sp) then
+      sw = 1.0_sp
+      dswdr = 0.0_sp
+   else
+      ! Keep the switching interval within the physical range 0 <= r <= cutoff.
+      effective_width = min(width, cutoff)
+      inner = cutoff - effective_width
+      if (r <= inner) then
+         sw = 1.0_sp
+         dswdr = 0.0_sp
+      else if (r >= cutoff) then
+         sw = 0.0_sp
+         dswdr = 0.0_sp
+      else
+         x = (cutoff - r) / effective_width
+         ! Quintic Hermite switch with zero first derivatives at both boundaries.
+         sw = x**3 * (step3 + x*(step4 + step5*x))
+         dswdr = -step_deriv * x**2 * (1.0_sp - x)**2 / effective_width
+      end if
+   end if
+
+end subroutine smooth_cutoff_sp
 
 
 !> Generate lattice points from repetitions
@@ -16,6 +16,8 @@
 
 !> Generic interface to define damping functions for the DFT-D4 model
 module dftd4_damping
+   use, intrinsic :: iso_fortran_env, only : error_unit
+   use dftd4_pairlist, only : pair_list
    use dftd4_partition, only : work_partition
    use mctc_env, only : wp
    use mctc_io, only : structure_type
@@ -39,13 +41,28 @@ module dftd4_damping
       generic :: get_pairwise_dispersion3 => get_pairwise_dispersion3_impl, get_pairwise_dispersion3_compat
       procedure(pairwise_dispersion_interface), deferred :: get_pairwise_dispersion3_impl
       procedure :: get_pairwise_dispersion3_compat
+      !> Long-range tail of the additive dispersion beyond the real space cutoff
+      procedure :: get_dispersion2_tail
+      !> Pairwise representation of the long-range tail of the additive dispersion
+      procedure :: get_pairwise_dispersion2_tail
+      !> Additive dispersion resolved for a sparse list of atom pairs
+      procedure :: get_sparse_dispersion2
+      !> Non-additive dispersion resolved for a sparse list of atom pairs
+      procedure :: get_sparse_dispersion3
+      !> Estimate the dispersion energy neglected beyond a real space cutoff
+      procedure :: get_cutoff_error
+      !> Additive dispersion of selected atoms with all their partners
+      procedure :: get_atomic_dispersion2
+      !> Non-additive dispersion of selected atoms with all their partners
+      procedure :: get_atomic_dispersion3
    end type damping_param
 
 
    abstract interface
       !> Evaluation of the dispersion energy expression
       subroutine dispersion_interface(self, mol, trans, cutoff, width, r4r2, &
-            & c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition)
+            & c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition, &
+            & pair_cutoff, mixed)
          import :: structure_type, damping_param, work_partition, wp
 
          !> Damping parameters
@@ -92,10 +109,17 @@ module dftd4_damping
 
          !> Work partition of the atom pairs, defaults to the complete work
          type(work_partition), intent(in), optional :: partition
+
+         !> Real space cutoff for each pair of species, overrides the global cutoff
+         real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+         !> Evaluate distances, damping and switching functions in single precision
+         logical, intent(in), optional :: mixed
       end subroutine dispersion_interface
 
       !> Evaluation of the pairwise representation of the dispersion energy
-      subroutine pairwise_dispersion_interface(self, mol, trans, cutoff, width, r4r2, c6, energy)
+      subroutine pairwise_dispersion_interface(self, mol, trans, cutoff, width, r4r2, c6, &
+            & energy, pair_cutoff, fragment, interaction)
          import :: structure_type, damping_param, wp
 
          !> Damping parameters
@@ -121,6 +145,15 @@ module dftd4_damping
 
          !> Pairwise representation of the dispersion energy
          real(wp), intent(inout) :: energy(:, :)
+
+         !> Real space cutoff for each pair of species, overrides the global cutoff
+         real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+         !> Fragment of each atom, the energy is accumulated for pairs of fragments
+         integer, intent(in), optional :: fragment(:)
+
+         !> Only evaluate the interaction energy between different fragments
+         logical, intent(in), optional :: interaction
       end subroutine pairwise_dispersion_interface
    end interface
 
@@ -274,4 +307,326 @@ subroutine get_pairwise_dispersion3_compat(self, mol, trans, cutoff, r4r2, c6, e
    call self%get_pairwise_dispersion3(mol, trans, cutoff, 0.0_wp, r4r2, c6, energy)
 end subroutine get_pairwise_dispersion3_compat
 
+!> Evaluation of the long-range tail of the additive dispersion energy beyond the
+!> real space cutoff. Damping functions without an analytic tail do not add anything.
+subroutine get_dispersion2_tail(self, mol, cutoff, width, r4r2, c6, dc6dcn, dc6dq, &
+      & energy, dEdcn, dEdq, sigma, partition, pair_cutoff)
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
+
+   !> Dispersion energy
+   real(wp), intent(inout) :: energy(:)
+
+   !> Derivative of the energy w.r.t. the coordination number
+   real(wp), intent(inout), optional :: dEdcn(:)
+
+   !> Derivative of the energy w.r.t. the partial charges
+   real(wp), intent(inout), optional :: dEdq(:)
+
+   !> Dispersion virial
+   real(wp), intent(inout), optional :: sigma(:, :)
+
+   !> Work partition of the atom pairs, defaults to the complete work
+   type(work_partition), intent(in), optional :: partition
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+end subroutine get_dispersion2_tail
+
+!> Evaluation of the pairwise representation of the long-range tail of the
+!> additive dispersion energy beyond the real space cutoff
+subroutine get_pairwise_dispersion2_tail(self, mol, cutoff, width, r4r2, c6, energy, &
+      & pair_cutoff, fragment, interaction)
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Pairwise representation of the dispersion energy
+   real(wp), intent(inout) :: energy(:, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Fragment of each atom, the energy is accumulated for pairs of fragments
+   integer, intent(in), optional :: fragment(:)
+
+   !> Only evaluate the interaction energy between different fragments
+   logical, intent(in), optional :: interaction
+
+end subroutine get_pairwise_dispersion2_tail
+
+!> Evaluation of the additive dispersion energy for each pair of a sparse pair list.
+!> Damping functions without a pair resolved representation do not add anything.
+subroutine get_sparse_dispersion2(self, mol, trans, cutoff, width, r4r2, c6, pairs, &
+      & pair_cutoff)
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Sparse list of atom pairs within the cutoff, energies are accumulated
+   type(pair_list), intent(inout) :: pairs
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+end subroutine get_sparse_dispersion2
+
+!> Evaluation of the non-additive dispersion energy for each pair of a sparse pair list.
+!> Damping functions without a pair resolved representation do not add anything.
+subroutine get_sparse_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, pairs, &
+      & pair_cutoff)
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Sparse list of atom pairs within the cutoff, energies are accumulated
+   type(pair_list), intent(inout) :: pairs
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+end subroutine get_sparse_dispersion3
+
+!> Estimate the two-body and three-body dispersion energy of an atom with all partner
+!> atoms of one species beyond a real space cutoff. Without an estimate for the
+!> damping function the error is reported as unbounded.
+subroutine get_cutoff_error(self, r4r2i, r4r2j, c6, c9, cutoff, density, npartner, &
+      & error2, error3)
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: self
+
+   !> Expectation values for r4 over r2 operator of both species
+   real(wp), intent(in) :: r4r2i, r4r2j
+
+   !> Upper bound for the C6 coefficient of the pair of species
+   real(wp), intent(in) :: c6
+
+   !> Upper bound for the C9 coefficient of triples including the pair of species
+   real(wp), intent(in) :: c9
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Number density of the partner atoms for periodic systems, zero for molecules
+   real(wp), intent(in) :: density
+
+   !> Number of partner atoms for molecules
+   real(wp), intent(in) :: npartner
+
+   !> Estimated two-body dispersion energy beyond the cutoff
+   real(wp), intent(out) :: error2
+
+   !> Estimated three-body dispersion energy beyond the cutoff
+   real(wp), intent(out) :: error3
+
+   error2 = huge(1.0_wp)
+   error3 = huge(1.0_wp)
+
+end subroutine get_cutoff_error
+
+!> Evaluation of the additive dispersion energy of selected atoms with all their
+!> partners. The energy and virial of every pair are shared equally between both
+!> atoms, the gradient contains the full derivative w.r.t. the selected atom.
+subroutine get_atomic_dispersion2(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, &
+      & dc6dq, atoms, energy, dEdcn, dEdq, gradient, sigma, pair_cutoff, &
+      & exclusive)
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Dispersion energy of the selected atoms
+   real(wp), intent(inout) :: energy(:)
+
+   !> Derivative of the energy w.r.t. the coordination number of the selected atoms
+   real(wp), intent(inout), optional :: dEdcn(:)
+
+   !> Derivative of the energy w.r.t. the partial charges of the selected atoms
+   real(wp), intent(inout), optional :: dEdq(:)
+
+   !> Dispersion gradient of the selected atoms
+   real(wp), intent(inout), optional :: gradient(:, :)
+
+   !> Atom-resolved dispersion virial of the selected atoms
+   real(wp), intent(inout), optional :: sigma(:, :, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Share the energy only between the selected atoms, the sum over the selected
+   !> atoms is the energy of all interactions involving at least one of them
+   logical, intent(in), optional :: exclusive
+
+   write(error_unit, '("[Error]:", 1x, a)') &
+      & "Atom-resolved evaluation not available for this damping function"
+   error stop
+
+end subroutine get_atomic_dispersion2
+
+!> Evaluation of the non-additive dispersion energy of selected atoms with all
+!> their partners. The energy and virial of every triple are shared equally between
+!> all three atoms, the gradient contains the full derivative w.r.t. the selected atom.
+subroutine get_atomic_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, &
+      & dc6dq, atoms, energy, dEdcn, dEdq, gradient, sigma, pair_cutoff, &
+      & exclusive)
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Dispersion energy of the selected atoms
+   real(wp), intent(inout) :: energy(:)
+
+   !> Derivative of the energy w.r.t. the coordination number of the selected atoms
+   real(wp), intent(inout), optional :: dEdcn(:)
+
+   !> Derivative of the energy w.r.t. the partial charges of the selected atoms
+   real(wp), intent(inout), optional :: dEdq(:)
+
+   !> Dispersion gradient of the selected atoms
+   real(wp), intent(inout), optional :: gradient(:, :)
+
+   !> Atom-resolved dispersion virial of the selected atoms
+   real(wp), intent(inout), optional :: sigma(:, :, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Share the energy only between the selected atoms, the sum over the selected
+   !> atoms is the energy of all interactions involving at least one of them
+   logical, intent(in), optional :: exclusive
+
+   write(error_unit, '("[Error]:", 1x, a)') &
+      & "Atom-resolved evaluation not available for this damping function"
+   error stop
+
+end subroutine get_atomic_dispersion3
+
 end module dftd4_damping
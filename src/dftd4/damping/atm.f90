@@ -18,14 +18,14 @@
 !> contribution with a modified zero (Chai--Head-Gordon) damping together
 !> with the critical radii from the rational (Becke--Johnson) damping.
 module dftd4_damping_atm
-   use dftd4_cutoff, only : smooth_cutoff
+   use dftd4_cutoff, only : smooth_cutoff, select_cutoff
    use dftd4_partition, only : work_partition, owns_pair
-   use mctc_env, only : wp
+   use mctc_env, only : sp, wp
    use mctc_io, only : structure_type
    implicit none
    private
 
-   public :: get_atm_dispersion
+   public :: get_atm_dispersion, get_atm_atomic_dispersion, get_energy_share
 
    real(wp), parameter :: third = 1.0_wp / 3.0_wp
 
@@ -34,7 +34,8 @@ contains
 
 !> Evaluation of the dispersion energy expression
 subroutine get_atm_dispersion(mol, trans, cutoff, width, s9, a1, a2, alp, r4r2, &
-      & c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition)
+      & c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition, &
+      & pair_cutoff, mixed)
 
    !> Molecular structure data
    class(structure_type), intent(in) :: mol
@@ -90,18 +91,32 @@ subroutine get_atm_dispersion(mol, trans, cutoff, width, s9, a1, a2, alp, r4r2,
    !> Optional externally assigned work partition
    type(work_partition), intent(in), optional :: partition
 
-   logical :: grad
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Evaluate distances, damping and switching functions in single precision
+   logical, intent(in), optional :: mixed
+
+   logical :: grad, single
 
    if (abs(s9) < epsilon(1.0_wp)) return
    grad = present(dc6dcn) .and. present(dEdcn) .and. present(dc6dq) &
       & .and. present(dEdq) .and. present(gradient) .and. present(sigma)
 
-   if (grad) then
+   single = .false.
+   if (present(mixed)) single = mixed
+
+   if (single) then
+      call get_atm_dispersion_mixed(mol, trans, cutoff, width, s9, a1, a2, alp, r4r2, &
+         & c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition, &
+         & pair_cutoff)
+   else if (grad) then
       call get_atm_dispersion_derivs(mol, trans, cutoff, width, s9, a1, a2, &
-         & alp, r4r2, c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition)
+         & alp, r4r2, c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, &
+         & partition, pair_cutoff)
    else
       call get_atm_dispersion_energy(mol, trans, cutoff, width, s9, a1, a2, &
-         & alp, r4r2, c6, energy, partition)
+         & alp, r4r2, c6, energy, partition, pair_cutoff)
    end if
 
 end subroutine get_atm_dispersion
@@ -109,7 +124,7 @@ end subroutine get_atm_dispersion
 
 !> Evaluation of the dispersion energy expression
 subroutine get_atm_dispersion_energy(mol, trans, cutoff, width, s9, a1, a2, alp, r4r2, &
-      & c6, energy, partition)
+      & c6, energy, partition, pair_cutoff)
 
    !> Molecular structure data
    class(structure_type), intent(in) :: mol
@@ -147,25 +162,27 @@ subroutine get_atm_dispersion_energy(mol, trans, cutoff, width, s9, a1, a2, alp,
    !> Work partition of the atom pairs, absent selects the complete work
    type(work_partition), intent(in), optional :: partition
 
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
    integer :: iat, jat, kat, izp, jzp, kzp, jtr, ktr
    real(wp) :: vij(3), vjk(3), vik(3), r2ij, r2jk, r2ik, rij, rjk, rik
    real(wp) :: c6ij, c6jk, c6ik, triple
    real(wp) :: r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, ang
-   real(wp) :: cutoff2, c9, dE, alp3, swij, swjk, swik, dswdr, sw
+   real(wp) :: cutij, cutik, cutjk, c9, dE, alp3, swij, swjk, swik, dswdr, sw
 
    ! Thread-private arrays for reduction
    ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
    real(wp), allocatable :: energy_local(:)
 
-   cutoff2 = cutoff*cutoff
    alp3 = alp / 3.0_wp
 
    !$omp parallel default(none) &
-   !$omp shared(mol, trans, c6, s9, a1, a2, alp3, r4r2, cutoff2, cutoff, width, partition) &
+   !$omp shared(mol, trans, c6, s9, a1, a2, alp3, r4r2, pair_cutoff, cutoff, width, partition) &
    !$omp private(iat, jat, kat, izp, jzp, kzp, jtr, ktr, vij, vjk, vik, &
    !$omp& r2ij, r2jk, r2ik, rij, rjk, rik, c6ij, c6jk, c6ik, triple, &
    !$omp& r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, ang, c9, dE, &
-   !$omp& swij, swjk, swik, dswdr, sw) &
+   !$omp& swij, swjk, swik, dswdr, sw, cutij, cutik, cutjk) &
    !$omp shared(energy) &
    !$omp private(energy_local)
    allocate(energy_local(size(energy, 1)), source=0.0_wp)
@@ -177,12 +194,13 @@ subroutine get_atm_dispersion_energy(mol, trans, cutoff, width, s9, a1, a2, alp,
          jzp = mol%id(jat)
          c6ij = c6(jat, iat)
          r0ij = a1 * sqrt(3*r4r2(jzp)*r4r2(izp)) + a2
+         cutij = select_cutoff(cutoff, izp, jzp, pair_cutoff)
          do jtr = 1, size(trans, 2)
             vij(:) = mol%xyz(:, jat) + trans(:, jtr) - mol%xyz(:, iat)
             r2ij = vij(1)*vij(1) + vij(2)*vij(2) + vij(3)*vij(3)
-            if (r2ij > cutoff2 .or. r2ij < epsilon(1.0_wp)) cycle
+            if (r2ij > cutij*cutij .or. r2ij < epsilon(1.0_wp)) cycle
             rij = sqrt(r2ij)
-            call smooth_cutoff(rij, cutoff, width, swij, dswdr)
+            call smooth_cutoff(rij, cutij, width, swij, dswdr)
             do kat = 1, jat
                kzp = mol%id(kat)
                c6ik = c6(kat, iat)
@@ -190,22 +208,24 @@ subroutine get_atm_dispersion_energy(mol, trans, cutoff, width, s9, a1, a2, alp,
                c9 = -s9 * sqrt(abs(c6ij*c6ik*c6jk))
                r0ik = a1 * sqrt(3*r4r2(kzp)*r4r2(izp)) + a2
                r0jk = a1 * sqrt(3*r4r2(kzp)*r4r2(jzp)) + a2
+               cutik = select_cutoff(cutoff, izp, kzp, pair_cutoff)
+               cutjk = select_cutoff(cutoff, jzp, kzp, pair_cutoff)
                r0 = r0ij * r0ik * r0jk
                triple = triple_scale(iat, jat, kat)
                do ktr = 1, size(trans, 2)
                   vik(:) = mol%xyz(:, kat) + trans(:, ktr) - mol%xyz(:, iat)
                   r2ik = vik(1)*vik(1) + vik(2)*vik(2) + vik(3)*vik(3)
-                  if (r2ik > cutoff2 .or. r2ik < epsilon(1.0_wp)) cycle
+                  if (r2ik > cutik*cutik .or. r2ik < epsilon(1.0_wp)) cycle
                   rik = sqrt(r2ik)
-                  call smooth_cutoff(rik, cutoff, width, swik, dswdr)
+                  call smooth_cutoff(rik, cutik, width, swik, dswdr)
 
                   ! vjk(:) = mol%xyz(:, kat) + trans(:, ktr)
                   !          - mol%xyz(:, jat) - trans(:, jtr)
                   vjk(:) = vik(:) - vij(:)
                   r2jk = vjk(1)*vjk(1) + vjk(2)*vjk(2) + vjk(3)*vjk(3)
-                  if (r2jk > cutoff2 .or. r2jk < epsilon(1.0_wp)) cycle
+                  if (r2jk > cutjk*cutjk .or. r2jk < epsilon(1.0_wp)) cycle
                   rjk = sqrt(r2jk)
-                  call smooth_cutoff(rjk, cutoff, width, swjk, dswdr)
+                  call smooth_cutoff(rjk, cutjk, width, swjk, dswdr)
                   sw = swij * swik * swjk
                   if (sw <= 0.0_wp) cycle
 
@@ -241,7 +261,8 @@ end subroutine get_atm_dispersion_energy
 
 !> Evaluation of the dispersion energy expression
 subroutine get_atm_dispersion_derivs(mol, trans, cutoff, width, s9, a1, a2, alp, r4r2, &
-      & c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition)
+      & c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition, &
+      & pair_cutoff)
 
    !> Molecular structure data
    class(structure_type), intent(in) :: mol
@@ -297,11 +318,14 @@ subroutine get_atm_dispersion_derivs(mol, trans, cutoff, width, s9, a1, a2, alp,
    !> Work partition of the atom pairs, absent selects the complete work
    type(work_partition), intent(in), optional :: partition
 
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
    integer :: iat, jat, kat, izp, jzp, kzp, jtr, ktr
    real(wp) :: vij(3), vjk(3), vik(3), r2ij, r2jk, r2ik, rij, rjk, rik
    real(wp) :: c6ij, c6jk, c6ik, triple
    real(wp) :: r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, dfdmp, ang, dang
-   real(wp) :: cutoff2, alp3, c9, dE, dE0, dE_third
+   real(wp) :: cutij, cutik, cutjk, alp3, c9, dE, dE0, dE_third
    real(wp) :: dGij(3), dGjk(3), dGik(3), dS(3, 3)
    real(wp) :: swij, swjk, swik, dswijdr, dswjkdr, dswikdr, sw
 
@@ -313,17 +337,16 @@ subroutine get_atm_dispersion_derivs(mol, trans, cutoff, width, s9, a1, a2, alp,
    real(wp), allocatable :: gradient_local(:, :)
    real(wp), allocatable :: sigma_local(:, :)
 
-   cutoff2 = cutoff*cutoff
    alp3 = alp / 3.0_wp
 
    !$omp parallel default(none) &
-   !$omp shared(mol, trans, c6, s9, a1, a2, alp, alp3, r4r2, cutoff2, &
+   !$omp shared(mol, trans, c6, s9, a1, a2, alp, alp3, r4r2, pair_cutoff, &
    !$omp& cutoff, width, dc6dcn, dc6dq, partition) &
    !$omp private(iat, jat, kat, izp, jzp, kzp, jtr, ktr, vij, vjk, vik, &
    !$omp& r2ij, r2jk, r2ik, rij, rjk, rik, c6ij, c6jk, c6ik, triple, &
    !$omp& r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, dfdmp, ang, dang, &
    !$omp& c9, dE, dE0, dE_third, dGij, dGjk, dGik, dS, swij, swjk, swik, &
-   !$omp& dswijdr, dswjkdr, dswikdr, sw) &
+   !$omp& dswijdr, dswjkdr, dswikdr, sw, cutij, cutik, cutjk) &
    !$omp shared(energy, gradient, sigma, dEdcn, dEdq) &
    !$omp private(energy_local, gradient_local, sigma_local, dEdcn_local, &
    !$omp& dEdq_local)
@@ -340,12 +363,13 @@ subroutine get_atm_dispersion_derivs(mol, trans, cutoff, width, s9, a1, a2, alp,
          jzp = mol%id(jat)
          c6ij = c6(jat, iat)
          r0ij = a1 * sqrt(3*r4r2(jzp)*r4r2(izp)) + a2
+         cutij = select_cutoff(cutoff, izp, jzp, pair_cutoff)
          do jtr = 1, size(trans, 2)
             vij(:) = mol%xyz(:, jat) + trans(:, jtr) - mol%xyz(:, iat)
             r2ij = vij(1)*vij(1) + vij(2)*vij(2) + vij(3)*vij(3)
-            if (r2ij > cutoff2 .or. r2ij < epsilon(1.0_wp)) cycle
+            if (r2ij > cutij*cutij .or. r2ij < epsilon(1.0_wp)) cycle
             rij = sqrt(r2ij)
-            call smooth_cutoff(rij, cutoff, width, swij, dswijdr)
+            call smooth_cutoff(rij, cutij, width, swij, dswijdr)
             do kat = 1, jat
                kzp = mol%id(kat)
                c6ik = c6(kat, iat)
@@ -353,22 +377,24 @@ subroutine get_atm_dispersion_derivs(mol, trans, cutoff, width, s9, a1, a2, alp,
                c9 = -s9 * sqrt(abs(c6ij*c6ik*c6jk))
                r0ik = a1 * sqrt(3*r4r2(kzp)*r4r2(izp)) + a2
                r0jk = a1 * sqrt(3*r4r2(kzp)*r4r2(jzp)) + a2
+               cutik = select_cutoff(cutoff, izp, kzp, pair_cutoff)
+               cutjk = select_cutoff(cutoff, jzp, kzp, pair_cutoff)
                r0 = r0ij * r0ik * r0jk
                triple = triple_scale(iat, jat, kat)
                do ktr = 1, size(trans, 2)
                   vik(:) = mol%xyz(:, kat) + trans(:, ktr) - mol%xyz(:, iat)
                   r2ik = vik(1)*vik(1) + vik(2)*vik(2) + vik(3)*vik(3)
-                  if (r2ik > cutoff2 .or. r2ik < epsilon(1.0_wp)) cycle
+                  if (r2ik > cutik*cutik .or. r2ik < epsilon(1.0_wp)) cycle
                   rik = sqrt(r2ik)
-                  call smooth_cutoff(rik, cutoff, width, swik, dswikdr)
+                  call smooth_cutoff(rik, cutik, width, swik, dswikdr)
 
                   ! vjk(:) = mol%xyz(:, kat) + trans(:, ktr)
                   !          - mol%xyz(:, jat) - trans(:, jtr)
                   vjk(:) = vik(:) - vij(:)
                   r2jk = vjk(1)*vjk(1) + vjk(2)*vjk(2) + vjk(3)*vjk(3)
-                  if (r2jk > cutoff2 .or. r2jk < epsilon(1.0_wp)) cycle
+                  if (r2jk > cutjk*cutjk .or. r2jk < epsilon(1.0_wp)) cycle
                   rjk = sqrt(r2jk)
-                  call smooth_cutoff(rjk, cutoff, width, swjk, dswjkdr)
+                  call smooth_cutoff(rjk, cutjk, width, swjk, dswjkdr)
                   sw = swij * swik * swjk
                   if (sw <= 0.0_wp) cycle
 
@@ -465,6 +491,554 @@ subroutine get_atm_dispersion_derivs(mol, trans, cutoff, width, s9, a1, a2, alp,
 end subroutine get_atm_dispersion_derivs
 
 
+!> Evaluation of the dispersion energy expression with distances, damping and
+!> switching functions in single precision. Only coordinates and lattice points are
+!> converted to single precision, the C6 coefficients are read in double precision
+!> and energy and derivatives are accumulated in double precision.
+subroutine get_atm_dispersion_mixed(mol, trans, cutoff, width, s9, a1, a2, alp, &
+      & r4r2, c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition, &
+      & pair_cutoff)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Scaling for dispersion coefficients
+   real(wp), intent(in) :: s9
+
+   !> Scaling parameter for critical radius
+   real(wp), intent(in) :: a1
+
+   !> Offset parameter for critical radius
+   real(wp), intent(in) :: a2
+
+   !> Exponent of zero damping function
+   real(wp), intent(in) :: alp
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
+
+   !> Dispersion energy
+   real(wp), intent(inout) :: energy(:)
+
+   !> Derivative of the energy w.r.t. the coordination number
+   real(wp), intent(inout), optional :: dEdcn(:)
+
+   !> Derivative of the energy w.r.t. the partial charges
+   real(wp), intent(inout), optional :: dEdq(:)
+
+   !> Dispersion gradient
+   real(wp), intent(inout), optional :: gradient(:, :)
+
+   !> Dispersion virial
+   real(wp), intent(inout), optional :: sigma(:, :)
+
+   !> Work partition of the atom pairs, absent selects the complete work
+   type(work_partition), intent(in), optional :: partition
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   logical :: grad
+   integer :: iat, jat, kat, izp, jzp, kzp, jtr, ktr
+   real(sp) :: vij(3), vjk(3), vik(3), r2ij, r2jk, r2ik, rij, rjk, rik
+   real(sp) :: swidth, alp3, alps
+   real(sp) :: r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, dfdmp, ang, dang
+   real(sp) :: cutij, cutik, cutjk, c9, dE0
+   real(sp) :: gij(3), gjk(3), gik(3)
+   real(sp) :: swij, swjk, swik, dswijdr, dswjkdr, dswikdr, sw
+   real(wp) :: c6ij, c6jk, c6ik, triple, dE, dE_third
+   real(wp) :: dGij(3), dGjk(3), dGik(3), dS(3, 3)
+   real(sp), allocatable :: xyz(:, :), lattr(:, :)
+
+   ! Thread-private arrays for reduction
+   ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
+   real(wp), allocatable :: energy_local(:)
+   real(wp), allocatable :: dEdcn_local(:)
+   real(wp), allocatable :: dEdq_local(:)
+   real(wp), allocatable :: gradient_local(:, :)
+   real(wp), allocatable :: sigma_local(:, :)
+
+   grad = present(dc6dcn) .and. present(dEdcn) .and. present(dc6dq) &
+      & .and. present(dEdq) .and. present(gradient) .and. present(sigma)
+
+   alps = real(alp, sp)
+   alp3 = real(alp / 3.0_wp, sp)
+   swidth = real(width, sp)
+   xyz = real(mol%xyz, sp)
+   lattr = real(trans, sp)
+
+   !$omp parallel default(none) &
+   !$omp shared(mol, grad, xyz, lattr, c6, s9, a1, a2, alps, alp3, r4r2, pair_cutoff, &
+   !$omp& cutoff, swidth, dc6dcn, dc6dq, partition) &
+   !$omp private(iat, jat, kat, izp, jzp, kzp, jtr, ktr, vij, vjk, vik, &
+   !$omp& r2ij, r2jk, r2ik, rij, rjk, rik, c6ij, c6jk, c6ik, triple, &
+   !$omp& r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, dfdmp, ang, dang, &
+   !$omp& c9, dE, dE0, dE_third, gij, gjk, gik, dGij, dGjk, dGik, dS, swij, swjk, swik, &
+   !$omp& dswijdr, dswjkdr, dswikdr, sw, cutij, cutik, cutjk) &
+   !$omp shared(energy, gradient, sigma, dEdcn, dEdq) &
+   !$omp private(energy_local, gradient_local, sigma_local, dEdcn_local, &
+   !$omp& dEdq_local)
+   allocate(energy_local(size(energy, 1)), source=0.0_wp)
+   if (grad) then
+      allocate(dEdcn_local(size(dEdcn, 1)), source=0.0_wp)
+      allocate(dEdq_local(size(dEdq, 1)), source=0.0_wp)
+      allocate(gradient_local(size(gradient, 1), size(gradient, 2)), source=0.0_wp)
+      allocate(sigma_local(size(sigma, 1), size(sigma, 2)), source=0.0_wp)
+   end if
+   !$omp do schedule(dynamic)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      do jat = 1, iat
+         if (.not.owns_pair(partition, iat, jat)) cycle
+         jzp = mol%id(jat)
+         c6ij = c6(jat, iat)
+         r0ij = real(a1 * sqrt(3*r4r2(jzp)*r4r2(izp)) + a2, sp)
+         cutij = real(select_cutoff(cutoff, izp, jzp, pair_cutoff), sp)
+         do jtr = 1, size(lattr, 2)
+            vij(:) = xyz(:, jat) + lattr(:, jtr) - xyz(:, iat)
+            r2ij = vij(1)*vij(1) + vij(2)*vij(2) + vij(3)*vij(3)
+            if (r2ij > cutij*cutij .or. r2ij < epsilon(1.0_sp)) cycle
+            rij = sqrt(r2ij)
+            call smooth_cutoff(rij, cutij, swidth, swij, dswijdr)
+            do kat = 1, jat
+               kzp = mol%id(kat)
+               c6ik = c6(kat, iat)
+               c6jk = c6(kat, jat)
+               c9 = real(-s9 * sqrt(abs(c6ij*c6ik*c6jk)), sp)
+               r0ik = real(a1 * sqrt(3*r4r2(kzp)*r4r2(izp)) + a2, sp)
+               r0jk = real(a1 * sqrt(3*r4r2(kzp)*r4r2(jzp)) + a2, sp)
+               cutik = real(select_cutoff(cutoff, izp, kzp, pair_cutoff), sp)
+               cutjk = real(select_cutoff(cutoff, jzp, kzp, pair_cutoff), sp)
+               r0 = r0ij * r0ik * r0jk
+               triple = triple_scale(iat, jat, kat)
+               do ktr = 1, size(lattr, 2)
+                  vik(:) = xyz(:, kat) + lattr(:, ktr) - xyz(:, iat)
+                  r2ik = vik(1)*vik(1) + vik(2)*vik(2) + vik(3)*vik(3)
+                  if (r2ik > cutik*cutik .or. r2ik < epsilon(1.0_sp)) cycle
+                  rik = sqrt(r2ik)
+                  call smooth_cutoff(rik, cutik, swidth, swik, dswikdr)
+
+                  vjk(:) = vik(:) - vij(:)
+                  r2jk = vjk(1)*vjk(1) + vjk(2)*vjk(2) + vjk(3)*vjk(3)
+                  if (r2jk > cutjk*cutjk .or. r2jk < epsilon(1.0_sp)) cycle
+                  rjk = sqrt(r2jk)
+                  call smooth_cutoff(rjk, cutjk, swidth, swjk, dswjkdr)
+                  sw = swij * swik * swjk
+                  if (sw <= 0.0_sp) cycle
+
+                  r2 = r2ij*r2ik*r2jk
+                  r1 = sqrt(r2)
+                  r3 = r2 * r1
+                  r5 = r3 * r2
+
+                  fdmp = 1.0_sp / (1.0_sp + 6.0_sp * (r0 / r1)**alp3)
+                  ang = 0.375_sp*(r2ij + r2jk - r2ik)*(r2ij - r2jk + r2ik)&
+                     & *(-r2ij + r2jk + r2ik) / r5 + 1.0_sp / r3
+
+                  rr = ang*fdmp
+                  dE0 = rr * c9
+
+                  dE = real(dE0 * sw, wp) * triple
+                  dE_third = dE * third
+                  energy_local(iat) = energy_local(iat) - dE_third
+                  energy_local(jat) = energy_local(jat) - dE_third
+                  energy_local(kat) = energy_local(kat) - dE_third
+                  if (.not.grad) cycle
+
+                  dfdmp = -2.0_sp * alps * (r0 / r1)**alp3 * fdmp**2
+
+                  ! d/drij
+                  dang = -0.375_sp * (r2ij**3 + r2ij**2 * (r2jk + r2ik)&
+                     & + r2ij * (3.0_sp * r2jk**2 + 2.0_sp * r2jk*r2ik&
+                     & + 3.0_sp * r2ik**2)&
+                     & - 5.0_sp * (r2jk - r2ik)**2 * (r2jk + r2ik)) / r5
+                  gij(:) = sw * c9 * (-dang*fdmp + ang*dfdmp) / r2ij * vij &
+                     & - dE0 * dswijdr / rij * swik * swjk * vij
+
+                  ! d/drik
+                  dang = -0.375_sp * (r2ik**3 + r2ik**2 * (r2jk + r2ij)&
+                     & + r2ik * (3.0_sp * r2jk**2 + 2.0_sp * r2jk * r2ij&
+                     & + 3.0_sp * r2ij**2)&
+                     & - 5.0_sp * (r2jk - r2ij)**2 * (r2jk + r2ij)) / r5
+                  gik(:) = sw * c9 * (-dang * fdmp + ang * dfdmp) / r2ik * vik &
+                     & - dE0 * dswikdr / rik * swij * swjk * vik
+
+                  ! d/drjk
+                  dang = -0.375_sp * (r2jk**3 + r2jk**2*(r2ik + r2ij)&
+                     & + r2jk * (3.0_sp * r2ik**2 + 2.0_sp * r2ik * r2ij&
+                     & + 3.0_sp * r2ij**2)&
+                     & - 5.0_sp * (r2ik - r2ij)**2 * (r2ik + r2ij)) / r5
+                  gjk(:) = sw * c9 * (-dang * fdmp + ang * dfdmp) / r2jk * vjk &
+                     & - dE0 * dswjkdr / rjk * swij * swik * vjk
+
+                  dGij(:) = real(gij, wp)
+                  dGik(:) = real(gik, wp)
+                  dGjk(:) = real(gjk, wp)
+
+                  gradient_local(:, iat) = gradient_local(:, iat) &
+                     & - (dGij + dGik) * triple
+                  gradient_local(:, jat) = gradient_local(:, jat) &
+                     & + (dGij - dGjk) * triple
+                  gradient_local(:, kat) = gradient_local(:, kat) &
+                     & + (dGik + dGjk) * triple
+
+                  dS(:, :) = spread(dGij, 1, 3) * spread(real(vij, wp), 2, 3)&
+                     & + spread(dGik, 1, 3) * spread(real(vik, wp), 2, 3)&
+                     & + spread(dGjk, 1, 3) * spread(real(vjk, wp), 2, 3)
+
+                  sigma_local(:, :) = sigma_local + dS * triple
+
+                  dEdcn_local(iat) = dEdcn_local(iat) - dE * 0.5_wp &
+                     & * (dc6dcn(iat, jat) / c6ij + dc6dcn(iat, kat) / c6ik)
+                  dEdcn_local(jat) = dEdcn_local(jat) - dE * 0.5_wp &
+                     & * (dc6dcn(jat, iat) / c6ij + dc6dcn(jat, kat) / c6jk)
+                  dEdcn_local(kat) = dEdcn_local(kat) - dE * 0.5_wp &
+                     & * (dc6dcn(kat, iat) / c6ik + dc6dcn(kat, jat) / c6jk)
+
+                  dEdq_local(iat) = dEdq_local(iat) - dE * 0.5_wp &
+                     & * (dc6dq(iat, jat) / c6ij + dc6dq(iat, kat) / c6ik)
+                  dEdq_local(jat) = dEdq_local(jat) - dE * 0.5_wp &
+                     & * (dc6dq(jat, iat) / c6ij + dc6dq(jat, kat) / c6jk)
+                  dEdq_local(kat) = dEdq_local(kat) - dE * 0.5_wp &
+                     & * (dc6dq(kat, iat) / c6ik + dc6dq(kat, jat) / c6jk)
+               end do
+            end do
+         end do
+      end do
+   end do
+   !$omp end do
+   !$omp critical (get_atm_dispersion_mixed_)
+   energy(:) = energy(:) + energy_local(:)
+   if (grad) then
+      dEdcn(:) = dEdcn(:) + dEdcn_local(:)
+      dEdq(:) = dEdq(:) + dEdq_local(:)
+      gradient(:, :) = gradient(:, :) + gradient_local(:, :)
+      sigma(:, :) = sigma(:, :) + sigma_local(:, :)
+   end if
+   !$omp end critical (get_atm_dispersion_mixed_)
+   deallocate(energy_local)
+   if (grad) then
+      deallocate(dEdcn_local)
+      deallocate(dEdq_local)
+      deallocate(gradient_local)
+      deallocate(sigma_local)
+   end if
+   !$omp end parallel
+
+end subroutine get_atm_dispersion_mixed
+
+
+!> Evaluation of the dispersion energy expression for selected atoms with all
+!> their partners. The triples are enumerated like for the complete dispersion
+!> energy and every selected member of a triple receives its share.
+subroutine get_atm_atomic_dispersion(mol, trans, cutoff, width, s9, a1, a2, alp, r4r2, &
+      & c6, dc6dcn, dc6dq, atoms, energy, dEdcn, dEdq, gradient, sigma, pair_cutoff, &
+      & exclusive)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Scaling for dispersion coefficients
+   real(wp), intent(in) :: s9
+
+   !> Scaling parameter for critical radius
+   real(wp), intent(in) :: a1
+
+   !> Offset parameter for critical radius
+   real(wp), intent(in) :: a2
+
+   !> Exponent of zero damping function
+   real(wp), intent(in) :: alp
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Dispersion energy of the selected atoms
+   real(wp), intent(inout) :: energy(:)
+
+   !> Derivative of the energy w.r.t. the coordination number of the selected atoms
+   real(wp), intent(inout), optional :: dEdcn(:)
+
+   !> Derivative of the energy w.r.t. the partial charges of the selected atoms
+   real(wp), intent(inout), optional :: dEdq(:)
+
+   !> Dispersion gradient of the selected atoms
+   real(wp), intent(inout), optional :: gradient(:, :)
+
+   !> Atom-resolved dispersion virial of the selected atoms
+   real(wp), intent(inout), optional :: sigma(:, :, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Share the energy only between the selected atoms, the sum over the selected
+   !> atoms is the energy of all interactions involving at least one of them
+   logical, intent(in), optional :: exclusive
+
+   logical :: grad
+   integer :: iat, jat, kat, izp, jzp, kzp, jtr, ktr, iu, ju, ku, first
+   real(wp) :: vij(3), vjk(3), vik(3), r2ij, r2jk, r2ik, rij, rjk, rik
+   real(wp) :: c6ij, c6jk, c6ik, triple
+   real(wp) :: r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, dfdmp, ang, dang
+   real(wp) :: cutij, cutik, cutjk, alp3, c9, dE, dE0, dE_share
+   real(wp) :: dGij(3), dGjk(3), dGik(3), dS(3, 3)
+   real(wp) :: swij, swjk, swik, dswijdr, dswjkdr, dswikdr, sw
+   integer, allocatable :: selected(:)
+   real(wp), allocatable :: share(:)
+
+   ! Thread-private arrays for reduction
+   real(wp), allocatable :: energy_local(:)
+   real(wp), allocatable :: dEdcn_local(:)
+   real(wp), allocatable :: dEdq_local(:)
+   real(wp), allocatable :: gradient_local(:, :)
+   real(wp), allocatable :: sigma_local(:, :, :)
+
+   if (abs(s9) < epsilon(1.0_wp) .or. size(atoms) == 0) return
+   grad = present(dc6dcn) .and. present(dEdcn) .and. present(dc6dq) &
+      & .and. present(dEdq) .and. present(gradient) .and. present(sigma)
+
+   alp3 = alp / 3.0_wp
+   call get_energy_share(mol%nat, atoms, exclusive, share)
+
+   ! Position of every atom in the selection, zero for atoms not selected
+   allocate(selected(mol%nat), source=0)
+   do iu = 1, size(atoms)
+      selected(atoms(iu)) = iu
+   end do
+   first = minval(atoms)
+
+   !$omp parallel default(none) &
+   !$omp shared(mol, trans, c6, s9, a1, a2, alp, alp3, r4r2, pair_cutoff, atoms, &
+   !$omp& cutoff, width, dc6dcn, dc6dq, grad, share, selected, first) &
+   !$omp private(iat, jat, kat, izp, jzp, kzp, jtr, ktr, iu, ju, ku, vij, vjk, vik, &
+   !$omp& r2ij, r2jk, r2ik, rij, rjk, rik, c6ij, c6jk, c6ik, triple, &
+   !$omp& r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, dfdmp, ang, dang, &
+   !$omp& c9, dE, dE0, dE_share, dGij, dGjk, dGik, dS, swij, swjk, swik, &
+   !$omp& dswijdr, dswjkdr, dswikdr, sw, cutij, cutik, cutjk) &
+   !$omp shared(energy, gradient, sigma, dEdcn, dEdq) &
+   !$omp private(energy_local, gradient_local, sigma_local, dEdcn_local, &
+   !$omp& dEdq_local)
+   allocate(energy_local(size(atoms)), source=0.0_wp)
+   allocate(dEdcn_local(size(atoms)), source=0.0_wp)
+   allocate(dEdq_local(size(atoms)), source=0.0_wp)
+   allocate(gradient_local(3, size(atoms)), source=0.0_wp)
+   allocate(sigma_local(3, 3, size(atoms)), source=0.0_wp)
+   !$omp do schedule(dynamic)
+   do iat = first, mol%nat
+      izp = mol%id(iat)
+      iu = selected(iat)
+      do jat = 1, iat
+         ju = selected(jat)
+         ! Only a selected atom with a lower index can complete the triple
+         if (iu == 0 .and. ju == 0 .and. jat < first) cycle
+         jzp = mol%id(jat)
+         c6ij = c6(jat, iat)
+         r0ij = a1 * sqrt(3*r4r2(jzp)*r4r2(izp)) + a2
+         cutij = select_cutoff(cutoff, izp, jzp, pair_cutoff)
+         do jtr = 1, size(trans, 2)
+            vij(:) = mol%xyz(:, jat) + trans(:, jtr) - mol%xyz(:, iat)
+            r2ij = vij(1)*vij(1) + vij(2)*vij(2) + vij(3)*vij(3)
+            if (r2ij > cutij*cutij .or. r2ij < epsilon(1.0_wp)) cycle
+            rij = sqrt(r2ij)
+            call smooth_cutoff(rij, cutij, width, swij, dswijdr)
+            do kat = 1, jat
+               ku = selected(kat)
+               if (iu == 0 .and. ju == 0 .and. ku == 0) cycle
+               kzp = mol%id(kat)
+               c6ik = c6(kat, iat)
+               c6jk = c6(kat, jat)
+               c9 = -s9 * sqrt(abs(c6ij*c6ik*c6jk))
+               r0ik = a1 * sqrt(3*r4r2(kzp)*r4r2(izp)) + a2
+               r0jk = a1 * sqrt(3*r4r2(kzp)*r4r2(jzp)) + a2
+               cutik = select_cutoff(cutoff, izp, kzp, pair_cutoff)
+               cutjk = select_cutoff(cutoff, jzp, kzp, pair_cutoff)
+               r0 = r0ij * r0ik * r0jk
+               triple = triple_scale(iat, jat, kat)
+               do ktr = 1, size(trans, 2)
+                  vik(:) = mol%xyz(:, kat) + trans(:, ktr) - mol%xyz(:, iat)
+                  r2ik = vik(1)*vik(1) + vik(2)*vik(2) + vik(3)*vik(3)
+                  if (r2ik > cutik*cutik .or. r2ik < epsilon(1.0_wp)) cycle
+                  rik = sqrt(r2ik)
+                  call smooth_cutoff(rik, cutik, width, swik, dswikdr)
+
+                  vjk(:) = vik(:) - vij(:)
+                  r2jk = vjk(1)*vjk(1) + vjk(2)*vjk(2) + vjk(3)*vjk(3)
+                  if (r2jk > cutjk*cutjk .or. r2jk < epsilon(1.0_wp)) cycle
+                  rjk = sqrt(r2jk)
+                  call smooth_cutoff(rjk, cutjk, width, swjk, dswjkdr)
+                  sw = swij * swik * swjk
+                  if (sw <= 0.0_wp) cycle
+
+                  r2 = r2ij*r2ik*r2jk
+                  r1 = sqrt(r2)
+                  r3 = r2 * r1
+                  r5 = r3 * r2
+
+                  fdmp = 1.0_wp / (1.0_wp + 6.0_wp * (r0 / r1)**alp3)
+                  ang = 0.375_wp*(r2ij + r2jk - r2ik)*(r2ij - r2jk + r2ik)&
+                     & *(-r2ij + r2jk + r2ik) / r5 + 1.0_wp / r3
+
+                  rr = ang*fdmp
+                  dE0 = rr * c9
+                  dE = dE0 * triple * sw
+                  ! Every selected member receives its share of the triple energy
+                  dE_share = dE / (share(iat) + share(jat) + share(kat))
+                  if (iu > 0) energy_local(iu) = energy_local(iu) - dE_share
+                  if (ju > 0) energy_local(ju) = energy_local(ju) - dE_share
+                  if (ku > 0) energy_local(ku) = energy_local(ku) - dE_share
+                  if (.not.grad) cycle
+
+                  dfdmp = -2.0_wp * alp * (r0 / r1)**alp3 * fdmp**2
+
+                  ! d/drij
+                  dang = -0.375_wp * (r2ij**3 + r2ij**2 * (r2jk + r2ik)&
+                     & + r2ij * (3.0_wp * r2jk**2 + 2.0_wp * r2jk*r2ik&
+                     & + 3.0_wp * r2ik**2)&
+                     & - 5.0_wp * (r2jk - r2ik)**2 * (r2jk + r2ik)) / r5
+                  dGij(:) = sw * c9 * (-dang*fdmp + ang*dfdmp) / r2ij * vij &
+                     & - dE0 * dswijdr / rij * swik * swjk * vij
+
+                  ! d/drik
+                  dang = -0.375_wp * (r2ik**3 + r2ik**2 * (r2jk + r2ij)&
+                     & + r2ik * (3.0_wp * r2jk**2 + 2.0_wp * r2jk * r2ij&
+                     & + 3.0_wp * r2ij**2)&
+                     & - 5.0_wp * (r2jk - r2ij)**2 * (r2jk + r2ij)) / r5
+                  dGik(:) = sw * c9 * (-dang * fdmp + ang * dfdmp) / r2ik * vik &
+                     & - dE0 * dswikdr / rik * swij * swjk * vik
+
+                  ! d/drjk
+                  dang = -0.375_wp * (r2jk**3 + r2jk**2*(r2ik + r2ij)&
+                     & + r2jk * (3.0_wp * r2ik**2 + 2.0_wp * r2ik * r2ij&
+                     & + 3.0_wp * r2ij**2)&
+                     & - 5.0_wp * (r2ik - r2ij)**2 * (r2ik + r2ij)) / r5
+                  dGjk(:) = sw * c9 * (-dang * fdmp + ang * dfdmp) / r2jk * vjk &
+                     & - dE0 * dswjkdr / rjk * swij * swik * vjk
+
+                  ! The virial of the triple is shared equally between its members
+                  dS(:, :) = (spread(dGij, 1, 3) * spread(vij, 2, 3)&
+                     & + spread(dGik, 1, 3) * spread(vik, 2, 3)&
+                     & + spread(dGjk, 1, 3) * spread(vjk, 2, 3)) * triple * third
+
+                  if (iu > 0) then
+                     gradient_local(:, iu) = gradient_local(:, iu) &
+                        & - (dGij + dGik) * triple
+                     sigma_local(:, :, iu) = sigma_local(:, :, iu) + dS
+                     dEdcn_local(iu) = dEdcn_local(iu) - dE * 0.5_wp &
+                        & * (dc6dcn(iat, jat) / c6ij + dc6dcn(iat, kat) / c6ik)
+                     dEdq_local(iu) = dEdq_local(iu) - dE * 0.5_wp &
+                        & * (dc6dq(iat, jat) / c6ij + dc6dq(iat, kat) / c6ik)
+                  end if
+                  if (ju > 0) then
+                     gradient_local(:, ju) = gradient_local(:, ju) &
+                        & + (dGij - dGjk) * triple
+                     sigma_local(:, :, ju) = sigma_local(:, :, ju) + dS
+                     dEdcn_local(ju) = dEdcn_local(ju) - dE * 0.5_wp &
+                        & * (dc6dcn(jat, iat) / c6ij + dc6dcn(jat, kat) / c6jk)
+                     dEdq_local(ju) = dEdq_local(ju) - dE * 0.5_wp &
+                        & * (dc6dq(jat, iat) / c6ij + dc6dq(jat, kat) / c6jk)
+                  end if
+                  if (ku > 0) then
+                     gradient_local(:, ku) = gradient_local(:, ku) &
+                        & + (dGik + dGjk) * triple
+                     sigma_local(:, :, ku) = sigma_local(:, :, ku) + dS
+                     dEdcn_local(ku) = dEdcn_local(ku) - dE * 0.5_wp &
+                        & * (dc6dcn(kat, iat) / c6ik + dc6dcn(kat, jat) / c6jk)
+                     dEdq_local(ku) = dEdq_local(ku) - dE * 0.5_wp &
+                        & * (dc6dq(kat, iat) / c6ik + dc6dq(kat, jat) / c6jk)
+                  end if
+               end do
+            end do
+         end do
+      end do
+   end do
+   !$omp end do
+   !$omp critical (get_atm_atomic_dispersion_)
+   energy(:) = energy(:) + energy_local(:)
+   if (grad) then
+      dEdcn(:) = dEdcn(:) + dEdcn_local(:)
+      dEdq(:) = dEdq(:) + dEdq_local(:)
+      gradient(:, :) = gradient(:, :) + gradient_local(:, :)
+      sigma(:, :, :) = sigma(:, :, :) + sigma_local(:, :, :)
+   end if
+   !$omp end critical (get_atm_atomic_dispersion_)
+   deallocate(energy_local)
+   deallocate(dEdcn_local)
+   deallocate(dEdq_local)
+   deallocate(gradient_local)
+   deallocate(sigma_local)
+   !$omp end parallel
+
+end subroutine get_atm_atomic_dispersion
+
+
+!> Number of further atoms sharing the energy of an interaction with every partner.
+!>
+!> All atoms share the energy equally by default, for an exclusive selection only
+!> the selected atoms share the energy.
+pure subroutine get_energy_share(nat, atoms, exclusive, share)
+
+   !> Number of atoms
+   integer, intent(in) :: nat
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Share the energy only between the selected atoms
+   logical, intent(in), optional :: exclusive
+
+   !> Contribution of every partner atom to the number of sharing atoms
+   real(wp), allocatable, intent(out) :: share(:)
+
+   allocate(share(nat), source=1.0_wp)
+   if (present(exclusive)) then
+      if (exclusive) then
+         share(:) = 0.0_wp
+         share(atoms) = 1.0_wp
+      end if
+   end if
+
+end subroutine get_energy_share
+
+
 !> Logic exercise to distribute a triple energy to atomwise energies.
 elemental function triple_scale(ii, jj, kk) result(triple)
 
@@ -16,13 +16,18 @@
 
 !> Implementation of the rational (Becke--Johnson) damping function.
 module dftd4_damping_rational
-   use dftd4_cutoff, only : smooth_cutoff
+   use dftd4_cutoff, only : smooth_cutoff, select_cutoff, smoothstep3, smoothstep4, &
+      & smoothstep5, smoothstep_deriv
    use dftd4_damping, only : damping_param
-   use dftd4_damping_atm, only : get_atm_dispersion
+   use dftd4_damping_atm, only : get_atm_dispersion, get_atm_atomic_dispersion, &
+      & get_energy_share
    use dftd4_data, only : get_r4r2_val
+   use dftd4_pairlist, only : pair_list
    use dftd4_partition, only : work_partition, owns_pair
-   use mctc_env, only : wp
+   use mctc_env, only : sp, wp
    use mctc_io, only : structure_type
+   use mctc_io_constants, only : pi
+   use mctc_io_math, only : matdet_3x3
    implicit none
    private
 
@@ -51,17 +56,64 @@ module dftd4_damping_rational
       !> Evaluate pairwise representation of non-additive dispersion energy
       procedure :: get_pairwise_dispersion3_impl => get_pairwise_dispersion3
 
+      !> Evaluate long-range tail of the pairwise dispersion energy expression
+      procedure :: get_dispersion2_tail
+
+      !> Evaluate pairwise representation of the long-range tail
+      procedure :: get_pairwise_dispersion2_tail
+
+      !> Evaluate additive dispersion energy for a sparse list of atom pairs
+      procedure :: get_sparse_dispersion2
+
+      !> Evaluate non-additive dispersion energy for a sparse list of atom pairs
+      procedure :: get_sparse_dispersion3
+
+      !> Estimate the dispersion energy neglected beyond a real space cutoff
+      procedure :: get_cutoff_error
+
+      !> Evaluate pairwise dispersion energy expression for selected atoms
+      procedure :: get_atomic_dispersion2
+
+      !> Evaluate ATM three-body dispersion energy expression for selected atoms
+      procedure :: get_atomic_dispersion3
+
    end type rational_damping_param
 
+
+   !> Damping radii and cutoffs tabulated for each pair of species
+   type :: pair_table
+      !> Product of the r4 over r2 expectation values scaled by three
+      real(wp), allocatable :: rrij(:, :)
+      !> Sixth power of the critical radius
+      real(wp), allocatable :: r06(:, :)
+      !> Eighth power of the critical radius
+      real(wp), allocatable :: r08(:, :)
+      !> Real space cutoff
+      real(wp), allocatable :: cutoff(:, :)
+      !> Inverse width of the smooth cutoff, zero for sharp cutoffs
+      real(wp), allocatable :: winv(:, :)
+      !> Shift of the switching variable, one for sharp cutoffs
+      real(wp), allocatable :: wshift(:, :)
+   end type pair_table
+
+   !> Collect the periodic images of an atom pair within the cutoff
+   interface collect_images
+      module procedure :: collect_images_dp
+      module procedure :: collect_images_sp
+   end interface collect_images
+
    real(wp), parameter :: sixth = 1.0_wp / 6.0_wp
 
+   !> Number of intervals for the quadrature of the long-range tail
+   integer, parameter :: tail_intervals = 64
+
 
 contains
 
 
 !> Evaluation of the dispersion energy expression
 subroutine get_dispersion2(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, dc6dq, &
-      & energy, dEdcn, dEdq, gradient, sigma, partition)
+      & energy, dEdcn, dEdq, gradient, sigma, partition, pair_cutoff, mixed)
    !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion2
 
    !> Damping parameters
@@ -109,24 +161,89 @@ subroutine get_dispersion2(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, dc
    !> Work partition of the atom pairs, defaults to the complete work
    type(work_partition), intent(in), optional :: partition
 
-   logical :: grad
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Evaluate distances, damping and switching functions in single precision
+   logical, intent(in), optional :: mixed
+
+   logical :: grad, single
 
    if (abs(self%s6) < epsilon(1.0_wp) .and. abs(self%s8) < epsilon(1.0_wp)) return
    grad = present(dc6dcn) .and. present(dEdcn) .and. present(dc6dq) &
       & .and. present(dEdq) .and. present(gradient) .and. present(sigma)
 
-   if (grad) then
+   single = .false.
+   if (present(mixed)) single = mixed
+
+   if (single) then
+      call get_dispersion_mixed(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, &
+         & dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition, pair_cutoff)
+   else if (grad) then
       call get_dispersion_derivs(self, mol, trans, cutoff, width, r4r2, c6, &
-         & dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition)
+         & dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition, pair_cutoff)
    else
-      call get_dispersion_energy(self, mol, trans, cutoff, width, r4r2, c6, energy, partition)
+      call get_dispersion_energy(self, mol, trans, cutoff, width, r4r2, c6, energy, &
+         & partition, pair_cutoff)
    end if
 
 end subroutine get_dispersion2
 
 
+!> Tabulate the damping radii and cutoffs for each pair of species
+subroutine new_pair_table(table, self, mol, cutoff, width, r4r2, pair_cutoff)
+
+   !> Tabulated parameters
+   type(pair_table), intent(out) :: table
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   integer :: isp, jsp
+   real(wp) :: r0ij
+
+   allocate(table%rrij(mol%nid, mol%nid), table%r06(mol%nid, mol%nid), &
+      & table%r08(mol%nid, mol%nid), table%cutoff(mol%nid, mol%nid), &
+      & table%winv(mol%nid, mol%nid), table%wshift(mol%nid, mol%nid))
+   do isp = 1, mol%nid
+      do jsp = 1, mol%nid
+         table%rrij(jsp, isp) = 3*r4r2(isp)*r4r2(jsp)
+         r0ij = self%a1 * sqrt(table%rrij(jsp, isp)) + self%a2
+         table%r06(jsp, isp) = r0ij**6
+         table%r08(jsp, isp) = r0ij**8
+         table%cutoff(jsp, isp) = select_cutoff(cutoff, isp, jsp, pair_cutoff)
+         ! Same switching as smooth_cutoff, sharp cutoffs keep the switch at one
+         if (width > 0.0_wp .and. table%cutoff(jsp, isp) > 0.0_wp) then
+            table%winv(jsp, isp) = 1.0_wp / min(width, table%cutoff(jsp, isp))
+            table%wshift(jsp, isp) = 0.0_wp
+         else
+            table%winv(jsp, isp) = 0.0_wp
+            table%wshift(jsp, isp) = 1.0_wp
+         end if
+      end do
+   end do
+
+end subroutine new_pair_table
+
+
 !> Evaluation of the dispersion energy expression
-subroutine get_dispersion_energy(self, mol, trans, cutoff, width, r4r2, c6, energy, partition)
+subroutine get_dispersion_energy(self, mol, trans, cutoff, width, r4r2, c6, energy, &
+      & partition, pair_cutoff)
 
    !> Damping parameters
    class(rational_damping_param), intent(in) :: self
@@ -155,52 +272,72 @@ subroutine get_dispersion_energy(self, mol, trans, cutoff, width, r4r2, c6, ener
    !> Work partition of the atom pairs, absent selects the complete work
    type(work_partition), intent(in), optional :: partition
 
-   integer :: iat, jat, izp, jzp, jtr
-   real(wp) :: vec(3), r2, r, cutoff2, r0ij, rrij, c6ij, t6, t8, edisp, dE
-   real(wp) :: sw, dswdr
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   integer :: iat, jat, izp, jzp, img, nimg
+   real(wp) :: r2, r6, r8, x, sw, den, t6, t8
+   real(wp) :: s6, s8rr, r06, r08, cutij, cutij2, winv, wshift, edisp, dE
+   type(pair_table) :: table
+   real(wp), allocatable :: xyz(:, :), lattr(:, :), rsq(:)
 
    ! Thread-private array for reduction
    ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
    real(wp), allocatable :: energy_local(:)
 
-   cutoff2 = cutoff*cutoff
+   call new_pair_table(table, self, mol, cutoff, width, r4r2, pair_cutoff)
+   xyz = transpose(mol%xyz)
+   lattr = transpose(trans)
+   s6 = self%s6
 
    !$omp parallel default(none) &
-   !$omp shared(mol, self, c6, trans, cutoff2, cutoff, width, r4r2, partition) &
-   !$omp private(iat, jat, izp, jzp, jtr, vec, r2, r0ij, rrij, c6ij, &
-   !$omp& t6, t8, edisp, dE, r, sw, dswdr) &
+   !$omp shared(mol, self, s6, c6, xyz, lattr, table, partition) &
+   !$omp private(iat, jat, izp, jzp, img, nimg, &
+   !$omp& r2, r6, r8, x, sw, den, t6, t8, s8rr, r06, r08, cutij, cutij2, winv, wshift, &
+   !$omp& edisp, dE, rsq) &
    !$omp shared(energy) &
    !$omp private(energy_local)
    allocate(energy_local(size(energy, 1)), source=0.0_wp)
+   allocate(rsq(size(lattr, 1)))
    !$omp do schedule(runtime)
    do iat = 1, mol%nat
       izp = mol%id(iat)
       do jat = 1, iat
          if (.not.owns_pair(partition, iat, jat)) cycle
          jzp = mol%id(jat)
-         rrij = 3*r4r2(izp)*r4r2(jzp)
-         r0ij = self%a1 * sqrt(rrij) + self%a2
-         c6ij = c6(jat, iat)
-         do jtr = 1, size(trans, 2)
-            vec(:) = mol%xyz(:, iat) - (mol%xyz(:, jat) + trans(:, jtr))
-            r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
-            if (r2 > cutoff2 .or. r2 < epsilon(1.0_wp)) cycle
-            r = sqrt(r2)
-            call smooth_cutoff(r, cutoff, width, sw, dswdr)
-            if (sw <= 0.0_wp) cycle
-
-            t6 = 1.0_wp/(r2**3 + r0ij**6)
-            t8 = 1.0_wp/(r2**4 + r0ij**8)
-
-            edisp = sw * (self%s6*t6 + self%s8*rrij*t8)
+         s8rr = self%s8*table%rrij(jzp, izp)
+         r06 = table%r06(jzp, izp)
+         r08 = table%r08(jzp, izp)
+         cutij = table%cutoff(jzp, izp)
+         cutij2 = cutij*cutij
+         winv = table%winv(jzp, izp)
+         wshift = table%wshift(jzp, izp)
+
+         ! Collect the images within the cutoff, the kernel below is branch-free
+         call collect_images(xyz, iat, jat, lattr, cutij2, nimg, rsq)
+
+         edisp = 0.0_wp
+         !$omp simd reduction(+:edisp)
+         do img = 1, nimg
+            r2 = rsq(img)
+            r6 = r2**3
+            r8 = r6*r2
+            x = min(max((cutij - sqrt(r2))*winv, 0.0_wp) + wshift, 1.0_wp)
+            sw = x**3 * (smoothstep3 + x*(smoothstep4 + smoothstep5*x))
+            ! Single division for both damped terms
+            den = 1.0_wp / ((r6 + r06)*(r8 + r08))
+            t6 = (r8 + r08)*den
+            t8 = (r6 + r06)*den
+
+            edisp = edisp + sw * (s6*t6 + s8rr*t8)
+         end do
 
-            dE = -c6ij*edisp * 0.5_wp
+         dE = -c6(jat, iat)*edisp * 0.5_wp
 
-            energy_local(iat) = energy_local(iat) + dE
-            if (iat /= jat) then
-               energy_local(jat) = energy_local(jat) + dE
-            end if
-         end do
+         energy_local(iat) = energy_local(iat) + dE
+         if (iat /= jat) then
+            energy_local(jat) = energy_local(jat) + dE
+         end if
       end do
    end do
    !$omp end do
@@ -208,6 +345,7 @@ subroutine get_dispersion_energy(self, mol, trans, cutoff, width, r4r2, c6, ener
    energy(:) = energy(:) + energy_local(:)
    !$omp end critical (get_dispersion_energy_)
    deallocate(energy_local)
+   deallocate(rsq)
    !$omp end parallel
 
 end subroutine get_dispersion_energy
@@ -215,7 +353,7 @@ end subroutine get_dispersion_energy
 
 !> Evaluation of the dispersion energy expression
 subroutine get_dispersion_derivs(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, dc6dq, &
-      & energy, dEdcn, dEdq, gradient, sigma, partition)
+      & energy, dEdcn, dEdq, gradient, sigma, partition, pair_cutoff)
 
    !> Damping parameters
    class(rational_damping_param), intent(in) :: self
@@ -262,10 +400,16 @@ subroutine get_dispersion_derivs(self, mol, trans, cutoff, width, r4r2, c6, dc6d
    !> Work partition of the atom pairs, absent selects the complete work
    type(work_partition), intent(in), optional :: partition
 
-   integer :: iat, jat, izp, jzp, jtr
-   real(wp) :: vec(3), r2, r, cutoff2, r0ij, rrij, c6ij, t6, t8, d6, d8
-   real(wp) :: edisp0, gdisp0, edisp, gdisp, sw, dswdr
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   integer :: iat, jat, izp, jzp, img, nimg
+   real(wp) :: vx, vy, vz, r2, r, r6, r8, x, sw, dswdr
+   real(wp) :: s6, s8rr, r06, r08, cutij, cutij2, winv, wshift, c6ij, den, t6, t8
+   real(wp) :: edisp0, gdisp, edisp, gx, gy, gz, sxx, sxy, sxz, syy, syz, szz
    real(wp) :: dE, dG(3), dS(3, 3)
+   type(pair_table) :: table
+   real(wp), allocatable :: xyz(:, :), lattr(:, :), rsq(:), vec(:, :)
 
    ! Thread-private arrays for reduction
    ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
@@ -275,12 +419,17 @@ subroutine get_dispersion_derivs(self, mol, trans, cutoff, width, r4r2, c6, dc6d
    real(wp), allocatable :: gradient_local(:, :)
    real(wp), allocatable :: sigma_local(:, :)
 
-   cutoff2 = cutoff*cutoff
+   call new_pair_table(table, self, mol, cutoff, width, r4r2, pair_cutoff)
+   xyz = transpose(mol%xyz)
+   lattr = transpose(trans)
+   s6 = self%s6
 
    !$omp parallel default(none) &
-   !$omp shared(mol, self, c6, dc6dcn, dc6dq, trans, cutoff2, cutoff, width, r4r2, partition) &
-   !$omp private(iat, jat, izp, jzp, jtr, vec, r2, r0ij, rrij, c6ij, t6, t8, &
-   !$omp& d6, d8, edisp0, gdisp0, edisp, gdisp, dE, dG, dS, r, sw, dswdr) &
+   !$omp shared(mol, self, s6, c6, dc6dcn, dc6dq, xyz, lattr, table, partition) &
+   !$omp private(iat, jat, izp, jzp, img, nimg, vx, vy, vz, &
+   !$omp& r2, r, r6, r8, x, sw, dswdr, s8rr, r06, r08, cutij, cutij2, winv, wshift, &
+   !$omp& c6ij, den, t6, t8, edisp0, gdisp, edisp, gx, gy, gz, sxx, sxy, sxz, syy, syz, &
+   !$omp& szz, dE, dG, dS, rsq, vec) &
    !$omp shared(energy, gradient, sigma, dEdcn, dEdq) &
    !$omp private(energy_local, gradient_local, sigma_local, dEdcn_local, &
    !$omp& dEdq_local)
@@ -289,52 +438,85 @@ subroutine get_dispersion_derivs(self, mol, trans, cutoff, width, r4r2, c6, dc6d
    allocate(dEdq_local(size(dEdq, 1)), source=0.0_wp)
    allocate(gradient_local(size(gradient, 1), size(gradient, 2)), source=0.0_wp)
    allocate(sigma_local(size(sigma, 1), size(sigma, 2)), source=0.0_wp)
+   allocate(rsq(size(lattr, 1)), vec(size(lattr, 1), 3))
    !$omp do schedule(runtime)
    do iat = 1, mol%nat
       izp = mol%id(iat)
       do jat = 1, iat
          if (.not.owns_pair(partition, iat, jat)) cycle
          jzp = mol%id(jat)
-         rrij = 3*r4r2(izp)*r4r2(jzp)
-         r0ij = self%a1 * sqrt(rrij) + self%a2
-         c6ij = c6(jat, iat)
-         do jtr = 1, size(trans, 2)
-            vec(:) = mol%xyz(:, iat) - (mol%xyz(:, jat) + trans(:, jtr))
-            r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
-            if (r2 > cutoff2 .or. r2 < epsilon(1.0_wp)) cycle
+         s8rr = self%s8*table%rrij(jzp, izp)
+         r06 = table%r06(jzp, izp)
+         r08 = table%r08(jzp, izp)
+         cutij = table%cutoff(jzp, izp)
+         cutij2 = cutij*cutij
+         winv = table%winv(jzp, izp)
+         wshift = table%wshift(jzp, izp)
+
+         ! Collect the images within the cutoff, the kernel below is branch-free
+         call collect_images(xyz, iat, jat, lattr, cutij2, nimg, rsq, vec)
+
+         edisp = 0.0_wp
+         gx = 0.0_wp
+         gy = 0.0_wp
+         gz = 0.0_wp
+         sxx = 0.0_wp
+         sxy = 0.0_wp
+         sxz = 0.0_wp
+         syy = 0.0_wp
+         syz = 0.0_wp
+         szz = 0.0_wp
+         !$omp simd reduction(+:edisp, gx, gy, gz, sxx, sxy, sxz, syy, syz, szz)
+         do img = 1, nimg
+            vx = vec(img, 1)
+            vy = vec(img, 2)
+            vz = vec(img, 3)
+            r2 = rsq(img)
             r = sqrt(r2)
-            call smooth_cutoff(r, cutoff, width, sw, dswdr)
-            if (sw <= 0.0_wp) cycle
-
-            t6 = 1.0_wp/(r2**3 + r0ij**6)
-            t8 = 1.0_wp/(r2**4 + r0ij**8)
-
-            d6 = -6*r2**2*t6**2
-            d8 = -8*r2**3*t8**2
-
-            edisp0 = self%s6*t6 + self%s8*rrij*t8
-            gdisp0 = self%s6*d6 + self%s8*rrij*d8
-            edisp = sw * edisp0
+            r6 = r2**3
+            r8 = r6*r2
+            x = min(max((cutij - r)*winv, 0.0_wp) + wshift, 1.0_wp)
+            sw = x**3 * (smoothstep3 + x*(smoothstep4 + smoothstep5*x))
+            dswdr = -smoothstep_deriv * x**2 * (1.0_wp - x)**2 * winv
+            ! Single division for both damped terms
+            den = 1.0_wp / ((r6 + r06)*(r8 + r08))
+            t6 = (r8 + r08)*den
+            t8 = (r6 + r06)*den
+
+            edisp0 = s6*t6 + s8rr*t8
             ! Product rule for d(sw(r)*edisp0(r2))/dr2.
-            gdisp = sw * gdisp0 + dswdr * edisp0 / r
-
-            dE = -c6ij*edisp * 0.5_wp
-            dG(:) = -c6ij*gdisp*vec
-            dS(:, :) = spread(dG, 1, 3) * spread(vec, 2, 3) * 0.5_wp
+            gdisp = sw * (-6*s6*r2*r2*t6*t6 - 8*s8rr*r6*t8*t8) + dswdr * edisp0 / r
+
+            edisp = edisp + sw * edisp0
+            gx = gx + gdisp*vx
+            gy = gy + gdisp*vy
+            gz = gz + gdisp*vz
+            sxx = sxx + gdisp*vx*vx
+            sxy = sxy + gdisp*vx*vy
+            sxz = sxz + gdisp*vx*vz
+            syy = syy + gdisp*vy*vy
+            syz = syz + gdisp*vy*vz
+            szz = szz + gdisp*vz*vz
+         end do
 
-            energy_local(iat) = energy_local(iat) + dE
-            dEdcn_local(iat) = dEdcn_local(iat) - dc6dcn(iat, jat) * edisp
-            dEdq_local(iat) = dEdq_local(iat) - dc6dq(iat, jat) * edisp
+         c6ij = c6(jat, iat)
+         dE = -c6ij*edisp * 0.5_wp
+         dG(:) = -c6ij*[gx, gy, gz]
+         dS(:, :) = -c6ij*0.5_wp*reshape([sxx, sxy, sxz, sxy, syy, syz, sxz, syz, szz], &
+            & [3, 3])
+
+         energy_local(iat) = energy_local(iat) + dE
+         dEdcn_local(iat) = dEdcn_local(iat) - dc6dcn(iat, jat) * edisp
+         dEdq_local(iat) = dEdq_local(iat) - dc6dq(iat, jat) * edisp
+         sigma_local(:, :) = sigma_local + dS
+         if (iat /= jat) then
+            energy_local(jat) = energy_local(jat) + dE
+            dEdcn_local(jat) = dEdcn_local(jat) - dc6dcn(jat, iat) * edisp
+            dEdq_local(jat) = dEdq_local(jat) - dc6dq(jat, iat) * edisp
+            gradient_local(:, iat) = gradient_local(:, iat) + dG
+            gradient_local(:, jat) = gradient_local(:, jat) - dG
             sigma_local(:, :) = sigma_local + dS
-            if (iat /= jat) then
-               energy_local(jat) = energy_local(jat) + dE
-               dEdcn_local(jat) = dEdcn_local(jat) - dc6dcn(jat, iat) * edisp
-               dEdq_local(jat) = dEdq_local(jat) - dc6dq(jat, iat) * edisp
-               gradient_local(:, iat) = gradient_local(:, iat) + dG
-               gradient_local(:, jat) = gradient_local(:, jat) - dG
-               sigma_local(:, :) = sigma_local + dS
-            end if
-         end do
+         end if
       end do
    end do
    !$omp end do
@@ -350,15 +532,18 @@ subroutine get_dispersion_derivs(self, mol, trans, cutoff, width, r4r2, c6, dc6d
    deallocate(dEdq_local)
    deallocate(gradient_local)
    deallocate(sigma_local)
+   deallocate(rsq, vec)
    !$omp end parallel
 
 end subroutine get_dispersion_derivs
 
 
-!> Evaluation of the dispersion energy expression
-subroutine get_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, dc6dq, &
-      & energy, dEdcn, dEdq, gradient, sigma, partition)
-   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion3
+!> Evaluation of the dispersion energy expression with distances, damping and
+!> switching functions in single precision. Only coordinates and lattice points are
+!> converted to single precision, the C6 coefficients are read in double precision
+!> and energy and derivatives are accumulated in double precision.
+subroutine get_dispersion_mixed(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, &
+      & dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition, pair_cutoff)
 
    !> Damping parameters
    class(rational_damping_param), intent(in) :: self
@@ -402,19 +587,284 @@ subroutine get_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, dc
    !> Dispersion virial
    real(wp), intent(inout), optional :: sigma(:, :)
 
-   !> Work partition of the atom pairs, defaults to the complete work
+   !> Work partition of the atom pairs, absent selects the complete work
    type(work_partition), intent(in), optional :: partition
 
-   call get_atm_dispersion(mol, trans, cutoff, width, self%s9, self%a1, &
-      & self%a2, self%alp, r4r2, c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, &
-      & gradient, sigma, partition)
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
 
-end subroutine get_dispersion3
+   logical :: grad
+   integer :: iat, jat, izp, jzp, img, nimg
+   real(sp) :: vx, vy, vz, r2, r, r6, r8, x, sw, dswdr
+   real(sp) :: s6, s8rr, r06, r08, cutij, cutij2, winv, wshift, c3, c4, c5, cd
+   real(sp) :: t6, t8, edisp0, gdisp
+   real(wp) :: c6ij, edisp, gx, gy, gz, sxx, sxy, sxz, syy, syz, szz
+   real(wp) :: dE, dG(3), dS(3, 3)
+   type(pair_table) :: table
+   real(sp), allocatable :: xyz(:, :), lattr(:, :), rsq(:), vec(:, :)
 
+   ! Thread-private arrays for reduction
+   ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
+   real(wp), allocatable :: energy_local(:)
+   real(wp), allocatable :: dEdcn_local(:)
+   real(wp), allocatable :: dEdq_local(:)
+   real(wp), allocatable :: gradient_local(:, :)
+   real(wp), allocatable :: sigma_local(:, :)
 
-!> Evaluation of the dispersion energy expression projected on atomic pairs
-subroutine get_pairwise_dispersion2(self, mol, trans, cutoff, width, r4r2, c6, energy)
-   !DEC$ ATTRIBUTES DLLEXPORT :: get_pairwise_dispersion2
+   grad = present(dc6dcn) .and. present(dEdcn) .and. present(dc6dq) &
+      & .and. present(dEdq) .and. present(gradient) .and. present(sigma)
+
+   call new_pair_table(table, self, mol, cutoff, width, r4r2, pair_cutoff)
+   xyz = real(transpose(mol%xyz), sp)
+   lattr = real(transpose(trans), sp)
+   s6 = real(self%s6, sp)
+   c3 = real(smoothstep3, sp)
+   c4 = real(smoothstep4, sp)
+   c5 = real(smoothstep5, sp)
+   cd = real(smoothstep_deriv, sp)
+
+   !$omp parallel default(none) &
+   !$omp shared(mol, self, grad, s6, c3, c4, c5, cd, c6, dc6dcn, dc6dq, xyz, lattr, &
+   !$omp& table, partition) &
+   !$omp private(iat, jat, izp, jzp, img, nimg, vx, vy, vz, &
+   !$omp& r2, r, r6, r8, x, sw, dswdr, s8rr, r06, r08, cutij, cutij2, winv, wshift, &
+   !$omp& c6ij, t6, t8, edisp0, gdisp, edisp, gx, gy, gz, sxx, sxy, sxz, syy, syz, &
+   !$omp& szz, dE, dG, dS, rsq, vec) &
+   !$omp shared(energy, gradient, sigma, dEdcn, dEdq) &
+   !$omp private(energy_local, gradient_local, sigma_local, dEdcn_local, &
+   !$omp& dEdq_local)
+   allocate(energy_local(size(energy, 1)), source=0.0_wp)
+   if (grad) then
+      allocate(dEdcn_local(size(dEdcn, 1)), source=0.0_wp)
+      allocate(dEdq_local(size(dEdq, 1)), source=0.0_wp)
+      allocate(gradient_local(size(gradient, 1), size(gradient, 2)), source=0.0_wp)
+      allocate(sigma_local(size(sigma, 1), size(sigma, 2)), source=0.0_wp)
+   end if
+   allocate(rsq(size(lattr, 1)), vec(size(lattr, 1), 3))
+   !$omp do schedule(runtime)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      do jat = 1, iat
+         if (.not.owns_pair(partition, iat, jat)) cycle
+         jzp = mol%id(jat)
+         s8rr = real(self%s8*table%rrij(jzp, izp), sp)
+         r06 = real(table%r06(jzp, izp), sp)
+         r08 = real(table%r08(jzp, izp), sp)
+         cutij = real(table%cutoff(jzp, izp), sp)
+         cutij2 = cutij*cutij
+         winv = real(table%winv(jzp, izp), sp)
+         wshift = real(table%wshift(jzp, izp), sp)
+
+         ! Collect the images within the cutoff, the kernel below is branch-free
+         call collect_images(xyz, iat, jat, lattr, cutij2, nimg, rsq, vec)
+
+         edisp = 0.0_wp
+         gx = 0.0_wp
+         gy = 0.0_wp
+         gz = 0.0_wp
+         sxx = 0.0_wp
+         sxy = 0.0_wp
+         sxz = 0.0_wp
+         syy = 0.0_wp
+         syz = 0.0_wp
+         szz = 0.0_wp
+         if (grad) then
+            !$omp simd reduction(+:edisp, gx, gy, gz, sxx, sxy, sxz, syy, syz, szz)
+            do img = 1, nimg
+               vx = vec(img, 1)
+               vy = vec(img, 2)
+               vz = vec(img, 3)
+               r2 = rsq(img)
+               r = sqrt(r2)
+               r6 = r2**3
+               r8 = r6*r2
+               x = min(max((cutij - r)*winv, 0.0_sp) + wshift, 1.0_sp)
+               sw = x**3 * (c3 + x*(c4 + c5*x))
+               dswdr = -cd * x**2 * (1.0_sp - x)**2 * winv
+               ! Separate divisions, the product of both denominators overflows
+               ! in single precision for large cutoffs
+               t6 = 1.0_sp / (r6 + r06)
+               t8 = 1.0_sp / (r8 + r08)
+
+               edisp0 = s6*t6 + s8rr*t8
+               ! Product rule for d(sw(r)*edisp0(r2))/dr2.
+               gdisp = sw * (-6*s6*r2*r2*t6*t6 - 8*s8rr*r6*t8*t8) + dswdr * edisp0 / r
+
+               edisp = edisp + real(sw * edisp0, wp)
+               gx = gx + real(gdisp*vx, wp)
+               gy = gy + real(gdisp*vy, wp)
+               gz = gz + real(gdisp*vz, wp)
+               sxx = sxx + real(gdisp*vx*vx, wp)
+               sxy = sxy + real(gdisp*vx*vy, wp)
+               sxz = sxz + real(gdisp*vx*vz, wp)
+               syy = syy + real(gdisp*vy*vy, wp)
+               syz = syz + real(gdisp*vy*vz, wp)
+               szz = szz + real(gdisp*vz*vz, wp)
+            end do
+         else
+            !$omp simd reduction(+:edisp)
+            do img = 1, nimg
+               r2 = rsq(img)
+               r6 = r2**3
+               r8 = r6*r2
+               x = min(max((cutij - sqrt(r2))*winv, 0.0_sp) + wshift, 1.0_sp)
+               sw = x**3 * (c3 + x*(c4 + c5*x))
+               t6 = 1.0_sp / (r6 + r06)
+               t8 = 1.0_sp / (r8 + r08)
+
+               edisp = edisp + real(sw * (s6*t6 + s8rr*t8), wp)
+            end do
+         end if
+
+         c6ij = c6(jat, iat)
+         dE = -c6ij*edisp * 0.5_wp
+         energy_local(iat) = energy_local(iat) + dE
+         if (iat /= jat) then
+            energy_local(jat) = energy_local(jat) + dE
+         end if
+         if (.not.grad) cycle
+
+         dG(:) = -c6ij*[gx, gy, gz]
+         dS(:, :) = -c6ij*0.5_wp*reshape([sxx, sxy, sxz, sxy, syy, syz, sxz, syz, szz], &
+            & [3, 3])
+
+         dEdcn_local(iat) = dEdcn_local(iat) - dc6dcn(iat, jat) * edisp
+         dEdq_local(iat) = dEdq_local(iat) - dc6dq(iat, jat) * edisp
+         sigma_local(:, :) = sigma_local + dS
+         if (iat /= jat) then
+            dEdcn_local(jat) = dEdcn_local(jat) - dc6dcn(jat, iat) * edisp
+            dEdq_local(jat) = dEdq_local(jat) - dc6dq(jat, iat) * edisp
+            gradient_local(:, iat) = gradient_local(:, iat) + dG
+            gradient_local(:, jat) = gradient_local(:, jat) - dG
+            sigma_local(:, :) = sigma_local + dS
+         end if
+      end do
+   end do
+   !$omp end do
+   !$omp critical (get_dispersion_mixed_)
+   energy(:) = energy(:) + energy_local(:)
+   if (grad) then
+      dEdcn(:) = dEdcn(:) + dEdcn_local(:)
+      dEdq(:) = dEdq(:) + dEdq_local(:)
+      gradient(:, :) = gradient(:, :) + gradient_local(:, :)
+      sigma(:, :) = sigma(:, :) + sigma_local(:, :)
+   end if
+   !$omp end critical (get_dispersion_mixed_)
+   deallocate(energy_local)
+   if (grad) then
+      deallocate(dEdcn_local)
+      deallocate(dEdq_local)
+      deallocate(gradient_local)
+      deallocate(sigma_local)
+   end if
+   deallocate(rsq, vec)
+   !$omp end parallel
+
+end subroutine get_dispersion_mixed
+
+
+!> Collect the periodic images of an atom pair within the cutoff in double precision
+pure subroutine collect_images_dp(xyz, iat, jat, lattr, cutoff2, nimg, rsq, vec)
+
+   !> Cartesian coordinates, atoms are the leading dimension
+   real(wp), intent(in) :: xyz(:, :)
+
+   !> First atom of the pair
+   integer, intent(in) :: iat
+
+   !> Second atom of the pair, shifted by the lattice points
+   integer, intent(in) :: jat
+
+   !> Lattice points, lattice points are the leading dimension
+   real(wp), intent(in) :: lattr(:, :)
+
+   !> Squared real space cutoff of the pair
+   real(wp), intent(in) :: cutoff2
+
+   !> Number of images within the cutoff
+   integer, intent(out) :: nimg
+
+   !> Squared distances of the images
+   real(wp), intent(inout) :: rsq(:)
+
+   !> Distance vectors of the images
+   real(wp), intent(inout), optional :: vec(:, :)
+
+   integer :: jtr
+   real(wp) :: vx, vy, vz, r2
+
+   nimg = 0
+   do jtr = 1, size(lattr, 1)
+      vx = xyz(iat, 1) - (xyz(jat, 1) + lattr(jtr, 1))
+      vy = xyz(iat, 2) - (xyz(jat, 2) + lattr(jtr, 2))
+      vz = xyz(iat, 3) - (xyz(jat, 3) + lattr(jtr, 3))
+      r2 = vx*vx + vy*vy + vz*vz
+      if (r2 > cutoff2 .or. r2 < epsilon(1.0_wp)) cycle
+      nimg = nimg + 1
+      rsq(nimg) = r2
+      if (present(vec)) then
+         vec(nimg, 1) = vx
+         vec(nimg, 2) = vy
+         vec(nimg, 3) = vz
+      end if
+   end do
+
+end subroutine collect_images_dp
+
+
+!> Collect the periodic images of an atom pair within the cutoff in single precision
+pure subroutine collect_images_sp(xyz, iat, jat, lattr, cutoff2, nimg, rsq, vec)
+
+   !> Cartesian coordinates, atoms are the leading dimension
+   real(sp), intent(in) :: xyz(:, :)
+
+   !> First atom of the pair
+   integer, intent(in) :: iat
+
+   !> Second atom of the pair, shifted by the lattice points
+   integer, intent(in) :: jat
+
+   !> Lattice points, lattice points are the leading dimension
+   real(sp), intent(in) :: lattr(:, :)
+
+   !> Squared real space cutoff of the pair
+   real(sp), intent(in) :: cutoff2
+
+   !> Number of images within the cutoff
+   integer, intent(out) :: nimg
+
+   !> Squared distances of the images
+   real(sp), intent(inout) :: rsq(:)
+
+   !> Distance vectors of the images
+   real(sp), intent(inout), optional :: vec(:, :)
+
+   integer :: jtr
+   real(sp) :: vx, vy, vz, r2
+
+   nimg = 0
+   do jtr = 1, size(lattr, 1)
+      vx = xyz(iat, 1) - (xyz(jat, 1) + lattr(jtr, 1))
+      vy = xyz(iat, 2) - (xyz(jat, 2) + lattr(jtr, 2))
+      vz = xyz(iat, 3) - (xyz(jat, 3) + lattr(jtr, 3))
+      r2 = vx*vx + vy*vy + vz*vz
+      if (r2 > cutoff2 .or. r2 < epsilon(1.0_sp)) cycle
+      nimg = nimg + 1
+      rsq(nimg) = r2
+      if (present(vec)) then
+         vec(nimg, 1) = vx
+         vec(nimg, 2) = vy
+         vec(nimg, 3) = vz
+      end if
+   end do
+
+end subroutine collect_images_sp
+
+
+!> Evaluation of the dispersion energy expression
+subroutine get_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, dc6dq, &
+      & energy, dEdcn, dEdq, gradient, sigma, partition, pair_cutoff, mixed)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion3
 
    !> Damping parameters
    class(rational_damping_param), intent(in) :: self
@@ -437,70 +887,49 @@ subroutine get_pairwise_dispersion2(self, mol, trans, cutoff, width, r4r2, c6, e
    !> C6 coefficients for all atom pairs.
    real(wp), intent(in) :: c6(:, :)
 
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
+
    !> Dispersion energy
-   real(wp), intent(inout) :: energy(:, :)
+   real(wp), intent(inout) :: energy(:)
 
-   integer :: iat, jat, izp, jzp, jtr
-   real(wp) :: vec(3), r2, r, cutoff2, r0ij, rrij, c6ij, t6, t8, edisp, dE
-   real(wp) :: sw, dswdr
+   !> Derivative of the energy w.r.t. the coordination number
+   real(wp), intent(inout), optional :: dEdcn(:)
 
-   ! Thread-private array for reduction
-   ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
-   real(wp), allocatable :: energy_local(:, :)
+   !> Derivative of the energy w.r.t. the partial charges
+   real(wp), intent(inout), optional :: dEdq(:)
 
-   if (abs(self%s6) < epsilon(1.0_wp) .and. abs(self%s8) < epsilon(1.0_wp)) return
-   cutoff2 = cutoff*cutoff
+   !> Dispersion gradient
+   real(wp), intent(inout), optional :: gradient(:, :)
 
-   !$omp parallel default(none) &
-   !$omp shared(mol, self, c6, trans, cutoff2, cutoff, width, r4r2) &
-   !$omp private(iat, jat, izp, jzp, jtr, vec, r2, r0ij, rrij, c6ij, &
-   !$omp& t6, t8, edisp, dE, r, sw, dswdr) &
-   !$omp shared(energy) &
-   !$omp private(energy_local)
-   allocate(energy_local(size(energy, 1), size(energy, 2)), source=0.0_wp)
-   !$omp do schedule(runtime)
-   do iat = 1, mol%nat
-      izp = mol%id(iat)
-      do jat = 1, iat
-         jzp = mol%id(jat)
-         rrij = 3*r4r2(izp)*r4r2(jzp)
-         r0ij = self%a1 * sqrt(rrij) + self%a2
-         c6ij = c6(jat, iat)
-         do jtr = 1, size(trans, 2)
-            vec(:) = mol%xyz(:, iat) - (mol%xyz(:, jat) + trans(:, jtr))
-            r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
-            if (r2 > cutoff2 .or. r2 < epsilon(1.0_wp)) cycle
-            r = sqrt(r2)
-            call smooth_cutoff(r, cutoff, width, sw, dswdr)
-            if (sw <= 0.0_wp) cycle
+   !> Dispersion virial
+   real(wp), intent(inout), optional :: sigma(:, :)
 
-            t6 = 1.0_wp/(r2**3 + r0ij**6)
-            t8 = 1.0_wp/(r2**4 + r0ij**8)
+   !> Work partition of the atom pairs, defaults to the complete work
+   type(work_partition), intent(in), optional :: partition
 
-            edisp = sw * (self%s6*t6 + self%s8*rrij*t8)
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
 
-            dE = -c6ij*edisp * 0.5_wp
+   !> Evaluate distances, damping and switching functions in single precision
+   logical, intent(in), optional :: mixed
 
-            energy_local(jat, iat) = energy_local(jat, iat) + dE
-            if (iat /= jat) then
-               energy_local(iat, jat) = energy_local(iat, jat) + dE
-            end if
-         end do
-      end do
-   end do
-   !$omp end do
-   !$omp critical (get_pairwise_dispersion2_)
-   energy(:, :) = energy(:, :) + energy_local(:, :)
-   !$omp end critical (get_pairwise_dispersion2_)
-   deallocate(energy_local)
-   !$omp end parallel
+   call get_atm_dispersion(mol, trans, cutoff, width, self%s9, self%a1, &
+      & self%a2, self%alp, r4r2, c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, &
+      & gradient, sigma, partition, pair_cutoff, mixed)
 
-end subroutine get_pairwise_dispersion2
+end subroutine get_dispersion3
 
 
-!> Evaluation of the dispersion energy expression
-subroutine get_pairwise_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, energy)
-   !DEC$ ATTRIBUTES DLLEXPORT :: get_pairwise_dispersion3
+!> Evaluation of the dispersion energy expression for selected atoms with all
+!> their partners, used for the symmetry-reduced evaluation
+subroutine get_atomic_dispersion2(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, &
+      & dc6dq, atoms, energy, dEdcn, dEdq, gradient, sigma, pair_cutoff, &
+      & exclusive)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_atomic_dispersion2
 
    !> Damping parameters
    class(rational_damping_param), intent(in) :: self
@@ -523,68 +952,384 @@ subroutine get_pairwise_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, e
    !> C6 coefficients for all atom pairs.
    real(wp), intent(in) :: c6(:, :)
 
-   !> Dispersion energy
-   real(wp), intent(inout) :: energy(:, :)
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
 
-   integer :: iat, jat, kat, izp, jzp, kzp, jtr, ktr
-   real(wp) :: vij(3), vjk(3), vik(3), r2ij, r2jk, r2ik, rij, rjk, rik
-   real(wp) :: c6ij, c6jk, c6ik, triple
-   real(wp) :: r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, ang
-   real(wp) :: cutoff2, c9, dE, alp3, swij, swjk, swik, dswdr, sw
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
 
-   ! Thread-private arrays for reduction
-   ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
-   real(wp), allocatable :: energy_local(:, :)
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
 
-   if (abs(self%s9) < epsilon(1.0_wp)) return
-   cutoff2 = cutoff*cutoff
-   alp3 = self%alp / 3.0_wp
+   !> Dispersion energy of the selected atoms
+   real(wp), intent(inout) :: energy(:)
+
+   !> Derivative of the energy w.r.t. the coordination number of the selected atoms
+   real(wp), intent(inout), optional :: dEdcn(:)
+
+   !> Derivative of the energy w.r.t. the partial charges of the selected atoms
+   real(wp), intent(inout), optional :: dEdq(:)
+
+   !> Dispersion gradient of the selected atoms
+   real(wp), intent(inout), optional :: gradient(:, :)
+
+   !> Atom-resolved dispersion virial of the selected atoms
+   real(wp), intent(inout), optional :: sigma(:, :, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Share the energy only between the selected atoms, the sum over the selected
+   !> atoms is the energy of all interactions involving at least one of them
+   logical, intent(in), optional :: exclusive
+
+   logical :: grad
+   integer :: iat, jat, izp, jzp, jtr, iu
+   real(wp) :: vec(3), r2, r, cutij, r06, r08, rrij, c6ij, t6, t8, d6, d8
+   real(wp) :: edisp0, gdisp0, edisp, gdisp, sw, dswdr, dG(3)
+   real(wp), allocatable :: share(:)
+   type(pair_table) :: table
+
+   if (abs(self%s6) < epsilon(1.0_wp) .and. abs(self%s8) < epsilon(1.0_wp)) return
+   grad = present(dc6dcn) .and. present(dEdcn) .and. present(dc6dq) &
+      & .and. present(dEdq) .and. present(gradient) .and. present(sigma)
+
+   call new_pair_table(table, self, mol, cutoff, width, r4r2, pair_cutoff)
+   call get_energy_share(mol%nat, atoms, exclusive, share)
+
+   ! Every selected atom only accumulates into its own entries, no reduction needed
+   !$omp parallel do schedule(dynamic) default(none) &
+   !$omp shared(mol, self, table, trans, atoms, width, c6, dc6dcn, dc6dq, grad, &
+   !$omp& share, energy, dEdcn, dEdq, gradient, sigma) &
+   !$omp private(iu, iat, jat, izp, jzp, jtr, vec, r2, r, cutij, r06, r08, rrij, &
+   !$omp& c6ij, t6, t8, d6, d8, edisp0, gdisp0, edisp, gdisp, sw, dswdr, dG)
+   do iu = 1, size(atoms)
+      iat = atoms(iu)
+      izp = mol%id(iat)
+      do jat = 1, mol%nat
+         jzp = mol%id(jat)
+         rrij = table%rrij(jzp, izp)
+         r06 = table%r06(jzp, izp)
+         r08 = table%r08(jzp, izp)
+         cutij = table%cutoff(jzp, izp)
+         c6ij = c6(jat, iat)
+         do jtr = 1, size(trans, 2)
+            vec(:) = mol%xyz(:, iat) - (mol%xyz(:, jat) + trans(:, jtr))
+            r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
+            if (r2 > cutij*cutij .or. r2 < epsilon(1.0_wp)) cycle
+            r = sqrt(r2)
+            call smooth_cutoff(r, cutij, width, sw, dswdr)
+            if (sw <= 0.0_wp) cycle
+
+            t6 = 1.0_wp/(r2**3 + r06)
+            t8 = 1.0_wp/(r2**4 + r08)
+
+            edisp0 = self%s6*t6 + self%s8*rrij*t8
+            edisp = sw * edisp0
+
+            energy(iu) = energy(iu) - c6ij*edisp / (1.0_wp + share(jat))
+            if (.not.grad) cycle
+
+            d6 = -6*r2**2*t6**2
+            d8 = -8*r2**3*t8**2
+            gdisp0 = self%s6*d6 + self%s8*rrij*d8
+            ! Product rule for d(sw(r)*edisp0(r2))/dr2.
+            gdisp = sw * gdisp0 + dswdr * edisp0 / r
+
+            dG(:) = -c6ij*gdisp*vec
+            dEdcn(iu) = dEdcn(iu) - dc6dcn(iat, jat) * edisp
+            dEdq(iu) = dEdq(iu) - dc6dq(iat, jat) * edisp
+            ! Images of the atom itself move along, they do not exert a force
+            if (iat /= jat) gradient(:, iu) = gradient(:, iu) + dG
+            sigma(:, :, iu) = sigma(:, :, iu) + spread(dG, 1, 3) * spread(vec, 2, 3) * 0.5_wp
+         end do
+      end do
+   end do
+
+end subroutine get_atomic_dispersion2
+
+
+!> Evaluation of the ATM three-body dispersion energy expression for selected
+!> atoms with all their partners, used for the symmetry-reduced evaluation
+subroutine get_atomic_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, dc6dcn, &
+      & dc6dq, atoms, energy, dEdcn, dEdq, gradient, sigma, pair_cutoff, &
+      & exclusive)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_atomic_dispersion3
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Dispersion energy of the selected atoms
+   real(wp), intent(inout) :: energy(:)
+
+   !> Derivative of the energy w.r.t. the coordination number of the selected atoms
+   real(wp), intent(inout), optional :: dEdcn(:)
+
+   !> Derivative of the energy w.r.t. the partial charges of the selected atoms
+   real(wp), intent(inout), optional :: dEdq(:)
+
+   !> Dispersion gradient of the selected atoms
+   real(wp), intent(inout), optional :: gradient(:, :)
+
+   !> Atom-resolved dispersion virial of the selected atoms
+   real(wp), intent(inout), optional :: sigma(:, :, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Share the energy only between the selected atoms, the sum over the selected
+   !> atoms is the energy of all interactions involving at least one of them
+   logical, intent(in), optional :: exclusive
+
+   call get_atm_atomic_dispersion(mol, trans, cutoff, width, self%s9, self%a1, &
+      & self%a2, self%alp, r4r2, c6, dc6dcn, dc6dq, atoms, energy, dEdcn, dEdq, &
+      & gradient, sigma, pair_cutoff, exclusive)
+
+end subroutine get_atomic_dispersion3
+
+
+!> Evaluation of the dispersion energy expression projected on atomic pairs
+subroutine get_pairwise_dispersion2(self, mol, trans, cutoff, width, r4r2, c6, energy, &
+      & pair_cutoff, fragment, interaction)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_pairwise_dispersion2
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Dispersion energy
+   real(wp), intent(inout) :: energy(:, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Fragment of each atom, the energy is accumulated for pairs of fragments
+   integer, intent(in), optional :: fragment(:)
+
+   !> Only evaluate the interaction energy between different fragments
+   logical, intent(in), optional :: interaction
+
+   integer :: iat, jat, izp, jzp, jtr, ifr, jfr
+   logical :: intra
+   real(wp) :: vec(3), r2, r, cutij, cutoff2, r0ij, rrij, c6ij, t6, t8, edisp, dE
+   real(wp) :: sw, dswdr
+
+   ! Thread-private array for reduction
+   ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
+   real(wp), allocatable :: energy_local(:, :)
+
+   if (abs(self%s6) < epsilon(1.0_wp) .and. abs(self%s8) < epsilon(1.0_wp)) return
+   intra = .true.
+   if (present(fragment) .and. present(interaction)) intra = .not.interaction
+
+   !$omp parallel default(none) &
+   !$omp shared(mol, self, c6, trans, cutoff, pair_cutoff, width, r4r2, fragment, intra) &
+   !$omp private(iat, jat, izp, jzp, jtr, vec, r2, r0ij, rrij, c6ij, &
+   !$omp& t6, t8, edisp, dE, r, sw, dswdr, cutij, cutoff2, ifr, jfr) &
+   !$omp shared(energy) &
+   !$omp private(energy_local)
+   allocate(energy_local(size(energy, 1), size(energy, 2)), source=0.0_wp)
+   !$omp do schedule(runtime)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      ifr = iat
+      if (present(fragment)) ifr = fragment(iat)
+      do jat = 1, iat
+         jzp = mol%id(jat)
+         jfr = jat
+         if (present(fragment)) jfr = fragment(jat)
+         if (.not.intra .and. ifr == jfr) cycle
+         rrij = 3*r4r2(izp)*r4r2(jzp)
+         r0ij = self%a1 * sqrt(rrij) + self%a2
+         cutij = select_cutoff(cutoff, izp, jzp, pair_cutoff)
+         cutoff2 = cutij*cutij
+         c6ij = c6(jat, iat)
+         do jtr = 1, size(trans, 2)
+            vec(:) = mol%xyz(:, iat) - (mol%xyz(:, jat) + trans(:, jtr))
+            r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
+            if (r2 > cutoff2 .or. r2 < epsilon(1.0_wp)) cycle
+            r = sqrt(r2)
+            call smooth_cutoff(r, cutij, width, sw, dswdr)
+            if (sw <= 0.0_wp) cycle
+
+            t6 = 1.0_wp/(r2**3 + r0ij**6)
+            t8 = 1.0_wp/(r2**4 + r0ij**8)
+
+            edisp = sw * (self%s6*t6 + self%s8*rrij*t8)
+
+            dE = -c6ij*edisp * 0.5_wp
+
+            energy_local(jfr, ifr) = energy_local(jfr, ifr) + dE
+            if (iat /= jat) then
+               energy_local(ifr, jfr) = energy_local(ifr, jfr) + dE
+            end if
+         end do
+      end do
+   end do
+   !$omp end do
+   !$omp critical (get_pairwise_dispersion2_)
+   energy(:, :) = energy(:, :) + energy_local(:, :)
+   !$omp end critical (get_pairwise_dispersion2_)
+   deallocate(energy_local)
+   !$omp end parallel
+
+end subroutine get_pairwise_dispersion2
+
+
+!> Evaluation of the dispersion energy expression
+subroutine get_pairwise_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, energy, &
+      & pair_cutoff, fragment, interaction)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_pairwise_dispersion3
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Dispersion energy
+   real(wp), intent(inout) :: energy(:, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Fragment of each atom, the energy is accumulated for pairs of fragments
+   integer, intent(in), optional :: fragment(:)
+
+   !> Only evaluate the interaction energy between different fragments
+   logical, intent(in), optional :: interaction
+
+   integer :: iat, jat, kat, izp, jzp, kzp, jtr, ktr, ifr, jfr, kfr
+   logical :: intra
+   real(wp) :: vij(3), vjk(3), vik(3), r2ij, r2jk, r2ik, rij, rjk, rik
+   real(wp) :: c6ij, c6jk, c6ik, triple
+   real(wp) :: r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, ang
+   real(wp) :: cutij, cutik, cutjk, c9, dE, alp3, swij, swjk, swik, dswdr, sw
+
+   ! Thread-private arrays for reduction
+   ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
+   real(wp), allocatable :: energy_local(:, :)
+
+   if (abs(self%s9) < epsilon(1.0_wp)) return
+   alp3 = self%alp / 3.0_wp
+   intra = .true.
+   if (present(fragment) .and. present(interaction)) intra = .not.interaction
 
    !$omp parallel default(none) &
-   !$omp shared(mol, trans, c6, r4r2, cutoff2, cutoff, width, alp3, self) &
+   !$omp shared(mol, trans, c6, r4r2, pair_cutoff, cutoff, width, alp3, self, &
+   !$omp& fragment, intra) &
    !$omp private(iat, jat, kat, izp, jzp, kzp, jtr, ktr, vij, vjk, vik, &
    !$omp& r2ij, r2jk, r2ik, rij, rjk, rik, c6ij, c6jk, c6ik, triple, &
    !$omp& r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, ang, c9, dE, &
-   !$omp& swij, swjk, swik, dswdr, sw) &
+   !$omp& swij, swjk, swik, dswdr, sw, cutij, cutik, cutjk, ifr, jfr, kfr) &
    !$omp shared(energy) &
    !$omp private(energy_local)
    allocate(energy_local(size(energy, 1), size(energy, 2)), source=0.0_wp)
    !$omp do schedule(runtime)
    do iat = 1, mol%nat
       izp = mol%id(iat)
+      ifr = iat
+      if (present(fragment)) ifr = fragment(iat)
       do jat = 1, iat
          jzp = mol%id(jat)
+         jfr = jat
+         if (present(fragment)) jfr = fragment(jat)
          c6ij = c6(jat, iat)
          r0ij = self%a1 * sqrt(3*r4r2(jzp)*r4r2(izp)) + self%a2
+         cutij = select_cutoff(cutoff, izp, jzp, pair_cutoff)
          do jtr = 1, size(trans, 2)
             vij(:) = mol%xyz(:, jat) + trans(:, jtr) - mol%xyz(:, iat)
             r2ij = vij(1)*vij(1) + vij(2)*vij(2) + vij(3)*vij(3)
-            if (r2ij > cutoff2 .or. r2ij < epsilon(1.0_wp)) cycle
+            if (r2ij > cutij*cutij .or. r2ij < epsilon(1.0_wp)) cycle
             rij = sqrt(r2ij)
-            call smooth_cutoff(rij, cutoff, width, swij, dswdr)
+            call smooth_cutoff(rij, cutij, width, swij, dswdr)
             do kat = 1, jat
                kzp = mol%id(kat)
+               kfr = kat
+               if (present(fragment)) kfr = fragment(kat)
+               if (.not.intra .and. ifr == jfr .and. jfr == kfr) cycle
                c6ik = c6(kat, iat)
                c6jk = c6(kat, jat)
                c9 = -self%s9 * sqrt(abs(c6ij*c6ik*c6jk))
                r0ik = self%a1 * sqrt(3*r4r2(kzp)*r4r2(izp)) + self%a2
                r0jk = self%a1 * sqrt(3*r4r2(kzp)*r4r2(jzp)) + self%a2
+               cutik = select_cutoff(cutoff, izp, kzp, pair_cutoff)
+               cutjk = select_cutoff(cutoff, jzp, kzp, pair_cutoff)
                r0 = r0ij * r0ik * r0jk
                triple = triple_scale(iat, jat, kat)
                do ktr = 1, size(trans, 2)
                   vik(:) = mol%xyz(:, kat) + trans(:, ktr) - mol%xyz(:, iat)
                   r2ik = vik(1)*vik(1) + vik(2)*vik(2) + vik(3)*vik(3)
-                  if (r2ik > cutoff2 .or. r2ik < epsilon(1.0_wp)) cycle
+                  if (r2ik > cutik*cutik .or. r2ik < epsilon(1.0_wp)) cycle
                   rik = sqrt(r2ik)
-                  call smooth_cutoff(rik, cutoff, width, swik, dswdr)
+                  call smooth_cutoff(rik, cutik, width, swik, dswdr)
 
                   ! vjk(:) = mol%xyz(:, kat) + trans(:, ktr)
                   !          - mol%xyz(:, jat) - trans(:, jtr)
                   vjk(:) = vik(:) - vij(:)
                   r2jk = vjk(1)*vjk(1) + vjk(2)*vjk(2) + vjk(3)*vjk(3)
-                  if (r2jk > cutoff2 .or. r2jk < epsilon(1.0_wp)) cycle
+                  if (r2jk > cutjk*cutjk .or. r2jk < epsilon(1.0_wp)) cycle
                   rjk = sqrt(r2jk)
-                  call smooth_cutoff(rjk, cutoff, width, swjk, dswdr)
+                  call smooth_cutoff(rjk, cutjk, width, swjk, dswdr)
                   sw = swij * swik * swjk
                   if (sw <= 0.0_wp) cycle
 
@@ -600,18 +1345,24 @@ subroutine get_pairwise_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, e
                   rr = ang*fdmp
 
                   dE = rr * c9 * triple * sixth * sw
-                  energy_local(jat, iat) = energy_local(jat, iat) - dE
-                  energy_local(kat, iat) = energy_local(kat, iat) - dE
-                  energy_local(iat, jat) = energy_local(iat, jat) - dE
-                  energy_local(kat, jat) = energy_local(kat, jat) - dE
-                  energy_local(iat, kat) = energy_local(iat, kat) - dE
-                  energy_local(jat, kat) = energy_local(jat, kat) - dE
+                  energy_local(jfr, ifr) = energy_local(jfr, ifr) - dE
+                  energy_local(kfr, ifr) = energy_local(kfr, ifr) - dE
+                  energy_local(ifr, jfr) = energy_local(ifr, jfr) - dE
+                  energy_local(kfr, jfr) = energy_local(kfr, jfr) - dE
+                  energy_local(ifr, kfr) = energy_local(ifr, kfr) - dE
+                  energy_local(jfr, kfr) = energy_local(jfr, kfr) - dE
                end do
             end do
          end do
       end do
    end do
    !$omp end do
+   if (.not.intra) then
+      ! Remove contributions of pairs within a fragment from mixed triples
+      do ifr = 1, min(size(energy_local, 1), size(energy_local, 2))
+         energy_local(ifr, ifr) = 0.0_wp
+      end do
+   end if
    !$omp critical (get_pairwise_dispersion3_)
    energy(:, :) = energy(:, :) + energy_local(:, :)
    !$omp end critical (get_pairwise_dispersion3_)
@@ -621,6 +1372,576 @@ subroutine get_pairwise_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, e
 end subroutine get_pairwise_dispersion3
 
 
+!> Evaluation of the additive dispersion energy for each pair of a sparse pair list
+subroutine get_sparse_dispersion2(self, mol, trans, cutoff, width, r4r2, c6, pairs, &
+      & pair_cutoff)
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Sparse list of atom pairs within the cutoff, energies are accumulated
+   type(pair_list), intent(inout) :: pairs
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   integer :: iat, jat, izp, jzp, ip
+   real(wp) :: vec(3), r2, r, cutij, r0ij, rrij, t6, t8, edisp, dE, sw, dswdr
+
+   if (abs(self%s6) < epsilon(1.0_wp) .and. abs(self%s8) < epsilon(1.0_wp)) return
+
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(mol, self, c6, trans, cutoff, pair_cutoff, width, r4r2, pairs) &
+   !$omp private(iat, jat, izp, jzp, ip, vec, r2, r, cutij, r0ij, rrij, &
+   !$omp& t6, t8, edisp, dE, sw, dswdr)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      do ip = pairs%rowptr(iat) + 1, pairs%rowptr(iat+1)
+         jat = pairs%jat(ip)
+         jzp = mol%id(jat)
+         rrij = 3*r4r2(izp)*r4r2(jzp)
+         r0ij = self%a1 * sqrt(rrij) + self%a2
+         cutij = select_cutoff(cutoff, izp, jzp, pair_cutoff)
+         vec(:) = mol%xyz(:, jat) + trans(:, pairs%jtr(ip)) - mol%xyz(:, iat)
+         r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
+         r = sqrt(r2)
+         call smooth_cutoff(r, cutij, width, sw, dswdr)
+         if (sw <= 0.0_wp) cycle
+
+         t6 = 1.0_wp/(r2**3 + r0ij**6)
+         t8 = 1.0_wp/(r2**4 + r0ij**8)
+
+         edisp = sw * (self%s6*t6 + self%s8*rrij*t8)
+
+         ! Interactions of an atom with its own images appear with both translations
+         dE = -c6(jat, iat)*edisp * merge(0.5_wp, 1.0_wp, iat == jat)
+
+         pairs%energy(ip) = pairs%energy(ip) + dE
+      end do
+   end do
+
+end subroutine get_sparse_dispersion2
+
+
+!> Evaluation of the non-additive dispersion energy for each pair of a sparse pair list,
+!> the energy of each triple is distributed equally over its three pairs
+subroutine get_sparse_dispersion3(self, mol, trans, cutoff, width, r4r2, c6, pairs, &
+      & pair_cutoff)
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Sparse list of atom pairs within the cutoff including the differences of the
+   !> lattice points, energies are accumulated
+   type(pair_list), intent(inout) :: pairs
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   integer :: iat, jat, kat, izp, jzp, kzp, jtr, ktr, ij, ik, jk
+   real(wp) :: vij(3), vjk(3), vik(3), r2ij, r2jk, r2ik, rij, rjk, rik
+   real(wp) :: c6ij, c6jk, c6ik, triple
+   real(wp) :: r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, ang
+   real(wp) :: cutij, cutjk, c9, dE, alp3, swij, swjk, swik, dswdr, sw
+
+   if (abs(self%s9) < epsilon(1.0_wp)) return
+   alp3 = self%alp / 3.0_wp
+
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(mol, trans, c6, r4r2, pair_cutoff, cutoff, width, alp3, self, pairs) &
+   !$omp private(iat, jat, kat, izp, jzp, kzp, jtr, ktr, ij, ik, jk, vij, vjk, vik, &
+   !$omp& r2ij, r2jk, r2ik, rij, rjk, rik, c6ij, c6jk, c6ik, triple, &
+   !$omp& r0ij, r0jk, r0ik, r0, r1, r2, r3, r5, rr, fdmp, ang, c9, dE, &
+   !$omp& swij, swjk, swik, dswdr, sw, cutij, cutjk)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      do ij = pairs%rowptr(iat) + 1, pairs%rowptr(iat+1)
+         jat = pairs%jat(ij)
+         jtr = pairs%jtr(ij)
+         ! Partners of atom iat are only taken from the given lattice points
+         if (jtr > size(trans, 2)) cycle
+         jzp = mol%id(jat)
+         c6ij = c6(jat, iat)
+         r0ij = self%a1 * sqrt(3*r4r2(jzp)*r4r2(izp)) + self%a2
+         cutij = select_cutoff(cutoff, izp, jzp, pair_cutoff)
+         vij(:) = mol%xyz(:, jat) + trans(:, jtr) - mol%xyz(:, iat)
+         r2ij = vij(1)*vij(1) + vij(2)*vij(2) + vij(3)*vij(3)
+         rij = sqrt(r2ij)
+         call smooth_cutoff(rij, cutij, width, swij, dswdr)
+         ! Partners of atom iat are ordered, all pairs with kat <= jat come first
+         do ik = pairs%rowptr(iat) + 1, pairs%rowptr(iat+1)
+            kat = pairs%jat(ik)
+            if (kat > jat) exit
+            ktr = pairs%jtr(ik)
+            if (ktr > size(trans, 2)) cycle
+            kzp = mol%id(kat)
+            c6ik = c6(kat, iat)
+            c6jk = c6(kat, jat)
+            c9 = -self%s9 * sqrt(abs(c6ij*c6ik*c6jk))
+            r0ik = self%a1 * sqrt(3*r4r2(kzp)*r4r2(izp)) + self%a2
+            r0jk = self%a1 * sqrt(3*r4r2(kzp)*r4r2(jzp)) + self%a2
+            cutjk = select_cutoff(cutoff, jzp, kzp, pair_cutoff)
+            r0 = r0ij * r0ik * r0jk
+            triple = triple_scale(iat, jat, kat)
+
+            vik(:) = mol%xyz(:, kat) + trans(:, ktr) - mol%xyz(:, iat)
+            r2ik = vik(1)*vik(1) + vik(2)*vik(2) + vik(3)*vik(3)
+            rik = sqrt(r2ik)
+            call smooth_cutoff(rik, select_cutoff(cutoff, izp, kzp, pair_cutoff), &
+               & width, swik, dswdr)
+
+            vjk(:) = vik(:) - vij(:)
+            r2jk = vjk(1)*vjk(1) + vjk(2)*vjk(2) + vjk(3)*vjk(3)
+            if (r2jk > cutjk*cutjk .or. r2jk < epsilon(1.0_wp)) cycle
+            ! Pair of atom jat with atom kat in the cell translated relative to jat,
+            ! pairs exactly at the cutoff might be missing due to rounding
+            jk = pairs%find(jat, kat, &
+               & pairs%find_image(pairs%image(:, ktr) - pairs%image(:, jtr)))
+            rjk = sqrt(r2jk)
+            call smooth_cutoff(rjk, cutjk, width, swjk, dswdr)
+            sw = swij * swik * swjk
+            if (sw <= 0.0_wp) cycle
+
+            r2 = r2ij*r2ik*r2jk
+            r1 = sqrt(r2)
+            r3 = r2 * r1
+            r5 = r3 * r2
+
+            fdmp = 1.0_wp / (1.0_wp + 6.0_wp * (r0 / r1)**alp3)
+            ang = 0.375_wp*(r2ij + r2jk - r2ik)*(r2ij - r2jk + r2ik)&
+               & *(-r2ij + r2jk + r2ik) / r5 + 1.0_wp / r3
+
+            rr = ang*fdmp
+
+            dE = 2 * rr * c9 * triple * sixth * sw
+            ! Without the pair of the partners its share is split between the others
+            if (jk == 0) dE = 1.5_wp * dE
+            !$omp atomic
+            pairs%energy(ij) = pairs%energy(ij) - dE
+            !$omp atomic
+            pairs%energy(ik) = pairs%energy(ik) - dE
+            if (jk == 0) cycle
+            !$omp atomic
+            pairs%energy(jk) = pairs%energy(jk) - dE
+         end do
+      end do
+   end do
+
+end subroutine get_sparse_dispersion3
+
+
+!> Evaluation of the long-range tail of the pairwise dispersion energy beyond the
+!> real space cutoff.
+!>
+!> The lattice sum beyond the cutoff is replaced by an integral over a homogeneous
+!> distribution of the lattice images with density 1/V, which only depends on the
+!> volume of the unit cell. Without explicit dependence on the atomic positions,
+!> the tail contributes to the virial and, via the C6 coefficients, to the
+!> derivatives w.r.t. the coordination number and partial charges only.
+subroutine get_dispersion2_tail(self, mol, cutoff, width, r4r2, c6, dc6dcn, dc6dq, &
+      & energy, dEdcn, dEdq, sigma, partition, pair_cutoff)
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
+
+   !> Dispersion energy
+   real(wp), intent(inout) :: energy(:)
+
+   !> Derivative of the energy w.r.t. the coordination number
+   real(wp), intent(inout), optional :: dEdcn(:)
+
+   !> Derivative of the energy w.r.t. the partial charges
+   real(wp), intent(inout), optional :: dEdq(:)
+
+   !> Dispersion virial
+   real(wp), intent(inout), optional :: sigma(:, :)
+
+   !> Work partition of the atom pairs, defaults to the complete work
+   type(work_partition), intent(in), optional :: partition
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   logical :: grad
+   integer :: iat, jat, izp, jzp, ic
+   real(wp) :: edisp, dE, etail, esurf
+   real(wp), allocatable :: tail(:, :), surface(:, :)
+
+   ! Thread-private arrays for reduction
+   ! Set to 0 explicitly as the shared variants are potentially non-zero (inout)
+   real(wp), allocatable :: energy_local(:), dEdcn_local(:), dEdq_local(:)
+
+   if (.not.all(mol%periodic)) return
+   if (abs(self%s6) < epsilon(1.0_wp) .and. abs(self%s8) < epsilon(1.0_wp)) return
+   grad = present(dc6dcn) .and. present(dEdcn) .and. present(dc6dq) .and. present(dEdq)
+
+   allocate(tail(mol%nid, mol%nid), surface(mol%nid, mol%nid))
+   call get_tail_table(self, mol, cutoff, width, r4r2, tail, surface, pair_cutoff)
+
+   etail = 0.0_wp
+   esurf = 0.0_wp
+   !$omp parallel default(none) &
+   !$omp shared(mol, c6, dc6dcn, dc6dq, tail, surface, partition, grad) &
+   !$omp private(iat, jat, izp, jzp, edisp, dE) &
+   !$omp shared(energy, dEdcn, dEdq) reduction(+:etail, esurf) &
+   !$omp private(energy_local, dEdcn_local, dEdq_local)
+   allocate(energy_local(size(energy, 1)), source=0.0_wp)
+   if (grad) then
+      allocate(dEdcn_local(size(dEdcn, 1)), source=0.0_wp)
+      allocate(dEdq_local(size(dEdq, 1)), source=0.0_wp)
+   end if
+   !$omp do schedule(runtime)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      do jat = 1, iat
+         if (.not.owns_pair(partition, iat, jat)) cycle
+         jzp = mol%id(jat)
+         edisp = tail(jzp, izp)
+
+         dE = -c6(jat, iat)*edisp * 0.5_wp
+
+         energy_local(iat) = energy_local(iat) + dE
+         etail = etail + dE
+         esurf = esurf - c6(jat, iat)*surface(jzp, izp) * 0.5_wp
+         if (iat /= jat) then
+            energy_local(jat) = energy_local(jat) + dE
+            etail = etail + dE
+            esurf = esurf - c6(jat, iat)*surface(jzp, izp) * 0.5_wp
+         end if
+         if (grad) then
+            dEdcn_local(iat) = dEdcn_local(iat) - dc6dcn(iat, jat) * edisp
+            dEdq_local(iat) = dEdq_local(iat) - dc6dq(iat, jat) * edisp
+            if (iat /= jat) then
+               dEdcn_local(jat) = dEdcn_local(jat) - dc6dcn(jat, iat) * edisp
+               dEdq_local(jat) = dEdq_local(jat) - dc6dq(jat, iat) * edisp
+            end if
+         end if
+      end do
+   end do
+   !$omp end do
+   !$omp critical (get_dispersion2_tail_)
+   energy(:) = energy(:) + energy_local(:)
+   if (grad) then
+      dEdcn(:) = dEdcn(:) + dEdcn_local(:)
+      dEdq(:) = dEdq(:) + dEdq_local(:)
+   end if
+   !$omp end critical (get_dispersion2_tail_)
+   deallocate(energy_local)
+   if (grad) then
+      deallocate(dEdcn_local, dEdq_local)
+   end if
+   !$omp end parallel
+
+   ! The tail energy is inversely proportional to the cell volume, for a sharp
+   ! cutoff the lattice images crossing the cutoff sphere contribute as well
+   if (present(sigma)) then
+      do ic = 1, 3
+         sigma(ic, ic) = sigma(ic, ic) - etail - esurf
+      end do
+   end if
+
+end subroutine get_dispersion2_tail
+
+
+!> Evaluation of the pairwise representation of the long-range tail of the
+!> pairwise dispersion energy beyond the real space cutoff
+subroutine get_pairwise_dispersion2_tail(self, mol, cutoff, width, r4r2, c6, energy, &
+      & pair_cutoff, fragment, interaction)
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Pairwise representation of the dispersion energy
+   real(wp), intent(inout) :: energy(:, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Fragment of each atom, the energy is accumulated for pairs of fragments
+   integer, intent(in), optional :: fragment(:)
+
+   !> Only evaluate the interaction energy between different fragments
+   logical, intent(in), optional :: interaction
+
+   integer :: iat, jat, izp, jzp, ifr, jfr
+   logical :: intra
+   real(wp) :: dE
+   real(wp), allocatable :: tail(:, :), surface(:, :)
+
+   if (.not.all(mol%periodic)) return
+   if (abs(self%s6) < epsilon(1.0_wp) .and. abs(self%s8) < epsilon(1.0_wp)) return
+
+   allocate(tail(mol%nid, mol%nid), surface(mol%nid, mol%nid))
+   call get_tail_table(self, mol, cutoff, width, r4r2, tail, surface, pair_cutoff)
+   intra = .true.
+   if (present(fragment) .and. present(interaction)) intra = .not.interaction
+
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      ifr = iat
+      if (present(fragment)) ifr = fragment(iat)
+      do jat = 1, iat
+         jzp = mol%id(jat)
+         jfr = jat
+         if (present(fragment)) jfr = fragment(jat)
+         if (.not.intra .and. ifr == jfr) cycle
+         dE = -c6(jat, iat)*tail(jzp, izp) * 0.5_wp
+         energy(jfr, ifr) = energy(jfr, ifr) + dE
+         if (iat /= jat) then
+            energy(ifr, jfr) = energy(ifr, jfr) + dE
+         end if
+      end do
+   end do
+
+end subroutine get_pairwise_dispersion2_tail
+
+
+!> Damped dispersion kernel integrated over a homogeneous distribution of lattice
+!> images beyond the real space cutoff for each pair of species
+subroutine get_tail_table(self, mol, cutoff, width, r4r2, tail, surface, pair_cutoff)
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> Tail of the damped kernel for each pair of species
+   real(wp), intent(out) :: tail(:, :)
+
+   !> Virial of the lattice images crossing a sharp cutoff for each pair of species
+   real(wp), intent(out) :: surface(:, :)
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   integer :: isp, jsp
+   real(wp) :: density, rrij, r0ij, cut, rc3
+
+   density = 4*pi / abs(matdet_3x3(mol%lattice))
+
+   do isp = 1, mol%nid
+      do jsp = 1, isp
+         rrij = 3*r4r2(isp)*r4r2(jsp)
+         r0ij = self%a1 * sqrt(rrij) + self%a2
+         cut = select_cutoff(cutoff, isp, jsp, pair_cutoff)
+         ! A smooth cutoff vanishes at the cutoff radius, no images cross the boundary
+         rc3 = merge(cut**3, 0.0_wp, width <= 0.0_wp)
+         tail(jsp, isp) = density * (self%s6*tail_integral(6, r0ij, cut, width) &
+            & + self%s8*rrij*tail_integral(8, r0ij, cut, width))
+         tail(isp, jsp) = tail(jsp, isp)
+         surface(jsp, isp) = density * rc3 / 3 * (self%s6/(cut**6 + r0ij**6) &
+            & + self%s8*rrij/(cut**8 + r0ij**8))
+         surface(isp, jsp) = surface(jsp, isp)
+      end do
+   end do
+
+end subroutine get_tail_table
+
+
+!> Estimate the two-body and three-body dispersion energy of an atom with all partner
+!> atoms of one species beyond a real space cutoff.
+!>
+!> For molecules every partner atom beyond the cutoff contributes at most the value
+!> of the damped kernel at the cutoff. For periodic systems the lattice images are
+!> integrated as homogeneous distribution like in the long-range tail correction.
+!> The three-body contribution is estimated from triples with the third atom at the
+!> critical radius of the pair and an upper bound of two for the angular factor.
+subroutine get_cutoff_error(self, r4r2i, r4r2j, c6, c9, cutoff, density, npartner, &
+      & error2, error3)
+
+   !> Damping parameters
+   class(rational_damping_param), intent(in) :: self
+
+   !> Expectation values for r4 over r2 operator of both species
+   real(wp), intent(in) :: r4r2i, r4r2j
+
+   !> Upper bound for the C6 coefficient of the pair of species
+   real(wp), intent(in) :: c6
+
+   !> Upper bound for the C9 coefficient of triples including the pair of species
+   real(wp), intent(in) :: c9
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Number density of the partner atoms for periodic systems, zero for molecules
+   real(wp), intent(in) :: density
+
+   !> Number of partner atoms for molecules
+   real(wp), intent(in) :: npartner
+
+   !> Estimated two-body dispersion energy beyond the cutoff
+   real(wp), intent(out) :: error2
+
+   !> Estimated three-body dispersion energy beyond the cutoff
+   real(wp), intent(out) :: error3
+
+   real(wp) :: rrij, r0ij
+
+   rrij = 3*r4r2i*r4r2j
+   r0ij = self%a1 * sqrt(rrij) + self%a2
+
+   if (density > 0.0_wp) then
+      error2 = 4*pi*density*abs(c6) * (abs(self%s6)*tail_integral(6, r0ij, cutoff, 0.0_wp) &
+         & + abs(self%s8)*rrij*tail_integral(8, r0ij, cutoff, 0.0_wp))
+      error3 = 4*pi*density*2*abs(self%s9*c9) / (3*cutoff**3*r0ij**3)
+   else
+      error2 = npartner*abs(c6) * (abs(self%s6)/(cutoff**6 + r0ij**6) &
+         & + abs(self%s8)*rrij/(cutoff**8 + r0ij**8))
+      error3 = npartner*2*abs(self%s9*c9) / (cutoff**6*r0ij**3)
+   end if
+
+end subroutine get_cutoff_error
+
+
+!> Radial integral of r^2/(r^n + r0^n) over the part of space not covered by the
+!> (smooth) real space cutoff, evaluated by Simpson's rule
+pure function tail_integral(n, r0, cutoff, width) result(integral)
+
+   !> Inverse power of the kernel
+   integer, intent(in) :: n
+
+   !> Critical radius of the rational damping
+   real(wp), intent(in) :: r0
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Value of the integral
+   real(wp) :: integral
+
+   integer :: i
+   real(wp) :: inner, h, r, u, sw, dswdr
+
+   integral = 0.0_wp
+   if (cutoff <= 0.0_wp) return
+
+   ! Switching region, only the fraction 1 - sw(r) is missing from the lattice sum
+   inner = cutoff - max(0.0_wp, min(width, cutoff))
+   if (cutoff > inner) then
+      h = (cutoff - inner) / tail_intervals
+      do i = 0, tail_intervals
+         r = inner + i*h
+         call smooth_cutoff(r, cutoff, width, sw, dswdr)
+         integral = integral + simpson_weight(i)*h/3 * (1.0_wp - sw)*r**2/(r**n + r0**n)
+      end do
+   end if
+
+   ! Beyond the cutoff, substitute u = 1/r to integrate over a finite interval
+   h = 1.0_wp / (cutoff * tail_intervals)
+   do i = 0, tail_intervals
+      u = i*h
+      integral = integral + simpson_weight(i)*h/3 * u**(n-4)/(1.0_wp + (r0*u)**n)
+   end do
+
+end function tail_integral
+
+
+!> Weight of a grid point in the composite Simpson's rule
+elemental function simpson_weight(i) result(weight)
+
+   !> Index of the grid point
+   integer, intent(in) :: i
+
+   !> Quadrature weight
+   real(wp) :: weight
+
+   if (i == 0 .or. i == tail_intervals) then
+      weight = 1.0_wp
+   else if (modulo(i, 2) == 1) then
+      weight = 4.0_wp
+   else
+      weight = 2.0_wp
+   end if
+
+end function simpson_weight
+
+
 !> Logic exercise to distribute a triple energy to atomwise energies.
 elemental function triple_scale(ii, jj, kk) result(triple)
 
@@ -23,22 +23,31 @@ module dftd4_disp
    use dftd4_data, only : get_covalent_rad
    use dftd4_model, only : dispersion_model
    use dftd4_ncoord, only : get_coordination_number, add_coordination_number_derivs
-   use dftd4_partition, only : work_partition
+   use dftd4_pairlist, only : pair_list, new_pair_list
+   use dftd4_partition, only : work_partition, owns_atom
+   use dftd4_symmetry, only : symmetry_type, add_symmetric_atomic, add_symmetric_gradient, &
+      & add_symmetric_sigma, get_reduced_cell
    use mctc_env, only : wp, error_type
    use mctc_io, only : structure_type
    use mctc_io_convert, only : autoaa
+   use mctc_io_math, only : matdet_3x3
    use multicharge, only : get_charges
    implicit none
    private
 
-   public :: get_dispersion, get_properties, get_pairwise_dispersion
+   public :: get_dispersion, get_properties, get_pairwise_dispersion, get_pair_cutoffs
+   public :: get_dispersion_results, get_dispersion_multi, get_dispersion_images
+   public :: get_pair_data
+   public :: get_sparse_pairwise_dispersion, get_sparse_c6
 
 
 contains
 
 
-!> Wrapper to handle the evaluation of dispersion energy and derivatives
-subroutine get_dispersion(mol, disp, param, cutoff, energy, gradient, sigma, partition)
+!> Wrapper to handle the evaluation of dispersion energy and derivatives.
+!> Periodic structures are evaluated in their reduced cell.
+recursive subroutine get_dispersion(mol, disp, param, cutoff, energy, gradient, sigma, &
+      & partition, mixed, symmetry, charges, dqdr, dqdL)
    !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion
 
    !> Molecular structure data
@@ -65,20 +74,53 @@ subroutine get_dispersion(mol, disp, param, cutoff, energy, gradient, sigma, par
    !> Optional externally assigned work partition
    type(work_partition), intent(in), optional :: partition
 
+   !> Evaluate distances, damping and switching functions of the interaction kernels
+   !> in single precision, energies and derivatives are still accumulated in double
+   logical, intent(in), optional :: mixed
+
+   !> Symmetry of the structure, only the symmetry-unique atoms are evaluated
+   !> in the interaction kernels
+   type(symmetry_type), intent(in), optional :: symmetry
+
+   !> Externally supplied atomic partial charges, replacing the electronegativity
+   !> equilibration model
+   real(wp), intent(in), optional :: charges(:)
+
+   !> Derivative of the external partial charges w.r.t. the cartesian coordinates,
+   !> the charge response is neglected in the gradient if not present
+   real(wp), intent(in), contiguous, optional :: dqdr(:, :, :)
+
+   !> Derivative of the external partial charges w.r.t. strain deformations,
+   !> the charge response is neglected in the virial if not present
+   real(wp), intent(in), contiguous, optional :: dqdL(:, :, :)
+
    logical :: grad
    integer :: mref
    real(wp), allocatable :: cn(:)
-   real(wp), allocatable :: q(:), dqdr(:, :, :), dqdL(:, :, :)
+   real(wp), allocatable :: q(:), qdr(:, :, :), qdL(:, :, :)
    real(wp), allocatable :: gwvec(:, :, :), gwdcn(:, :, :), gwdq(:, :, :)
    real(wp), allocatable :: c6(:, :), dc6dcn(:, :), dc6dq(:, :)
    real(wp), allocatable :: dEdcn(:), dEdq(:), energies(:)
-   real(wp), allocatable :: lattr(:, :)
+   real(wp), allocatable :: lattr(:, :), pair2(:, :), pair3(:, :)
+   real(wp) :: cutoff2, cutoff3
    type(error_type), allocatable :: error
+   type(structure_type) :: cell
+   logical :: reduced
+
+   ! The lattice points are generated from the cell, which makes the truncation of
+   ! the lattice sums and the images seen by symmetry-equivalent atoms depend on
+   ! the choice of the cell, unless the cell is reduced
+   call get_reduced_cell(mol, cell, reduced)
+   if (reduced) then
+      call get_dispersion(cell, disp, param, cutoff, energy, gradient, sigma, partition, &
+         & mixed, symmetry, charges, dqdr, dqdL)
+      return
+   end if
 
    mref = maxval(disp%ref)
    grad = present(gradient).or.present(sigma)
 
-   if (.not. allocated(disp%mchrg)) then
+   if (.not. allocated(disp%mchrg) .and. .not.present(charges)) then
       write(error_unit, '("[Error]:", 1x, a)') "Not supported for non-self-consistent D4 version"
       error stop
    end if
@@ -88,11 +130,18 @@ subroutine get_dispersion(mol, disp, param, cutoff, energy, gradient, sigma, par
    call get_coordination_number(mol, lattr, cutoff%cn, disp%rcov, disp%en, cn)
 
    allocate(q(mol%nat))
-   if (grad) allocate(dqdr(3, mol%nat, mol%nat), dqdL(3, 3, mol%nat))
-   call get_charges(disp%mchrg, mol, error, q, dqdr, dqdL)
-   if(allocated(error)) then
-      write(error_unit, '("[Error]:", 1x, a)') error%message
-      error stop
+   if (present(charges)) then
+      call check_charges(mol, charges, dqdr, dqdL)
+      q(:) = charges
+      if (grad .and. present(dqdr)) qdr = dqdr
+      if (grad .and. present(dqdL)) qdL = dqdL
+   else
+      if (grad) allocate(qdr(3, mol%nat, mol%nat), qdL(3, 3, mol%nat))
+      call get_charges(disp%mchrg, mol, error, q, qdr, qdL)
+      if(allocated(error)) then
+         write(error_unit, '("[Error]:", 1x, a)') error%message
+         error stop
+      end if
    end if
 
    allocate(gwvec(mref, mol%nat, disp%ncoup))
@@ -101,7 +150,12 @@ subroutine get_dispersion(mol, disp, param, cutoff, energy, gradient, sigma, par
 
    allocate(c6(mol%nat, mol%nat))
    if (grad) allocate(dc6dcn(mol%nat, mol%nat), dc6dq(mol%nat, mol%nat))
-   call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+   if (present(symmetry)) then
+      call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+   else
+      ! The two-body kernels only access the pairs owned by this part
+      call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq, partition)
+   end if
 
    allocate(energies(mol%nat))
    energies(:) = 0.0_wp
@@ -113,24 +167,48 @@ subroutine get_dispersion(mol, disp, param, cutoff, energy, gradient, sigma, par
       sigma(:, :) = 0.0_wp
    end if
 
-   call get_lattice_points(mol%periodic, mol%lattice, cutoff%disp2, lattr)
-   call param%get_dispersion2(mol, lattr, cutoff%disp2, cutoff%width2, &
-      & disp%r4r2, c6, dc6dcn, dc6dq, energies, dEdcn, dEdq, gradient, &
-      & sigma, partition)
-   if (grad) then
-      call d4_gemv(dqdr, dEdq, gradient, beta=1.0_wp)
-      call d4_gemv(dqdL, dEdq, sigma, beta=1.0_wp)
+   cutoff2 = cutoff%disp2
+   cutoff3 = cutoff%disp3
+   if (cutoff%tolerance > 0.0_wp) then
+      allocate(pair2(mol%nid, mol%nid), pair3(mol%nid, mol%nid))
+      call get_pair_cutoffs(mol, disp, param, cutoff, pair2, pair3)
+      cutoff2 = maxval(pair2)
+      cutoff3 = maxval(pair3)
    end if
 
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr)
+   if (present(symmetry)) then
+      call get_symmetric_dispersion(mol, param, symmetry, 2, lattr, cutoff2, &
+         & cutoff%width2, disp%r4r2, c6, dc6dcn, dc6dq, energies, dEdcn, dEdq, &
+         & gradient, sigma, partition, pair2)
+   else
+      call param%get_dispersion2(mol, lattr, cutoff2, cutoff%width2, &
+         & disp%r4r2, c6, dc6dcn, dc6dq, energies, dEdcn, dEdq, gradient, &
+         & sigma, partition, pair2, mixed)
+   end if
+   if (cutoff%tail) then
+      call param%get_dispersion2_tail(mol, cutoff2, cutoff%width2, &
+         & disp%r4r2, c6, dc6dcn, dc6dq, energies, dEdcn, dEdq, sigma, partition, pair2)
+   end if
+   if (allocated(qdr)) call d4_gemv(qdr, dEdq, gradient, beta=1.0_wp)
+   if (allocated(qdL)) call d4_gemv(qdL, dEdq, sigma, beta=1.0_wp)
+
    q(:) = 0.0_wp
    call disp%weight_references(mol, cn, q, gwvec, gwdcn, gwdq)
    call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
 
-   call get_lattice_points(mol%periodic, mol%lattice, cutoff%disp3, lattr)
-   call param%get_dispersion3(mol, lattr, cutoff%disp3, cutoff%width3, &
-      & disp%r4r2, c6, dc6dcn, dc6dq, energies, dEdcn, dEdq, gradient, &
-      & sigma, partition)
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr)
+   if (present(symmetry)) then
+      call get_symmetric_dispersion(mol, param, symmetry, 3, lattr, cutoff3, &
+         & cutoff%width3, disp%r4r2, c6, dc6dcn, dc6dq, energies, dEdcn, dEdq, &
+         & gradient, sigma, partition, pair3)
+   else
+      call param%get_dispersion3(mol, lattr, cutoff3, cutoff%width3, &
+         & disp%r4r2, c6, dc6dcn, dc6dq, energies, dEdcn, dEdq, gradient, &
+         & sigma, partition, pair3, mixed)
+   end if
    if (grad) then
+      call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr)
       call add_coordination_number_derivs(mol, lattr, cutoff%cn, &
          & disp%rcov, disp%en, dEdcn, gradient, sigma)
    end if
@@ -140,8 +218,122 @@ subroutine get_dispersion(mol, disp, param, cutoff, energy, gradient, sigma, par
 end subroutine get_dispersion
 
 
-!> Wrapper to handle the evaluation of properties related to this dispersion model
-subroutine get_properties(mol, disp, cutoff, cn, q, c6, alpha)
+!> Evaluate the two-body or three-body dispersion for the symmetry-unique atoms
+!> and distribute the contributions to all atoms
+subroutine get_symmetric_dispersion(mol, param, symmetry, body, trans, cutoff, width, &
+      & r4r2, c6, dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma, partition, &
+      & pair_cutoff)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Symmetry of the structure
+   type(symmetry_type), intent(in) :: symmetry
+
+   !> Many-body order of the contribution, either two-body or three-body
+   integer, intent(in) :: body
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   !> Expectation values for r4 over r2 operator
+   real(wp), intent(in) :: r4r2(:)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(in) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(in), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charges
+   real(wp), intent(in), optional :: dc6dq(:, :)
+
+   !> Dispersion energy
+   real(wp), intent(inout) :: energy(:)
+
+   !> Derivative of the energy w.r.t. the coordination number
+   real(wp), intent(inout), optional :: dEdcn(:)
+
+   !> Derivative of the energy w.r.t. the partial charges
+   real(wp), intent(inout), optional :: dEdq(:)
+
+   !> Dispersion gradient
+   real(wp), intent(inout), optional :: gradient(:, :)
+
+   !> Dispersion virial
+   real(wp), intent(inout), optional :: sigma(:, :)
+
+   !> Work partition of the symmetry-unique atoms, defaults to the complete work
+   type(work_partition), intent(in), optional :: partition
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   logical :: grad
+   integer :: iuniq, nown
+   integer, allocatable :: owned(:)
+   real(wp), allocatable :: energy_u(:), dEdcn_u(:), dEdq_u(:), scalar(:)
+   real(wp), allocatable :: gradient_u(:, :), sigma_u(:, :, :), vector(:, :), tensor(:, :, :)
+
+   grad = present(gradient) .and. present(sigma)
+
+   ! Symmetry-unique atoms evaluated by this part
+   owned = pack([(iuniq, iuniq = 1, symmetry%nuniq)], &
+      & owns_atom(partition, [(iuniq, iuniq = 1, symmetry%nuniq)]))
+   nown = size(owned)
+
+   allocate(energy_u(nown), source=0.0_wp)
+   if (grad) then
+      allocate(dEdcn_u(nown), dEdq_u(nown), source=0.0_wp)
+      allocate(gradient_u(3, nown), source=0.0_wp)
+      allocate(sigma_u(3, 3, nown), source=0.0_wp)
+   end if
+
+   select case(body)
+   case(2)
+      call param%get_atomic_dispersion2(mol, trans, cutoff, width, r4r2, c6, &
+         & dc6dcn, dc6dq, symmetry%unique(owned), energy_u, dEdcn_u, dEdq_u, &
+         & gradient_u, sigma_u, pair_cutoff)
+   case(3)
+      call param%get_atomic_dispersion3(mol, trans, cutoff, width, r4r2, c6, &
+         & dc6dcn, dc6dq, symmetry%unique(owned), energy_u, dEdcn_u, dEdq_u, &
+         & gradient_u, sigma_u, pair_cutoff)
+   end select
+
+   ! Atoms owned by other parts do not contribute
+   allocate(scalar(symmetry%nuniq), source=0.0_wp)
+   scalar(owned) = energy_u
+   call add_symmetric_atomic(symmetry, scalar, energy)
+   if (grad) then
+      scalar(owned) = dEdcn_u
+      call add_symmetric_atomic(symmetry, scalar, dEdcn)
+      scalar(owned) = dEdq_u
+      call add_symmetric_atomic(symmetry, scalar, dEdq)
+      allocate(vector(3, symmetry%nuniq), source=0.0_wp)
+      vector(:, owned) = gradient_u
+      call add_symmetric_gradient(symmetry, vector, gradient)
+      allocate(tensor(3, 3, symmetry%nuniq), source=0.0_wp)
+      tensor(:, :, owned) = sigma_u
+      call add_symmetric_sigma(symmetry, tensor, sigma)
+   end if
+
+end subroutine get_symmetric_dispersion
+
+
+!> Wrapper to handle the evaluation of properties related to this dispersion model.
+!> All properties are optional, only the work needed for the requested properties
+!> is performed, e.g. the C6 coefficients for all atom pairs are only evaluated if
+!> requested.
+subroutine get_properties(mol, disp, cutoff, cn, q, c6, alpha, charges)
    !DEC$ ATTRIBUTES DLLEXPORT :: get_properties
 
    !> Molecular structure data
@@ -154,48 +346,258 @@ subroutine get_properties(mol, disp, cutoff, cn, q, c6, alpha)
    type(realspace_cutoff), intent(in) :: cutoff
 
    !> Coordination number
-   real(wp), intent(out) :: cn(:)
+   real(wp), intent(out), optional :: cn(:)
 
    !> Atomic partial charges
-   real(wp), intent(out), contiguous :: q(:)
+   real(wp), intent(out), contiguous, optional :: q(:)
 
    !> C6 coefficients
-   real(wp), intent(out) :: c6(:, :)
+   real(wp), intent(out), optional :: c6(:, :)
 
    !> Static polarizabilities
-   real(wp), intent(out) :: alpha(:)
+   real(wp), intent(out), optional :: alpha(:)
 
+   !> Externally supplied atomic partial charges, replacing the electronegativity
+   !> equilibration model
+   real(wp), intent(in), optional :: charges(:)
+
+   logical :: weights
    integer :: mref
-   real(wp), allocatable :: gwvec(:, :, :), lattr(:, :)
+   real(wp), allocatable :: cnat(:), qat(:), gwvec(:, :, :), lattr(:, :)
    type(error_type), allocatable :: error
 
-   if (.not. allocated(disp%mchrg)) then
+   weights = present(c6) .or. present(alpha)
+
+   if (present(cn) .or. weights) then
+      allocate(cnat(mol%nat))
+      call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr)
+      call get_coordination_number(mol, lattr, cutoff%cn, disp%rcov, disp%en, cnat)
+      if (present(cn)) cn(:) = cnat
+   end if
+
+   if (present(q) .or. weights) then
+      allocate(qat(mol%nat))
+      if (present(charges)) then
+         call check_charges(mol, charges)
+         qat(:) = charges
+      else
+         if (.not. allocated(disp%mchrg)) then
+            write(error_unit, '("[Error]:", 1x, a)') &
+               & "Not supported for non-self-consistent D4 version"
+            error stop
+         end if
+         call get_charges(disp%mchrg, mol, error, qat)
+         if(allocated(error)) then
+            write(error_unit, '("[Error]:", 1x, a)') error%message
+            error stop
+         end if
+      end if
+      if (present(q)) q(:) = qat
+   end if
+
+   if (.not.weights) return
+
+   mref = maxval(disp%ref)
+   allocate(gwvec(mref, mol%nat, disp%ncoup))
+   call disp%weight_references(mol, cnat, qat, gwvec)
+
+   if (present(c6)) call disp%get_atomic_c6(mol, gwvec, c6=c6)
+   if (present(alpha)) call disp%get_polarizabilities(mol, gwvec, alpha=alpha)
+
+end subroutine get_properties
+
+
+!> Evaluate the C6 coefficients only for atom pairs within a real space cutoff.
+!> Every pair is stored once with iat >= jat, including the pair of each atom with
+!> itself. In periodic systems a pair is included if any image of the partner atom
+!> is within the cutoff.
+subroutine get_sparse_c6(mol, disp, cutoff, c6_cutoff, pairs, c6, charges)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_sparse_c6
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Real space cutoff for the selection of atom pairs
+   real(wp), intent(in) :: c6_cutoff
+
+   !> Atom indices of each pair: [2, npair]
+   integer, allocatable, intent(out) :: pairs(:, :)
+
+   !> C6 coefficients of each pair: [npair]
+   real(wp), allocatable, intent(out) :: c6(:)
+
+   !> Externally supplied atomic partial charges, replacing the electronegativity
+   !> equilibration model
+   real(wp), intent(in), optional :: charges(:)
+
+   integer :: mref
+   real(wp), allocatable :: cn(:), q(:), gwvec(:, :, :), lattr(:, :)
+
+   allocate(cn(mol%nat), q(mol%nat))
+   call get_properties(mol, disp, cutoff, cn, q, charges=charges)
+
+   mref = maxval(disp%ref)
+   allocate(gwvec(mref, mol%nat, disp%ncoup))
+   call disp%weight_references(mol, cn, q, gwvec)
+
+   call get_lattice_points(mol%periodic, mol%lattice, c6_cutoff, lattr)
+   call get_close_pairs(mol, lattr, c6_cutoff, pairs)
+
+   allocate(c6(size(pairs, 2)))
+   call disp%get_pair_c6(mol, gwvec, pairs, c6)
+
+end subroutine get_sparse_c6
+
+
+!> Collect all atom pairs with any image of the partner atom within the cutoff
+subroutine get_close_pairs(mol, trans, cutoff, pairs)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Atom indices of each pair: [2, npair]
+   integer, allocatable, intent(out) :: pairs(:, :)
+
+   integer :: iat, jat, ip
+   integer, allocatable :: offset(:)
+
+   allocate(offset(mol%nat + 1), source=0)
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(mol, trans, cutoff, offset) private(iat, jat)
+   do iat = 1, mol%nat
+      do jat = 1, iat
+         if (is_close(iat, jat)) offset(iat + 1) = offset(iat + 1) + 1
+      end do
+   end do
+   do iat = 1, mol%nat
+      offset(iat + 1) = offset(iat + 1) + offset(iat)
+   end do
+
+   allocate(pairs(2, offset(mol%nat + 1)))
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(mol, trans, cutoff, offset, pairs) private(iat, jat, ip)
+   do iat = 1, mol%nat
+      ip = offset(iat)
+      do jat = 1, iat
+         if (.not.is_close(iat, jat)) cycle
+         ip = ip + 1
+         pairs(:, ip) = [iat, jat]
+      end do
+   end do
+
+contains
+
+   !> Check whether any image of atom jat is within the cutoff of atom iat
+   pure logical function is_close(iat, jat)
+      integer, intent(in) :: iat, jat
+      integer :: jtr
+      real(wp) :: vec(3), r2
+
+      is_close = iat == jat
+      if (is_close) return
+      do jtr = 1, size(trans, 2)
+         vec(:) = mol%xyz(:, jat) + trans(:, jtr) - mol%xyz(:, iat)
+         r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
+         is_close = r2 <= cutoff*cutoff
+         if (is_close) return
+      end do
+   end function is_close
+
+end subroutine get_close_pairs
+
+
+!> Evaluate the damping parameter independent pair data, i.e. the C6 coefficients
+!> used for the two-body and three-body dispersion and the products of the
+!> expectation values for the r4 over r2 operator entering the damping function.
+subroutine get_pair_data(mol, disp, cutoff, c6, c6_3, rrij, charges)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_pair_data
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> C6 coefficients for the two-body dispersion
+   real(wp), intent(out) :: c6(:, :)
+
+   !> C6 coefficients for the three-body dispersion
+   real(wp), intent(out) :: c6_3(:, :)
+
+   !> Products of the expectation values for the r4 over r2 operator, 3*r4r2(i)*r4r2(j)
+   real(wp), intent(out) :: rrij(:, :)
+
+   !> Externally supplied atomic partial charges, replacing the electronegativity
+   !> equilibration model
+   real(wp), intent(in), optional :: charges(:)
+
+   integer :: mref, iat, jat
+   real(wp), allocatable :: cn(:), q(:), gwvec(:, :, :), lattr(:, :)
+   type(error_type), allocatable :: error
+
+   if (.not. allocated(disp%mchrg) .and. .not.present(charges)) then
       write(error_unit, '("[Error]:", 1x, a)') "Not supported for non-self-consistent D4 version"
       error stop
    end if
 
    mref = maxval(disp%ref)
 
+   allocate(cn(mol%nat))
    call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr)
    call get_coordination_number(mol, lattr, cutoff%cn, disp%rcov, disp%en, cn)
 
-   call get_charges(disp%mchrg, mol, error, q)
-   if(allocated(error)) then
-      write(error_unit, '("[Error]:", 1x, a)') error%message
-      error stop
+   allocate(q(mol%nat))
+   if (present(charges)) then
+      call check_charges(mol, charges)
+      q(:) = charges
+   else
+      call get_charges(disp%mchrg, mol, error, q)
+      if(allocated(error)) then
+         write(error_unit, '("[Error]:", 1x, a)') error%message
+         error stop
+      end if
    end if
 
    allocate(gwvec(mref, mol%nat, disp%ncoup))
    call disp%weight_references(mol, cn, q, gwvec)
-
    call disp%get_atomic_c6(mol, gwvec, c6=c6)
-   call disp%get_polarizabilities(mol, gwvec, alpha=alpha)
 
-end subroutine get_properties
+   q(:) = 0.0_wp
+   call disp%weight_references(mol, cn, q, gwvec)
+   call disp%get_atomic_c6(mol, gwvec, c6=c6_3)
 
+   do iat = 1, mol%nat
+      do jat = 1, mol%nat
+         rrij(jat, iat) = 3*disp%r4r2(mol%id(iat))*disp%r4r2(mol%id(jat))
+      end do
+   end do
 
-!> Wrapper to handle the evaluation of pairwise representation of the dispersion energy
-subroutine get_pairwise_dispersion(mol, disp, param, cutoff, energy2, energy3)
+end subroutine get_pair_data
+
+
+!> Wrapper to handle the evaluation of pairwise representation of the dispersion energy.
+!>
+!> If fragments are given the pairwise energies are accumulated for pairs of fragments
+!> instead of atom pairs, the energy arrays must be dimensioned by the number of fragments.
+!> With the interaction flag only pairs of different fragments are evaluated, such that
+!> the diagonal of the fragment representation is zero.
+subroutine get_pairwise_dispersion(mol, disp, param, cutoff, energy2, energy3, charges, &
+      & fragment, interaction)
    !DEC$ ATTRIBUTES DLLEXPORT :: get_pairwise_dispersion
 
    !> Molecular structure data
@@ -216,15 +618,36 @@ subroutine get_pairwise_dispersion(mol, disp, param, cutoff, energy2, energy3)
    !> Pairwise representation of non-additive dispersion energy
    real(wp), intent(out) :: energy3(:, :)
 
+   !> Externally supplied atomic partial charges, replacing the electronegativity
+   !> equilibration model
+   real(wp), intent(in), optional :: charges(:)
+
+   !> Fragment of each atom, numbered from one to the number of fragments
+   integer, intent(in), optional :: fragment(:)
+
+   !> Only evaluate the interaction energy between different fragments
+   logical, intent(in), optional :: interaction
+
    integer :: mref
    real(wp), allocatable :: cn(:), q(:), gwvec(:, :, :), c6(:, :), lattr(:, :)
+   real(wp), allocatable :: pair2(:, :), pair3(:, :)
+   real(wp) :: cutoff2, cutoff3
    type(error_type), allocatable :: error
 
-   if (.not. allocated(disp%mchrg)) then
+   if (.not. allocated(disp%mchrg) .and. .not.present(charges)) then
       write(error_unit, '("[Error]:", 1x, a)') "Not supported for non-self-consistent D4 version"
       error stop
    end if
 
+   if (present(fragment)) then
+      if (size(fragment) /= mol%nat .or. any(fragment < 1) &
+         & .or. any(fragment > min(size(energy2, 1), size(energy3, 1)))) then
+         write(error_unit, '("[Error]:", 1x, a)') &
+            & "Fragment indices do not match the shape of the energy arrays"
+         error stop
+      end if
+   end if
+
    mref = maxval(disp%ref)
 
    allocate(cn(mol%nat))
@@ -232,10 +655,15 @@ subroutine get_pairwise_dispersion(mol, disp, param, cutoff, energy2, energy3)
    call get_coordination_number(mol, lattr, cutoff%cn, disp%rcov, disp%en, cn)
 
    allocate(q(mol%nat))
-   call get_charges(disp%mchrg, mol, error, q)
-   if(allocated(error)) then
-      write(error_unit, '("[Error]:", 1x, a)') error%message
-      error stop
+   if (present(charges)) then
+      call check_charges(mol, charges)
+      q(:) = charges
+   else
+      call get_charges(disp%mchrg, mol, error, q)
+      if(allocated(error)) then
+         write(error_unit, '("[Error]:", 1x, a)') error%message
+         error stop
+      end if
    end if
 
    allocate(gwvec(mref, mol%nat, disp%ncoup))
@@ -244,21 +672,771 @@ subroutine get_pairwise_dispersion(mol, disp, param, cutoff, energy2, energy3)
    allocate(c6(mol%nat, mol%nat))
    call disp%get_atomic_c6(mol, gwvec, c6=c6)
 
+   cutoff2 = cutoff%disp2
+   cutoff3 = cutoff%disp3
+   if (cutoff%tolerance > 0.0_wp) then
+      allocate(pair2(mol%nid, mol%nid), pair3(mol%nid, mol%nid))
+      call get_pair_cutoffs(mol, disp, param, cutoff, pair2, pair3)
+      cutoff2 = maxval(pair2)
+      cutoff3 = maxval(pair3)
+   end if
+
    energy2(:, :) = 0.0_wp
    energy3(:, :) = 0.0_wp
-   call get_lattice_points(mol%periodic, mol%lattice, cutoff%disp2, lattr)
-   call param%get_pairwise_dispersion2(mol, lattr, cutoff%disp2, cutoff%width2, &
-      & disp%r4r2, c6, energy2)
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr)
+   call param%get_pairwise_dispersion2(mol, lattr, cutoff2, cutoff%width2, &
+      & disp%r4r2, c6, energy2, pair2, fragment, interaction)
+   if (cutoff%tail) then
+      call param%get_pairwise_dispersion2_tail(mol, cutoff2, cutoff%width2, &
+         & disp%r4r2, c6, energy2, pair2, fragment, interaction)
+   end if
 
    q(:) = 0.0_wp
    call disp%weight_references(mol, cn, q, gwvec)
    call disp%get_atomic_c6(mol, gwvec, c6=c6)
 
-   call get_lattice_points(mol%periodic, mol%lattice, cutoff%disp3, lattr)
-   call param%get_pairwise_dispersion3(mol, lattr, cutoff%disp3, cutoff%width3, &
-      & disp%r4r2, c6, energy3)
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr)
+   call param%get_pairwise_dispersion3(mol, lattr, cutoff3, cutoff%width3, &
+      & disp%r4r2, c6, energy3, pair3, fragment, interaction)
 
 end subroutine get_pairwise_dispersion
 
 
+!> Wrapper to handle the evaluation of the pairwise representation of the dispersion
+!> energy as sparse lists of atom pairs resolved by lattice images. Only pairs within
+!> the real space cutoffs are stored, pairs with an absolute energy below the threshold
+!> are removed. Each pair is stored once with the full pair energy, the long-range
+!> tail beyond the cutoff is not included.
+subroutine get_sparse_pairwise_dispersion(mol, disp, param, cutoff, threshold, &
+      & pairs2, pairs3, charges)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_sparse_pairwise_dispersion
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Threshold for the absolute pair energy, pairs below are removed
+   real(wp), intent(in) :: threshold
+
+   !> Sparse list of pairwise additive energies
+   type(pair_list), intent(out) :: pairs2
+
+   !> Sparse list of pairwise non-additive energies
+   type(pair_list), intent(out) :: pairs3
+
+   !> Externally supplied atomic partial charges, replacing the electronegativity
+   !> equilibration model
+   real(wp), intent(in), optional :: charges(:)
+
+   integer :: mref
+   real(wp), allocatable :: cn(:), q(:), gwvec(:, :, :), c6(:, :), lattr(:, :)
+   real(wp), allocatable :: pair2(:, :), pair3(:, :)
+   real(wp) :: cutoff2, cutoff3
+   type(error_type), allocatable :: error
+
+   if (.not. allocated(disp%mchrg) .and. .not.present(charges)) then
+      write(error_unit, '("[Error]:", 1x, a)') "Not supported for non-self-consistent D4 version"
+      error stop
+   end if
+
+   mref = maxval(disp%ref)
+
+   allocate(cn(mol%nat))
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr)
+   call get_coordination_number(mol, lattr, cutoff%cn, disp%rcov, disp%en, cn)
+
+   allocate(q(mol%nat))
+   if (present(charges)) then
+      call check_charges(mol, charges)
+      q(:) = charges
+   else
+      call get_charges(disp%mchrg, mol, error, q)
+      if(allocated(error)) then
+         write(error_unit, '("[Error]:", 1x, a)') error%message
+         error stop
+      end if
+   end if
+
+   allocate(gwvec(mref, mol%nat, disp%ncoup))
+   call disp%weight_references(mol, cn, q, gwvec)
+
+   allocate(c6(mol%nat, mol%nat))
+   call disp%get_atomic_c6(mol, gwvec, c6=c6)
+
+   cutoff2 = cutoff%disp2
+   cutoff3 = cutoff%disp3
+   if (cutoff%tolerance > 0.0_wp) then
+      allocate(pair2(mol%nid, mol%nid), pair3(mol%nid, mol%nid))
+      call get_pair_cutoffs(mol, disp, param, cutoff, pair2, pair3)
+      cutoff2 = maxval(pair2)
+      cutoff3 = maxval(pair3)
+   end if
+
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr)
+   call new_pair_list(pairs2, mol, lattr, cutoff2, pair2)
+   call param%get_sparse_dispersion2(mol, lattr, cutoff2, cutoff%width2, &
+      & disp%r4r2, c6, pairs2, pair2)
+   call pairs2%compact(threshold)
+
+   q(:) = 0.0_wp
+   call disp%weight_references(mol, cn, q, gwvec)
+   call disp%get_atomic_c6(mol, gwvec, c6=c6)
+
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr)
+   ! Pairs between the partners of an atom can be outside of the lattice points
+   call new_pair_list(pairs3, mol, lattr, cutoff3, pair3, differences=.true.)
+   call param%get_sparse_dispersion3(mol, lattr, cutoff3, cutoff%width3, &
+      & disp%r4r2, c6, pairs3, pair3)
+   call pairs3%compact(threshold)
+
+end subroutine get_sparse_pairwise_dispersion
+
+
+!> Evaluate any combination of energies, derivatives, properties and pairwise
+!> energies in a single pass, coordination numbers, partial charges and C6
+!> coefficients are only computed once for all requested quantities.
+subroutine get_dispersion_results(mol, disp, param, cutoff, energy, gradient, sigma, &
+      & energy2b, energy3b, energies, cn, q, c6, alpha, pair_disp2, pair_disp3, &
+      & charges, dqdr, dqdL, sigmas)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion_results
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Dispersion energy
+   real(wp), intent(out) :: energy
+
+   !> Dispersion gradient
+   real(wp), intent(out), contiguous, optional :: gradient(:, :)
+
+   !> Dispersion virial
+   real(wp), intent(out), contiguous, optional :: sigma(:, :)
+
+   !> Additive two-body dispersion energy
+   real(wp), intent(out), optional :: energy2b
+
+   !> Non-additive three-body dispersion energy
+   real(wp), intent(out), optional :: energy3b
+
+   !> Atom-resolved dispersion energy
+   real(wp), intent(out), optional :: energies(:)
+
+   !> Coordination number
+   real(wp), intent(out), optional :: cn(:)
+
+   !> Atomic partial charges
+   real(wp), intent(out), optional :: q(:)
+
+   !> C6 coefficients
+   real(wp), intent(out), optional :: c6(:, :)
+
+   !> Static polarizabilities
+   real(wp), intent(out), optional :: alpha(:)
+
+   !> Pairwise representation of additive dispersion energy
+   real(wp), intent(out), optional :: pair_disp2(:, :)
+
+   !> Pairwise representation of non-additive dispersion energy
+   real(wp), intent(out), optional :: pair_disp3(:, :)
+
+   !> Externally supplied atomic partial charges, replacing the electronegativity
+   !> equilibration model
+   real(wp), intent(in), optional :: charges(:)
+
+   !> Derivative of the external partial charges w.r.t. the cartesian coordinates
+   real(wp), intent(in), contiguous, optional :: dqdr(:, :, :)
+
+   !> Derivative of the external partial charges w.r.t. strain deformations
+   real(wp), intent(in), contiguous, optional :: dqdL(:, :, :)
+
+   !> Atom-resolved dispersion virial, the interactions are shared equally
+   !> between the atoms involved
+   real(wp), intent(out), contiguous, optional :: sigmas(:, :, :)
+
+   logical :: grad
+   integer :: mref, iat
+   integer, allocatable :: atoms(:)
+   real(wp), allocatable :: cnat(:), qat(:), qdr(:, :, :), qdL(:, :, :)
+   real(wp), allocatable :: gwvec(:, :, :), gwdcn(:, :, :), gwdq(:, :, :)
+   real(wp), allocatable :: c6at(:, :), dc6dcn(:, :), dc6dq(:, :)
+   real(wp), allocatable :: dEdcn(:), dEdq(:), energies2(:), energies3(:)
+   real(wp), allocatable :: gradient_(:, :), sigma_(:, :)
+   real(wp), allocatable :: lattr(:, :), pair2(:, :), pair3(:, :)
+   real(wp), allocatable :: dcndr(:, :, :), dcndL(:, :, :), etail(:)
+   real(wp) :: stail(3, 3)
+   real(wp) :: cutoff2, cutoff3
+   type(error_type), allocatable :: error
+
+   if (.not. allocated(disp%mchrg) .and. .not.present(charges)) then
+      write(error_unit, '("[Error]:", 1x, a)') "Not supported for non-self-consistent D4 version"
+      error stop
+   end if
+
+   mref = maxval(disp%ref)
+   grad = present(gradient).or.present(sigma).or.present(sigmas)
+
+   allocate(cnat(mol%nat))
+   if (present(sigmas)) allocate(dcndr(3, mol%nat, mol%nat), dcndL(3, 3, mol%nat))
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr)
+   call get_coordination_number(mol, lattr, cutoff%cn, disp%rcov, disp%en, cnat, &
+      & dcndr, dcndL)
+   if (present(cn)) cn(:) = cnat
+
+   allocate(qat(mol%nat))
+   if (present(charges)) then
+      call check_charges(mol, charges, dqdr, dqdL)
+      qat(:) = charges
+      if (grad .and. present(dqdr)) qdr = dqdr
+      if (grad .and. present(dqdL)) qdL = dqdL
+   else
+      if (grad) allocate(qdr(3, mol%nat, mol%nat), qdL(3, 3, mol%nat))
+      call get_charges(disp%mchrg, mol, error, qat, qdr, qdL)
+      if(allocated(error)) then
+         write(error_unit, '("[Error]:", 1x, a)') error%message
+         error stop
+      end if
+   end if
+   if (present(q)) q(:) = qat
+
+   allocate(gwvec(mref, mol%nat, disp%ncoup))
+   if (grad) allocate(gwdcn(mref, mol%nat, disp%ncoup), gwdq(mref, mol%nat, disp%ncoup))
+   call disp%weight_references(mol, cnat, qat, gwvec, gwdcn, gwdq)
+
+   allocate(c6at(mol%nat, mol%nat))
+   if (grad) allocate(dc6dcn(mol%nat, mol%nat), dc6dq(mol%nat, mol%nat))
+   call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6at, dc6dcn, dc6dq)
+   if (present(c6)) c6(:, :) = c6at
+   if (present(alpha)) call disp%get_polarizabilities(mol, gwvec, alpha=alpha)
+
+   allocate(energies2(mol%nat), energies3(mol%nat), source=0.0_wp)
+   if (grad) then
+      allocate(dEdcn(mol%nat), dEdq(mol%nat), source=0.0_wp)
+      allocate(gradient_(3, mol%nat), sigma_(3, 3), source=0.0_wp)
+   end if
+   if (present(sigmas)) then
+      atoms = [(iat, iat = 1, mol%nat)]
+      sigmas(:, :, :) = 0.0_wp
+   end if
+
+   cutoff2 = cutoff%disp2
+   cutoff3 = cutoff%disp3
+   if (cutoff%tolerance > 0.0_wp) then
+      allocate(pair2(mol%nid, mol%nid), pair3(mol%nid, mol%nid))
+      call get_pair_cutoffs(mol, disp, param, cutoff, pair2, pair3)
+      cutoff2 = maxval(pair2)
+      cutoff3 = maxval(pair3)
+   end if
+
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr)
+   if (present(sigmas)) then
+      call param%get_atomic_dispersion2(mol, lattr, cutoff2, cutoff%width2, disp%r4r2, &
+         & c6at, dc6dcn, dc6dq, atoms, energies2, dEdcn, dEdq, gradient_, sigmas, &
+         & pair_cutoff=pair2)
+   else
+      call param%get_dispersion2(mol, lattr, cutoff2, cutoff%width2, disp%r4r2, c6at, &
+         & dc6dcn, dc6dq, energies2, dEdcn, dEdq, gradient_, sigma_, pair_cutoff=pair2)
+   end if
+   if (present(pair_disp2)) then
+      pair_disp2(:, :) = 0.0_wp
+      call param%get_pairwise_dispersion2(mol, lattr, cutoff2, cutoff%width2, &
+         & disp%r4r2, c6at, pair_disp2, pair2)
+   end if
+   if (cutoff%tail) then
+      if (present(sigmas)) then
+         ! The isotropic virial of the tail is shared like the tail energy
+         allocate(etail(mol%nat), source=0.0_wp)
+         stail(:, :) = 0.0_wp
+         call param%get_dispersion2_tail(mol, cutoff2, cutoff%width2, disp%r4r2, c6at, &
+            & dc6dcn, dc6dq, etail, dEdcn, dEdq, stail, pair_cutoff=pair2)
+         energies2(:) = energies2 + etail
+         if (abs(sum(etail)) > epsilon(1.0_wp)) then
+            do iat = 1, mol%nat
+               sigmas(:, :, iat) = sigmas(:, :, iat) + stail * etail(iat) / sum(etail)
+            end do
+         end if
+      else
+         call param%get_dispersion2_tail(mol, cutoff2, cutoff%width2, disp%r4r2, c6at, &
+            & dc6dcn, dc6dq, energies2, dEdcn, dEdq, sigma_, pair_cutoff=pair2)
+      end if
+      if (present(pair_disp2)) then
+         call param%get_pairwise_dispersion2_tail(mol, cutoff2, cutoff%width2, &
+            & disp%r4r2, c6at, pair_disp2, pair2)
+      end if
+   end if
+   if (allocated(qdr)) call d4_gemv(qdr, dEdq, gradient_, beta=1.0_wp)
+   if (allocated(qdL)) call d4_gemv(qdL, dEdq, sigma_, beta=1.0_wp)
+   if (allocated(qdL) .and. present(sigmas)) then
+      do iat = 1, mol%nat
+         sigmas(:, :, iat) = sigmas(:, :, iat) + dEdq(iat) * qdL(:, :, iat)
+      end do
+   end if
+
+   qat(:) = 0.0_wp
+   call disp%weight_references(mol, cnat, qat, gwvec, gwdcn, gwdq)
+   call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6at, dc6dcn, dc6dq)
+
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr)
+   if (present(sigmas)) then
+      call param%get_atomic_dispersion3(mol, lattr, cutoff3, cutoff%width3, disp%r4r2, &
+         & c6at, dc6dcn, dc6dq, atoms, energies3, dEdcn, dEdq, gradient_, sigmas, &
+         & pair_cutoff=pair3)
+   else
+      call param%get_dispersion3(mol, lattr, cutoff3, cutoff%width3, disp%r4r2, c6at, &
+         & dc6dcn, dc6dq, energies3, dEdcn, dEdq, gradient_, sigma_, pair_cutoff=pair3)
+   end if
+   if (present(pair_disp3)) then
+      pair_disp3(:, :) = 0.0_wp
+      call param%get_pairwise_dispersion3(mol, lattr, cutoff3, cutoff%width3, &
+         & disp%r4r2, c6at, pair_disp3, pair3)
+   end if
+
+   if (grad) then
+      call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr)
+      call add_coordination_number_derivs(mol, lattr, cutoff%cn, &
+         & disp%rcov, disp%en, dEdcn, gradient_, sigma_)
+      if (present(sigmas)) then
+         do iat = 1, mol%nat
+            sigmas(:, :, iat) = sigmas(:, :, iat) + dEdcn(iat) * dcndL(:, :, iat)
+         end do
+         sigma_(:, :) = sum(sigmas, dim=3)
+      end if
+      if (present(gradient)) gradient(:, :) = gradient_
+      if (present(sigma)) sigma(:, :) = sigma_
+   end if
+
+   energy = sum(energies2) + sum(energies3)
+   if (present(energy2b)) energy2b = sum(energies2)
+   if (present(energy3b)) energy3b = sum(energies3)
+   if (present(energies)) energies(:) = energies2 + energies3
+
+end subroutine get_dispersion_results
+
+
+!> Evaluate the dispersion energy and derivatives for several sets of damping
+!> parameters, coordination numbers, partial charges and C6 coefficients do not
+!> depend on the damping parameters and are only computed once.
+subroutine get_dispersion_multi(mol, disp, param, cutoff, energy, gradient, sigma)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion_multi
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param(:)
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Dispersion energy for each set of damping parameters
+   real(wp), intent(out) :: energy(:)
+
+   !> Dispersion gradient for each set of damping parameters
+   real(wp), intent(out), contiguous, optional :: gradient(:, :, :)
+
+   !> Dispersion virial for each set of damping parameters
+   real(wp), intent(out), contiguous, optional :: sigma(:, :, :)
+
+   logical :: grad
+   integer :: mref, iparam
+   real(wp), allocatable :: cn(:), q(:), dqdr(:, :, :), dqdL(:, :, :)
+   real(wp), allocatable :: gwvec(:, :, :), gwdcn(:, :, :), gwdq(:, :, :)
+   real(wp), allocatable :: c6_2(:, :), dc6dcn_2(:, :), dc6dq_2(:, :)
+   real(wp), allocatable :: c6_3(:, :), dc6dcn_3(:, :), dc6dq_3(:, :)
+   real(wp), allocatable :: dEdcn(:), dEdq(:), energies(:), gradient_(:, :), sigma_(:, :)
+   real(wp), allocatable :: lattr_cn(:, :), lattr2(:, :), lattr3(:, :)
+   real(wp), allocatable :: pair2(:, :), pair3(:, :)
+   real(wp) :: cutoff2, cutoff3
+   type(error_type), allocatable :: error
+
+   if (.not. allocated(disp%mchrg)) then
+      write(error_unit, '("[Error]:", 1x, a)') "Not supported for non-self-consistent D4 version"
+      error stop
+   end if
+
+   mref = maxval(disp%ref)
+   grad = present(gradient).or.present(sigma)
+
+   allocate(cn(mol%nat))
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr_cn)
+   call get_coordination_number(mol, lattr_cn, cutoff%cn, disp%rcov, disp%en, cn)
+
+   allocate(q(mol%nat))
+   if (grad) allocate(dqdr(3, mol%nat, mol%nat), dqdL(3, 3, mol%nat))
+   call get_charges(disp%mchrg, mol, error, q, dqdr, dqdL)
+   if(allocated(error)) then
+      write(error_unit, '("[Error]:", 1x, a)') error%message
+      error stop
+   end if
+
+   allocate(gwvec(mref, mol%nat, disp%ncoup))
+   if (grad) allocate(gwdcn(mref, mol%nat, disp%ncoup), gwdq(mref, mol%nat, disp%ncoup))
+
+   allocate(c6_2(mol%nat, mol%nat), c6_3(mol%nat, mol%nat))
+   if (grad) allocate(dc6dcn_2(mol%nat, mol%nat), dc6dq_2(mol%nat, mol%nat), &
+      & dc6dcn_3(mol%nat, mol%nat), dc6dq_3(mol%nat, mol%nat))
+   call disp%weight_references(mol, cn, q, gwvec, gwdcn, gwdq)
+   call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6_2, dc6dcn_2, dc6dq_2)
+   q(:) = 0.0_wp
+   call disp%weight_references(mol, cn, q, gwvec, gwdcn, gwdq)
+   call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6_3, dc6dcn_3, dc6dq_3)
+
+   allocate(energies(mol%nat))
+   if (grad) allocate(dEdcn(mol%nat), dEdq(mol%nat), gradient_(3, mol%nat), sigma_(3, 3))
+
+   cutoff2 = cutoff%disp2
+   cutoff3 = cutoff%disp3
+   if (cutoff%tolerance > 0.0_wp) then
+      allocate(pair2(mol%nid, mol%nid), pair3(mol%nid, mol%nid))
+   else
+      call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr2)
+      call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr3)
+   end if
+
+   do iparam = 1, size(param)
+      associate(par => param(iparam))
+         if (cutoff%tolerance > 0.0_wp) then
+            call get_pair_cutoffs(mol, disp, par, cutoff, pair2, pair3)
+            cutoff2 = maxval(pair2)
+            cutoff3 = maxval(pair3)
+            call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr2)
+            call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr3)
+         end if
+
+         energies(:) = 0.0_wp
+         if (grad) then
+            dEdcn(:) = 0.0_wp
+            dEdq(:) = 0.0_wp
+            gradient_(:, :) = 0.0_wp
+            sigma_(:, :) = 0.0_wp
+         end if
+
+         call par%get_dispersion2(mol, lattr2, cutoff2, cutoff%width2, disp%r4r2, &
+            & c6_2, dc6dcn_2, dc6dq_2, energies, dEdcn, dEdq, gradient_, sigma_, &
+            & pair_cutoff=pair2)
+         if (cutoff%tail) then
+            call par%get_dispersion2_tail(mol, cutoff2, cutoff%width2, disp%r4r2, &
+               & c6_2, dc6dcn_2, dc6dq_2, energies, dEdcn, dEdq, sigma_, &
+               & pair_cutoff=pair2)
+         end if
+         if (grad) then
+            call d4_gemv(dqdr, dEdq, gradient_, beta=1.0_wp)
+            call d4_gemv(dqdL, dEdq, sigma_, beta=1.0_wp)
+         end if
+
+         call par%get_dispersion3(mol, lattr3, cutoff3, cutoff%width3, disp%r4r2, &
+            & c6_3, dc6dcn_3, dc6dq_3, energies, dEdcn, dEdq, gradient_, sigma_, &
+            & pair_cutoff=pair3)
+      end associate
+
+      energy(iparam) = sum(energies)
+      if (grad) then
+         call add_coordination_number_derivs(mol, lattr_cn, cutoff%cn, &
+            & disp%rcov, disp%en, dEdcn, gradient_, sigma_)
+         if (present(gradient)) gradient(:, :, iparam) = gradient_
+         if (present(sigma)) sigma(:, :, iparam) = sigma_
+      end if
+   end do
+
+end subroutine get_dispersion_multi
+
+
+!> Evaluate the dispersion energy and derivatives for several images of the same
+!> structure, like the images of a reaction path or an ensemble of geometries.
+!> The images are distributed over the available threads.
+subroutine get_dispersion_images(mol, disp, param, cutoff, xyz, lattice, energy, &
+      & gradient, sigma, partition, mixed)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion_images
+
+   !> Molecular structure data, defines the composition of all images
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Cartesian coordinates of each image
+   real(wp), intent(in) :: xyz(:, :, :)
+
+   !> Lattice parameters of each image, the lattice of the structure is used if absent
+   real(wp), intent(in), optional :: lattice(:, :, :)
+
+   !> Dispersion energy of each image
+   real(wp), intent(out) :: energy(:)
+
+   !> Dispersion gradient of each image
+   real(wp), intent(out), contiguous, optional :: gradient(:, :, :)
+
+   !> Dispersion virial of each image
+   real(wp), intent(out), contiguous, optional :: sigma(:, :, :)
+
+   !> Optional externally assigned work partition, applied to every image
+   type(work_partition), intent(in), optional :: partition
+
+   !> Evaluate the interaction kernels in mixed precision
+   logical, intent(in), optional :: mixed
+
+   integer :: iimg
+   real(wp) :: sigma_(3, 3)
+   real(wp), allocatable :: gradient_(:, :)
+   type(structure_type) :: img
+
+   !$omp parallel do default(none) schedule(dynamic) &
+   !$omp shared(mol, disp, param, cutoff, xyz, lattice, energy, gradient, sigma, &
+   !$omp& partition, mixed) private(iimg, img, gradient_, sigma_)
+   do iimg = 1, size(energy)
+      img = mol
+      img%xyz(:, :) = xyz(:, :, iimg)
+      if (present(lattice)) img%lattice(:, :) = lattice(:, :, iimg)
+      if (present(gradient) .or. present(sigma)) then
+         allocate(gradient_(3, mol%nat))
+         call get_dispersion(img, disp, param, cutoff, energy(iimg), gradient_, sigma_, &
+            & partition=partition, mixed=mixed)
+         if (present(gradient)) gradient(:, :, iimg) = gradient_
+         if (present(sigma)) sigma(:, :, iimg) = sigma_
+         deallocate(gradient_)
+      else
+         call get_dispersion(img, disp, param, cutoff, energy(iimg), &
+            & partition=partition, mixed=mixed)
+      end if
+   end do
+
+end subroutine get_dispersion_images
+
+
+!> Check the shape of externally supplied partial charges and their derivatives
+subroutine check_charges(mol, charges, dqdr, dqdL)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Atomic partial charges
+   real(wp), intent(in) :: charges(:)
+
+   !> Derivative of the partial charges w.r.t. the cartesian coordinates
+   real(wp), intent(in), optional :: dqdr(:, :, :)
+
+   !> Derivative of the partial charges w.r.t. strain deformations
+   real(wp), intent(in), optional :: dqdL(:, :, :)
+
+   logical :: stat
+
+   stat = size(charges) == mol%nat
+   if (present(dqdr)) stat = stat .and. all(shape(dqdr) == [3, mol%nat, mol%nat])
+   if (present(dqdL)) stat = stat .and. all(shape(dqdL) == [3, 3, mol%nat])
+   if (.not.stat) then
+      write(error_unit, '("[Error]:", 1x, a)') &
+         & "Shape of partial charges does not match the structure"
+      error stop
+   end if
+
+end subroutine check_charges
+
+
+!> Derive real space cutoffs for each pair of species from the error tolerance.
+!>
+!> The cutoffs are chosen such that the estimated two-body and three-body dispersion
+!> energy neglected per atom stays below the tolerance, using the largest reference
+!> C6 coefficient of each pair of species. The cutoffs of the realspace_cutoff
+!> act as upper limit and are used for all pairs if no tolerance is given.
+!> Lower dimensional periodic systems always use the upper limits.
+subroutine get_pair_cutoffs(mol, disp, param, cutoff, disp2, disp3, error2, error3)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Two-body interaction cutoff for each pair of species
+   real(wp), intent(out) :: disp2(:, :)
+
+   !> Three-body interaction cutoff for each pair of species
+   real(wp), intent(out) :: disp3(:, :)
+
+   !> Estimated two-body dispersion energy per atom neglected by the cutoffs
+   real(wp), intent(out), optional :: error2
+
+   !> Estimated three-body dispersion energy per atom neglected by the cutoffs
+   real(wp), intent(out), optional :: error3
+
+   integer :: isp, jsp, ksp
+   real(wp) :: volume, target, e2, e3
+   real(wp), allocatable :: nspecies(:), density(:), c6max(:, :), c9max(:, :)
+   real(wp), allocatable :: err2(:, :), err3(:, :)
+
+   disp2(:, :) = cutoff%disp2
+   disp3(:, :) = cutoff%disp3
+
+   if (any(mol%periodic) .and. .not.all(mol%periodic)) then
+      if (present(error2)) error2 = huge(1.0_wp)
+      if (present(error3)) error3 = huge(1.0_wp)
+      return
+   end if
+
+   allocate(nspecies(mol%nid), density(mol%nid), c6max(mol%nid, mol%nid), &
+      & c9max(mol%nid, mol%nid), err2(mol%nid, mol%nid), err3(mol%nid, mol%nid))
+   do isp = 1, mol%nid
+      nspecies(isp) = real(count(mol%id == isp), wp)
+   end do
+   if (all(mol%periodic)) then
+      volume = abs(matdet_3x3(mol%lattice))
+      density(:) = nspecies / volume
+   else
+      density(:) = 0.0_wp
+   end if
+
+   do isp = 1, mol%nid
+      do jsp = 1, mol%nid
+         c6max(jsp, isp) = maxval(abs(disp%c6(:disp%ref(jsp), :disp%ref(isp), jsp, isp)))
+      end do
+   end do
+   do isp = 1, mol%nid
+      do jsp = 1, mol%nid
+         c9max(jsp, isp) = 0.0_wp
+         do ksp = 1, mol%nid
+            c9max(jsp, isp) = max(c9max(jsp, isp), &
+               & sqrt(c6max(jsp, isp)*c6max(ksp, isp)*c6max(ksp, jsp)))
+         end do
+      end do
+   end do
+
+   if (cutoff%tolerance > 0.0_wp) then
+      ! Every partner species of an atom may contribute the same share of the error
+      target = cutoff%tolerance / mol%nid
+      do isp = 1, mol%nid
+         do jsp = 1, isp
+            disp2(jsp, isp) = find_cutoff(param, disp%r4r2(isp), disp%r4r2(jsp), &
+               & c6max(jsp, isp), c9max(jsp, isp), max(density(isp), density(jsp)), &
+               & max(nspecies(isp), nspecies(jsp)), cutoff%disp2, target, 2)
+            disp2(isp, jsp) = disp2(jsp, isp)
+            disp3(jsp, isp) = find_cutoff(param, disp%r4r2(isp), disp%r4r2(jsp), &
+               & c6max(jsp, isp), c9max(jsp, isp), max(density(isp), density(jsp)), &
+               & max(nspecies(isp), nspecies(jsp)), cutoff%disp3, target, 3)
+            disp3(isp, jsp) = disp3(jsp, isp)
+         end do
+      end do
+   end if
+
+   if (present(error2) .or. present(error3)) then
+      ! Error of an atom of species isp with all partners of species jsp
+      do isp = 1, mol%nid
+         do jsp = 1, mol%nid
+            call param%get_cutoff_error(disp%r4r2(isp), disp%r4r2(jsp), c6max(jsp, isp), &
+               & c9max(jsp, isp), disp2(jsp, isp), density(jsp), nspecies(jsp), &
+               & err2(jsp, isp), e3)
+            call param%get_cutoff_error(disp%r4r2(isp), disp%r4r2(jsp), c6max(jsp, isp), &
+               & c9max(jsp, isp), disp3(jsp, isp), density(jsp), nspecies(jsp), &
+               & e2, err3(jsp, isp))
+         end do
+      end do
+      if (present(error2)) error2 = maxval(sum(err2, 1))
+      if (present(error3)) error3 = maxval(sum(err3, 1))
+   end if
+
+end subroutine get_pair_cutoffs
+
+
+!> Find the shortest cutoff for which the estimated error is below the target by
+!> bisection, the upper limit is returned if the target cannot be reached
+function find_cutoff(param, r4r2i, r4r2j, c6, c9, density, npartner, limit, target, &
+      & body) result(cutoff)
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Expectation values for r4 over r2 operator of both species
+   real(wp), intent(in) :: r4r2i, r4r2j
+
+   !> Upper bound for the C6 coefficient of the pair of species
+   real(wp), intent(in) :: c6
+
+   !> Upper bound for the C9 coefficient of triples including the pair of species
+   real(wp), intent(in) :: c9
+
+   !> Number density of the partner atoms for periodic systems, zero for molecules
+   real(wp), intent(in) :: density
+
+   !> Number of partner atoms for molecules
+   real(wp), intent(in) :: npartner
+
+   !> Upper limit for the cutoff
+   real(wp), intent(in) :: limit
+
+   !> Target for the estimated error
+   real(wp), intent(in) :: target
+
+   !> Select the two-body or three-body error
+   integer, intent(in) :: body
+
+   !> Real space cutoff
+   real(wp) :: cutoff
+
+   integer, parameter :: max_iter = 50
+   real(wp), parameter :: conv = 1.0e-3_wp
+   integer :: iter
+   real(wp) :: lower, upper
+
+   lower = 0.0_wp
+   upper = limit
+   if (cutoff_error(upper) > target) then
+      cutoff = limit
+      return
+   end if
+
+   do iter = 1, max_iter
+      cutoff = 0.5_wp * (lower + upper)
+      if (cutoff_error(cutoff) > target) then
+         lower = cutoff
+      else
+         upper = cutoff
+      end if
+      if (upper - lower < conv) exit
+   end do
+   cutoff = upper
+
+contains
+
+   function cutoff_error(r) result(error)
+      real(wp), intent(in) :: r
+      real(wp) :: error
+      real(wp) :: e2, e3
+
+      call param%get_cutoff_error(r4r2i, r4r2j, c6, c9, r, density, npartner, e2, e3)
+      error = merge(e2, e3, body == 2)
+   end function cutoff_error
+
+end function find_cutoff
+
+
 end module dftd4_disp
@@ -0,0 +1,388 @@
+! This file is part of dftd4.
+! SPDX-Identifier: LGPL-3.0-or-later
+!
+! dftd4 is free software: you can redistribute it and/or modify it under
+! the terms of the Lesser GNU General Public License as published by
+! the Free Software Foundation, either version 3 of the License, or
+! (at your option) any later version.
+!
+! dftd4 is distributed in the hope that it will be useful,
+! but WITHOUT ANY WARRANTY; without even the implied warranty of
+! MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+! Lesser GNU General Public License for more details.
+!
+! You should have received a copy of the Lesser GNU General Public License
+! along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+
+!> Dispersion energy of a small moving region embedded in a frozen environment.
+!>
+!> The coordination numbers, reference weights and C6 coefficients of the
+!> environment atoms as well as the dispersion energy between environment atoms
+!> are cached on a refresh. Each evaluation only recomputes the coordination numbers
+!> of the region atoms, the C6 coefficients of pairs involving region atoms and the
+!> interactions involving at least one region atom. Partial charges of all atoms
+!> are kept from the last refresh.
+!>
+!> The gradient is only evaluated w.r.t. the positions of the region atoms, the
+!> environment is considered fixed between refreshes.
+module dftd4_embedding
+   use dftd4_cutoff, only : realspace_cutoff, get_lattice_points
+   use dftd4_damping, only : damping_param
+   use dftd4_disp, only : get_pair_cutoffs
+   use dftd4_model, only : dispersion_model
+   use dftd4_ncoord, only : get_coordination_number, add_coordination_number_derivs
+   use dftd4_utils, only : new_species_structure
+   use mctc_env, only : wp, error_type, fatal_error
+   use mctc_io, only : structure_type
+   use multicharge, only : get_charges
+   implicit none
+   private
+
+   public :: embedding_dispersion, new_embedding_dispersion
+
+
+   !> Cached environment for the dispersion energy of an embedded region
+   type :: embedding_dispersion
+      private
+      !> Atoms of the moving region
+      integer, allocatable :: region(:)
+      !> Number of evaluations between automatic refreshes, never refreshed if zero
+      integer :: interval = 0
+      !> Number of evaluations since the last refresh
+      integer :: steps = 0
+      !> Dispersion energy of all interactions between environment atoms
+      real(wp) :: environment_energy = 0.0_wp
+      !> Coordination numbers
+      real(wp), allocatable :: cn(:)
+      !> Partial charges
+      real(wp), allocatable :: q(:)
+      !> Real space cutoff for each pair of species in the additive dispersion
+      real(wp), allocatable :: pair2(:, :)
+      !> Real space cutoff for each pair of species in the non-additive dispersion
+      real(wp), allocatable :: pair3(:, :)
+      !> C6 coefficients for the additive dispersion
+      real(wp), allocatable :: c6_2(:, :)
+      !> Derivative of the additive C6 coefficients w.r.t. the coordination number
+      real(wp), allocatable :: dc6dcn_2(:, :)
+      !> C6 coefficients for the non-additive dispersion
+      real(wp), allocatable :: c6_3(:, :)
+      !> Derivative of the non-additive C6 coefficients w.r.t. the coordination number
+      real(wp), allocatable :: dc6dcn_3(:, :)
+   contains
+      !> Evaluate the dispersion energy of the embedded region
+      procedure :: get_dispersion
+      !> Recompute the cached environment
+      procedure :: refresh
+   end type embedding_dispersion
+
+
+contains
+
+
+!> Create a new embedding for a moving region and evaluate the cached environment
+subroutine new_embedding_dispersion(error, self, mol, disp, param, cutoff, region, &
+      & interval)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Embedding state
+   type(embedding_dispersion), intent(out) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Atoms of the moving region
+   integer, intent(in) :: region(:)
+
+   !> Number of evaluations between automatic refreshes of the environment
+   integer, intent(in), optional :: interval
+
+   integer :: iat
+
+   if (.not. allocated(disp%mchrg)) then
+      call fatal_error(error, "Not supported for non-self-consistent D4 version")
+      return
+   end if
+   if (cutoff%tail .and. all(mol%periodic)) then
+      call fatal_error(error, "Tail correction is not supported for embedded regions")
+      return
+   end if
+   if (size(region) < 1 .or. any(region < 1) .or. any(region > mol%nat)) then
+      call fatal_error(error, "Invalid atom index in embedded region")
+      return
+   end if
+   do iat = 2, size(region)
+      if (any(region(:iat-1) == region(iat))) then
+         call fatal_error(error, "Atom is selected more than once in embedded region")
+         return
+      end if
+   end do
+
+   self%region = region
+   if (present(interval)) self%interval = max(interval, 0)
+
+   call self%refresh(error, mol, disp, param, cutoff)
+
+end subroutine new_embedding_dispersion
+
+
+!> Recompute coordination numbers, partial charges and C6 coefficients of all atoms
+!> and the dispersion energy between environment atoms
+subroutine refresh(self, error, mol, disp, param, cutoff)
+
+   !> Embedding state
+   class(embedding_dispersion), intent(inout) :: self
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   integer :: mref
+   real(wp) :: cutoff2, cutoff3
+   real(wp), allocatable :: lattr(:, :), energies(:), region_energies(:), q(:)
+   real(wp), allocatable :: gwvec(:, :, :), gwdcn(:, :, :), gwdq(:, :, :), dc6dq(:, :)
+
+   mref = maxval(disp%ref)
+   self%steps = 0
+
+   if (allocated(self%cn)) deallocate(self%cn)
+   allocate(self%cn(mol%nat))
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr)
+   call get_coordination_number(mol, lattr, cutoff%cn, disp%rcov, disp%en, self%cn)
+
+   if (allocated(self%q)) deallocate(self%q)
+   allocate(self%q(mol%nat))
+   call get_charges(disp%mchrg, mol, error, self%q)
+   if (allocated(error)) return
+
+   if (allocated(self%pair2)) deallocate(self%pair2)
+   if (allocated(self%pair3)) deallocate(self%pair3)
+   cutoff2 = cutoff%disp2
+   cutoff3 = cutoff%disp3
+   if (cutoff%tolerance > 0.0_wp) then
+      allocate(self%pair2(mol%nid, mol%nid), self%pair3(mol%nid, mol%nid))
+      call get_pair_cutoffs(mol, disp, param, cutoff, self%pair2, self%pair3)
+      cutoff2 = maxval(self%pair2)
+      cutoff3 = maxval(self%pair3)
+   end if
+
+   allocate(gwvec(mref, mol%nat, disp%ncoup), gwdcn(mref, mol%nat, disp%ncoup), &
+      & gwdq(mref, mol%nat, disp%ncoup), dc6dq(mol%nat, mol%nat))
+   if (allocated(self%c6_2)) deallocate(self%c6_2, self%dc6dcn_2, self%c6_3, self%dc6dcn_3)
+   allocate(self%c6_2(mol%nat, mol%nat), self%dc6dcn_2(mol%nat, mol%nat), &
+      & self%c6_3(mol%nat, mol%nat), self%dc6dcn_3(mol%nat, mol%nat))
+   call disp%weight_references(mol, self%cn, self%q, gwvec, gwdcn, gwdq)
+   call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, self%c6_2, self%dc6dcn_2, dc6dq)
+   allocate(q(mol%nat), source=0.0_wp)
+   call disp%weight_references(mol, self%cn, q, gwvec, gwdcn, gwdq)
+   call disp%get_atomic_c6(mol, gwvec, gwdcn, gwdq, self%c6_3, self%dc6dcn_3, dc6dq)
+
+   ! Energy between environment atoms is the complete energy without all
+   ! interactions involving a region atom
+   allocate(energies(mol%nat), region_energies(size(self%region)), source=0.0_wp)
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr)
+   call param%get_dispersion2(mol, lattr, cutoff2, cutoff%width2, disp%r4r2, &
+      & self%c6_2, energy=energies, pair_cutoff=self%pair2)
+   call param%get_atomic_dispersion2(mol, lattr, cutoff2, cutoff%width2, disp%r4r2, &
+      & self%c6_2, atoms=self%region, energy=region_energies, pair_cutoff=self%pair2, &
+      & exclusive=.true.)
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr)
+   call param%get_dispersion3(mol, lattr, cutoff3, cutoff%width3, disp%r4r2, &
+      & self%c6_3, energy=energies, pair_cutoff=self%pair3)
+   call param%get_atomic_dispersion3(mol, lattr, cutoff3, cutoff%width3, disp%r4r2, &
+      & self%c6_3, atoms=self%region, energy=region_energies, pair_cutoff=self%pair3, &
+      & exclusive=.true.)
+
+   self%environment_energy = sum(energies) - sum(region_energies)
+
+end subroutine refresh
+
+
+!> Evaluate the dispersion energy and the gradient w.r.t. the region atoms for the
+!> current positions, the environment is refreshed after the requested interval
+subroutine get_dispersion(self, error, mol, disp, param, cutoff, energy, gradient)
+
+   !> Embedding state
+   class(embedding_dispersion), intent(inout) :: self
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Dispersion energy
+   real(wp), intent(out) :: energy
+
+   !> Dispersion gradient, only the region atoms are set
+   real(wp), intent(out), contiguous, optional :: gradient(:, :)
+
+   logical :: grad
+   integer :: mref, nreg
+   integer, allocatable :: cluster(:), position(:)
+   real(wp) :: cutoff2, cutoff3, sigma(3, 3)
+   real(wp), allocatable :: lattr(:, :), energies(:), q(:), dEdcn(:), dEdq(:)
+   real(wp), allocatable :: gwvec(:, :, :), gwdcn(:, :, :), gwdq(:, :, :), dc6dq(:, :)
+   real(wp), allocatable :: region_gradient(:, :), region_sigma(:, :, :)
+   real(wp), allocatable :: cluster_cn(:), cluster_dEdcn(:), cluster_gradient(:, :)
+   type(structure_type) :: sub
+
+   energy = 0.0_wp
+   if (.not.allocated(self%cn)) then
+      call fatal_error(error, "Embedded region is not initialized")
+      return
+   end if
+   if (mol%nat /= size(self%cn)) then
+      call fatal_error(error, "Number of atoms does not match the embedded region")
+      return
+   end if
+
+   if (self%interval > 0 .and. self%steps >= self%interval) then
+      call self%refresh(error, mol, disp, param, cutoff)
+      if (allocated(error)) return
+   end if
+   self%steps = self%steps + 1
+
+   grad = present(gradient)
+   mref = maxval(disp%ref)
+   nreg = size(self%region)
+
+   ! Coordination numbers of the region atoms only depend on the surrounding cluster
+   call get_region_cluster(mol, cutoff, self%region, cluster, position)
+   call new_species_structure(sub, mol, mol%id(cluster), mol%xyz(:, cluster))
+   allocate(cluster_cn(size(cluster)))
+   call get_lattice_points(sub%periodic, sub%lattice, cutoff%cn, lattr)
+   call get_coordination_number(sub, lattr, cutoff%cn, disp%rcov, disp%en, cluster_cn)
+   self%cn(self%region) = cluster_cn(position)
+
+   ! Reference weights of the environment are unchanged, only the C6 coefficients
+   ! of pairs involving region atoms have to be updated
+   allocate(gwvec(mref, mol%nat, disp%ncoup), gwdcn(mref, mol%nat, disp%ncoup), &
+      & gwdq(mref, mol%nat, disp%ncoup), dc6dq(mol%nat, mol%nat))
+   call disp%weight_references(mol, self%cn, self%q, gwvec, gwdcn, gwdq)
+   call disp%update_atomic_c6(mol, self%region, gwvec, gwdcn, gwdq, self%c6_2, &
+      & self%dc6dcn_2, dc6dq)
+   allocate(q(mol%nat), source=0.0_wp)
+   call disp%weight_references(mol, self%cn, q, gwvec, gwdcn, gwdq)
+   call disp%update_atomic_c6(mol, self%region, gwvec, gwdcn, gwdq, self%c6_3, &
+      & self%dc6dcn_3, dc6dq)
+
+   allocate(energies(nreg), source=0.0_wp)
+   if (grad) then
+      allocate(dEdcn(nreg), dEdq(nreg), source=0.0_wp)
+      allocate(region_gradient(3, nreg), region_sigma(3, 3, nreg), source=0.0_wp)
+   end if
+
+   cutoff2 = cutoff%disp2
+   if (allocated(self%pair2)) cutoff2 = maxval(self%pair2)
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr)
+   call param%get_atomic_dispersion2(mol, lattr, cutoff2, cutoff%width2, disp%r4r2, &
+      & self%c6_2, self%dc6dcn_2, dc6dq, self%region, energies, dEdcn, dEdq, &
+      & region_gradient, region_sigma, self%pair2, exclusive=.true.)
+
+   cutoff3 = cutoff%disp3
+   if (allocated(self%pair3)) cutoff3 = maxval(self%pair3)
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr)
+   call param%get_atomic_dispersion3(mol, lattr, cutoff3, cutoff%width3, disp%r4r2, &
+      & self%c6_3, self%dc6dcn_3, dc6dq, self%region, energies, dEdcn, dEdq, &
+      & region_gradient, region_sigma, self%pair3, exclusive=.true.)
+
+   energy = self%environment_energy + sum(energies)
+
+   if (grad) then
+      gradient(:, :) = 0.0_wp
+      gradient(:, self%region) = region_gradient
+
+      allocate(cluster_dEdcn(size(cluster)), cluster_gradient(3, size(cluster)), &
+         & source=0.0_wp)
+      cluster_dEdcn(position) = dEdcn
+      sigma(:, :) = 0.0_wp
+      call get_lattice_points(sub%periodic, sub%lattice, cutoff%cn, lattr)
+      call add_coordination_number_derivs(sub, lattr, cutoff%cn, disp%rcov, disp%en, &
+         & cluster_dEdcn, cluster_gradient, sigma)
+      gradient(:, self%region) = gradient(:, self%region) + cluster_gradient(:, position)
+   end if
+
+end subroutine get_dispersion
+
+
+!> Select the region atoms and all atoms within the coordination number cutoff
+!> of any region atom
+subroutine get_region_cluster(mol, cutoff, region, cluster, position)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Atoms of the moving region
+   integer, intent(in) :: region(:)
+
+   !> Atoms of the cluster
+   integer, allocatable, intent(out) :: cluster(:)
+
+   !> Position of the region atoms in the cluster
+   integer, allocatable, intent(out) :: position(:)
+
+   integer :: ii, iat, jat, itr
+   logical, allocatable :: near(:)
+   real(wp), allocatable :: lattr(:, :)
+
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr)
+   allocate(near(mol%nat), source=.false.)
+   near(region) = .true.
+   do ii = 1, size(region)
+      iat = region(ii)
+      do jat = 1, mol%nat
+         if (near(jat)) cycle
+         do itr = 1, size(lattr, 2)
+            if (sum((mol%xyz(:, iat) - mol%xyz(:, jat) - lattr(:, itr))**2) &
+               & < cutoff%cn**2) then
+               near(jat) = .true.
+               exit
+            end if
+         end do
+      end do
+   end do
+
+   cluster = pack([(iat, iat = 1, mol%nat)], near)
+   allocate(position(size(region)))
+   do ii = 1, size(region)
+      position(ii) = findloc(cluster, region(ii), 1)
+   end do
+
+end subroutine get_region_cluster
+
+
+end module dftd4_embedding
@@ -0,0 +1,846 @@
+! This file is part of dftd4.
+! SPDX-Identifier: LGPL-3.0-or-later
+!
+! dftd4 is free software: you can redistribute it and/or modify it under
+! the terms of the Lesser GNU General Public License as published by
+! the Free Software Foundation, either version 3 of the License, or
+! (at your option) any later version.
+!
+! dftd4 is distributed in the hope that it will be useful,
+! but WITHOUT ANY WARRANTY; without even the implied warranty of
+! MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+! Lesser GNU General Public License for more details.
+!
+! You should have received a copy of the Lesser GNU General Public License
+! along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+
+!> Incremental dispersion energies for Monte Carlo moves.
+!>
+!> A move displaces, inserts or deletes a small set of atoms and returns the
+!> change of the dispersion energy. The move is kept as trial until it is
+!> accepted or rejected, accepting a move applies it to the committed state.
+!>
+!> With frozen coordination numbers and partial charges the C6 coefficients of
+!> the unchanged atoms are kept and only the pairs and triples involving the moved
+!> atoms are evaluated. The trial only records the changes of the move, inserted
+!> atoms obtain their coordination numbers and partial charges from the isolated
+!> inserted fragment and only their rows and columns of the C6 coefficients are
+!> evaluated, using the spare storage of the committed state. Without freezing the
+!> environment changes with every move and the trial state is evaluated completely.
+!>
+!> The real space cutoffs for each pair of species are fixed when the state is
+!> created, such that energy changes of consecutive moves are consistent.
+module dftd4_incremental
+   use dftd4_cutoff, only : realspace_cutoff, get_lattice_points
+   use dftd4_damping, only : damping_param
+   use dftd4_disp, only : get_pair_cutoffs
+   use dftd4_model, only : dispersion_model
+   use dftd4_ncoord, only : get_coordination_number
+   use dftd4_utils, only : new_species_structure
+   use mctc_env, only : wp, error_type, fatal_error
+   use mctc_io, only : structure_type
+   use multicharge, only : get_charges
+   implicit none
+   private
+
+   public :: incremental_dispersion, new_incremental_dispersion
+
+
+   !> Possible kinds of proposed moves
+   type :: enum_move_kind
+      !> No move proposed
+      integer :: none = 0
+      !> Displacement with frozen environment
+      integer :: displacement = 1
+      !> Insertion with frozen environment
+      integer :: insertion = 2
+      !> Deletion with frozen environment
+      integer :: deletion = 3
+      !> Completely evaluated trial state
+      integer :: complete = 4
+   end type enum_move_kind
+
+   !> Actual enumerator for the kinds of proposed moves
+   type(enum_move_kind), parameter :: move_kind = enum_move_kind()
+
+
+   !> Cached quantities of a structure, the arrays can hold more atoms than the
+   !> structure to append inserted atoms without reallocation
+   type :: incremental_state
+      !> Molecular structure data
+      type(structure_type) :: mol
+      !> Dispersion energy
+      real(wp) :: energy = 0.0_wp
+      !> Coordination numbers
+      real(wp), allocatable :: cn(:)
+      !> Partial charges
+      real(wp), allocatable :: q(:)
+      !> Reference weights for the additive dispersion
+      real(wp), allocatable :: gwvec2(:, :, :)
+      !> Reference weights for the non-additive dispersion
+      real(wp), allocatable :: gwvec3(:, :, :)
+      !> C6 coefficients for the additive dispersion
+      real(wp), allocatable :: c6_2(:, :)
+      !> C6 coefficients for the non-additive dispersion
+      real(wp), allocatable :: c6_3(:, :)
+   end type incremental_state
+
+
+   !> Changes of a proposed move w.r.t. the committed state
+   type :: incremental_move
+      !> Kind of the proposed move
+      integer :: kind = move_kind%none
+      !> Change of the dispersion energy
+      real(wp) :: delta = 0.0_wp
+      !> Displaced or deleted atoms
+      integer, allocatable :: atoms(:)
+      !> New cartesian coordinates of the displaced atoms
+      real(wp), allocatable :: xyz(:, :)
+      !> Structure after the insertion
+      type(structure_type) :: mol
+      !> Completely evaluated trial state
+      type(incremental_state) :: state
+   end type incremental_move
+
+
+   !> Dispersion energy of a structure with incremental updates for trial moves
+   type :: incremental_dispersion
+      private
+      !> Committed state
+      type(incremental_state) :: current
+      !> Proposed move
+      type(incremental_move) :: trial
+      !> Real space cutoff for each pair of species in the additive dispersion
+      real(wp), allocatable :: pair2(:, :)
+      !> Real space cutoff for each pair of species in the non-additive dispersion
+      real(wp), allocatable :: pair3(:, :)
+      !> Long-range tail of the additive dispersion per unit C6 for each pair of species
+      real(wp), allocatable :: tail(:, :)
+   contains
+      !> Displace a set of atoms
+      procedure :: propose_displacement
+      !> Insert a set of atoms
+      procedure :: propose_insertion
+      !> Delete a set of atoms
+      procedure :: propose_deletion
+      !> Commit the proposed move
+      procedure :: accept_move
+      !> Discard the proposed move
+      procedure :: reject_move
+      !> Dispersion energy of the committed state
+      procedure :: get_energy
+      !> Number of atoms in the committed state
+      procedure :: get_natoms
+   end type incremental_dispersion
+
+
+contains
+
+
+!> Create a new incremental dispersion state from a complete evaluation
+subroutine new_incremental_dispersion(error, self, mol, disp, param, cutoff)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Incremental dispersion state
+   type(incremental_dispersion), intent(out) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   if (.not. allocated(disp%mchrg)) then
+      call fatal_error(error, "Not supported for non-self-consistent D4 version")
+      return
+   end if
+
+   if (cutoff%tolerance > 0.0_wp) then
+      allocate(self%pair2(mol%nid, mol%nid), self%pair3(mol%nid, mol%nid))
+      call get_pair_cutoffs(mol, disp, param, cutoff, self%pair2, self%pair3)
+   end if
+
+   allocate(self%tail(mol%nid, mol%nid))
+   call get_tail_table(mol, disp, param, cutoff, self%pair2, self%tail)
+
+   self%current%mol = mol
+   call new_state(error, self%current, disp, param, cutoff, self%pair2, self%pair3)
+
+end subroutine new_incremental_dispersion
+
+
+!> Propose new positions for a set of atoms
+subroutine propose_displacement(self, error, disp, param, cutoff, atoms, xyz, frozen, &
+      & delta)
+
+   !> Incremental dispersion state
+   class(incremental_dispersion), intent(inout) :: self
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Indices of the displaced atoms
+   integer, intent(in) :: atoms(:)
+
+   !> New cartesian coordinates of the displaced atoms
+   real(wp), intent(in) :: xyz(:, :)
+
+   !> Keep coordination numbers and partial charges of all atoms
+   logical, intent(in) :: frozen
+
+   !> Change of the dispersion energy
+   real(wp), intent(out) :: delta
+
+   real(wp), allocatable :: xyz0(:, :)
+   type(incremental_state) :: trial
+
+   delta = 0.0_wp
+   self%trial%kind = move_kind%none
+   call check_atoms(error, self%current%mol, atoms)
+   if (allocated(error)) return
+   if (any(shape(xyz) /= [3, size(atoms)])) then
+      call fatal_error(error, "Number of displaced atoms and positions does not match")
+      return
+   end if
+
+   if (frozen) then
+      ! The C6 coefficients do not change, the energy is evaluated for the new
+      ! positions in place and the old positions are restored afterwards
+      associate(current => self%current)
+         xyz0 = current%mol%xyz(:, atoms)
+         delta = -get_touched_energy(current, current%mol, disp, param, cutoff, &
+            & self%pair2, self%pair3, atoms)
+         current%mol%xyz(:, atoms) = xyz
+         delta = delta + get_touched_energy(current, current%mol, disp, param, cutoff, &
+            & self%pair2, self%pair3, atoms)
+         current%mol%xyz(:, atoms) = xyz0
+      end associate
+      self%trial%atoms = atoms
+      self%trial%xyz = xyz
+      self%trial%kind = move_kind%displacement
+   else
+      trial%mol = self%current%mol
+      trial%mol%xyz(:, atoms) = xyz
+      call new_state(error, trial, disp, param, cutoff, self%pair2, self%pair3)
+      if (allocated(error)) return
+      delta = trial%energy - self%current%energy
+      call move_state(trial, self%trial%state)
+      self%trial%kind = move_kind%complete
+   end if
+   self%trial%delta = delta
+
+end subroutine propose_displacement
+
+
+!> Propose the insertion of a set of atoms, the inserted atoms are appended
+subroutine propose_insertion(self, error, disp, param, cutoff, num, xyz, frozen, delta)
+
+   !> Incremental dispersion state
+   class(incremental_dispersion), intent(inout) :: self
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Atomic numbers of the inserted atoms
+   integer, intent(in) :: num(:)
+
+   !> Cartesian coordinates of the inserted atoms
+   real(wp), intent(in) :: xyz(:, :)
+
+   !> Keep coordination numbers and partial charges of all atoms
+   logical, intent(in) :: frozen
+
+   !> Change of the dispersion energy
+   real(wp), intent(out) :: delta
+
+   integer :: iat, nat
+   integer, allocatable :: id(:), inserted(:)
+   type(incremental_state) :: trial, fragment
+
+   delta = 0.0_wp
+   self%trial%kind = move_kind%none
+   if (size(num) < 1 .or. any(shape(xyz) /= [3, size(num)])) then
+      call fatal_error(error, "Number of inserted atoms and positions does not match")
+      return
+   end if
+
+   associate(mol => self%current%mol)
+      allocate(id(size(num)))
+      do iat = 1, size(num)
+         id(iat) = findloc(mol%num, num(iat), 1)
+      end do
+      if (any(id == 0)) then
+         call fatal_error(error, "Inserted species is not available in the dispersion model")
+         return
+      end if
+
+      nat = mol%nat + size(num)
+      call new_species_structure(trial%mol, mol, [mol%id, id], &
+         & reshape([mol%xyz, xyz], [3, nat]))
+      call new_species_structure(fragment%mol, mol, id, xyz)
+   end associate
+   inserted = [(iat, iat = self%current%mol%nat + 1, nat)]
+
+   if (frozen) then
+      call new_environment(error, fragment, disp, cutoff)
+      if (allocated(error)) return
+
+      ! The inserted atoms are stored behind the committed atoms, which keeps the
+      ! committed state intact until the move is accepted
+      associate(current => self%current)
+         call reserve_state(current, nat)
+         current%cn(inserted) = fragment%cn
+         current%q(inserted) = fragment%q
+         current%gwvec2(:, inserted, :) = fragment%gwvec2
+         current%gwvec3(:, inserted, :) = fragment%gwvec3
+         call disp%update_atomic_c6(trial%mol, inserted, current%gwvec2(:, :nat, :), &
+            & c6=current%c6_2(:nat, :nat))
+         call disp%update_atomic_c6(trial%mol, inserted, current%gwvec3(:, :nat, :), &
+            & c6=current%c6_3(:nat, :nat))
+
+         delta = get_touched_energy(current, trial%mol, disp, param, cutoff, &
+            & self%pair2, self%pair3, inserted) &
+            & + get_touched_tail(current, trial%mol, self%tail, inserted)
+      end associate
+      call move_alloc(inserted, self%trial%atoms)
+      self%trial%mol = trial%mol
+      self%trial%kind = move_kind%insertion
+   else
+      call new_state(error, trial, disp, param, cutoff, self%pair2, self%pair3)
+      if (allocated(error)) return
+      delta = trial%energy - self%current%energy
+      call move_state(trial, self%trial%state)
+      self%trial%kind = move_kind%complete
+   end if
+   self%trial%delta = delta
+
+end subroutine propose_insertion
+
+
+!> Propose the deletion of a set of atoms, the order of the remaining atoms is kept
+subroutine propose_deletion(self, error, disp, param, cutoff, atoms, frozen, delta)
+
+   !> Incremental dispersion state
+   class(incremental_dispersion), intent(inout) :: self
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Indices of the deleted atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Keep coordination numbers and partial charges of all atoms
+   logical, intent(in) :: frozen
+
+   !> Change of the dispersion energy
+   real(wp), intent(out) :: delta
+
+   integer :: iat
+   integer, allocatable :: kept(:)
+   logical, allocatable :: keep(:)
+   type(incremental_state) :: trial
+
+   delta = 0.0_wp
+   self%trial%kind = move_kind%none
+   call check_atoms(error, self%current%mol, atoms)
+   if (allocated(error)) return
+   if (size(atoms) >= self%current%mol%nat) then
+      call fatal_error(error, "Cannot delete all atoms of the structure")
+      return
+   end if
+
+   if (frozen) then
+      associate(current => self%current)
+         delta = -get_touched_energy(current, current%mol, disp, param, cutoff, &
+            & self%pair2, self%pair3, atoms) &
+            & - get_touched_tail(current, current%mol, self%tail, atoms)
+      end associate
+      self%trial%atoms = atoms
+      self%trial%kind = move_kind%deletion
+   else
+      associate(mol => self%current%mol)
+         allocate(keep(mol%nat), source=.true.)
+         keep(atoms) = .false.
+         kept = pack([(iat, iat = 1, mol%nat)], keep)
+         call new_species_structure(trial%mol, mol, mol%id(kept), mol%xyz(:, kept))
+      end associate
+      call new_state(error, trial, disp, param, cutoff, self%pair2, self%pair3)
+      if (allocated(error)) return
+      delta = trial%energy - self%current%energy
+      call move_state(trial, self%trial%state)
+      self%trial%kind = move_kind%complete
+   end if
+   self%trial%delta = delta
+
+end subroutine propose_deletion
+
+
+!> Commit the proposed move as new state
+subroutine accept_move(self, error)
+
+   !> Incremental dispersion state
+   class(incremental_dispersion), intent(inout) :: self
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   associate(current => self%current, trial => self%trial)
+      select case(trial%kind)
+      case default
+         call fatal_error(error, "No proposed move to accept")
+         return
+      case(move_kind%displacement)
+         current%mol%xyz(:, trial%atoms) = trial%xyz
+         current%energy = current%energy + trial%delta
+      case(move_kind%insertion)
+         current%mol = trial%mol
+         current%energy = current%energy + trial%delta
+      case(move_kind%deletion)
+         call remove_atoms(current, trial%atoms)
+         current%energy = current%energy + trial%delta
+      case(move_kind%complete)
+         call move_state(trial%state, current)
+      end select
+      trial%kind = move_kind%none
+   end associate
+
+end subroutine accept_move
+
+
+!> Discard the proposed move and keep the current state
+subroutine reject_move(self)
+
+   !> Incremental dispersion state
+   class(incremental_dispersion), intent(inout) :: self
+
+   self%trial%kind = move_kind%none
+
+end subroutine reject_move
+
+
+!> Dispersion energy of the committed state
+pure function get_energy(self) result(energy)
+
+   !> Incremental dispersion state
+   class(incremental_dispersion), intent(in) :: self
+
+   !> Dispersion energy
+   real(wp) :: energy
+
+   energy = self%current%energy
+
+end function get_energy
+
+
+!> Number of atoms in the committed state
+pure function get_natoms(self) result(nat)
+
+   !> Incremental dispersion state
+   class(incremental_dispersion), intent(in) :: self
+
+   !> Number of atoms
+   integer :: nat
+
+   nat = self%current%mol%nat
+
+end function get_natoms
+
+
+!> Evaluate coordination numbers, partial charges, C6 coefficients and the complete
+!> dispersion energy of a structure
+subroutine new_state(error, state, disp, param, cutoff, pair2, pair3)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Cached quantities of the structure
+   type(incremental_state), intent(inout) :: state
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Real space cutoff for each pair of species in the additive dispersion
+   real(wp), allocatable, intent(in) :: pair2(:, :)
+
+   !> Real space cutoff for each pair of species in the non-additive dispersion
+   real(wp), allocatable, intent(in) :: pair3(:, :)
+
+   real(wp), allocatable :: energies(:), lattr(:, :)
+   real(wp) :: cutoff2, cutoff3
+
+   call new_environment(error, state, disp, cutoff)
+   if (allocated(error)) return
+
+   associate(mol => state%mol)
+      allocate(state%c6_2(mol%nat, mol%nat), state%c6_3(mol%nat, mol%nat))
+      call disp%get_atomic_c6(mol, state%gwvec2, c6=state%c6_2)
+      call disp%get_atomic_c6(mol, state%gwvec3, c6=state%c6_3)
+
+      allocate(energies(mol%nat), source=0.0_wp)
+      cutoff2 = cutoff%disp2
+      if (allocated(pair2)) cutoff2 = maxval(pair2)
+      call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr)
+      call param%get_dispersion2(mol, lattr, cutoff2, cutoff%width2, disp%r4r2, &
+         & state%c6_2, energy=energies, pair_cutoff=pair2)
+
+      cutoff3 = cutoff%disp3
+      if (allocated(pair3)) cutoff3 = maxval(pair3)
+      call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr)
+      call param%get_dispersion3(mol, lattr, cutoff3, cutoff%width3, disp%r4r2, &
+         & state%c6_3, energy=energies, pair_cutoff=pair3)
+
+      if (cutoff%tail) then
+         call param%get_dispersion2_tail(mol, cutoff2, cutoff%width2, disp%r4r2, &
+            & state%c6_2, energy=energies, pair_cutoff=pair2)
+      end if
+   end associate
+
+   state%energy = sum(energies)
+
+end subroutine new_state
+
+
+!> Evaluate coordination numbers, partial charges and reference weights
+subroutine new_environment(error, state, disp, cutoff)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Cached quantities of the structure
+   type(incremental_state), intent(inout) :: state
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   integer :: mref
+   real(wp), allocatable :: lattr(:, :), q(:)
+
+   mref = maxval(disp%ref)
+   associate(mol => state%mol)
+      allocate(state%cn(mol%nat))
+      call get_lattice_points(mol%periodic, mol%lattice, cutoff%cn, lattr)
+      call get_coordination_number(mol, lattr, cutoff%cn, disp%rcov, disp%en, state%cn)
+
+      allocate(state%q(mol%nat))
+      call get_charges(disp%mchrg, mol, error, state%q)
+      if (allocated(error)) return
+
+      allocate(state%gwvec2(mref, mol%nat, disp%ncoup), state%gwvec3(mref, mol%nat, disp%ncoup))
+      call disp%weight_references(mol, state%cn, state%q, state%gwvec2)
+      allocate(q(mol%nat), source=0.0_wp)
+      call disp%weight_references(mol, state%cn, q, state%gwvec3)
+   end associate
+
+end subroutine new_environment
+
+
+!> Energy of all interactions involving at least one of the selected atoms, the
+!> structure can contain inserted atoms beyond the committed atoms of the state
+function get_touched_energy(state, mol, disp, param, cutoff, pair2, pair3, atoms) &
+      & result(energy)
+
+   !> Cached quantities of the structure
+   type(incremental_state), intent(in) :: state
+
+   !> Molecular structure data
+   type(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Real space cutoff for each pair of species in the additive dispersion
+   real(wp), allocatable, intent(in) :: pair2(:, :)
+
+   !> Real space cutoff for each pair of species in the non-additive dispersion
+   real(wp), allocatable, intent(in) :: pair3(:, :)
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Dispersion energy
+   real(wp) :: energy
+
+   real(wp), allocatable :: energies(:), lattr(:, :)
+   real(wp) :: cutoff2, cutoff3
+
+   allocate(energies(size(atoms)), source=0.0_wp)
+
+   cutoff2 = cutoff%disp2
+   if (allocated(pair2)) cutoff2 = maxval(pair2)
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff2, lattr)
+   call param%get_atomic_dispersion2(mol, lattr, cutoff2, cutoff%width2, disp%r4r2, &
+      & state%c6_2(:mol%nat, :mol%nat), atoms=atoms, energy=energies, &
+      & pair_cutoff=pair2, exclusive=.true.)
+
+   cutoff3 = cutoff%disp3
+   if (allocated(pair3)) cutoff3 = maxval(pair3)
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff3, lattr)
+   call param%get_atomic_dispersion3(mol, lattr, cutoff3, cutoff%width3, disp%r4r2, &
+      & state%c6_3(:mol%nat, :mol%nat), atoms=atoms, energy=energies, &
+      & pair_cutoff=pair3, exclusive=.true.)
+
+   energy = sum(energies)
+
+end function get_touched_energy
+
+
+!> Long-range tail of all pairs involving at least one of the selected atoms
+function get_touched_tail(state, mol, tail, atoms) result(energy)
+
+   !> Cached quantities of the structure
+   type(incremental_state), intent(in) :: state
+
+   !> Molecular structure data
+   type(structure_type), intent(in) :: mol
+
+   !> Long-range tail per unit C6 for each pair of species
+   real(wp), intent(in) :: tail(:, :)
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Dispersion energy
+   real(wp) :: energy
+
+   integer :: ii, iat, jat
+   logical, allocatable :: selected(:)
+
+   allocate(selected(mol%nat), source=.false.)
+   selected(atoms) = .true.
+
+   ! Pairs between two selected atoms are only counted once
+   energy = 0.0_wp
+   do ii = 1, size(atoms)
+      iat = atoms(ii)
+      do jat = 1, mol%nat
+         energy = energy + merge(1.0_wp, 2.0_wp, selected(jat)) &
+            & * state%c6_2(jat, iat) * tail(mol%id(jat), mol%id(iat))
+      end do
+   end do
+
+end function get_touched_tail
+
+
+!> Long-range tail of the additive dispersion per unit C6 for each pair of species,
+!> obtained from a structure containing every species once
+subroutine get_tail_table(mol, disp, param, cutoff, pair2, tail)
+
+   !> Molecular structure data
+   type(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Real space cutoff for each pair of species in the additive dispersion
+   real(wp), allocatable, intent(in) :: pair2(:, :)
+
+   !> Long-range tail per unit C6 for each pair of species
+   real(wp), intent(out) :: tail(:, :)
+
+   integer :: isp
+   real(wp) :: cutoff2
+   real(wp), allocatable :: c6(:, :), xyz(:, :)
+   type(structure_type) :: species
+
+   tail(:, :) = 0.0_wp
+   if (.not.cutoff%tail) return
+
+   cutoff2 = cutoff%disp2
+   if (allocated(pair2)) cutoff2 = maxval(pair2)
+   allocate(xyz(3, mol%nid), source=0.0_wp)
+   allocate(c6(mol%nid, mol%nid), source=1.0_wp)
+   call new_species_structure(species, mol, [(isp, isp = 1, mol%nid)], xyz)
+   call param%get_pairwise_dispersion2_tail(species, cutoff2, cutoff%width2, &
+      & disp%r4r2, c6, tail, pair_cutoff=pair2)
+
+end subroutine get_tail_table
+
+
+!> Ensure the cached quantities can hold a number of atoms, the quantities of the
+!> atoms in the structure are kept
+subroutine reserve_state(state, nat)
+
+   !> Cached quantities of the structure
+   type(incremental_state), intent(inout) :: state
+
+   !> Required number of atoms
+   integer, intent(in) :: nat
+
+   integer :: cap, nold
+   real(wp), allocatable :: tmp1(:), tmp2(:, :), tmp3(:, :, :)
+
+   if (nat <= size(state%cn)) return
+   cap = max(nat, 2*size(state%cn))
+   nold = state%mol%nat
+
+   allocate(tmp1(cap))
+   tmp1(:nold) = state%cn(:nold)
+   call move_alloc(tmp1, state%cn)
+   allocate(tmp1(cap))
+   tmp1(:nold) = state%q(:nold)
+   call move_alloc(tmp1, state%q)
+
+   allocate(tmp3(size(state%gwvec2, 1), cap, size(state%gwvec2, 3)))
+   tmp3(:, :nold, :) = state%gwvec2(:, :nold, :)
+   call move_alloc(tmp3, state%gwvec2)
+   allocate(tmp3(size(state%gwvec3, 1), cap, size(state%gwvec3, 3)))
+   tmp3(:, :nold, :) = state%gwvec3(:, :nold, :)
+   call move_alloc(tmp3, state%gwvec3)
+
+   allocate(tmp2(cap, cap))
+   tmp2(:nold, :nold) = state%c6_2(:nold, :nold)
+   call move_alloc(tmp2, state%c6_2)
+   allocate(tmp2(cap, cap))
+   tmp2(:nold, :nold) = state%c6_3(:nold, :nold)
+   call move_alloc(tmp2, state%c6_3)
+
+end subroutine reserve_state
+
+
+!> Remove atoms from the cached quantities, the order of the remaining atoms is kept
+subroutine remove_atoms(state, atoms)
+
+   !> Cached quantities of the structure
+   type(incremental_state), intent(inout) :: state
+
+   !> Removed atoms
+   integer, intent(in) :: atoms(:)
+
+   integer :: iat, ii, jj
+   integer, allocatable :: kept(:)
+   logical, allocatable :: keep(:)
+   type(structure_type) :: mol
+
+   associate(nat => state%mol%nat)
+      allocate(keep(nat), source=.true.)
+      keep(atoms) = .false.
+      kept = pack([(iat, iat = 1, nat)], keep)
+   end associate
+
+   ! Kept atoms never move to a later position, copying in ascending order
+   ! only reads entries which were not overwritten yet
+   do ii = 1, size(kept)
+      state%cn(ii) = state%cn(kept(ii))
+      state%q(ii) = state%q(kept(ii))
+      state%gwvec2(:, ii, :) = state%gwvec2(:, kept(ii), :)
+      state%gwvec3(:, ii, :) = state%gwvec3(:, kept(ii), :)
+   end do
+   do jj = 1, size(kept)
+      do ii = 1, size(kept)
+         state%c6_2(ii, jj) = state%c6_2(kept(ii), kept(jj))
+         state%c6_3(ii, jj) = state%c6_3(kept(ii), kept(jj))
+      end do
+   end do
+
+   call new_species_structure(mol, state%mol, state%mol%id(kept), state%mol%xyz(:, kept))
+   state%mol = mol
+
+end subroutine remove_atoms
+
+
+!> Transfer the trial state to the current state
+subroutine move_state(from, to)
+
+   !> Trial state
+   type(incremental_state), intent(inout) :: from
+
+   !> Current state
+   type(incremental_state), intent(inout) :: to
+
+   to%mol = from%mol
+   to%energy = from%energy
+   call move_alloc(from%cn, to%cn)
+   call move_alloc(from%q, to%q)
+   call move_alloc(from%gwvec2, to%gwvec2)
+   call move_alloc(from%gwvec3, to%gwvec3)
+   call move_alloc(from%c6_2, to%c6_2)
+   call move_alloc(from%c6_3, to%c6_3)
+
+end subroutine move_state
+
+
+!> Check that all selected atoms exist and are unique
+subroutine check_atoms(error, mol, atoms)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Molecular structure data
+   type(structure_type), intent(in) :: mol
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   integer :: iat
+
+   if (size(atoms) < 1 .or. any(atoms < 1) .or. any(atoms > mol%nat)) then
+      call fatal_error(error, "Invalid atom index in move")
+      return
+   end if
+   do iat = 2, size(atoms)
+      if (any(atoms(:iat-1) == atoms(iat))) then
+         call fatal_error(error, "Atom is selected more than once in move")
+         return
+      end if
+   end do
+
+end subroutine check_atoms
+
+
+end module dftd4_incremental
@@ -16,6 +16,7 @@
 
 !> Re-export of all dispersion models
 module dftd4_model
+   use dftd4_model_cache, only : prewarm_reference_cache, clear_reference_cache
    use dftd4_model_d4, only : d4_model, new_d4_model
    use dftd4_model_d4s, only : d4s_model, new_d4s_model
    use dftd4_model_type, only : dispersion_model, d4_qmod
@@ -29,6 +30,7 @@ module dftd4_model
    public :: d4_model, new_d4_model
    public :: d4s_model, new_d4s_model
    public :: new_dispersion_model
+   public :: prewarm_reference_cache, clear_reference_cache
 
 
 contains
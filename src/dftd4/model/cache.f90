@@ -0,0 +1,297 @@
+! This file is part of dftd4.
+! SPDX-Identifier: LGPL-3.0-or-later
+!
+! dftd4 is free software: you can redistribute it and/or modify it under
+! the terms of the Lesser GNU General Public License as published by
+! the Free Software Foundation, either version 3 of the License, or
+! (at your option) any later version.
+!
+! dftd4 is distributed in the hope that it will be useful,
+! but WITHOUT ANY WARRANTY; without even the implied warranty of
+! MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+! Lesser GNU General Public License for more details.
+!
+! You should have received a copy of the Lesser GNU General Public License
+! along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+
+!> Process wide cache for the reference polarizabilities and the Casimir-Polder
+!> integrated reference C6 coefficients.
+!>
+!> The reference data only depends on the elements, the charge scaling parameters
+!> and the reference charge model, but not on the actual structure. Entries are
+!> created on first use for every element and element pair and shared by all
+!> dispersion models constructed afterwards. Access to the cache is guarded by
+!> a named critical section, such that models can be created from several threads.
+module dftd4_model_cache
+   use dftd4_model_type, only : d4_qmod
+   use dftd4_model_utils, only : trapzd
+   use dftd4_reference, only : get_nref, set_refalpha_eeq, set_refalpha_eeqbc, &
+      & set_refalpha_gfn2
+   use mctc_env, only : wp
+   use mctc_io_constants, only : pi
+   implicit none
+   private
+
+   public :: get_reference_c6, prewarm_reference_cache, clear_reference_cache
+
+
+   !> Largest element with reference data
+   integer, parameter :: max_elem = 118
+
+   !> Maximum number of reference systems per element
+   integer, parameter :: max_ref = 7
+
+   !> Default maximum charge scaling height for partial charge extrapolation
+   real(wp), parameter :: ga_default = 3.0_wp
+
+   !> Default charge scaling steepness for partial charge extrapolation
+   real(wp), parameter :: gc_default = 2.0_wp
+
+
+   !> Reference data for one set of charge scaling parameters and charge model
+   type :: reference_table
+
+      !> Charge scaling height
+      real(wp) :: ga
+
+      !> Charge scaling steepness
+      real(wp) :: gc
+
+      !> Charge model of the reference polarizabilities
+      integer :: qmod
+
+      !> Reference polarizabilities available for an element
+      logical, allocatable :: has_alpha(:)
+
+      !> Reference C6 coefficients available for an element pair
+      logical, allocatable :: has_c6(:, :)
+
+      !> Reference dynamic polarizabilities: [23, max_ref, max_elem]
+      real(wp), allocatable :: aiw(:, :, :)
+
+      !> Reference C6 coefficients: [max_ref, max_ref, max_elem, max_elem]
+      real(wp), allocatable :: c6(:, :, :, :)
+
+   end type reference_table
+
+
+   !> Reference tables created so far
+   type(reference_table), allocatable, save :: tables(:)
+
+
+contains
+
+
+!> Gather reference polarizabilities and C6 coefficients for a list of species,
+!> missing entries are evaluated and stored in the cache.
+subroutine get_reference_c6(num, ga, gc, qmod, aiw, c6)
+
+   !> Atomic numbers of all species
+   integer, intent(in) :: num(:)
+
+   !> Charge scaling height
+   real(wp), intent(in) :: ga
+
+   !> Charge scaling steepness
+   real(wp), intent(in) :: gc
+
+   !> Charge model of the reference polarizabilities
+   integer, intent(in) :: qmod
+
+   !> Reference dynamic polarizabilities: [23, mref, nid]
+   real(wp), intent(out) :: aiw(:, :, :)
+
+   !> Reference C6 coefficients: [mref, mref, nid, nid]
+   real(wp), intent(out) :: c6(:, :, :, :)
+
+   integer :: it, isp, jsp, izp, jzp, mref
+
+   mref = size(c6, 1)
+   aiw(:, :, :) = 0.0_wp
+   c6(:, :, :, :) = 0.0_wp
+
+   !$omp critical (dftd4_reference_cache)
+   call get_table(ga, gc, qmod, it)
+   associate(table => tables(it))
+      do isp = 1, size(num)
+         izp = num(isp)
+         if (izp < 1 .or. izp > max_elem) cycle
+         call add_alpha(table, izp)
+         aiw(:, :min(mref, max_ref), isp) = table%aiw(:, :min(mref, max_ref), izp)
+      end do
+
+      do isp = 1, size(num)
+         izp = num(isp)
+         if (izp < 1 .or. izp > max_elem) cycle
+         do jsp = 1, isp
+            jzp = num(jsp)
+            if (jzp < 1 .or. jzp > max_elem) cycle
+            call add_c6(table, izp, jzp)
+            c6(:min(mref, max_ref), :min(mref, max_ref), isp, jsp) = &
+               & table%c6(:min(mref, max_ref), :min(mref, max_ref), izp, jzp)
+            c6(:min(mref, max_ref), :min(mref, max_ref), jsp, isp) = &
+               & table%c6(:min(mref, max_ref), :min(mref, max_ref), jzp, izp)
+         end do
+      end do
+   end associate
+   !$omp end critical (dftd4_reference_cache)
+
+end subroutine get_reference_c6
+
+
+!> Evaluate the reference data for all pairs of the given elements ahead of time,
+!> dispersion models created for these elements afterwards only gather the data.
+subroutine prewarm_reference_cache(num, ga, gc, qmod)
+
+   !> Atomic numbers of all elements
+   integer, intent(in) :: num(:)
+
+   !> Charge scaling height
+   real(wp), intent(in), optional :: ga
+
+   !> Charge scaling steepness
+   real(wp), intent(in), optional :: gc
+
+   !> Charge model of the reference polarizabilities
+   integer, intent(in), optional :: qmod
+
+   integer :: it, ii, jj
+   real(wp) :: ga_, gc_
+   integer :: qmod_
+
+   ga_ = ga_default
+   if (present(ga)) ga_ = ga
+   gc_ = gc_default
+   if (present(gc)) gc_ = gc
+   qmod_ = d4_qmod%eeq
+   if (present(qmod)) qmod_ = qmod
+
+   !$omp critical (dftd4_reference_cache)
+   call get_table(ga_, gc_, qmod_, it)
+   do ii = 1, size(num)
+      if (num(ii) < 1 .or. num(ii) > max_elem) cycle
+      do jj = 1, ii
+         if (num(jj) < 1 .or. num(jj) > max_elem) cycle
+         call add_c6(tables(it), num(ii), num(jj))
+      end do
+   end do
+   !$omp end critical (dftd4_reference_cache)
+
+end subroutine prewarm_reference_cache
+
+
+!> Release all cached reference data
+subroutine clear_reference_cache
+
+   !$omp critical (dftd4_reference_cache)
+   if (allocated(tables)) deallocate(tables)
+   !$omp end critical (dftd4_reference_cache)
+
+end subroutine clear_reference_cache
+
+
+!> Find the reference table for a set of parameters or create a new one,
+!> must be called from within the critical section.
+subroutine get_table(ga, gc, qmod, it)
+
+   !> Charge scaling height
+   real(wp), intent(in) :: ga
+
+   !> Charge scaling steepness
+   real(wp), intent(in) :: gc
+
+   !> Charge model of the reference polarizabilities
+   integer, intent(in) :: qmod
+
+   !> Index of the reference table
+   integer, intent(out) :: it
+
+   type(reference_table), allocatable :: tmp(:)
+
+   if (.not.allocated(tables)) allocate(tables(0))
+
+   do it = 1, size(tables)
+      if (tables(it)%ga == ga .and. tables(it)%gc == gc &
+         & .and. tables(it)%qmod == qmod) return
+   end do
+
+   allocate(tmp(size(tables) + 1))
+   tmp(:size(tables)) = tables
+   call move_alloc(tmp, tables)
+
+   it = size(tables)
+   tables(it)%ga = ga
+   tables(it)%gc = gc
+   tables(it)%qmod = qmod
+   allocate(tables(it)%has_alpha(max_elem), source=.false.)
+   allocate(tables(it)%has_c6(max_elem, max_elem), source=.false.)
+   allocate(tables(it)%aiw(23, max_ref, max_elem))
+   allocate(tables(it)%c6(max_ref, max_ref, max_elem, max_elem))
+
+end subroutine get_table
+
+
+!> Evaluate the reference polarizabilities of an element if not yet available
+subroutine add_alpha(table, izp)
+
+   !> Reference table
+   type(reference_table), intent(inout) :: table
+
+   !> Atomic number
+   integer, intent(in) :: izp
+
+   if (table%has_alpha(izp)) return
+
+   select case(table%qmod)
+   case default
+      table%aiw(:, :, izp) = 0.0_wp
+   case(d4_qmod%eeq)
+      call set_refalpha_eeq(table%aiw(:, :, izp), table%ga, table%gc, izp)
+   case(d4_qmod%eeqbc)
+      call set_refalpha_eeqbc(table%aiw(:, :, izp), table%ga, table%gc, izp)
+   case(d4_qmod%gfn2)
+      call set_refalpha_gfn2(table%aiw(:, :, izp), table%ga, table%gc, izp)
+   end select
+   table%has_alpha(izp) = .true.
+
+end subroutine add_alpha
+
+
+!> Integrate the reference C6 coefficients of an element pair if not yet available
+subroutine add_c6(table, izp, jzp)
+
+   !> Reference table
+   type(reference_table), intent(inout) :: table
+
+   !> Atomic number of the first element
+   integer, intent(in) :: izp
+
+   !> Atomic number of the second element
+   integer, intent(in) :: jzp
+
+   integer :: iref, jref
+   real(wp) :: aiw(23), c6
+   real(wp), parameter :: thopi = 3.0_wp/pi
+
+   if (table%has_c6(izp, jzp)) return
+
+   call add_alpha(table, izp)
+   call add_alpha(table, jzp)
+
+   table%c6(:, :, izp, jzp) = 0.0_wp
+   table%c6(:, :, jzp, izp) = 0.0_wp
+   do iref = 1, get_nref(izp)
+      do jref = 1, get_nref(jzp)
+         aiw(:) = table%aiw(:, iref, izp) * table%aiw(:, jref, jzp)
+         c6 = thopi * trapzd(aiw)
+         table%c6(iref, jref, izp, jzp) = c6
+         table%c6(jref, iref, jzp, izp) = c6
+      end do
+   end do
+   table%has_c6(izp, jzp) = .true.
+   table%has_c6(jzp, izp) = .true.
+
+end subroutine add_c6
+
+
+end module dftd4_model_cache
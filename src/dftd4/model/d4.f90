@@ -20,14 +20,14 @@ module dftd4_model_d4
    use, intrinsic :: iso_fortran_env, only : output_unit, error_unit
    use dftd4_data, only : get_covalent_rad, get_r4r2_val, get_effective_charge, &
       get_electronegativity, get_hardness
+   use dftd4_model_cache, only : get_reference_c6
    use dftd4_model_type, only : dispersion_model, d4_qmod
-   use dftd4_model_utils, only : dzeta, is_exceptional, trapzd, weight_cn, zeta
-   use dftd4_reference, only : get_nref, set_refalpha_eeq, set_refalpha_eeqbc, &
-      & set_refalpha_gfn2, set_refcn, set_refgw, set_refq_eeq, set_refq_eeqbc, &
-      & set_refq_gfn2
+   use dftd4_model_utils, only : dzeta, is_exceptional, weight_cn, zeta
+   use dftd4_partition, only : work_partition, owns_pair
+   use dftd4_reference, only : get_nref, set_refcn, set_refgw, set_refq_eeq, &
+      & set_refq_eeqbc, set_refq_gfn2
    use mctc_env, only : error_type, fatal_error, wp
    use mctc_io, only : structure_type
-   use mctc_io_constants, only : pi
    use multicharge, only : new_eeq2019_model, new_eeqbc2025_model
    implicit none
    private
@@ -49,6 +49,12 @@ module dftd4_model_d4
       !> Evaluate C6 coefficient
       procedure :: get_atomic_c6
 
+      !> Update C6 coefficients of all pairs involving selected atoms
+      procedure :: update_atomic_c6
+
+      !> Evaluate C6 coefficients for a list of atom pairs
+      procedure :: get_pair_c6
+
       !> Evaluate atomic polarizabilities
       procedure :: get_polarizabilities
 
@@ -92,10 +98,8 @@ subroutine new_d4_model(error, d4, mol, ga, gc, wf, qmod)
    !> Charge model selection
    integer, intent(in), optional :: qmod
 
-   integer :: isp, izp, iref, jsp, jzp, jref
+   integer :: isp, izp
    integer :: mref, tmp_qmod
-   real(wp) :: aiw(23), c6
-   real(wp), parameter :: thopi = 3.0_wp/pi
 
    ! check for unsupported elements (104 (Rf) - 111 (Rg))
    do isp = 1, mol%nid
@@ -184,7 +188,6 @@ subroutine new_d4_model(error, d4, mol, ga, gc, wf, qmod)
       do isp = 1, mol%nid
          izp = mol%num(isp)
          call set_refq_eeq(d4%q(:, isp), izp)
-         call set_refalpha_eeq(d4%aiw(:, :, isp), d4%ga, d4%gc, izp)
       end do
       ! Setup EEQ model
       call new_eeq2019_model(mol, d4%mchrg, error)
@@ -193,7 +196,6 @@ subroutine new_d4_model(error, d4, mol, ga, gc, wf, qmod)
       do isp = 1, mol%nid
          izp = mol%num(isp)
          call set_refq_eeqbc(d4%q(:, isp), izp)
-         call set_refalpha_eeqbc(d4%aiw(:, :, isp), d4%ga, d4%gc, izp)
       end do
       ! Setup EEQBC model
       call new_eeqbc2025_model(mol, d4%mchrg, error)
@@ -202,7 +204,6 @@ subroutine new_d4_model(error, d4, mol, ga, gc, wf, qmod)
       do isp = 1, mol%nid
          izp = mol%num(isp)
          call set_refq_gfn2(d4%q(:, isp), izp)
-         call set_refalpha_gfn2(d4%aiw(:, :, isp), d4%ga, d4%gc, izp)
       end do
    end select
 
@@ -213,20 +214,7 @@ subroutine new_d4_model(error, d4, mol, ga, gc, wf, qmod)
    end do
 
    allocate(d4%c6(mref, mref, mol%nid, mol%nid))
-   do isp = 1, mol%nid
-      izp = mol%num(isp)
-      do jsp = 1, isp
-         jzp = mol%num(jsp)
-         do iref = 1, d4%ref(isp)
-            do jref = 1, d4%ref(jsp)
-               aiw(:) = d4%aiw(:, iref, isp) * d4%aiw(:, jref, jsp)
-               c6 = thopi * trapzd(aiw)
-               d4%c6(jref, iref, jsp, isp) = c6
-               d4%c6(iref, jref, isp, jsp) = c6
-            end do
-         end do
-      end do
-   end do
+   call get_reference_c6(mol%num(:mol%nid), d4%ga, d4%gc, tmp_qmod, d4%aiw, d4%c6)
 
 end subroutine new_d4_model
 
@@ -378,7 +366,8 @@ end subroutine weight_references
 
 !> Calculate atomic dispersion coefficients and their derivatives w.r.t.
 !> the coordination numbers and atomic partial charges.
-subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq, &
+      & partition)
    !DEC$ ATTRIBUTES DLLEXPORT :: get_atomic_c6
 
    !> Instance of the dispersion model
@@ -405,6 +394,10 @@ subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
    !> Derivative of the C6 w.r.t. the partial charge
    real(wp), intent(out), optional :: dc6dq(:, :)
 
+   !> Work partition of the atom pairs, only the pairs owned by this part
+   !> are evaluated and all other entries are zero
+   type(work_partition), intent(in), optional :: partition
+
    integer :: iat, jat, izp, jzp, iref, jref
    real(wp) :: refc6, dc6, dc6dcni, dc6dcnj, dc6dqi, dc6dqj
 
@@ -415,12 +408,13 @@ subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
       dc6dq(:, :) = 0.0_wp
 
       !$omp parallel do default(none) schedule(runtime) &
-      !$omp shared(c6, dc6dcn, dc6dq, mol, self, gwvec, gwdcn, gwdq) &
+      !$omp shared(c6, dc6dcn, dc6dq, mol, self, gwvec, gwdcn, gwdq, partition) &
       !$omp private(iat, jat, izp, jzp, iref, jref, refc6, dc6, dc6dqi, dc6dqj, &
       !$omp& dc6dcni, dc6dcnj)
       do iat = 1, mol%nat
          izp = mol%id(iat)
          do jat = 1, iat
+            if (.not.owns_pair(partition, iat, jat)) cycle
             jzp = mol%id(jat)
             dc6 = 0.0_wp
             dc6dcni = 0.0_wp
@@ -451,11 +445,12 @@ subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
       c6(:, :) = 0.0_wp
 
       !$omp parallel do default(none) schedule(runtime) &
-      !$omp shared(c6, mol, self, gwvec) &
+      !$omp shared(c6, mol, self, gwvec, partition) &
       !$omp private(iat, jat, izp, jzp, iref, jref, refc6, dc6)
       do iat = 1, mol%nat
          izp = mol%id(iat)
          do jat = 1, iat
+            if (.not.owns_pair(partition, iat, jat)) cycle
             jzp = mol%id(jat)
             dc6 = 0.0_wp
             do iref = 1, self%ref(izp)
@@ -473,6 +468,134 @@ subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
 end subroutine get_atomic_c6
 
 
+!> Update atomic dispersion coefficients and their derivatives of all pairs
+!> involving at least one of the selected atoms, all other pairs are kept.
+subroutine update_atomic_c6(self, mol, atoms, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+   !DEC$ ATTRIBUTES DLLEXPORT :: update_atomic_c6
+
+   !> Instance of the dispersion model
+   class(d4_model), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Weighting function for the atomic reference systems
+   real(wp), intent(in) :: gwvec(:, :, :)
+
+   !> Derivative of the weighting function w.r.t. the coordination number
+   real(wp), intent(in), optional :: gwdcn(:, :, :)
+
+   !> Derivative of the weighting function w.r.t. the partial charge
+   real(wp), intent(in), optional :: gwdq(:, :, :)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(inout) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(inout), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charge
+   real(wp), intent(inout), optional :: dc6dq(:, :)
+
+   logical :: grad
+   logical, allocatable :: selected(:)
+   integer :: ii, iat, jat, izp, jzp, iref, jref
+   real(wp) :: refc6, dc6, dc6dcni, dc6dcnj, dc6dqi, dc6dqj
+
+   grad = present(gwdcn).and.present(dc6dcn).and.present(gwdq).and.present(dc6dq)
+   allocate(selected(mol%nat), source=.false.)
+   selected(atoms) = .true.
+
+   ! Every selected atom owns its column, the row is only written for partners
+   ! which are not selected themselves to avoid concurrent updates of a pair
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(c6, dc6dcn, dc6dq, mol, self, atoms, selected, grad, gwvec, gwdcn, gwdq) &
+   !$omp private(ii, iat, jat, izp, jzp, iref, jref, refc6, dc6, dc6dqi, dc6dqj, &
+   !$omp& dc6dcni, dc6dcnj)
+   do ii = 1, size(atoms)
+      iat = atoms(ii)
+      izp = mol%id(iat)
+      do jat = 1, mol%nat
+         jzp = mol%id(jat)
+         dc6 = 0.0_wp
+         dc6dcni = 0.0_wp
+         dc6dcnj = 0.0_wp
+         dc6dqi = 0.0_wp
+         dc6dqj = 0.0_wp
+         do iref = 1, self%ref(izp)
+            do jref = 1, self%ref(jzp)
+               refc6 = self%c6(iref, jref, izp, jzp)
+               dc6 = dc6 + gwvec(iref, iat, 1) * gwvec(jref, jat, 1) * refc6
+               if (.not.grad) cycle
+               dc6dcni = dc6dcni + gwdcn(iref, iat, 1) * gwvec(jref, jat, 1) * refc6
+               dc6dcnj = dc6dcnj + gwvec(iref, iat, 1) * gwdcn(jref, jat, 1) * refc6
+               dc6dqi = dc6dqi + gwdq(iref, iat, 1) * gwvec(jref, jat, 1) * refc6
+               dc6dqj = dc6dqj + gwvec(iref, iat, 1) * gwdq(jref, jat, 1) * refc6
+            end do
+         end do
+         c6(jat, iat) = dc6
+         if (grad) then
+            dc6dcn(jat, iat) = dc6dcnj
+            dc6dq(jat, iat) = dc6dqj
+         end if
+         if (selected(jat)) cycle
+         c6(iat, jat) = dc6
+         if (grad) then
+            dc6dcn(iat, jat) = dc6dcni
+            dc6dq(iat, jat) = dc6dqi
+         end if
+      end do
+   end do
+
+end subroutine update_atomic_c6
+
+
+!> Calculate atomic dispersion coefficients only for a list of atom pairs
+subroutine get_pair_c6(self, mol, gwvec, pairs, c6)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_pair_c6
+
+   !> Instance of the dispersion model
+   class(d4_model), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Weighting function for the atomic reference systems
+   real(wp), intent(in) :: gwvec(:, :, :)
+
+   !> Atom indices of each pair: [2, npair]
+   integer, intent(in) :: pairs(:, :)
+
+   !> C6 coefficients of each pair: [npair]
+   real(wp), intent(out) :: c6(:)
+
+   integer :: ip, iat, jat, izp, jzp, iref, jref
+   real(wp) :: refc6, dc6
+
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(c6, mol, self, gwvec, pairs) &
+   !$omp private(ip, iat, jat, izp, jzp, iref, jref, refc6, dc6)
+   do ip = 1, size(pairs, 2)
+      iat = pairs(1, ip)
+      jat = pairs(2, ip)
+      izp = mol%id(iat)
+      jzp = mol%id(jat)
+      dc6 = 0.0_wp
+      do iref = 1, self%ref(izp)
+         do jref = 1, self%ref(jzp)
+            refc6 = self%c6(iref, jref, izp, jzp)
+            dc6 = dc6 + gwvec(iref, iat, 1) * gwvec(jref, jat, 1) * refc6
+         end do
+      end do
+      c6(ip) = dc6
+   end do
+
+end subroutine get_pair_c6
+
+
 !> Calculate atomic polarizabilities and their derivatives w.r.t.
 !> the coordination numbers and atomic partial charges.
 subroutine get_polarizabilities(self, mol, gwvec, gwdcn, gwdq, alpha, dadcn, dadq)
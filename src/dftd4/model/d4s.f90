@@ -20,14 +20,14 @@ module dftd4_model_d4s
    use, intrinsic :: iso_fortran_env, only : output_unit, error_unit
    use dftd4_data, only : get_covalent_rad, get_r4r2_val, get_wfpair_val, &
       & get_effective_charge, get_electronegativity, get_hardness
+   use dftd4_model_cache, only : get_reference_c6
    use dftd4_model_type, only : dispersion_model, d4_qmod
-   use dftd4_model_utils, only : dzeta, is_exceptional, trapzd, weight_cn, zeta
-   use dftd4_reference, only : get_nref, set_refalpha_eeq, set_refalpha_eeqbc, &
-      & set_refalpha_gfn2, set_refcn, set_refgw, set_refq_eeq, set_refq_eeqbc, &
-      & set_refq_gfn2
+   use dftd4_model_utils, only : dzeta, is_exceptional, weight_cn, zeta
+   use dftd4_partition, only : work_partition, owns_pair
+   use dftd4_reference, only : get_nref, set_refcn, set_refgw, set_refq_eeq, &
+      & set_refq_eeqbc, set_refq_gfn2
    use mctc_env, only : error_type, fatal_error, wp
    use mctc_io, only : structure_type
-   use mctc_io_constants, only : pi
    use multicharge, only : new_eeq2019_model, new_eeqbc2025_model
    implicit none
    private
@@ -49,6 +49,12 @@ module dftd4_model_d4s
       !> Evaluate C6 coefficient
       procedure :: get_atomic_c6
 
+      !> Update C6 coefficients of all pairs involving selected atoms
+      procedure :: update_atomic_c6
+
+      !> Evaluate C6 coefficients for a list of atom pairs
+      procedure :: get_pair_c6
+
       !> Evaluate atomic polarizabilities
       procedure :: get_polarizabilities
 
@@ -86,10 +92,8 @@ subroutine new_d4s_model(error, d4, mol, ga, gc, qmod)
    !> Charge model selection
    integer, intent(in), optional :: qmod
 
-   integer :: isp, izp, iref, jsp, jzp, jref
+   integer :: isp, izp, jsp, jzp
    integer :: mref, tmp_qmod
-   real(wp) :: aiw(23), c6
-   real(wp), parameter :: thopi = 3.0_wp/pi
 
    ! check for unsupported elements (104 (Rf) - 111 (Rg))
    do isp = 1, mol%nid
@@ -99,7 +103,7 @@ subroutine new_d4s_model(error, d4, mol, ga, gc, qmod)
       end if
    end do
 
-   d4%ncoup = mol%nat
+   d4%ncoup = mol%nid
 
    if (present(ga)) then
       d4%ga = ga
@@ -181,7 +185,6 @@ subroutine new_d4s_model(error, d4, mol, ga, gc, qmod)
       do isp = 1, mol%nid
          izp = mol%num(isp)
          call set_refq_eeq(d4%q(:, isp), izp)
-         call set_refalpha_eeq(d4%aiw(:, :, isp), d4%ga, d4%gc, izp)
       end do
       ! Setup EEQ model
       call new_eeq2019_model(mol, d4%mchrg, error)
@@ -190,7 +193,6 @@ subroutine new_d4s_model(error, d4, mol, ga, gc, qmod)
       do isp = 1, mol%nid
          izp = mol%num(isp)
          call set_refq_eeqbc(d4%q(:, isp), izp)
-         call set_refalpha_eeqbc(d4%aiw(:, :, isp), d4%ga, d4%gc, izp)
       end do
       ! Setup EEQBC model
       call new_eeqbc2025_model(mol, d4%mchrg, error)
@@ -199,7 +201,6 @@ subroutine new_d4s_model(error, d4, mol, ga, gc, qmod)
       do isp = 1, mol%nid
          izp = mol%num(isp)
          call set_refq_gfn2(d4%q(:, isp), izp)
-         call set_refalpha_gfn2(d4%aiw(:, :, isp), d4%ga, d4%gc, izp)
       end do
    end select
 
@@ -210,20 +211,7 @@ subroutine new_d4s_model(error, d4, mol, ga, gc, qmod)
    end do
 
    allocate(d4%c6(mref, mref, mol%nid, mol%nid))
-   do isp = 1, mol%nid
-      izp = mol%num(isp)
-      do jsp = 1, isp
-         jzp = mol%num(jsp)
-         do iref = 1, d4%ref(isp)
-            do jref = 1, d4%ref(jsp)
-               aiw(:) = d4%aiw(:, iref, isp) * d4%aiw(:, jref, jsp)
-               c6 = thopi * trapzd(aiw)
-               d4%c6(jref, iref, jsp, isp) = c6
-               d4%c6(iref, jref, isp, jsp) = c6
-            end do
-         end do
-      end do
-   end do
+   call get_reference_c6(mol%num(:mol%nid), d4%ga, d4%gc, tmp_qmod, d4%aiw, d4%c6)
 
 end subroutine new_d4s_model
 
@@ -254,7 +242,7 @@ subroutine weight_references(self, mol, cn, q, gwvec, gwdcn, gwdq)
    !> derivative of the pairwise weighting function w.r.t. the charge scaling
    real(wp), intent(out), optional :: gwdq(:, :, :)
 
-   integer :: iat, izp, iref, igw, jat, jzp
+   integer :: iat, izp, iref, igw, jzp
    real(wp) :: norm, dnorm, gw, expw, expd, gwk, dgwk, wf, zi, gi, maxcn
    real(wp), parameter :: eps_norm = tiny(1.0_wp)**0.5_wp
 
@@ -265,15 +253,14 @@ subroutine weight_references(self, mol, cn, q, gwvec, gwdcn, gwdq)
 
       !$omp parallel do default(none) schedule(runtime) &
       !$omp shared(gwvec, gwdcn, gwdq, mol, self, cn, q) &
-      !$omp private(iat, izp, iref, igw, zi, gi, jat, jzp) &
+      !$omp private(iat, izp, iref, igw, zi, gi, jzp) &
       !$omp private(norm, dnorm, gw, expw, expd, gwk, dgwk, wf, maxcn)
       do iat = 1, mol%nat
          izp = mol%id(iat)
          zi = self%zeff(izp)
          gi = self%eta(izp) * self%gc
 
-         do jat = 1, mol%nat
-            jzp = mol%id(jat)
+         do jzp = 1, mol%nid
 
             norm = 0.0_wp
             dnorm = 0.0_wp
@@ -312,14 +299,14 @@ subroutine weight_references(self, mol, cn, q, gwvec, gwdcn, gwdq)
                   end if
                end if
 
-               gwvec(iref, iat, jat) = gwk * zeta(self%ga, gi, self%q(iref, izp)+zi, q(iat)+zi)
-               gwdq(iref, iat, jat) = gwk * dzeta(self%ga, gi, self%q(iref, izp)+zi, q(iat)+zi)
+               gwvec(iref, iat, jzp) = gwk * zeta(self%ga, gi, self%q(iref, izp)+zi, q(iat)+zi)
+               gwdq(iref, iat, jzp) = gwk * dzeta(self%ga, gi, self%q(iref, izp)+zi, q(iat)+zi)
 
                dgwk = norm * (expd - expw * dnorm * norm)
                if (is_exceptional(dgwk) .or. norm == 0.0_wp) then
                   dgwk = 0.0_wp
                end if
-               gwdcn(iref, iat, jat) = dgwk * zeta(self%ga, gi, self%q(iref, izp)+zi, q(iat)+zi)
+               gwdcn(iref, iat, jzp) = dgwk * zeta(self%ga, gi, self%q(iref, izp)+zi, q(iat)+zi)
             end do
 
          end do
@@ -330,15 +317,14 @@ subroutine weight_references(self, mol, cn, q, gwvec, gwdcn, gwdq)
 
       !$omp parallel do default(none) schedule(runtime) &
       !$omp shared(gwvec, mol, self, cn, q) &
-      !$omp private(iat, izp, iref, igw, zi, gi, jat, jzp) &
+      !$omp private(iat, izp, iref, igw, zi, gi, jzp) &
       !$omp private(norm, gw, expw, gwk, wf, maxcn)
       do iat = 1, mol%nat
          izp = mol%id(iat)
          zi = self%zeff(izp)
          gi = self%eta(izp) * self%gc
 
-         do jat = 1, mol%nat
-            jzp = mol%id(jat)
+         do jzp = 1, mol%nid
 
             norm = 0.0_wp
             do iref = 1, self%ref(izp)
@@ -371,7 +357,7 @@ subroutine weight_references(self, mol, cn, q, gwvec, gwdcn, gwdq)
                   end if
                end if
 
-               gwvec(iref, iat, jat) = gwk * zeta(self%ga, gi, self%q(iref, izp)+zi, q(iat)+zi)
+               gwvec(iref, iat, jzp) = gwk * zeta(self%ga, gi, self%q(iref, izp)+zi, q(iat)+zi)
             end do
 
          end do
@@ -383,7 +369,8 @@ end subroutine weight_references
 
 !> Calculate atomic dispersion coefficients and their derivatives w.r.t.
 !> the coordination numbers and atomic partial charges.
-subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq, &
+      & partition)
    !DEC$ ATTRIBUTES DLLEXPORT :: get_atomic_c6
 
    !> Instance of the dispersion model
@@ -410,6 +397,10 @@ subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
    !> Derivative of the C6 w.r.t. the partial charge
    real(wp), intent(out), optional :: dc6dq(:, :)
 
+   !> Work partition of the atom pairs, only the pairs owned by this part
+   !> are evaluated and all other entries are zero
+   type(work_partition), intent(in), optional :: partition
+
    integer :: iat, jat, izp, jzp, iref, jref
    real(wp) :: refc6, dc6, dc6dcni, dc6dcnj, dc6dqi, dc6dqj
 
@@ -420,12 +411,13 @@ subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
       dc6dq(:, :) = 0.0_wp
 
       !$omp parallel do default(none) schedule(runtime) &
-      !$omp shared(c6, dc6dcn, dc6dq, mol, self, gwvec, gwdcn, gwdq) &
+      !$omp shared(c6, dc6dcn, dc6dq, mol, self, gwvec, gwdcn, gwdq, partition) &
       !$omp private(iat, jat, izp, jzp, iref, jref, refc6, dc6, dc6dqi, dc6dqj, &
       !$omp& dc6dcni, dc6dcnj)
       do iat = 1, mol%nat
          izp = mol%id(iat)
          do jat = 1, iat
+            if (.not.owns_pair(partition, iat, jat)) cycle
             jzp = mol%id(jat)
             dc6 = 0.0_wp
             dc6dcni = 0.0_wp
@@ -435,11 +427,11 @@ subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
             do iref = 1, self%ref(izp)
                do jref = 1, self%ref(jzp)
                   refc6 = self%c6(iref, jref, izp, jzp)
-                  dc6 = dc6 + gwvec(iref, iat, jat) * gwvec(jref, jat, iat) * refc6
-                  dc6dcni = dc6dcni + gwdcn(iref, iat, jat) * gwvec(jref, jat, iat) * refc6
-                  dc6dcnj = dc6dcnj + gwvec(iref, iat, jat) * gwdcn(jref, jat, iat) * refc6
-                  dc6dqi = dc6dqi + gwdq(iref, iat, jat) * gwvec(jref, jat, iat) * refc6
-                  dc6dqj = dc6dqj + gwvec(iref, iat, jat) * gwdq(jref, jat, iat) * refc6
+                  dc6 = dc6 + gwvec(iref, iat, jzp) * gwvec(jref, jat, izp) * refc6
+                  dc6dcni = dc6dcni + gwdcn(iref, iat, jzp) * gwvec(jref, jat, izp) * refc6
+                  dc6dcnj = dc6dcnj + gwvec(iref, iat, jzp) * gwdcn(jref, jat, izp) * refc6
+                  dc6dqi = dc6dqi + gwdq(iref, iat, jzp) * gwvec(jref, jat, izp) * refc6
+                  dc6dqj = dc6dqj + gwvec(iref, iat, jzp) * gwdq(jref, jat, izp) * refc6
                end do
             end do
             c6(iat, jat) = dc6
@@ -456,17 +448,18 @@ subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
       c6(:, :) = 0.0_wp
 
       !$omp parallel do default(none) schedule(runtime) &
-      !$omp shared(c6, mol, self, gwvec) &
+      !$omp shared(c6, mol, self, gwvec, partition) &
       !$omp private(iat, jat, izp, jzp, iref, jref, refc6, dc6)
       do iat = 1, mol%nat
          izp = mol%id(iat)
          do jat = 1, iat
+            if (.not.owns_pair(partition, iat, jat)) cycle
             jzp = mol%id(jat)
             dc6 = 0.0_wp
             do iref = 1, self%ref(izp)
                do jref = 1, self%ref(jzp)
                   refc6 = self%c6(iref, jref, izp, jzp)
-                  dc6 = dc6 + gwvec(iref, iat, jat) * gwvec(jref, jat, iat) * refc6
+                  dc6 = dc6 + gwvec(iref, iat, jzp) * gwvec(jref, jat, izp) * refc6
                end do
             end do
             c6(iat, jat) = dc6
@@ -478,6 +471,134 @@ subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
 end subroutine get_atomic_c6
 
 
+!> Update atomic dispersion coefficients and their derivatives of all pairs
+!> involving at least one of the selected atoms, all other pairs are kept.
+subroutine update_atomic_c6(self, mol, atoms, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+   !DEC$ ATTRIBUTES DLLEXPORT :: update_atomic_c6
+
+   !> Instance of the dispersion model
+   class(d4s_model), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Selected atoms
+   integer, intent(in) :: atoms(:)
+
+   !> Weighting function for the atomic reference systems
+   real(wp), intent(in) :: gwvec(:, :, :)
+
+   !> Derivative of the weighting function w.r.t. the coordination number
+   real(wp), intent(in), optional :: gwdcn(:, :, :)
+
+   !> Derivative of the weighting function w.r.t. the partial charge
+   real(wp), intent(in), optional :: gwdq(:, :, :)
+
+   !> C6 coefficients for all atom pairs.
+   real(wp), intent(inout) :: c6(:, :)
+
+   !> Derivative of the C6 w.r.t. the coordination number
+   real(wp), intent(inout), optional :: dc6dcn(:, :)
+
+   !> Derivative of the C6 w.r.t. the partial charge
+   real(wp), intent(inout), optional :: dc6dq(:, :)
+
+   logical :: grad
+   logical, allocatable :: selected(:)
+   integer :: ii, iat, jat, izp, jzp, iref, jref
+   real(wp) :: refc6, dc6, dc6dcni, dc6dcnj, dc6dqi, dc6dqj
+
+   grad = present(gwdcn).and.present(dc6dcn).and.present(gwdq).and.present(dc6dq)
+   allocate(selected(mol%nat), source=.false.)
+   selected(atoms) = .true.
+
+   ! Every selected atom owns its column, the row is only written for partners
+   ! which are not selected themselves to avoid concurrent updates of a pair
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(c6, dc6dcn, dc6dq, mol, self, atoms, selected, grad, gwvec, gwdcn, gwdq) &
+   !$omp private(ii, iat, jat, izp, jzp, iref, jref, refc6, dc6, dc6dqi, dc6dqj, &
+   !$omp& dc6dcni, dc6dcnj)
+   do ii = 1, size(atoms)
+      iat = atoms(ii)
+      izp = mol%id(iat)
+      do jat = 1, mol%nat
+         jzp = mol%id(jat)
+         dc6 = 0.0_wp
+         dc6dcni = 0.0_wp
+         dc6dcnj = 0.0_wp
+         dc6dqi = 0.0_wp
+         dc6dqj = 0.0_wp
+         do iref = 1, self%ref(izp)
+            do jref = 1, self%ref(jzp)
+               refc6 = self%c6(iref, jref, izp, jzp)
+               dc6 = dc6 + gwvec(iref, iat, jzp) * gwvec(jref, jat, izp) * refc6
+               if (.not.grad) cycle
+               dc6dcni = dc6dcni + gwdcn(iref, iat, jzp) * gwvec(jref, jat, izp) * refc6
+               dc6dcnj = dc6dcnj + gwvec(iref, iat, jzp) * gwdcn(jref, jat, izp) * refc6
+               dc6dqi = dc6dqi + gwdq(iref, iat, jzp) * gwvec(jref, jat, izp) * refc6
+               dc6dqj = dc6dqj + gwvec(iref, iat, jzp) * gwdq(jref, jat, izp) * refc6
+            end do
+         end do
+         c6(jat, iat) = dc6
+         if (grad) then
+            dc6dcn(jat, iat) = dc6dcnj
+            dc6dq(jat, iat) = dc6dqj
+         end if
+         if (selected(jat)) cycle
+         c6(iat, jat) = dc6
+         if (grad) then
+            dc6dcn(iat, jat) = dc6dcni
+            dc6dq(iat, jat) = dc6dqi
+         end if
+      end do
+   end do
+
+end subroutine update_atomic_c6
+
+
+!> Calculate atomic dispersion coefficients only for a list of atom pairs
+subroutine get_pair_c6(self, mol, gwvec, pairs, c6)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_pair_c6
+
+   !> Instance of the dispersion model
+   class(d4s_model), intent(in) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Weighting function for the atomic reference systems
+   real(wp), intent(in) :: gwvec(:, :, :)
+
+   !> Atom indices of each pair: [2, npair]
+   integer, intent(in) :: pairs(:, :)
+
+   !> C6 coefficients of each pair: [npair]
+   real(wp), intent(out) :: c6(:)
+
+   integer :: ip, iat, jat, izp, jzp, iref, jref
+   real(wp) :: refc6, dc6
+
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(c6, mol, self, gwvec, pairs) &
+   !$omp private(ip, iat, jat, izp, jzp, iref, jref, refc6, dc6)
+   do ip = 1, size(pairs, 2)
+      iat = pairs(1, ip)
+      jat = pairs(2, ip)
+      izp = mol%id(iat)
+      jzp = mol%id(jat)
+      dc6 = 0.0_wp
+      do iref = 1, self%ref(izp)
+         do jref = 1, self%ref(jzp)
+            refc6 = self%c6(iref, jref, izp, jzp)
+            dc6 = dc6 + gwvec(iref, iat, jzp) * gwvec(jref, jat, izp) * refc6
+         end do
+      end do
+      c6(ip) = dc6
+   end do
+
+end subroutine get_pair_c6
+
+
 !> Calculate atomic polarizabilities and their derivatives w.r.t.
 !> the coordination numbers and atomic partial charges.
 subroutine get_polarizabilities(self, mol, gwvec, gwdcn, gwdq, alpha, dadcn, dadq)
@@ -526,9 +647,9 @@ subroutine get_polarizabilities(self, mol, gwvec, gwdcn, gwdq, alpha, dadcn, dad
          dadqi = 0.0_wp
          do iref = 1, self%ref(izp)
             refa = self%aiw(1, iref, izp)
-            da = da + gwvec(iref, iat, iat) * refa
-            dadcni = dadcni + gwdcn(iref, iat, iat) * refa
-            dadqi = dadqi + gwdq(iref, iat, iat) * refa
+            da = da + gwvec(iref, iat, izp) * refa
+            dadcni = dadcni + gwdcn(iref, iat, izp) * refa
+            dadqi = dadqi + gwdq(iref, iat, izp) * refa
          end do
          alpha(iat) = da
          dadcn(iat) = dadcni
@@ -545,7 +666,7 @@ subroutine get_polarizabilities(self, mol, gwvec, gwdcn, gwdq, alpha, dadcn, dad
          izp = mol%id(iat)
          da = 0.0_wp
          do iref = 1, self%ref(izp)
-            da = da + gwvec(iref, iat, iat) * self%aiw(1, iref, izp)
+            da = da + gwvec(iref, iat, izp) * self%aiw(1, iref, izp)
          end do
          alpha(iat) = da
       end do
@@ -16,6 +16,7 @@
 
 !> Definition of the abstract base dispersion model for the evaluation of C6 coefficients.
 module dftd4_model_type
+   use dftd4_partition, only : work_partition
    use mctc_env, only : wp
    use mctc_io, only : structure_type
    use multicharge, only : mchrg_model_type
@@ -28,7 +29,7 @@ module dftd4_model_type
    !> Abstract base dispersion model to evaluate C6 coefficients
    type, abstract :: dispersion_model
 
-      !> Number of atoms coupled to by pairwise parameters
+      !> Number of species coupled to by pairwise parameters
       integer :: ncoup
 
       !> Charge scaling height
@@ -81,6 +82,12 @@ module dftd4_model_type
       !> Evaluate C6 coefficient
       procedure(get_atomic_c6), deferred :: get_atomic_c6
 
+      !> Update C6 coefficients of all pairs involving selected atoms
+      procedure(update_atomic_c6), deferred :: update_atomic_c6
+
+      !> Evaluate C6 coefficients for a list of atom pairs
+      procedure(get_pair_c6), deferred :: get_pair_c6
+
       !> Evaluate atomic polarizabilities
       procedure(get_polarizabilities), deferred :: get_polarizabilities
 
@@ -110,8 +117,9 @@ module dftd4_model_type
 
       !> Calculate atomic dispersion coefficients and their derivatives w.r.t.
       !> the coordination numbers and atomic partial charges.
-      subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
-         import dispersion_model, structure_type, wp
+      subroutine get_atomic_c6(self, mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq, &
+            & partition)
+         import dispersion_model, structure_type, work_partition, wp
          !> Instance of the dispersion model
          class(dispersion_model), intent(in) :: self
          !> Molecular structure data
@@ -128,8 +136,50 @@ module dftd4_model_type
          real(wp), intent(out), optional :: dc6dcn(:, :)
          !> Derivative of the C6 w.r.t. the partial charge
          real(wp), intent(out), optional :: dc6dq(:, :)
+         !> Work partition of the atom pairs, only the pairs owned by this part
+         !> are evaluated and all other entries are zero
+         type(work_partition), intent(in), optional :: partition
       end subroutine get_atomic_c6
 
+      !> Update atomic dispersion coefficients and their derivatives of all pairs
+      !> involving at least one of the selected atoms, all other pairs are kept.
+      subroutine update_atomic_c6(self, mol, atoms, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+         import dispersion_model, structure_type, wp
+         !> Instance of the dispersion model
+         class(dispersion_model), intent(in) :: self
+         !> Molecular structure data
+         class(structure_type), intent(in) :: mol
+         !> Selected atoms
+         integer, intent(in) :: atoms(:)
+         !> Weighting function for the atomic reference systems
+         real(wp), intent(in) :: gwvec(:, :, :)
+         !> Derivative of the weighting function w.r.t. the coordination number
+         real(wp), intent(in), optional :: gwdcn(:, :, :)
+         !> Derivative of the weighting function w.r.t. the partial charge
+         real(wp), intent(in), optional :: gwdq(:, :, :)
+         !> C6 coefficients for all atom pairs.
+         real(wp), intent(inout) :: c6(:, :)
+         !> Derivative of the C6 w.r.t. the coordination number
+         real(wp), intent(inout), optional :: dc6dcn(:, :)
+         !> Derivative of the C6 w.r.t. the partial charge
+         real(wp), intent(inout), optional :: dc6dq(:, :)
+      end subroutine update_atomic_c6
+
+      !> Calculate atomic dispersion coefficients only for a list of atom pairs
+      subroutine get_pair_c6(self, mol, gwvec, pairs, c6)
+         import dispersion_model, structure_type, wp
+         !> Instance of the dispersion model
+         class(dispersion_model), intent(in) :: self
+         !> Molecular structure data
+         class(structure_type), intent(in) :: mol
+         !> Weighting function for the atomic reference systems
+         real(wp), intent(in) :: gwvec(:, :, :)
+         !> Atom indices of each pair: [2, npair]
+         integer, intent(in) :: pairs(:, :)
+         !> C6 coefficients of each pair: [npair]
+         real(wp), intent(out) :: c6(:)
+      end subroutine get_pair_c6
+
       !> Calculate atomic polarizabilities and their derivatives w.r.t.
       !> the coordination numbers and atomic partial charges.
       subroutine get_polarizabilities(self, mol, gwvec, gwdcn, gwdq, alpha, dadcn, dadq)
@@ -26,14 +26,14 @@ module dftd4_numdiff
    implicit none
    private
 
-   public :: get_dispersion_hessian
+   public :: get_dispersion_hessian, get_dispersion_hessian_columns
 
 
 contains
 
 
 !> Evaluate hessian matrix by numerical differentiation
-subroutine get_dispersion_hessian(mol, disp, param, cutoff, hessian, partition)
+subroutine get_dispersion_hessian(mol, disp, param, cutoff, hessian, partition, atoms)
    !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion_hessian
 
    !> Molecular structure data
@@ -48,38 +48,114 @@ subroutine get_dispersion_hessian(mol, disp, param, cutoff, hessian, partition)
    !> Realspace cutoffs
    type(realspace_cutoff), intent(in) :: cutoff
 
-   !> Dispersion hessian
+   !> Dispersion hessian, the last dimension runs over the displaced atoms
    real(wp), intent(out) :: hessian(:, :, :, :)
 
    !> Work partition of the interaction loops, defaults to the complete work
    type(work_partition), intent(in), optional :: partition
 
-   integer :: iat, ix
+   !> Selection of atoms to displace, defaults to all atoms
+   integer, intent(in), optional :: atoms(:)
+
+   integer :: iat, ix, isel
+   integer, allocatable :: columns(:)
+
+   if (present(atoms)) then
+      columns = [((3*(atoms(isel)-1)+ix, ix = 1, 3), isel = 1, size(atoms))]
+   else
+      columns = [(iat, iat = 1, 3*mol%nat)]
+   end if
+
+   call get_hessian_columns(mol, disp, param, cutoff, columns, hessian, partition)
+end subroutine get_dispersion_hessian
+
+
+!> Evaluate a contiguous range of hessian columns by numerical differentiation,
+!> the column index runs over the cartesian displacements of all atoms
+subroutine get_dispersion_hessian_columns(mol, disp, param, cutoff, first, hessian, &
+      & partition)
+   !DEC$ ATTRIBUTES DLLEXPORT :: get_dispersion_hessian_columns
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> First column to evaluate, the number of columns is given by the hessian
+   integer, intent(in) :: first
+
+   !> Columns of the dispersion hessian
+   real(wp), intent(out) :: hessian(:, :, :)
+
+   !> Work partition of the interaction loops, defaults to the complete work
+   type(work_partition), intent(in), optional :: partition
+
+   integer :: icol
+   integer, allocatable :: columns(:)
+
+   columns = [(first + icol, icol = 0, size(hessian, 3) - 1)]
+
+   call get_hessian_columns(mol, disp, param, cutoff, columns, hessian, partition)
+end subroutine get_dispersion_hessian_columns
+
+
+!> Displacement loop for a list of hessian columns
+subroutine get_hessian_columns(mol, disp, param, cutoff, columns, hessian, partition)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: disp
+
+   !> Damping parameters
+   class(damping_param), intent(in) :: param
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Cartesian displacements to evaluate, ordered as 3*(iat-1)+ix
+   integer, intent(in) :: columns(:)
+
+   !> Columns of the dispersion hessian
+   real(wp), intent(out) :: hessian(3, mol%nat, size(columns))
+
+   !> Work partition of the interaction loops, defaults to the complete work
+   type(work_partition), intent(in), optional :: partition
+
+   integer :: iat, ix, icol
    real(wp), parameter :: step = 1.0e-4_wp
    type(structure_type) :: displ
    real(wp) :: el, er
    real(wp), allocatable :: gl(:, :), gr(:, :), sl(:, :), sr(:, :)
 
-   hessian(:, :, :, :) = 0.0_wp
+   hessian(:, :, :) = 0.0_wp
    !$omp parallel default(none) &
-   !$omp private(iat, ix, displ, er, el, gr, gl, sr, sl) &
-   !$omp shared(mol, disp, param, cutoff, hessian, partition)
+   !$omp private(iat, ix, icol, displ, er, el, gr, gl, sr, sl) &
+   !$omp shared(mol, disp, param, cutoff, hessian, partition, columns)
    displ = mol
    allocate(gl(3, mol%nat), gr(3, mol%nat), sl(3, 3), sr(3, 3))
-   !$omp do schedule(dynamic) collapse(2)
-   do iat = 1, mol%nat
-      do ix = 1, 3
-         displ%xyz(ix, iat) = mol%xyz(ix, iat) + step
-         call get_dispersion(displ, disp, param, cutoff, el, gl, sl, partition)
-
-         displ%xyz(ix, iat) = mol%xyz(ix, iat) - step
-         call get_dispersion(displ, disp, param, cutoff, er, gr, sr, partition)
-
-         displ%xyz(ix, iat) = mol%xyz(ix, iat)
-         hessian(:, :, ix, iat) = (gl - gr) / (2 * step)
-      end do
+   !$omp do schedule(dynamic)
+   do icol = 1, size(columns)
+      iat = (columns(icol) - 1) / 3 + 1
+      ix = columns(icol) - 3*(iat - 1)
+      displ%xyz(ix, iat) = mol%xyz(ix, iat) + step
+      call get_dispersion(displ, disp, param, cutoff, el, gl, sl, partition)
+
+      displ%xyz(ix, iat) = mol%xyz(ix, iat) - step
+      call get_dispersion(displ, disp, param, cutoff, er, gr, sr, partition)
+
+      displ%xyz(ix, iat) = mol%xyz(ix, iat)
+      hessian(:, :, icol) = (gl - gr) / (2 * step)
    end do
    !$omp end parallel
-end subroutine get_dispersion_hessian
+end subroutine get_hessian_columns
 
 end module dftd4_numdiff
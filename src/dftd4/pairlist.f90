@@ -0,0 +1,281 @@
+! This file is part of dftd4.
+! SPDX-Identifier: LGPL-3.0-or-later
+!
+! dftd4 is free software: you can redistribute it and/or modify it under
+! the terms of the Lesser GNU General Public License as published by
+! the Free Software Foundation, either version 3 of the License, or
+! (at your option) any later version.
+!
+! dftd4 is distributed in the hope that it will be useful,
+! but WITHOUT ANY WARRANTY; without even the implied warranty of
+! MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+! Lesser GNU General Public License for more details.
+!
+! You should have received a copy of the Lesser GNU General Public License
+! along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+
+!> Sparse list of atom pairs within a real space cutoff resolved by lattice images.
+!>
+!> Every pair is stored once with iat >= jat, the partner atom jat is displaced by
+!> a lattice point relative to atom iat. The pairs are stored row-wise for every
+!> atom iat in compressed sparse row format and are ordered by partner atom and
+!> lattice point within each row, which allows to find a pair by bisection.
+module dftd4_pairlist
+   use dftd4_cutoff, only : select_cutoff
+   use mctc_env, only : wp
+   use mctc_io, only : structure_type
+   use mctc_io_math, only : matinv_3x3
+   implicit none
+   private
+
+   public :: pair_list, new_pair_list
+
+
+   !> Sparse list of atom pairs with their pairwise energies
+   type :: pair_list
+
+      !> Number of pairs in the list
+      integer :: npair = 0
+
+      !> Offsets of the pairs of each atom, the pairs of atom iat are stored
+      !> from rowptr(iat)+1 to rowptr(iat+1)
+      integer, allocatable :: rowptr(:)
+
+      !> Partner atom of each pair
+      integer, allocatable :: jat(:)
+
+      !> Lattice point of the partner atom of each pair, lattice points beyond the
+      !> ones used to create the list are only present for differences of lattice points
+      integer, allocatable :: jtr(:)
+
+      !> Pairwise energy of each pair
+      real(wp), allocatable :: energy(:)
+
+      !> Cell translation of each lattice point in units of the lattice vectors
+      integer, allocatable :: image(:, :)
+
+      !> Map from cell translations to lattice points, zero if not available
+      integer, allocatable :: lookup(:, :, :)
+
+   contains
+
+      !> Find a pair in the list
+      procedure :: find
+
+      !> Find the lattice point of a cell translation
+      procedure :: find_image
+
+      !> Remove all pairs with an energy below a threshold
+      procedure :: compact
+
+   end type pair_list
+
+
+contains
+
+
+!> Create a list of all atom pairs within the real space cutoff
+subroutine new_pair_list(self, mol, trans, cutoff, pair_cutoff, differences)
+
+   !> Instance of the pair list
+   type(pair_list), intent(out) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Lattice points
+   real(wp), intent(in) :: trans(:, :)
+
+   !> Real space cutoff
+   real(wp), intent(in) :: cutoff
+
+   !> Real space cutoff for each pair of species, overrides the global cutoff
+   real(wp), intent(in), optional :: pair_cutoff(:, :)
+
+   !> Include the pairs for all differences of the lattice points, as required for
+   !> the pairs between two partners of an atom. The additional lattice points
+   !> are appended after the given lattice points.
+   logical, intent(in), optional :: differences
+
+   integer :: iat, jat, izp, jzp, jtr, ip, rep(3), ix, iy, iz, ntr
+   integer, allocatable :: npair(:), image(:, :)
+   real(wp) :: vec(3), r2, cutij
+   real(wp), allocatable :: lattr(:, :)
+
+   if (any(mol%periodic)) then
+      self%image = nint(matmul(matinv_3x3(mol%lattice), trans))
+   else
+      allocate(self%image(3, size(trans, 2)), source=0)
+   end if
+   rep(:) = maxval(abs(self%image), dim=2)
+   if (present(differences)) then
+      if (differences) rep(:) = 2 * rep
+   end if
+   allocate(self%lookup(-rep(1):rep(1), -rep(2):rep(2), -rep(3):rep(3)), source=0)
+   do jtr = 1, size(trans, 2)
+      self%lookup(self%image(1, jtr), self%image(2, jtr), self%image(3, jtr)) = jtr
+   end do
+
+   lattr = trans
+   if (any(rep > maxval(abs(self%image), dim=2))) then
+      ! The differences of the lattice points span twice the range in every direction
+      allocate(image(3, size(self%lookup) - size(trans, 2)))
+      ntr = size(trans, 2)
+      do iz = -rep(3), rep(3)
+         do iy = -rep(2), rep(2)
+            do ix = -rep(1), rep(1)
+               if (self%lookup(ix, iy, iz) > 0) cycle
+               ntr = ntr + 1
+               self%lookup(ix, iy, iz) = ntr
+               image(:, ntr - size(trans, 2)) = [ix, iy, iz]
+            end do
+         end do
+      end do
+      self%image = reshape([self%image, image], [3, ntr])
+      lattr = reshape([trans, matmul(mol%lattice, real(image, wp))], [3, ntr])
+   end if
+
+   allocate(npair(mol%nat), source=0)
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(mol, lattr, cutoff, pair_cutoff, npair) &
+   !$omp private(iat, jat, izp, jzp, jtr, vec, r2, cutij)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      do jat = 1, iat
+         jzp = mol%id(jat)
+         cutij = select_cutoff(cutoff, izp, jzp, pair_cutoff)
+         do jtr = 1, size(lattr, 2)
+            vec(:) = mol%xyz(:, jat) + lattr(:, jtr) - mol%xyz(:, iat)
+            r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
+            if (r2 > cutij*cutij .or. r2 < epsilon(1.0_wp)) cycle
+            npair(iat) = npair(iat) + 1
+         end do
+      end do
+   end do
+
+   allocate(self%rowptr(mol%nat+1))
+   self%rowptr(1) = 0
+   do iat = 1, mol%nat
+      self%rowptr(iat+1) = self%rowptr(iat) + npair(iat)
+   end do
+   self%npair = self%rowptr(mol%nat+1)
+   allocate(self%jat(self%npair), self%jtr(self%npair))
+   allocate(self%energy(self%npair), source=0.0_wp)
+
+   !$omp parallel do default(none) schedule(runtime) &
+   !$omp shared(self, mol, lattr, cutoff, pair_cutoff) &
+   !$omp private(iat, jat, izp, jzp, jtr, ip, vec, r2, cutij)
+   do iat = 1, mol%nat
+      izp = mol%id(iat)
+      ip = self%rowptr(iat)
+      do jat = 1, iat
+         jzp = mol%id(jat)
+         cutij = select_cutoff(cutoff, izp, jzp, pair_cutoff)
+         do jtr = 1, size(lattr, 2)
+            vec(:) = mol%xyz(:, jat) + lattr(:, jtr) - mol%xyz(:, iat)
+            r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
+            if (r2 > cutij*cutij .or. r2 < epsilon(1.0_wp)) cycle
+            ip = ip + 1
+            self%jat(ip) = jat
+            self%jtr(ip) = jtr
+         end do
+      end do
+   end do
+
+end subroutine new_pair_list
+
+
+!> Find a pair in the list, returns zero if the pair is not present
+pure function find(self, iat, jat, jtr) result(ip)
+
+   !> Instance of the pair list
+   class(pair_list), intent(in) :: self
+
+   !> First atom of the pair
+   integer, intent(in) :: iat
+
+   !> Partner atom of the pair, must not be larger than iat
+   integer, intent(in) :: jat
+
+   !> Lattice point of the partner atom
+   integer, intent(in) :: jtr
+
+   !> Position of the pair in the list
+   integer :: ip
+
+   integer :: lo, hi, mid
+
+   ip = 0
+   lo = self%rowptr(iat) + 1
+   hi = self%rowptr(iat+1)
+   do while (lo <= hi)
+      mid = (lo + hi) / 2
+      if (self%jat(mid) == jat .and. self%jtr(mid) == jtr) then
+         ip = mid
+         return
+      end if
+      if (self%jat(mid) < jat .or. (self%jat(mid) == jat .and. self%jtr(mid) < jtr)) then
+         lo = mid + 1
+      else
+         hi = mid - 1
+      end if
+   end do
+
+end function find
+
+
+!> Find the lattice point of a cell translation, returns zero if not available
+pure function find_image(self, image) result(jtr)
+
+   !> Instance of the pair list
+   class(pair_list), intent(in) :: self
+
+   !> Cell translation in units of the lattice vectors
+   integer, intent(in) :: image(3)
+
+   !> Lattice point of the cell translation
+   integer :: jtr
+
+   jtr = 0
+   if (any(image < lbound(self%lookup)) .or. any(image > ubound(self%lookup))) return
+   jtr = self%lookup(image(1), image(2), image(3))
+
+end function find_image
+
+
+!> Remove all pairs with an absolute energy below a threshold, the order of the
+!> remaining pairs is preserved
+subroutine compact(self, threshold)
+
+   !> Instance of the pair list
+   class(pair_list), intent(inout) :: self
+
+   !> Threshold for the absolute pair energy
+   real(wp), intent(in) :: threshold
+
+   integer :: iat, ip, np, first
+
+   if (threshold <= 0.0_wp) return
+
+   np = 0
+   do iat = 1, size(self%rowptr) - 1
+      first = self%rowptr(iat) + 1
+      self%rowptr(iat) = np
+      do ip = first, self%rowptr(iat+1)
+         if (abs(self%energy(ip)) < threshold) cycle
+         np = np + 1
+         self%jat(np) = self%jat(ip)
+         self%jtr(np) = self%jtr(ip)
+         self%energy(np) = self%energy(ip)
+      end do
+   end do
+   self%rowptr(size(self%rowptr)) = np
+   self%npair = np
+   self%jat = self%jat(:np)
+   self%jtr = self%jtr(:np)
+   self%energy = self%energy(:np)
+
+end subroutine compact
+
+
+end module dftd4_pairlist
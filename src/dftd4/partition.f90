@@ -16,19 +16,54 @@
 
 !> Work partitioning for externally distributed dispersion calculations
 module dftd4_partition
-   use mctc_env, only : error_type, fatal_error, i8
+   use dftd4_cutoff, only : realspace_cutoff, get_lattice_points
+   use mctc_env, only : error_type, fatal_error, i8, wp
+   use mctc_io, only : structure_type
    implicit none
    private
 
    public :: work_partition, new_work_partition, serial_work_partition
-   public :: owns_pair
+   public :: owns_pair, owns_atom, partition_scheme
 
 
-   !> Cyclic partition of the work of a dispersion calculation.
+   !> Possible schemes to assign the atom pairs to the parts
+   type :: enum_partition_scheme
+
+      !> Cyclic assignment of the atom pairs by their lower-triangular index
+      integer :: cyclic = 0
+
+      !> Spatial domain decomposition by recursive coordinate bisection of the
+      !> atoms, weighted by their estimated cost
+      integer :: spatial = 1
+
+      !> Contiguous blocks of atoms with equal estimated cost
+      integer :: cost = 2
+
+   end type enum_partition_scheme
+
+   !> Actual enumerator for the work partition schemes
+   type(enum_partition_scheme), parameter :: partition_scheme = enum_partition_scheme()
+
+
+   !> Partition of the work of a dispersion calculation.
    !>
    !> Parts are zero based. Every unit of work is assigned to exactly one part,
    !> summing the energy and derivative contributions of all parts reproduces the
    !> complete result. An absent partition owns all of the work.
+   !>
+   !> By default the atom pairs are assigned cyclically. The spatial and
+   !> cost-weighted schemes assign every atom to a part, which owns all pairs
+   !> (iat, jat) with jat <= iat and the ATM triples led by them. The assignment
+   !> is balanced by the neighbor counts of the structure used to create the
+   !> partition and is kept for later structures with the same number of atoms.
+   !>
+   !> The atom pairs are shared by the two-body C6 coefficients and interactions,
+   !> such that a part only evaluates the C6 coefficients it needs. The derivatives
+   !> w.r.t. coordination numbers and partial charges of a part only contain its
+   !> own contributions, they enter gradient and virial linearly and are contracted
+   !> on every part without a reduction between the stages. Coordination numbers,
+   !> three-body C6 coefficients and the contraction of the derivatives are still
+   !> evaluated for all atom pairs on every part.
    type :: work_partition
       private
 
@@ -37,6 +72,9 @@ module dftd4_partition
 
       !> Total number of parts
       integer :: nparts = 1
+
+      !> Part owning the pairs of each atom, cyclic assignment if not allocated
+      integer, allocatable :: owner(:)
    end type work_partition
 
    !> Complete work of an ordinary serial calculation, equivalent to omitting
@@ -48,7 +86,7 @@ contains
 
 
 !> Create a work partition
-subroutine new_work_partition(error, partition, part, nparts)
+subroutine new_work_partition(error, partition, part, nparts, scheme, mol, cutoff)
    !> Error handling
    type(error_type), allocatable, intent(out) :: error
 
@@ -61,17 +99,239 @@ subroutine new_work_partition(error, partition, part, nparts)
    !> Total number of parts
    integer, intent(in) :: nparts
 
+   !> Scheme to assign the atom pairs, defaults to the cyclic assignment
+   integer, intent(in), optional :: scheme
+
+   !> Molecular structure data, required for the spatial and cost-weighted schemes
+   class(structure_type), intent(in), optional :: mol
+
+   !> Realspace cutoffs used to estimate the cost of the atoms
+   type(realspace_cutoff), intent(in), optional :: cutoff
+
+   integer :: iat, scheme_
+   integer, allocatable :: order(:)
+   integer(i8), allocatable :: cost(:)
+
    if (nparts <= 0 .or. part < 0 .or. part >= nparts) then
       call fatal_error(error, "Invalid dispersion work partition")
       return
    end if
 
+   scheme_ = partition_scheme%cyclic
+   if (present(scheme)) scheme_ = scheme
+
+   select case(scheme_)
+   case default
+      call fatal_error(error, "Unknown dispersion work partition scheme")
+      return
+   case(partition_scheme%cyclic)
+   case(partition_scheme%spatial, partition_scheme%cost)
+      if (.not.present(mol)) then
+         call fatal_error(error, "Structure required for dispersion work partition scheme")
+         return
+      end if
+
+      if (present(cutoff)) then
+         call get_atom_cost(mol, cutoff, cost)
+      else
+         call get_atom_cost(mol, realspace_cutoff(), cost)
+      end if
+
+      allocate(partition%owner(mol%nat))
+      order = [(iat, iat = 1, mol%nat)]
+      if (scheme_ == partition_scheme%spatial) then
+         call bisect_atoms(mol%xyz, cost, order, 0, nparts, partition%owner)
+      else
+         call split_atoms(cost, order, 0, nparts, partition%owner)
+      end if
+   end select
+
    partition%part = part
    partition%nparts = nparts
 
 end subroutine new_work_partition
 
 
+!> Estimate the cost of the pairs and ATM triples owned by each atom from the
+!> number of lattice images of its partners within the realspace cutoffs
+subroutine get_atom_cost(mol, cutoff, cost)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Realspace cutoffs
+   type(realspace_cutoff), intent(in) :: cutoff
+
+   !> Estimated cost of each atom
+   integer(i8), allocatable, intent(out) :: cost(:)
+
+   integer :: iat, jat, jtr
+   integer(i8) :: n2, n3, nk
+   real(wp) :: vec(3), r2, cut2, cut3
+   real(wp), allocatable :: trans(:, :)
+
+   cut2 = cutoff%disp2**2
+   cut3 = cutoff%disp3**2
+   call get_lattice_points(mol%periodic, mol%lattice, max(cutoff%disp2, cutoff%disp3), &
+      & trans)
+
+   allocate(cost(mol%nat))
+   !$omp parallel do default(none) schedule(dynamic) &
+   !$omp shared(mol, trans, cut2, cut3, cost) private(iat, jat, jtr, n2, n3, nk, vec, r2)
+   do iat = 1, mol%nat
+      cost(iat) = 0_i8
+      ! partners of the ATM triples led by the pairs of this atom, (kat, ktr) with kat <= jat
+      nk = 0_i8
+      do jat = 1, iat
+         n2 = 0_i8
+         n3 = 0_i8
+         do jtr = 1, size(trans, 2)
+            vec(:) = mol%xyz(:, jat) + trans(:, jtr) - mol%xyz(:, iat)
+            r2 = vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3)
+            if (r2 < epsilon(1.0_wp)) cycle
+            if (r2 <= cut2) n2 = n2 + 1_i8
+            if (r2 <= cut3) n3 = n3 + 1_i8
+         end do
+         nk = nk + n3
+         cost(iat) = cost(iat) + 1_i8 + n2 + n3*nk
+      end do
+   end do
+
+end subroutine get_atom_cost
+
+
+!> Assign contiguous blocks of atoms with about equal cost to a range of parts
+subroutine split_atoms(cost, order, first, nparts, owner)
+
+   !> Estimated cost of each atom
+   integer(i8), intent(in) :: cost(:)
+
+   !> Atoms to assign in the order of the blocks
+   integer, intent(in) :: order(:)
+
+   !> First part of the range
+   integer, intent(in) :: first
+
+   !> Number of parts in the range
+   integer, intent(in) :: nparts
+
+   !> Part owning each atom
+   integer, intent(inout) :: owner(:)
+
+   integer :: ii, iat
+   integer(i8) :: total, prefix
+
+   total = sum(cost(order))
+   prefix = 0_i8
+   do ii = 1, size(order)
+      iat = order(ii)
+      ! assign by the midpoint of the atom in the cumulated cost
+      owner(iat) = first + min(nparts - 1, &
+         & int(real(2_i8*prefix + cost(iat), wp) * nparts / real(2_i8*max(total, 1_i8), wp)))
+      prefix = prefix + cost(iat)
+   end do
+
+end subroutine split_atoms
+
+
+!> Recursively bisect a set of atoms along the longest extent of their bounding box,
+!> such that the cost of both halves is proportional to their number of parts
+recursive subroutine bisect_atoms(xyz, cost, order, first, nparts, owner)
+
+   !> Cartesian coordinates of all atoms
+   real(wp), intent(in) :: xyz(:, :)
+
+   !> Estimated cost of each atom
+   integer(i8), intent(in) :: cost(:)
+
+   !> Atoms to assign, reordered along the bisection axis
+   integer, intent(inout) :: order(:)
+
+   !> First part of the range
+   integer, intent(in) :: first
+
+   !> Number of parts in the range
+   integer, intent(in) :: nparts
+
+   !> Part owning each atom
+   integer, intent(inout) :: owner(:)
+
+   integer :: axis, nleft, nsplit, ii
+   integer(i8) :: prefix
+   real(wp) :: target
+   real(wp), allocatable :: key(:)
+
+   if (nparts == 1 .or. size(order) <= 1) then
+      owner(order) = first
+      return
+   end if
+
+   axis = maxloc(maxval(xyz(:, order), 2) - minval(xyz(:, order), 2), 1)
+   key = xyz(axis, order)
+   call sort_index(key, order)
+
+   nleft = nparts / 2
+   target = real(sum(cost(order)), wp) * nleft / nparts
+   nsplit = 0
+   prefix = 0_i8
+   do ii = 1, size(order)
+      if (real(2_i8*prefix + cost(order(ii)), wp) > 2*target) exit
+      prefix = prefix + cost(order(ii))
+      nsplit = ii
+   end do
+   nsplit = max(1, min(size(order) - 1, nsplit))
+
+   call bisect_atoms(xyz, cost, order(:nsplit), first, nleft, owner)
+   call bisect_atoms(xyz, cost, order(nsplit+1:), first + nleft, nparts - nleft, owner)
+
+end subroutine bisect_atoms
+
+
+!> Stable merge sort of an index array by its keys
+pure subroutine sort_index(key, order)
+
+   !> Keys of the entries, sorted on exit
+   real(wp), intent(inout) :: key(:)
+
+   !> Index array, reordered together with the keys
+   integer, intent(inout) :: order(:)
+
+   integer :: nn, width, lo, mid, hi, ii, jj, kk
+   logical :: left
+   real(wp), allocatable :: ktmp(:)
+   integer, allocatable :: otmp(:)
+
+   nn = size(key)
+   allocate(ktmp(nn), otmp(nn))
+   width = 1
+   do while (width < nn)
+      do lo = 1, nn, 2*width
+         mid = min(lo + width - 1, nn)
+         hi = min(lo + 2*width - 1, nn)
+         ii = lo
+         jj = mid + 1
+         do kk = lo, hi
+            left = ii <= mid
+            if (left .and. jj <= hi) left = key(ii) <= key(jj)
+            if (left) then
+               ktmp(kk) = key(ii)
+               otmp(kk) = order(ii)
+               ii = ii + 1
+            else
+               ktmp(kk) = key(jj)
+               otmp(kk) = order(jj)
+               jj = jj + 1
+            end if
+         end do
+      end do
+      key(:) = ktmp
+      order(:) = otmp
+      width = 2*width
+   end do
+
+end subroutine sort_index
+
+
 !> Whether this part owns a symmetry-reduced atom pair
 elemental function owns_pair(partition, iat, jat) result(owned)
 
@@ -90,6 +350,13 @@ elemental function owns_pair(partition, iat, jat) result(owned)
    if (.not.present(partition)) return
    if (partition%nparts == 1) return
 
+   if (allocated(partition%owner)) then
+      if (iat <= size(partition%owner)) then
+         owned = partition%owner(iat) == partition%part
+         return
+      end if
+   end if
+
    ! zero-based index in the lower-triangular sequence (1,1), (2,1), (2,2), ...
    pair_index = int(iat - 1, i8)*int(iat, i8)/2_i8 + int(jat - 1, i8)
    owned = modulo(pair_index, int(partition%nparts, i8)) == int(partition%part, i8)
@@ -97,4 +364,25 @@ elemental function owns_pair(partition, iat, jat) result(owned)
 end function owns_pair
 
 
+!> Whether this part owns an atom, atoms are assigned cyclically to the parts
+!> independent of the partition scheme
+elemental function owns_atom(partition, iat) result(owned)
+
+   !> Work partition, absent selects the complete work
+   type(work_partition), intent(in), optional :: partition
+
+   !> Atom index
+   integer, intent(in) :: iat
+
+   !> Whether this part owns the atom
+   logical :: owned
+
+   owned = .true.
+   if (.not.present(partition)) return
+
+   owned = modulo(iat - 1, partition%nparts) == partition%part
+
+end function owns_atom
+
+
 end module dftd4_partition
@@ -0,0 +1,457 @@
+! This file is part of dftd4.
+! SPDX-Identifier: LGPL-3.0-or-later
+!
+! dftd4 is free software: you can redistribute it and/or modify it under
+! the terms of the Lesser GNU General Public License as published by
+! the Free Software Foundation, either version 3 of the License, or
+! (at your option) any later version.
+!
+! dftd4 is distributed in the hope that it will be useful,
+! but WITHOUT ANY WARRANTY; without even the implied warranty of
+! MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+! Lesser GNU General Public License for more details.
+!
+! You should have received a copy of the Lesser GNU General Public License
+! along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
+
+!> Symmetry operations of a structure for the symmetry-reduced evaluation
+!> of the dispersion energy.
+!>
+!> The atoms are grouped in orbits of symmetry-equivalent atoms. Only one
+!> representative atom of each orbit has to be evaluated, the contributions
+!> of the other atoms are obtained by applying the symmetry operations.
+module dftd4_symmetry
+   use dftd4_utils, only : wrap_to_central_cell
+   use mctc_env, only : wp, error_type, fatal_error
+   use mctc_io, only : structure_type
+   use mctc_io_math, only : matinv_3x3
+   implicit none
+   private
+
+   public :: symmetry_type, new_symmetry, detect_symmetry, get_reduced_cell
+   public :: add_symmetric_atomic, add_symmetric_gradient, add_symmetric_sigma
+
+
+   !> Symmetry operations and orbits of equivalent atoms
+   type :: symmetry_type
+      !> Number of symmetry operations
+      integer :: nsym = 0
+      !> Cartesian rotation matrices of the symmetry operations
+      real(wp), allocatable :: rot(:, :, :)
+      !> Image of every atom under each symmetry operation
+      integer, allocatable :: map(:, :)
+      !> Number of symmetry-unique atoms
+      integer :: nuniq = 0
+      !> Representative atom of every orbit
+      integer, allocatable :: unique(:)
+      !> Number of atoms in every orbit
+      integer, allocatable :: mult(:)
+      !> Orbit of every atom
+      integer, allocatable :: orbit(:)
+      !> Symmetry operation mapping the representative of the orbit onto every atom
+      integer, allocatable :: op(:)
+   end type symmetry_type
+
+   !> Default tolerance for matching symmetry-equivalent atoms in Bohr
+   real(wp), parameter :: default_tolerance = 1.0e-4_wp
+
+
+contains
+
+
+!> Create symmetry information from a set of symmetry operations.
+!>
+!> For periodic systems the operations act on fractional coordinates, as provided
+!> by most space group libraries, x' = W x + t. For molecules the operations are
+!> given in Cartesian coordinates with the translation in Bohr. The operations
+!> must form a group, including the identity.
+subroutine new_symmetry(error, self, mol, rotations, translations, tolerance)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Symmetry information
+   type(symmetry_type), intent(out) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Rotation part of the symmetry operations
+   real(wp), intent(in) :: rotations(:, :, :)
+
+   !> Translation part of the symmetry operations
+   real(wp), intent(in) :: translations(:, :)
+
+   !> Tolerance for matching symmetry-equivalent atoms in Bohr
+   real(wp), intent(in), optional :: tolerance
+
+   integer :: isym, nsym
+   real(wp) :: tol
+   real(wp), allocatable :: frac(:, :)
+   logical :: periodic, found
+
+   tol = default_tolerance
+   if (present(tolerance)) tol = tolerance
+
+   nsym = size(rotations, 3)
+   if (nsym < 1 .or. size(translations, 2) /= nsym) then
+      call fatal_error(error, "Number of symmetry rotations and translations does not match")
+      return
+   end if
+
+   periodic = any(mol%periodic)
+   if (periodic .and. .not.all(mol%periodic)) then
+      call fatal_error(error, "Symmetry is only supported for molecules and 3D periodic systems")
+      return
+   end if
+
+   if (periodic) frac = matmul(matinv_3x3(mol%lattice), mol%xyz)
+
+   self%nsym = nsym
+   allocate(self%rot(3, 3, nsym), self%map(mol%nat, nsym))
+   do isym = 1, nsym
+      if (periodic) then
+         call map_atoms(mol, frac, rotations(:, :, isym), translations(:, isym), tol, &
+            & self%map(:, isym), found)
+         self%rot(:, :, isym) = matmul(mol%lattice, &
+            & matmul(rotations(:, :, isym), matinv_3x3(mol%lattice)))
+      else
+         call map_atoms(mol, mol%xyz, rotations(:, :, isym), translations(:, isym), tol, &
+            & self%map(:, isym), found)
+         self%rot(:, :, isym) = rotations(:, :, isym)
+      end if
+      if (.not.found) then
+         call fatal_error(error, "Symmetry operation does not map the structure onto itself")
+         return
+      end if
+      if (maxval(abs(matmul(transpose(self%rot(:, :, isym)), self%rot(:, :, isym)) &
+         & - identity())) > sqrt(tol)) then
+         call fatal_error(error, "Symmetry operation is not an orthogonal transformation")
+         return
+      end if
+   end do
+
+   call new_orbits(self, mol%nat)
+   if (any(self%orbit == 0)) then
+      call fatal_error(error, "Symmetry operations do not form a group")
+      return
+   end if
+
+end subroutine new_symmetry
+
+
+!> Detect the space group operations of a 3D periodic system.
+!>
+!> The lattice is reduced first, candidate rotations are all integer matrices with
+!> elements in {-1, 0, 1} preserving the metric of the reduced lattice, which are
+!> transformed back to the lattice of the structure.
+!> Molecules and lower dimensional periodic systems only get the identity.
+subroutine detect_symmetry(error, self, mol, tolerance)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Symmetry information
+   type(symmetry_type), intent(out) :: self
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Tolerance for matching symmetry-equivalent atoms in Bohr
+   real(wp), intent(in), optional :: tolerance
+
+   integer, parameter :: max_sym = 48
+   integer :: icand, ic, jc, jat, isp, nsym, ref, k
+   integer :: trafo(3, 3)
+   integer, allocatable :: map(:)
+   real(wp) :: tol, rot(3, 3), metric(3, 3), trans(3), reduced(3, 3), inv(3, 3)
+   real(wp), allocatable :: frac(:, :), rotations(:, :, :), translations(:, :)
+   logical :: found
+
+   tol = default_tolerance
+   if (present(tolerance)) tol = tolerance
+
+   if (.not.all(mol%periodic)) then
+      call new_symmetry(error, self, mol, reshape(identity(), [3, 3, 1]), &
+         & reshape([0.0_wp, 0.0_wp, 0.0_wp], [3, 1]), tol)
+      return
+   end if
+
+   frac = matmul(matinv_3x3(mol%lattice), mol%xyz)
+   call reduce_lattice(mol%lattice, trafo)
+   reduced(:, :) = matmul(mol%lattice, real(trafo, wp))
+   inv(:, :) = real(nint(matinv_3x3(real(trafo, wp))), wp)
+   metric = matmul(transpose(reduced), reduced)
+
+   ! Use the least frequent species to generate the candidate translations
+   ref = 0
+   do isp = 1, mol%nid
+      if (ref == 0) then
+         ref = isp
+      else if (count(mol%id == isp) < count(mol%id == ref)) then
+         ref = isp
+      end if
+   end do
+   ref = findloc(mol%id, ref, 1)
+
+   allocate(map(mol%nat))
+   allocate(rotations(3, 3, max_sym*count(mol%id == mol%id(ref))), &
+      & translations(3, max_sym*count(mol%id == mol%id(ref))))
+   nsym = 0
+   do icand = 0, 3**9 - 1
+      k = icand
+      do jc = 1, 3
+         do ic = 1, 3
+            rot(ic, jc) = real(modulo(k, 3) - 1, wp)
+            k = k / 3
+         end do
+      end do
+      if (maxval(abs(matmul(transpose(rot), matmul(metric, rot)) - metric)) &
+         & > 2*tol*sqrt(maxval(abs(metric)))) cycle
+      ! Rotation in fractional coordinates of the lattice of the structure
+      rot(:, :) = matmul(real(trafo, wp), matmul(rot, inv))
+
+      do jat = 1, mol%nat
+         if (mol%id(jat) /= mol%id(ref)) cycle
+         trans(:) = frac(:, jat) - matmul(rot, frac(:, ref))
+         trans(:) = trans - nint(trans)
+         call map_atoms(mol, frac, rot, trans, tol, map, found)
+         if (.not.found) cycle
+         if (nsym >= size(rotations, 3)) exit
+         nsym = nsym + 1
+         rotations(:, :, nsym) = rot
+         translations(:, nsym) = trans
+      end do
+   end do
+
+   call new_symmetry(error, self, mol, rotations(:, :, :nsym), translations(:, :nsym), tol)
+
+end subroutine detect_symmetry
+
+
+!> Express a three dimensional periodic structure in its reduced cell with all atoms
+!> wrapped into the cell. The atoms keep their order and Cartesian gradients and
+!> virials are the same in both cells.
+subroutine get_reduced_cell(mol, cell, reduced)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Structure in the reduced cell, only created if the cell can be reduced
+   type(structure_type), intent(out) :: cell
+
+   !> The cell of the structure can be reduced
+   logical, intent(out) :: reduced
+
+   integer :: trafo(3, 3)
+
+   reduced = .false.
+   if (.not.all(mol%periodic)) return
+   call reduce_lattice(mol%lattice, trafo)
+   reduced = any(trafo /= nint(identity()))
+   if (.not.reduced) return
+
+   cell = mol
+   cell%lattice(:, :) = matmul(mol%lattice, real(trafo, wp))
+   call wrap_to_central_cell(cell%xyz, cell%lattice, cell%periodic)
+
+end subroutine get_reduced_cell
+
+
+!> Reduce the lattice vectors by repeatedly subtracting integer multiples of the
+!> other vectors as long as this shortens them, the reduced lattice vectors are
+!> obtained from the unimodular transformation as lattice times trafo
+subroutine reduce_lattice(lattice, trafo)
+
+   !> Lattice vectors
+   real(wp), intent(in) :: lattice(:, :)
+
+   !> Integer transformation to the reduced lattice vectors
+   integer, intent(out) :: trafo(:, :)
+
+   integer, parameter :: max_iter = 100
+   integer :: iter, ic, jc, n
+   real(wp) :: basis(3, 3), vec(3)
+   logical :: changed
+
+   basis(:, :) = lattice
+   trafo(:, :) = nint(identity())
+   do iter = 1, max_iter
+      changed = .false.
+      do ic = 1, 3
+         do jc = 1, 3
+            if (ic == jc) cycle
+            n = nint(dot_product(basis(:, ic), basis(:, jc)) &
+               & / dot_product(basis(:, jc), basis(:, jc)))
+            if (n == 0) cycle
+            vec(:) = basis(:, ic) - n * basis(:, jc)
+            if (dot_product(vec, vec) >= (1.0_wp - epsilon(1.0_wp)) &
+               & * dot_product(basis(:, ic), basis(:, ic))) cycle
+            basis(:, ic) = vec
+            trafo(:, ic) = trafo(:, ic) - n * trafo(:, jc)
+            changed = .true.
+         end do
+      end do
+      if (.not.changed) exit
+   end do
+
+end subroutine reduce_lattice
+
+
+!> Find the image of every atom under a symmetry operation
+subroutine map_atoms(mol, pos, rot, trans, tol, map, found)
+
+   !> Molecular structure data
+   class(structure_type), intent(in) :: mol
+
+   !> Fractional coordinates for periodic systems, Cartesian coordinates otherwise
+   real(wp), intent(in) :: pos(:, :)
+
+   !> Rotation part of the symmetry operation
+   real(wp), intent(in) :: rot(:, :)
+
+   !> Translation part of the symmetry operation
+   real(wp), intent(in) :: trans(:)
+
+   !> Tolerance for matching symmetry-equivalent atoms in Bohr
+   real(wp), intent(in) :: tol
+
+   !> Image of every atom
+   integer, intent(out) :: map(:)
+
+   !> All atoms could be matched to a distinct image
+   logical, intent(out) :: found
+
+   integer :: iat, jat
+   real(wp) :: vec(3)
+   logical, allocatable :: taken(:)
+
+   allocate(taken(mol%nat), source=.false.)
+   found = .false.
+   do iat = 1, mol%nat
+      map(iat) = 0
+      do jat = 1, mol%nat
+         if (taken(jat) .or. mol%id(jat) /= mol%id(iat)) cycle
+         vec(:) = matmul(rot, pos(:, iat)) + trans - pos(:, jat)
+         if (any(mol%periodic)) vec(:) = matmul(mol%lattice, vec - nint(vec))
+         if (vec(1)*vec(1) + vec(2)*vec(2) + vec(3)*vec(3) < tol*tol) then
+            map(iat) = jat
+            taken(jat) = .true.
+            exit
+         end if
+      end do
+      if (map(iat) == 0) return
+   end do
+   found = .true.
+
+end subroutine map_atoms
+
+
+!> Group the atoms in orbits of symmetry-equivalent atoms
+subroutine new_orbits(self, nat)
+
+   !> Symmetry information
+   type(symmetry_type), intent(inout) :: self
+
+   !> Number of atoms
+   integer, intent(in) :: nat
+
+   integer :: iat, isym, jat
+   integer, allocatable :: unique(:), mult(:)
+
+   allocate(self%orbit(nat), self%op(nat), unique(nat), mult(nat))
+   self%orbit(:) = 0
+   self%nuniq = 0
+   do iat = 1, nat
+      if (self%orbit(iat) /= 0) cycle
+      self%nuniq = self%nuniq + 1
+      unique(self%nuniq) = iat
+      mult(self%nuniq) = 0
+      do isym = 1, self%nsym
+         jat = self%map(iat, isym)
+         if (self%orbit(jat) /= 0) cycle
+         self%orbit(jat) = self%nuniq
+         self%op(jat) = isym
+         mult(self%nuniq) = mult(self%nuniq) + 1
+      end do
+   end do
+   self%unique = unique(:self%nuniq)
+   self%mult = mult(:self%nuniq)
+
+end subroutine new_orbits
+
+
+!> Add a scalar property of the symmetry-unique atoms to all atoms
+subroutine add_symmetric_atomic(self, unique, atomic)
+
+   !> Symmetry information
+   type(symmetry_type), intent(in) :: self
+
+   !> Property of the symmetry-unique atoms
+   real(wp), intent(in) :: unique(:)
+
+   !> Property of all atoms
+   real(wp), intent(inout) :: atomic(:)
+
+   atomic(:) = atomic + unique(self%orbit)
+
+end subroutine add_symmetric_atomic
+
+
+!> Add the gradient of the symmetry-unique atoms to all atoms
+subroutine add_symmetric_gradient(self, unique, gradient)
+
+   !> Symmetry information
+   type(symmetry_type), intent(in) :: self
+
+   !> Gradient of the symmetry-unique atoms
+   real(wp), intent(in) :: unique(:, :)
+
+   !> Gradient of all atoms
+   real(wp), intent(inout) :: gradient(:, :)
+
+   integer :: iat
+
+   do iat = 1, size(gradient, 2)
+      gradient(:, iat) = gradient(:, iat) &
+         & + matmul(self%rot(:, :, self%op(iat)), unique(:, self%orbit(iat)))
+   end do
+
+end subroutine add_symmetric_gradient
+
+
+!> Add the atom-resolved virial of the symmetry-unique atoms to the total virial
+subroutine add_symmetric_sigma(self, unique, sigma)
+
+   !> Symmetry information
+   type(symmetry_type), intent(in) :: self
+
+   !> Atom-resolved virial of the symmetry-unique atoms
+   real(wp), intent(in) :: unique(:, :, :)
+
+   !> Virial of the complete system
+   real(wp), intent(inout) :: sigma(:, :)
+
+   integer :: iuniq, isym
+   real(wp) :: scale
+
+   ! Every atom of an orbit is reached by nsym/mult operations
+   do iuniq = 1, self%nuniq
+      scale = real(self%mult(iuniq), wp) / real(self%nsym, wp)
+      do isym = 1, self%nsym
+         sigma(:, :) = sigma + scale * matmul(self%rot(:, :, isym), &
+            & matmul(unique(:, :, iuniq), transpose(self%rot(:, :, isym))))
+      end do
+   end do
+
+end subroutine add_symmetric_sigma
+
+
+!> Three dimensional identity matrix
+pure function identity() result(mat)
+   real(wp) :: mat(3, 3)
+   mat(:, :) = reshape([1, 0, 0, 0, 1, 0, 0, 0, 1], [3, 3])
+end function identity
+
+
+end module dftd4_symmetry
@@ -16,11 +16,12 @@
 
 module dftd4_utils
    use mctc_env, only : wp
+   use mctc_io, only : structure_type, new
    use mctc_io_math, only : matinv_3x3
    implicit none
    private
 
-   public :: lowercase, wrap_to_central_cell
+   public :: lowercase, wrap_to_central_cell, new_species_structure
 
 
 contains
@@ -97,4 +98,30 @@ pure function lowercase(str) result(lcstr)
 end function lowercase
 
 
+!> Create a structure with the species of a reference structure
+subroutine new_species_structure(mol, ref, id, xyz)
+
+   !> Molecular structure data
+   type(structure_type), intent(out) :: mol
+
+   !> Reference structure defining the species
+   type(structure_type), intent(in) :: ref
+
+   !> Species of every atom
+   integer, intent(in) :: id(:)
+
+   !> Cartesian coordinates
+   real(wp), intent(in) :: xyz(:, :)
+
+   call new(mol, ref%num(id), xyz, ref%charge, ref%uhf, ref%lattice, ref%periodic)
+
+   ! Keep the species of the reference, even if some are absent in the new structure
+   mol%nid = ref%nid
+   mol%num = ref%num
+   mol%sym = ref%sym
+   mol%id = id
+
+end subroutine new_species_structure
+
+
 end module dftd4_utils
@@ -90,6 +90,20 @@ int test_invalid_partition(void)
     if (!dftd4_check_error(error)) {
         goto unexpected;
     }
+    dftd4_delete(error);
+    error = dftd4_new_error();
+
+    dftd4_set_model_work_partition_scheme(error, mol, disp, 0, 3, 3);
+    if (!dftd4_check_error(error)) {
+        goto unexpected;
+    }
+    dftd4_delete(error);
+    error = dftd4_new_error();
+
+    dftd4_set_model_work_partition_scheme(error, NULL, disp, 0, 3, 1);
+    if (!dftd4_check_error(error)) {
+        goto unexpected;
+    }
 
     dftd4_delete(disp);
     dftd4_delete(mol);
@@ -123,6 +137,7 @@ int test_example(void)
     double sigma[9];
     double part_energy;
     double partitioned_energy;
+    double cutoff_error2, cutoff_error3;
     double part_gradient[21];
     double partitioned_gradient[21];
     double part_sigma[9];
@@ -134,6 +149,12 @@ int test_example(void)
     double* part_hessian;
     double* partitioned_hessian;
     double* c6;
+    double charges[7];
+    const int hess_atoms[2] = {4, 1};
+    const int move_atoms[1] = {6};
+    const int move_numbers[1] = {1};
+    const double move_xyz[3] = {+0.2, -0.1, +5.5};
+    double delta, reverse_delta;
 
     pair_disp2 = (double*)malloc(nat_sq * sizeof(double));
     pair_disp3 = (double*)malloc(nat_sq * sizeof(double));
@@ -166,6 +187,11 @@ int test_example(void)
         goto err;
     }
 
+    dftd4_prewarm_reference_cache(error, 2, attyp + 2, 3.0, 2.0);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+
     disp = dftd4_new_d4_model(error, mol);
     if (dftd4_check_error(error)) {
         goto err;
@@ -177,6 +203,11 @@ int test_example(void)
     if (dftd4_check_error(error)) {
         goto err;
     }
+    // The tail correction leaves molecular systems unchanged
+    dftd4_set_model_tail_correction(error, disp, true);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
 
     // C6 coefficients
     dftd4_get_properties(error, mol, disp, NULL, NULL, c6, NULL);
@@ -184,6 +215,32 @@ int test_example(void)
         goto err;
     }
 
+    // Sparse C6 coefficients within a cutoff match the dense ones
+    {
+        int npair;
+        dftd4_get_sparse_c6(error, mol, disp, NULL, 4.0, &npair);
+        if (dftd4_check_error(error)) {
+            goto err;
+        }
+        if (npair < natoms || npair > natoms * (natoms + 1) / 2) {
+            goto err;
+        }
+        int* index = (int*)malloc(2 * npair * sizeof(int));
+        double* c6_sparse = (double*)malloc(npair * sizeof(double));
+        dftd4_get_sparse_c6_pairs(error, disp, index, c6_sparse);
+        int mismatch = 0;
+        for (int i = 0; i < npair; i++) {
+            if (fabs(c6_sparse[i] - c6[index[2 * i] * natoms + index[2 * i + 1]]) > 1e-10) {
+                mismatch = 1;
+            }
+        }
+        free(index);
+        free(c6_sparse);
+        if (dftd4_check_error(error) || mismatch) {
+            goto err;
+        }
+    }
+
     // PBE-D4
     param = dftd4_new_rational_damping(error, 1.0, 0.95948085, 0.0, 0.38574991, 4.80688534, 16.0);
     if (dftd4_check_error(error)) {
@@ -201,6 +258,93 @@ int test_example(void)
     if (dftd4_check_error(error)) {
         goto err;
     }
+
+    // Charges of the model passed back as external charges reproduce the energy
+    dftd4_get_properties(error, mol, disp, NULL, charges, NULL, NULL);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    dftd4_get_dispersion_with_charges(error, mol, disp, param, charges, NULL, NULL,
+                                      &part_energy, NULL, NULL);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    if (fabs(part_energy - energy) > 1e-12) {
+        goto err;
+    }
+
+    // Evaluation for several parameter sets reproduces the single evaluation
+    {
+        dftd4_param params[2] = {param, param};
+        double energies[2];
+        dftd4_get_dispersion_multi(error, mol, disp, 2, params, energies, NULL, NULL);
+        if (dftd4_check_error(error)) {
+            goto err;
+        }
+        if (fabs(energies[0] - energy) > 1e-12 || fabs(energies[1] - energy) > 1e-12) {
+            goto err;
+        }
+    }
+
+    // Evaluation of several images reproduces the single evaluation
+    {
+        double images[42];
+        double energies[2];
+        double image_gradient[42];
+        for (int i = 0; i < nat3; ++i) images[i] = images[nat3 + i] = coord[i];
+        dftd4_get_dispersion_images(error, mol, disp, param, 2, images, NULL,
+                                    energies, image_gradient, NULL);
+        if (dftd4_check_error(error)) {
+            goto err;
+        }
+        if (fabs(energies[0] - energy) > 1e-12 || fabs(energies[1] - energy) > 1e-12) {
+            goto err;
+        }
+        for (int i = 0; i < nat3; ++i) {
+            if (fabs(image_gradient[nat3 + i] - gradient[i]) > 1e-12) {
+                goto err;
+            }
+        }
+    }
+
+    // Fused evaluation reproduces energy, gradient and charges
+    dftd4_get_dispersion_results(error, mol, disp, param, &part_energy, part_gradient,
+                                 part_sigma, NULL, NULL, NULL, NULL, charges, NULL,
+                                 NULL, NULL, NULL, NULL);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    if (fabs(part_energy - energy) > 1e-12) {
+        goto err;
+    }
+    for (int i = 0; i < nat3; ++i) {
+        if (fabs(part_gradient[i] - gradient[i]) > 1e-12) {
+            goto err;
+        }
+    }
+
+    // Atom-resolved energies and virials sum up to the total values
+    {
+        double atomic_energies[7];
+        double atomic_sigmas[63];
+        dftd4_get_dispersion_results(error, mol, disp, param, &part_energy, NULL,
+                                     part_sigma, NULL, NULL, atomic_energies, NULL,
+                                     NULL, NULL, NULL, NULL, NULL, atomic_sigmas);
+        if (dftd4_check_error(error)) {
+            goto err;
+        }
+        for (int i = 0; i < 7; ++i) part_energy -= atomic_energies[i];
+        if (fabs(part_energy) > 1e-12) {
+            goto err;
+        }
+        for (int i = 0; i < 63; ++i) part_sigma[i % 9] -= atomic_sigmas[i];
+        for (int i = 0; i < 9; ++i) {
+            if (fabs(part_sigma[i]) > 1e-12) {
+                goto err;
+            }
+        }
+    }
+
     dftd4_get_numerical_hessian(error, mol, disp, param, hessian);
     if (dftd4_check_error(error)) {
         goto err;
@@ -252,16 +396,233 @@ int test_example(void)
         }
     }
 
+    // Partitions balanced by the cost of the atoms must reproduce the energy
+    // for the spatial and the cost-weighted scheme.
+    for (int scheme = 1; scheme <= 2; ++scheme) {
+        partitioned_energy = 0.0;
+        for (int part = 0; part < 3; ++part) {
+            dftd4_set_model_work_partition_scheme(error, mol, disp, part, 3, scheme);
+            if (dftd4_check_error(error)) {
+                goto err;
+            }
+            dftd4_get_dispersion(error, mol, disp, param, &part_energy, NULL, NULL);
+            if (dftd4_check_error(error)) {
+                goto err;
+            }
+            partitioned_energy += part_energy;
+        }
+        if (fabs(partitioned_energy - energy) > 1e-12) {
+            goto err;
+        }
+    }
+
     // Restore the ordinary serial calculation for subsequent calls.
     dftd4_set_model_work_partition(error, disp, 0, 1);
     if (dftd4_check_error(error)) {
         goto err;
     }
 
+    // Cutoffs derived from a tolerance must stay within the reported error bound
+    dftd4_set_model_realspace_cutoff_tolerance(error, disp, 1.0e-6);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    dftd4_get_realspace_cutoff_error(error, mol, disp, param, &cutoff_error2, &cutoff_error3);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    if (cutoff_error2 > 1.0e-6 || cutoff_error3 > 1.0e-6) {
+        goto err;
+    }
+    dftd4_get_dispersion(error, mol, disp, param, &part_energy, NULL, NULL);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    if (fabs(part_energy - energy) > natoms * (cutoff_error2 + cutoff_error3)) {
+        goto err;
+    }
+    dftd4_set_model_realspace_cutoff_tolerance(error, disp, 0.0);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+
+    // Mixed precision kernels stay close to the double precision energy
+    dftd4_set_model_mixed_precision(error, disp, true);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    dftd4_get_dispersion(error, mol, disp, param, &part_energy, NULL, NULL);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    if (fabs(part_energy - energy) > 1.0e-5 * fabs(energy)) {
+        goto err;
+    }
+    dftd4_set_model_mixed_precision(error, disp, false);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+
+    // Symmetry-reduced evaluation reproduces the complete calculation
+    dftd4_set_model_symmetry(error, disp, true);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    dftd4_get_dispersion(error, mol, disp, param, &part_energy, NULL, NULL);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    if (fabs(part_energy - energy) > 1e-12) {
+        goto err;
+    }
+    dftd4_set_model_symmetry(error, disp, false);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+
+    // Incremental updates start from the complete energy and cancel for reverted moves
+    dftd4_new_incremental(error, mol, disp, param, &part_energy);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    if (fabs(part_energy - energy) > 1e-12) {
+        goto err;
+    }
+    dftd4_propose_displacement(error, disp, param, 1, move_atoms, move_xyz, true, &delta);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    dftd4_finish_move(error, disp, true);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    dftd4_propose_displacement(error, disp, param, 1, move_atoms, &coord[18], true,
+                               &reverse_delta);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    if (fabs(delta + reverse_delta) > 1e-12) {
+        goto err;
+    }
+    dftd4_propose_insertion(error, disp, param, 1, move_numbers, &coord[18], true, &delta);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    dftd4_finish_move(error, disp, false);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    // Nothing left to accept after rejecting the move
+    dftd4_finish_move(error, disp, true);
+    if (!dftd4_check_error(error)) {
+        goto err;
+    }
+    dftd4_delete(error);
+    error = dftd4_new_error();
+    if (!error) {
+        goto err;
+    }
+
+    // Embedded region in the unchanged structure reproduces the complete energy,
+    // the gradient of the frozen environment vanishes
+    dftd4_set_model_embedding(error, mol, disp, param, 2, hess_atoms, 0);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    dftd4_get_embedded_dispersion(error, mol, disp, param, &part_energy,
+                                  part_gradient);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    if (fabs(part_energy - energy) > 1e-12) {
+        goto err;
+    }
+    for (int i = 0; i < nat3; ++i) {
+        if (i / 3 != hess_atoms[0] && i / 3 != hess_atoms[1]
+            && part_gradient[i] != 0.0) {
+            goto err;
+        }
+    }
+
+    // Displacing only a selection of atoms must reproduce the hessian rows
+    // of the complete calculation.
+    dftd4_get_numerical_hessian_atoms(error, mol, disp, param, 2, hess_atoms,
+                                      part_hessian);
+    if (dftd4_check_error(error)) {
+        goto err;
+    }
+    for (int k = 0; k < 2; ++k) {
+        for (int i = 0; i < 3 * nat3; ++i) {
+            if (fabs(part_hessian[k * 3 * nat3 + i]
+                     - hessian[hess_atoms[k] * 3 * nat3 + i]) > 1e-12) {
+                goto err;
+            }
+        }
+    }
+
     dftd4_get_pairwise_dispersion(error, mol, disp, param, pair_disp2, pair_disp3);
     if (dftd4_check_error(error)) {
         goto err;
     }
+
+    // Sparse pair lists add up to the same energy as the dense representation
+    {
+        int npair2, npair3;
+        double sum_dense = 0.0, sum_sparse = 0.0;
+        dftd4_get_sparse_pairwise_dispersion(error, mol, disp, param, 0.0, &npair2, &npair3);
+        if (dftd4_check_error(error)) {
+            goto err;
+        }
+        int* index2 = (int*)malloc(2 * npair2 * sizeof(int));
+        double* energy2 = (double*)malloc(npair2 * sizeof(double));
+        dftd4_get_sparse_pairs(error, disp, index2, NULL, energy2, NULL, NULL, NULL);
+        for (int i = 0; i < nat_sq; i++) {
+            sum_dense += pair_disp2[i];
+        }
+        for (int i = 0; i < npair2; i++) {
+            sum_sparse += energy2[i];
+        }
+        free(index2);
+        free(energy2);
+        if (dftd4_check_error(error)) {
+            goto err;
+        }
+        if (fabs(sum_dense - sum_sparse) > 1e-12) {
+            goto err;
+        }
+    }
+
+    // Fragment energies add up to the same energy as the dense representation
+    {
+        int fragment[natoms];
+        double frag_disp2[4], frag_disp3[4];
+        double sum_dense = 0.0, sum_frag = 0.0;
+        for (int i = 0; i < natoms; i++) {
+            fragment[i] = i % 2;
+        }
+        dftd4_get_fragment_dispersion(error, mol, disp, param, 2, fragment, false,
+                                      frag_disp2, frag_disp3);
+        if (dftd4_check_error(error)) {
+            goto err;
+        }
+        for (int i = 0; i < nat_sq; i++) {
+            sum_dense += pair_disp2[i];
+        }
+        for (int i = 0; i < 4; i++) {
+            sum_frag += frag_disp2[i];
+        }
+        if (fabs(sum_dense - sum_frag) > 1e-12) {
+            goto err;
+        }
+        dftd4_get_fragment_dispersion(error, mol, disp, param, 2, fragment, true,
+                                      frag_disp2, frag_disp3);
+        if (dftd4_check_error(error)) {
+            goto err;
+        }
+        if (frag_disp2[0] != 0.0 || frag_disp2[3] != 0.0) {
+            goto err;
+        }
+    }
     dftd4_delete(param);
 
     // DSD-BLYP-D4-ATM
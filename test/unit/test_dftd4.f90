@@ -15,15 +15,23 @@
 ! along with dftd4.  If not, see <https://www.gnu.org/licenses/>.
 
 module test_dftd4
-   use dftd4, only : d4_model, d4_qmod, d4s_model, damping_param, dispersion_model, &
-      & get_dispersion, get_pairwise_dispersion, new_d4_model, new_d4s_model, &
-      & new_work_partition, rational_damping_param, realspace_cutoff, &
-      & serial_work_partition, work_partition
+   use dftd4, only : clear_reference_cache, d4_model, d4_qmod, d4s_model, &
+      & damping_param, dispersion_model, eeq_solver, embedding_dispersion, get_dispersion, &
+      & get_dispersion_hessian, get_dispersion_images, get_dispersion_multi, &
+      & get_dispersion_results, get_pair_data, &
+      & get_sparse_pairwise_dispersion, pair_list, get_sparse_c6, &
+      & get_dispersion_hessian_columns, get_pairwise_dispersion, get_properties, &
+      & incremental_dispersion, new_d4_model, new_eeq_solver, &
+      & new_embedding_dispersion, new_incremental_dispersion, new_d4s_model, &
+      & new_symmetry, new_work_partition, partition_scheme, prewarm_reference_cache, &
+      & rational_damping_param, realspace_cutoff, serial_work_partition, symmetry_type, &
+      & work_partition
    use mctc_env, only : wp
    use mctc_env_testing, only : new_unittest, unittest_type, error_type, check, &
       & test_failed
    use mctc_io, only : structure_type, new
    use mstore, only : get_structure
+   use multicharge, only : get_charges
    implicit none
    private
 
@@ -84,6 +92,24 @@ subroutine collect_dftd4(testsuite)
       & new_unittest("TPSSh-D4S-ATM-AmF3", test_tpsshd4satm_amf3), &
       & new_unittest("smooth cutoff", test_smooth_cutoff), &
       & new_unittest("partitioned dispersion", test_partitioned_dispersion), &
+      & new_unittest("partition schemes", test_partition_schemes), &
+      & new_unittest("mixed precision", test_mixed_precision), &
+      & new_unittest("symmetry operations", test_symmetry_operations), &
+      & new_unittest("incremental moves", test_incremental_moves), &
+      & new_unittest("embedded region", test_embedded_region), &
+      & new_unittest("external charges", test_external_charges), &
+      & new_unittest("iterative charges", test_iterative_charges), &
+      & new_unittest("reference cache", test_reference_cache), &
+      & new_unittest("fused results", test_dispersion_results), &
+      & new_unittest("multiple parameters", test_dispersion_multi), &
+      & new_unittest("multiple images", test_dispersion_images), &
+      & new_unittest("pair data", test_pair_data), &
+      & new_unittest("sparse pairwise", test_sparse_pairwise), &
+      & new_unittest("fragment pairwise", test_fragment_pairwise), &
+      & new_unittest("selected properties", test_selected_properties), &
+      & new_unittest("atomic virials", test_atomic_virials), &
+      & new_unittest("hessian atoms", test_hessian_atoms), &
+      & new_unittest("hessian columns", test_hessian_columns), &
       & new_unittest("Actinides-D4", test_actinides_d4), &
       & new_unittest("Actinides-D4S", test_actinides_d4s) &
       & ]
@@ -371,6 +397,1162 @@ subroutine test_partitioned_dispersion(error)
 end subroutine test_partitioned_dispersion
 
 
+subroutine test_partition_schemes(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   integer, parameter :: nparts = 3
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   type(work_partition) :: partition
+   type(error_type), allocatable :: partition_error
+   integer :: part, scheme
+   real(wp) :: energy, part_energy, partitioned_energy
+   real(wp), allocatable :: gradient(:, :), part_gradient(:, :), partitioned_gradient(:, :)
+   real(wp) :: sigma(3, 3), part_sigma(3, 3), partitioned_sigma(3, 3)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "MB16-43", "09")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   allocate(gradient(3, mol%nat), part_gradient(3, mol%nat), &
+      & partitioned_gradient(3, mol%nat))
+   call get_dispersion(mol, d4, param, realspace_cutoff(), energy, gradient, sigma)
+
+   do scheme = partition_scheme%spatial, partition_scheme%cost
+      partitioned_energy = 0.0_wp
+      partitioned_gradient(:, :) = 0.0_wp
+      partitioned_sigma(:, :) = 0.0_wp
+      do part = 0, nparts - 1
+         call new_work_partition(error, partition, part, nparts, scheme, mol, &
+            & realspace_cutoff())
+         if (allocated(error)) return
+         call get_dispersion(mol, d4, param, realspace_cutoff(), part_energy, &
+            & part_gradient, part_sigma, partition)
+         if (abs(part_energy) < thr) then
+            call test_failed(error, "Part of the partition scheme owns no work")
+            return
+         end if
+         partitioned_energy = partitioned_energy + part_energy
+         partitioned_gradient(:, :) = partitioned_gradient + part_gradient
+         partitioned_sigma(:, :) = partitioned_sigma + part_sigma
+      end do
+
+      call check(error, partitioned_energy, energy, thr=thr2)
+      if (allocated(error)) then
+         call test_failed(error, "Partitioned dispersion energy does not match")
+         return
+      end if
+
+      if (any(abs(partitioned_gradient - gradient) > thr2) .or. &
+            & any(abs(partitioned_sigma - sigma) > thr2)) then
+         call test_failed(error, "Partitioned dispersion derivatives do not match")
+         return
+      end if
+   end do
+
+   call new_work_partition(partition_error, partition, 0, nparts, partition_scheme%cost)
+   if (.not.allocated(partition_error)) then
+      call test_failed(error, "Missing structure for partition scheme did not return an error")
+      return
+   end if
+
+   call new_work_partition(partition_error, partition, 0, nparts, -1, mol)
+   if (.not.allocated(partition_error)) then
+      call test_failed(error, "Unknown partition scheme did not return an error")
+      return
+   else if (partition_error%message /= "Unknown dispersion work partition scheme") then
+      call test_failed(error, "Unexpected error message for unknown partition scheme")
+      return
+   end if
+
+end subroutine test_partition_schemes
+
+
+!> Accuracy of the mixed precision kernels against the double precision path.
+!> Distances, damping and switching functions are evaluated in single precision,
+!> which limits the relative energy error to about 1e-6 while the accumulation in
+!> double precision keeps gradient and virial errors well below 1e-7 Hartree/Bohr.
+subroutine test_mixed_precision(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   real(wp), parameter :: thr_energy = 1.0e-5_wp, thr_grad = 1.0e-7_wp
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   type(realspace_cutoff) :: cutoff
+   real(wp) :: energy, mixed_energy, sigma(3, 3), mixed_sigma(3, 3)
+   real(wp), allocatable :: gradient(:, :), mixed_gradient(:, :)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+   cutoff = realspace_cutoff(width2=2.0_wp, width3=2.0_wp)
+
+   call get_structure(mol, "MB16-43", "09")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   allocate(gradient(3, mol%nat), mixed_gradient(3, mol%nat))
+   call get_dispersion(mol, d4, param, cutoff, energy, gradient, sigma)
+   call get_dispersion(mol, d4, param, cutoff, mixed_energy, mixed_gradient, &
+      & mixed_sigma, mixed=.true.)
+
+   call check(error, abs(mixed_energy - energy) < thr_energy * abs(energy))
+   if (allocated(error)) then
+      print*, energy, mixed_energy
+      return
+   end if
+   if (any(abs(mixed_gradient - gradient) > thr_grad) .or. &
+         & any(abs(mixed_sigma - sigma) > thr_grad)) then
+      call test_failed(error, "Mixed precision derivatives do not match")
+      return
+   end if
+
+   call get_dispersion(mol, d4, param, cutoff, mixed_energy, mixed=.true.)
+   call check(error, abs(mixed_energy - energy) < thr_energy * abs(energy))
+
+end subroutine test_mixed_precision
+
+
+subroutine test_symmetry_operations(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   real(wp), parameter :: pi = 3.14159265358979323846_wp
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(symmetry_type) :: sym
+   type(rational_damping_param) :: param
+   integer :: iop
+   real(wp) :: xyz(3, 4), rot(3, 3, 6), trans(3, 6), angle
+   real(wp) :: energy, sym_energy, sigma(3, 3), sym_sigma(3, 3)
+   real(wp), allocatable :: gradient(:, :), sym_gradient(:, :)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   ! Pyramidal AH3 molecule with C3v symmetry around the z-axis
+   xyz(:, 1) = [0.0_wp, 0.0_wp, 0.25_wp]
+   rot(:, :, :) = 0.0_wp
+   trans(:, :) = 0.0_wp
+   do iop = 1, 3
+      angle = 2*pi*(iop-1)/3
+      xyz(:, iop+1) = [1.8_wp*cos(angle), 1.8_wp*sin(angle), -0.6_wp]
+      rot(:, :, iop) = reshape([cos(angle), sin(angle), 0.0_wp, &
+         & -sin(angle), cos(angle), 0.0_wp, 0.0_wp, 0.0_wp, 1.0_wp], [3, 3])
+      rot(:, :, iop+3) = rot(:, :, iop)
+      rot(:, 2, iop+3) = -rot(:, 2, iop)
+   end do
+   call new(mol, [7, 1, 1, 1], xyz)
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   call new_symmetry(error, sym, mol, rot, trans)
+   if (allocated(error)) return
+   call check(error, sym%nuniq, 2)
+   if (allocated(error)) return
+
+   allocate(gradient(3, mol%nat), sym_gradient(3, mol%nat))
+   call get_dispersion(mol, d4, param, realspace_cutoff(), energy, gradient, sigma)
+   call get_dispersion(mol, d4, param, realspace_cutoff(), sym_energy, sym_gradient, &
+      & sym_sigma, symmetry=sym)
+
+   call check(error, sym_energy, energy, thr=thr)
+   if (allocated(error)) return
+   if (any(abs(sym_gradient - gradient) > thr) .or. any(abs(sym_sigma - sigma) > thr)) then
+      call test_failed(error, "Symmetry-reduced derivatives do not match")
+      return
+   end if
+
+   ! A twofold rotation around the z-axis is not a symmetry of this molecule
+   rot(:, :, 2) = reshape([-1, 0, 0, 0, -1, 0, 0, 0, 1], [3, 3])
+   call new_symmetry(error, sym, mol, rot(:, :, :2), trans(:, :2))
+   if (.not.allocated(error)) then
+      call test_failed(error, "Invalid symmetry operation was accepted")
+   else
+      deallocate(error)
+   end if
+
+end subroutine test_symmetry_operations
+
+
+subroutine test_incremental_moves(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol, moved
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   type(incremental_dispersion) :: state
+   real(wp) :: energy, moved_energy, delta, reverse
+   real(wp), allocatable :: xyz(:, :)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "MB16-43", "01")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   call get_dispersion(mol, d4, param, realspace_cutoff(), energy)
+   call new_incremental_dispersion(error, state, mol, d4, param, realspace_cutoff())
+   if (allocated(error)) return
+   call check(error, state%get_energy(), energy, thr=thr)
+   if (allocated(error)) return
+
+   ! Complete reevaluation of the trial structure without frozen environment
+   moved = mol
+   moved%xyz(:, [3, 5]) = moved%xyz(:, [3, 5]) + spread([0.3_wp, -0.2_wp, 0.1_wp], 2, 2)
+   call get_dispersion(moved, d4, param, realspace_cutoff(), moved_energy)
+   call state%propose_displacement(error, d4, param, realspace_cutoff(), [3, 5], &
+      & moved%xyz(:, [3, 5]), .false., delta)
+   if (allocated(error)) return
+   call check(error, delta, moved_energy - energy, thr=thr)
+   if (allocated(error)) return
+
+   ! Moving the atoms back with frozen environment restores the energy
+   call state%propose_displacement(error, d4, param, realspace_cutoff(), [3, 5], &
+      & moved%xyz(:, [3, 5]), .true., delta)
+   if (allocated(error)) return
+   call state%accept_move(error)
+   if (allocated(error)) return
+   call state%propose_displacement(error, d4, param, realspace_cutoff(), [3, 5], &
+      & mol%xyz(:, [3, 5]), .true., reverse)
+   if (allocated(error)) return
+   call check(error, delta + reverse, 0.0_wp, thr=thr)
+   if (allocated(error)) return
+   call state%accept_move(error)
+   if (allocated(error)) return
+   call check(error, state%get_energy(), energy, thr=thr)
+   if (allocated(error)) return
+
+   ! Deleting an inserted atom restores the energy
+   xyz = reshape(mol%xyz(:, 1) + [0.0_wp, 0.0_wp, 3.5_wp], [3, 1])
+   call state%propose_insertion(error, d4, param, realspace_cutoff(), &
+      & [mol%num(mol%id(1))], xyz, .true., delta)
+   if (allocated(error)) return
+   call state%accept_move(error)
+   if (allocated(error)) return
+   call check(error, state%get_natoms(), mol%nat + 1)
+   if (allocated(error)) return
+   call state%propose_deletion(error, d4, param, realspace_cutoff(), [mol%nat + 1], &
+      & .true., reverse)
+   if (allocated(error)) return
+   call check(error, delta + reverse, 0.0_wp, thr=thr)
+   if (allocated(error)) return
+
+   ! Nothing to accept after rejecting the move
+   call state%reject_move()
+   call state%accept_move(error)
+   if (.not.allocated(error)) then
+      call test_failed(error, "Accepted move without proposal")
+      return
+   else
+      deallocate(error)
+   end if
+
+   ! Inserted atoms beyond the reserved storage including the long-range tail
+   call get_structure(mol, "X23", "ammonia")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   call get_dispersion(mol, d4, param, realspace_cutoff(tail=.true.), energy)
+   call new_incremental_dispersion(error, state, mol, d4, param, &
+      & realspace_cutoff(tail=.true.))
+   if (allocated(error)) return
+   call check(error, state%get_energy(), energy, thr=thr)
+   if (allocated(error)) return
+
+   xyz = reshape([mol%xyz(:, 1) + [2.5_wp, 0.0_wp, 0.0_wp], &
+      & mol%xyz(:, 1) + [0.0_wp, 2.5_wp, 0.0_wp]], [3, 2])
+   call state%propose_insertion(error, d4, param, realspace_cutoff(tail=.true.), &
+      & mol%num(mol%id(:2)), xyz, .true., delta)
+   if (allocated(error)) return
+   call state%accept_move(error)
+   if (allocated(error)) return
+   call state%propose_insertion(error, d4, param, realspace_cutoff(tail=.true.), &
+      & mol%num(mol%id(:2)), xyz + 1.5_wp, .true., moved_energy)
+   if (allocated(error)) return
+   call state%accept_move(error)
+   if (allocated(error)) return
+   call check(error, state%get_natoms(), mol%nat + 4)
+   if (allocated(error)) return
+   call state%propose_deletion(error, d4, param, realspace_cutoff(tail=.true.), &
+      & [mol%nat + 1, mol%nat + 2, mol%nat + 4, mol%nat + 3], .true., reverse)
+   if (allocated(error)) return
+   call state%accept_move(error)
+   if (allocated(error)) return
+   call check(error, delta + moved_energy + reverse, 0.0_wp, thr=thr)
+   if (allocated(error)) return
+   call check(error, state%get_energy(), energy, thr=thr)
+   if (allocated(error)) return
+
+end subroutine test_incremental_moves
+
+
+subroutine test_embedded_region(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   type(embedding_dispersion) :: state
+   real(wp) :: energy, er, el
+   real(wp), allocatable :: gradient(:, :), sigma(:, :), numgrad(:, :)
+   integer :: iat, ic
+   integer, parameter :: region(2) = [3, 5]
+   real(wp), parameter :: step = 1.0e-6_wp
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "MB16-43", "01")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   allocate(gradient(3, mol%nat), sigma(3, 3), numgrad(3, mol%nat))
+   call get_dispersion(mol, d4, param, realspace_cutoff(), energy, gradient, sigma)
+
+   ! Unchanged structure reproduces the complete evaluation
+   call new_embedding_dispersion(error, state, mol, d4, param, realspace_cutoff(), &
+      & region)
+   if (allocated(error)) return
+   call state%get_dispersion(error, mol, d4, param, realspace_cutoff(), er, gradient)
+   if (allocated(error)) return
+   call check(error, er, energy, thr=thr)
+   if (allocated(error)) return
+
+   ! Gradient w.r.t. the region atoms, environment atoms are fixed
+   numgrad(:, :) = 0.0_wp
+   do iat = 1, size(region)
+      do ic = 1, 3
+         mol%xyz(ic, region(iat)) = mol%xyz(ic, region(iat)) + step
+         call state%get_dispersion(error, mol, d4, param, realspace_cutoff(), er)
+         if (allocated(error)) return
+         mol%xyz(ic, region(iat)) = mol%xyz(ic, region(iat)) - 2*step
+         call state%get_dispersion(error, mol, d4, param, realspace_cutoff(), el)
+         if (allocated(error)) return
+         mol%xyz(ic, region(iat)) = mol%xyz(ic, region(iat)) + step
+         numgrad(ic, region(iat)) = 0.5_wp*(er - el)/step
+      end do
+   end do
+
+   if (any(abs(gradient - numgrad) > thr2)) then
+      call test_failed(error, "Gradient of embedded region does not match")
+      print'(3es21.14)', gradient - numgrad
+   end if
+   if (allocated(error)) return
+
+   call new_embedding_dispersion(error, state, mol, d4, param, realspace_cutoff(), &
+      & [3, 3])
+   if (.not.allocated(error)) then
+      call test_failed(error, "Accepted region with duplicated atoms")
+   else
+      deallocate(error)
+   end if
+
+end subroutine test_embedded_region
+
+
+subroutine test_external_charges(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   real(wp) :: energy, qenergy
+   real(wp), allocatable :: gradient(:, :), sigma(:, :), qgradient(:, :), qsigma(:, :)
+   real(wp), allocatable :: cn(:), q(:), qprop(:), c6(:, :), alpha(:)
+   real(wp), allocatable :: dqdr(:, :, :), dqdL(:, :, :)
+   real(wp), allocatable :: energy2(:, :), energy3(:, :), qenergy2(:, :), qenergy3(:, :)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "MB16-43", "01")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   allocate(gradient(3, mol%nat), sigma(3, 3), qgradient(3, mol%nat), qsigma(3, 3), &
+      & cn(mol%nat), q(mol%nat), qprop(mol%nat), alpha(mol%nat), c6(mol%nat, mol%nat), &
+      & dqdr(3, mol%nat, mol%nat), dqdL(3, 3, mol%nat), &
+      & energy2(mol%nat, mol%nat), energy3(mol%nat, mol%nat), &
+      & qenergy2(mol%nat, mol%nat), qenergy3(mol%nat, mol%nat))
+   call get_charges(d4%mchrg, mol, error, q, dqdr, dqdL)
+   if (allocated(error)) return
+
+   ! Charges of the electronegativity equilibration model reproduce the default
+   call get_dispersion(mol, d4, param, realspace_cutoff(), energy, gradient, sigma)
+   call get_dispersion(mol, d4, param, realspace_cutoff(), qenergy, qgradient, qsigma, &
+      & charges=q, dqdr=dqdr, dqdL=dqdL)
+   call check(error, qenergy, energy, thr=thr)
+   if (allocated(error)) return
+   if (any(abs(qgradient - gradient) > thr) .or. any(abs(qsigma - sigma) > thr)) then
+      call test_failed(error, "Gradient with external charges does not match")
+   end if
+   if (allocated(error)) return
+
+   call get_pairwise_dispersion(mol, d4, param, realspace_cutoff(), energy2, energy3)
+   call get_pairwise_dispersion(mol, d4, param, realspace_cutoff(), qenergy2, qenergy3, &
+      & charges=q)
+   if (any(abs(qenergy2 - energy2) > thr) .or. any(abs(qenergy3 - energy3) > thr)) then
+      call test_failed(error, "Pairwise energies with external charges do not match")
+   end if
+   if (allocated(error)) return
+
+   ! Other charges change the energy and are returned as properties
+   q(:) = 0.5_wp * q
+   call get_dispersion(mol, d4, param, realspace_cutoff(), qenergy, charges=q)
+   call get_pairwise_dispersion(mol, d4, param, realspace_cutoff(), qenergy2, qenergy3, &
+      & charges=q)
+   call check(error, sum(qenergy2) + sum(qenergy3), qenergy, thr=thr)
+   if (allocated(error)) return
+   if (abs(qenergy - energy) < thr) then
+      call test_failed(error, "Energy does not depend on external charges")
+   end if
+   if (allocated(error)) return
+
+   call get_properties(mol, d4, realspace_cutoff(), cn, qprop, c6, alpha, charges=q)
+   if (any(abs(qprop - q) > thr)) then
+      call test_failed(error, "External charges not returned as properties")
+   end if
+
+end subroutine test_external_charges
+
+
+subroutine test_iterative_charges(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(eeq_solver) :: solver, displaced
+   real(wp), allocatable :: chi(:), eta(:), rad(:), q(:), qr(:), ql(:), dqdr(:, :, :)
+   real(wp), allocatable :: numdr(:, :, :), qref(:), dqdL(:, :, :), dEdq(:)
+   real(wp), allocatable :: gradient(:, :), gref(:, :)
+   real(wp) :: sigma(3, 3), sref(3, 3)
+   integer :: iat, ic
+   real(wp), parameter :: step = 1.0e-4_wp
+
+   call get_structure(mol, "MB16-43", "01")
+   allocate(chi(mol%nat), eta(mol%nid), rad(mol%nid), q(mol%nat), qr(mol%nat), &
+      & ql(mol%nat), dqdr(3, mol%nat, mol%nat), numdr(3, mol%nat, mol%nat))
+   chi(:) = 0.1_wp * sin(real(mol%num(mol%id), wp))
+   eta(:) = 0.6_wp + 0.05_wp * cos(real(mol%num, wp))
+   rad(:) = 1.0_wp + 0.02_wp * mol%num
+
+   call new_eeq_solver(solver, conv=1.0e-13_wp)
+   call solver%solve(error, mol, chi, eta, rad, q, dqdr=dqdr)
+   if (allocated(error)) return
+   call check(error, sum(q), mol%charge, thr=thr)
+   if (allocated(error)) return
+
+   ! The molecule is within the cutoff, the complete Coulomb interaction is recovered
+   allocate(qref(mol%nat))
+   call get_dense_charges(mol, chi, eta, rad, qref)
+   if (any(abs(q - qref) > 1.0e-10_wp)) then
+      call test_failed(error, "Charges do not match dense solution")
+      print'(3es21.14)', q - qref
+   end if
+   if (allocated(error)) return
+
+   ! Solution of the previous step is already converged
+   call solver%solve(error, mol, chi, eta, rad, q, dqdr=dqdr)
+   if (allocated(error)) return
+   call check(error, solver%iterations, 0)
+   if (allocated(error)) return
+
+   call new_eeq_solver(displaced, conv=1.0e-13_wp)
+   do iat = 1, mol%nat
+      do ic = 1, 3
+         mol%xyz(ic, iat) = mol%xyz(ic, iat) + step
+         call displaced%solve(error, mol, chi, eta, rad, qr)
+         if (allocated(error)) return
+         mol%xyz(ic, iat) = mol%xyz(ic, iat) - 2*step
+         call displaced%solve(error, mol, chi, eta, rad, ql)
+         if (allocated(error)) return
+         mol%xyz(ic, iat) = mol%xyz(ic, iat) + step
+         numdr(ic, iat, :) = 0.5_wp*(qr - ql)/step
+      end do
+   end do
+
+   if (any(abs(dqdr - numdr) > thr2)) then
+      call test_failed(error, "Charge derivatives do not match")
+      print'(3es21.14)', dqdr - numdr
+   end if
+   if (allocated(error)) return
+
+   ! Response of the charges from the adjoint system instead of the dense derivatives
+   allocate(dqdL(3, 3, mol%nat), dEdq(mol%nat), gradient(3, mol%nat), &
+      & gref(3, mol%nat), source=0.0_wp)
+   dEdq(:) = 0.01_wp * cos(real(mol%num(mol%id), wp))
+   sigma(:, :) = 0.0_wp
+   call solver%solve(error, mol, chi, eta, rad, q, dqdr=dqdr, dqdL=dqdL, &
+      & dEdq=dEdq, gradient=gradient, sigma=sigma)
+   if (allocated(error)) return
+   do iat = 1, mol%nat
+      gref(:, :) = gref + dEdq(iat) * dqdr(:, :, iat)
+   end do
+   sref(:, :) = 0.0_wp
+   do iat = 1, mol%nat
+      sref(:, :) = sref + dEdq(iat) * dqdL(:, :, iat)
+   end do
+
+   if (any(abs(gradient - gref) > thr)) then
+      call test_failed(error, "Charge response gradient does not match")
+      print'(3es21.14)', gradient - gref
+   end if
+   if (allocated(error)) return
+
+   if (any(abs(sigma - sref) > thr)) then
+      call test_failed(error, "Charge response virial does not match")
+      print'(3es21.14)', sigma - sref
+   end if
+
+end subroutine test_iterative_charges
+
+
+!> Solve the electronegativity equilibration for a molecule with the complete
+!> Coulomb interaction by Gaussian elimination of the bordered linear system
+subroutine get_dense_charges(mol, chi, eta, rad, qvec)
+
+   !> Molecular structure data
+   type(structure_type), intent(in) :: mol
+
+   !> Electronegativity of each atom
+   real(wp), intent(in) :: chi(:)
+
+   !> Chemical hardness of each species
+   real(wp), intent(in) :: eta(:)
+
+   !> Width of the Gaussian charge distribution of each species
+   real(wp), intent(in) :: rad(:)
+
+   !> Atomic partial charges
+   real(wp), intent(out) :: qvec(:)
+
+   integer :: iat, jat, ipiv, n
+   real(wp) :: r1, gam
+   real(wp), allocatable :: amat(:, :), xvec(:)
+
+   n = mol%nat + 1
+   allocate(amat(n, n), xvec(n))
+   amat(:, :) = 0.0_wp
+   do iat = 1, mol%nat
+      do jat = 1, mol%nat
+         gam = 1.0_wp / sqrt(rad(mol%id(iat))**2 + rad(mol%id(jat))**2)
+         if (iat == jat) then
+            amat(iat, iat) = eta(mol%id(iat)) + 2*gam/sqrt(acos(-1.0_wp))
+         else
+            r1 = norm2(mol%xyz(:, iat) - mol%xyz(:, jat))
+            amat(iat, jat) = erf(gam*r1)/r1
+         end if
+      end do
+   end do
+   amat(:mol%nat, n) = 1.0_wp
+   amat(n, :mol%nat) = 1.0_wp
+   xvec(:mol%nat) = -chi
+   xvec(n) = mol%charge
+
+   do iat = 1, n
+      ipiv = iat - 1 + maxloc(abs(amat(iat:, iat)), 1)
+      amat([iat, ipiv], :) = amat([ipiv, iat], :)
+      xvec([iat, ipiv]) = xvec([ipiv, iat])
+      do jat = iat + 1, n
+         xvec(jat) = xvec(jat) - amat(jat, iat) / amat(iat, iat) * xvec(iat)
+         amat(jat, :) = amat(jat, :) - amat(jat, iat) / amat(iat, iat) * amat(iat, :)
+      end do
+   end do
+   do iat = n, 1, -1
+      xvec(iat) = (xvec(iat) - sum(amat(iat, iat+1:) * xvec(iat+1:))) / amat(iat, iat)
+   end do
+   qvec(:) = xvec(:mol%nat)
+
+end subroutine get_dense_charges
+
+
+subroutine test_reference_cache(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4, ref
+   type(d4s_model) :: d4s, refs
+
+   call get_structure(mol, "MB16-43", "01")
+   call clear_reference_cache
+   call new_d4_model(error, ref, mol, qmod=d4_qmod%gfn2)
+   if (allocated(error)) return
+   call new_d4s_model(error, refs, mol, ga=2.5_wp)
+   if (allocated(error)) return
+
+   ! Models created from the cache must reproduce the freshly integrated data
+   call clear_reference_cache
+   call prewarm_reference_cache(mol%num, qmod=d4_qmod%gfn2)
+   call prewarm_reference_cache(mol%num(:3), ga=2.5_wp)
+   call new_d4_model(error, d4, mol, qmod=d4_qmod%gfn2)
+   if (allocated(error)) return
+   call new_d4s_model(error, d4s, mol, ga=2.5_wp)
+   if (allocated(error)) return
+
+   if (any(abs(d4%c6 - ref%c6) > thr) .or. any(abs(d4%aiw - ref%aiw) > thr)) then
+      call test_failed(error, "Reference C6 coefficients from cache do not match")
+   end if
+   if (allocated(error)) return
+   if (any(abs(d4s%c6 - refs%c6) > thr) .or. any(abs(d4s%aiw - refs%aiw) > thr)) then
+      call test_failed(error, "Reference C6 coefficients from cache do not match")
+   end if
+
+end subroutine test_reference_cache
+
+
+subroutine test_dispersion_results(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   type(realspace_cutoff) :: cutoff
+   real(wp) :: energy, eref, energy2b, energy3b
+   real(wp), allocatable :: gradient(:, :), sigma(:, :), gref(:, :), sref(:, :)
+   real(wp), allocatable :: energies(:), cn(:), q(:), c6(:, :), alpha(:)
+   real(wp), allocatable :: cnref(:), qref(:), c6ref(:, :), aref(:)
+   real(wp), allocatable :: pair2(:, :), pair3(:, :), p2ref(:, :), p3ref(:, :)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "X23", "formamide")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   cutoff = realspace_cutoff(disp2=40.0_wp, disp3=25.0_wp, cn=30.0_wp)
+
+   allocate(gradient(3, mol%nat), sigma(3, 3), gref(3, mol%nat), sref(3, 3), &
+      & energies(mol%nat), cn(mol%nat), q(mol%nat), c6(mol%nat, mol%nat), &
+      & alpha(mol%nat), cnref(mol%nat), qref(mol%nat), c6ref(mol%nat, mol%nat), &
+      & aref(mol%nat), pair2(mol%nat, mol%nat), pair3(mol%nat, mol%nat), &
+      & p2ref(mol%nat, mol%nat), p3ref(mol%nat, mol%nat))
+
+   call get_dispersion(mol, d4, param, cutoff, eref, gref, sref)
+   call get_properties(mol, d4, cutoff, cnref, qref, c6ref, aref)
+   call get_pairwise_dispersion(mol, d4, param, cutoff, p2ref, p3ref)
+
+   call get_dispersion_results(mol, d4, param, cutoff, energy, gradient, sigma, &
+      & energy2b, energy3b, energies, cn, q, c6, alpha, pair2, pair3)
+
+   call check(error, energy, eref, thr=thr)
+   if (allocated(error)) return
+   call check(error, energy2b, sum(p2ref), thr=thr)
+   if (allocated(error)) return
+   call check(error, energy3b, sum(p3ref), thr=thr)
+   if (allocated(error)) return
+   call check(error, sum(energies), eref, thr=thr)
+   if (allocated(error)) return
+   if (any(abs(gradient - gref) > thr) .or. any(abs(sigma - sref) > thr)) then
+      call test_failed(error, "Gradient does not match")
+   end if
+   if (allocated(error)) return
+   ! The charges are solved with their derivatives here, which can change them
+   ! in the last digits compared to solving for the charges alone
+   if (any(abs(cn - cnref) > thr) .or. any(abs(q - qref) > thr2) &
+      & .or. any(abs(c6 - c6ref) > thr2) .or. any(abs(alpha - aref) > thr2)) then
+      call test_failed(error, "Properties do not match")
+   end if
+   if (allocated(error)) return
+   if (any(abs(pair2 - p2ref) > thr) .or. any(abs(pair3 - p3ref) > thr)) then
+      call test_failed(error, "Pairwise dispersion energies do not match")
+   end if
+   if (allocated(error)) return
+
+   ! Only the energy requested
+   call get_dispersion_results(mol, d4, param, cutoff, energy)
+   call check(error, energy, eref, thr=thr)
+
+end subroutine test_dispersion_results
+
+
+subroutine test_dispersion_multi(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param(3)
+   type(realspace_cutoff) :: cutoff
+   real(wp) :: energy(3), eref
+   real(wp), allocatable :: gradient(:, :, :), sigma(:, :, :), gref(:, :), sref(:, :)
+   integer :: iparam
+
+   param(1) = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+   param(2) = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 0.0_wp, alp = 16.0_wp, &
+      & s8 = 0.95948085_wp, a1 = 0.38574991_wp, a2 = 4.80688534_wp)
+   param(3) = rational_damping_param(&
+      & s6 = 0.8_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 2.0_wp, a1 = 0.5_wp, a2 = 5.0_wp)
+
+   call get_structure(mol, "X23", "formamide")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   cutoff = realspace_cutoff(disp2=40.0_wp, disp3=25.0_wp, cn=30.0_wp)
+
+   allocate(gradient(3, mol%nat, size(param)), sigma(3, 3, size(param)), &
+      & gref(3, mol%nat), sref(3, 3))
+   call get_dispersion_multi(mol, d4, param, cutoff, energy, gradient, sigma)
+
+   do iparam = 1, size(param)
+      call get_dispersion(mol, d4, param(iparam), cutoff, eref, gref, sref)
+      call check(error, energy(iparam), eref, thr=thr)
+      if (allocated(error)) return
+      if (any(abs(gradient(:, :, iparam) - gref) > thr) &
+         & .or. any(abs(sigma(:, :, iparam) - sref) > thr)) then
+         call test_failed(error, "Gradient does not match")
+         return
+      end if
+   end do
+
+end subroutine test_dispersion_multi
+
+
+subroutine test_dispersion_images(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   integer, parameter :: nimg = 3
+   type(structure_type) :: mol, img
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   type(realspace_cutoff) :: cutoff
+   real(wp) :: energy(nimg), eref
+   real(wp), allocatable :: xyz(:, :, :), lattice(:, :, :)
+   real(wp), allocatable :: gradient(:, :, :), sigma(:, :, :), gref(:, :), sref(:, :)
+   integer :: iimg
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "X23", "formamide")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   cutoff = realspace_cutoff(disp2=40.0_wp, disp3=25.0_wp, cn=30.0_wp)
+
+   allocate(xyz(3, mol%nat, nimg), lattice(3, 3, nimg))
+   do iimg = 1, nimg
+      xyz(:, :, iimg) = mol%xyz * (0.98_wp + 0.02_wp*iimg)
+      lattice(:, :, iimg) = mol%lattice * (0.98_wp + 0.02_wp*iimg)
+   end do
+
+   allocate(gradient(3, mol%nat, nimg), sigma(3, 3, nimg), gref(3, mol%nat), sref(3, 3))
+   call get_dispersion_images(mol, d4, param, cutoff, xyz, lattice, energy, gradient, sigma)
+
+   img = mol
+   do iimg = 1, nimg
+      img%xyz(:, :) = xyz(:, :, iimg)
+      img%lattice(:, :) = lattice(:, :, iimg)
+      call get_dispersion(img, d4, param, cutoff, eref, gref, sref)
+      call check(error, energy(iimg), eref, thr=thr)
+      if (allocated(error)) return
+      if (any(abs(gradient(:, :, iimg) - gref) > thr) &
+         & .or. any(abs(sigma(:, :, iimg) - sref) > thr)) then
+         call test_failed(error, "Gradient does not match")
+         return
+      end if
+   end do
+
+   call get_dispersion_images(mol, d4, param, cutoff, xyz, energy=energy)
+   img%xyz(:, :) = xyz(:, :, 2)
+   img%lattice(:, :) = mol%lattice
+   call get_dispersion(img, d4, param, cutoff, eref)
+   call check(error, energy(2), eref, thr=thr)
+
+end subroutine test_dispersion_images
+
+
+subroutine test_pair_data(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(realspace_cutoff) :: cutoff
+   real(wp), allocatable :: c6(:, :), c6_3(:, :), rrij(:, :), cn(:), q(:), &
+      & c6ref(:, :), alpha(:), qzero(:)
+
+   call get_structure(mol, "MB16-43", "01")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   cutoff = realspace_cutoff()
+
+   allocate(c6(mol%nat, mol%nat), c6_3(mol%nat, mol%nat), rrij(mol%nat, mol%nat), &
+      & c6ref(mol%nat, mol%nat), cn(mol%nat), q(mol%nat), alpha(mol%nat))
+   allocate(qzero(mol%nat), source=0.0_wp)
+   call get_pair_data(mol, d4, cutoff, c6, c6_3, rrij)
+
+   call get_properties(mol, d4, cutoff, cn, q, c6ref, alpha)
+   if (any(abs(c6 - c6ref) > thr)) then
+      call test_failed(error, "Two-body C6 coefficients do not match")
+      return
+   end if
+
+   call get_properties(mol, d4, cutoff, cn, q, c6ref, alpha, charges=qzero)
+   if (any(abs(c6_3 - c6ref) > thr)) then
+      call test_failed(error, "Three-body C6 coefficients do not match")
+      return
+   end if
+
+   call check(error, rrij(1, 2), 3*d4%r4r2(mol%id(1))*d4%r4r2(mol%id(2)), thr=thr)
+   if (allocated(error)) return
+   if (any(abs(rrij - transpose(rrij)) > thr)) then
+      call test_failed(error, "Products of r4r2 expectation values are not symmetric")
+      return
+   end if
+
+end subroutine test_pair_data
+
+
+subroutine test_sparse_pairwise(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   type(realspace_cutoff) :: cutoff
+   type(pair_list) :: pairs2, pairs3
+   real(wp), allocatable :: energy2(:, :), energy3(:, :)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "X23", "formamide")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   cutoff = realspace_cutoff(disp2=30.0_wp, disp3=15.0_wp, cn=30.0_wp)
+
+   allocate(energy2(mol%nat, mol%nat), energy3(mol%nat, mol%nat))
+   call get_pairwise_dispersion(mol, d4, param, cutoff, energy2, energy3)
+   call get_sparse_pairwise_dispersion(mol, d4, param, cutoff, 0.0_wp, pairs2, pairs3)
+
+   call check_pairs(error, pairs2, energy2)
+   if (allocated(error)) return
+   call check_pairs(error, pairs3, energy3)
+   if (allocated(error)) return
+
+   call get_sparse_pairwise_dispersion(mol, d4, param, cutoff, 1.0e-6_wp, pairs2, pairs3)
+   if (any(abs(pairs2%energy) < 1.0e-6_wp) .or. any(abs(pairs3%energy) < 1.0e-6_wp)) then
+      call test_failed(error, "Pairs below threshold are present")
+      return
+   end if
+
+   ! Atoms outside of the reference cell have partners beyond the lattice points
+   ! of the reference cell
+   mol%xyz(:, 1) = mol%xyz(:, 1) + mol%lattice(:, 1) - mol%lattice(:, 3)
+   mol%xyz(:, 2) = mol%xyz(:, 2) - mol%lattice(:, 2)
+   call get_pairwise_dispersion(mol, d4, param, cutoff, energy2, energy3)
+   call get_sparse_pairwise_dispersion(mol, d4, param, cutoff, 0.0_wp, pairs2, pairs3)
+
+   call check_pairs(error, pairs3, energy3)
+   if (allocated(error)) return
+
+contains
+
+   subroutine check_pairs(error, pairs, energy)
+      type(error_type), allocatable, intent(out) :: error
+      type(pair_list), intent(in) :: pairs
+      real(wp), intent(in) :: energy(:, :)
+
+      real(wp), allocatable :: dense(:, :)
+      integer :: iat, jat, ip
+
+      allocate(dense(size(energy, 1), size(energy, 2)), source=0.0_wp)
+      do iat = 1, size(pairs%rowptr) - 1
+         do ip = pairs%rowptr(iat) + 1, pairs%rowptr(iat+1)
+            jat = pairs%jat(ip)
+            dense(jat, iat) = dense(jat, iat) + 0.5_wp * pairs%energy(ip)
+            dense(iat, jat) = dense(iat, jat) + 0.5_wp * pairs%energy(ip)
+         end do
+      end do
+
+      call check(error, sum(pairs%energy), sum(energy), thr=thr)
+      if (allocated(error)) return
+      if (any(abs(dense - energy) > thr)) then
+         call test_failed(error, "Sparse pairwise energies do not match")
+      end if
+   end subroutine check_pairs
+
+end subroutine test_sparse_pairwise
+
+
+subroutine test_fragment_pairwise(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   type(realspace_cutoff) :: cutoff
+   integer, parameter :: nfrag = 3
+   integer :: iat, jat, ifr
+   integer, allocatable :: fragment(:)
+   real(wp), allocatable :: energy2(:, :), energy3(:, :)
+   real(wp) :: ref2(nfrag, nfrag), ref3(nfrag, nfrag)
+   real(wp) :: frag2(nfrag, nfrag), frag3(nfrag, nfrag)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "X23", "formamide")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   cutoff = realspace_cutoff(disp2=30.0_wp, disp3=15.0_wp, cn=30.0_wp)
+
+   fragment = [(mod(iat, nfrag) + 1, iat = 1, mol%nat)]
+   allocate(energy2(mol%nat, mol%nat), energy3(mol%nat, mol%nat))
+   call get_pairwise_dispersion(mol, d4, param, cutoff, energy2, energy3)
+   ref2(:, :) = 0.0_wp
+   ref3(:, :) = 0.0_wp
+   do iat = 1, mol%nat
+      do jat = 1, mol%nat
+         ref2(fragment(jat), fragment(iat)) = ref2(fragment(jat), fragment(iat)) &
+            & + energy2(jat, iat)
+         ref3(fragment(jat), fragment(iat)) = ref3(fragment(jat), fragment(iat)) &
+            & + energy3(jat, iat)
+      end do
+   end do
+
+   call get_pairwise_dispersion(mol, d4, param, cutoff, frag2, frag3, &
+      & fragment=fragment)
+   if (any(abs(frag2 - ref2) > thr) .or. any(abs(frag3 - ref3) > thr)) then
+      call test_failed(error, "Fragment energies do not match pairwise energies")
+      return
+   end if
+
+   do ifr = 1, nfrag
+      ref2(ifr, ifr) = 0.0_wp
+      ref3(ifr, ifr) = 0.0_wp
+   end do
+   call get_pairwise_dispersion(mol, d4, param, cutoff, frag2, frag3, &
+      & fragment=fragment, interaction=.true.)
+   if (any(abs(frag2 - ref2) > thr) .or. any(abs(frag3 - ref3) > thr)) then
+      call test_failed(error, "Fragment interaction energies do not match")
+      return
+   end if
+
+end subroutine test_fragment_pairwise
+
+
+subroutine test_selected_properties(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(d4s_model) :: d4s
+   type(realspace_cutoff) :: cutoff
+   integer :: ip
+   integer, allocatable :: pairs(:, :)
+   real(wp), allocatable :: cnref(:), qref(:), c6ref(:, :), aref(:)
+   real(wp), allocatable :: cn(:), q(:), alpha(:), c6(:)
+   real(wp), parameter :: c6_cutoff = 8.0_wp
+
+   call get_structure(mol, "X23", "formamide")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   cutoff = realspace_cutoff(cn=30.0_wp)
+
+   allocate(cnref(mol%nat), qref(mol%nat), c6ref(mol%nat, mol%nat), aref(mol%nat))
+   allocate(cn(mol%nat), q(mol%nat), alpha(mol%nat))
+   call get_properties(mol, d4, cutoff, cnref, qref, c6ref, aref)
+
+   call get_properties(mol, d4, cutoff, cn=cn, q=q)
+   if (any(abs(cn - cnref) > thr) .or. any(abs(q - qref) > thr)) then
+      call test_failed(error, "Selected coordination numbers or charges do not match")
+      return
+   end if
+
+   call get_properties(mol, d4, cutoff, alpha=alpha)
+   if (any(abs(alpha - aref) > thr)) then
+      call test_failed(error, "Selected polarizabilities do not match")
+      return
+   end if
+
+   call get_sparse_c6(mol, d4, cutoff, c6_cutoff, pairs, c6)
+   call check(error, size(c6), size(pairs, 2))
+   if (allocated(error)) return
+   if (any(pairs(1, :) < pairs(2, :))) then
+      call test_failed(error, "Sparse C6 pairs are not ordered")
+      return
+   end if
+   if (count(pairs(1, :) == pairs(2, :)) /= mol%nat) then
+      call test_failed(error, "Diagonal pairs are missing from the sparse C6")
+      return
+   end if
+   do ip = 1, size(c6)
+      call check(error, c6(ip), c6ref(pairs(1, ip), pairs(2, ip)), thr=thr)
+      if (allocated(error)) return
+   end do
+
+   call new_d4s_model(error, d4s, mol)
+   if (allocated(error)) return
+   call get_properties(mol, d4s, cutoff, c6=c6ref)
+   call get_sparse_c6(mol, d4s, cutoff, c6_cutoff, pairs, c6)
+   do ip = 1, size(c6)
+      call check(error, c6(ip), c6ref(pairs(1, ip), pairs(2, ip)), thr=thr)
+      if (allocated(error)) return
+   end do
+
+end subroutine test_selected_properties
+
+
+subroutine test_atomic_virials(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   type(realspace_cutoff) :: cutoff
+   real(wp) :: energy, eref
+   real(wp), allocatable :: gradient(:, :), sigma(:, :), gref(:, :), sref(:, :)
+   real(wp), allocatable :: energies(:), sigmas(:, :, :)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "X23", "formamide")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   cutoff = realspace_cutoff(disp2=20.0_wp, disp3=15.0_wp, cn=30.0_wp, &
+      & width2=2.0_wp, tail=.true.)
+
+   allocate(gradient(3, mol%nat), sigma(3, 3), gref(3, mol%nat), sref(3, 3), &
+      & energies(mol%nat), sigmas(3, 3, mol%nat))
+
+   call get_dispersion(mol, d4, param, cutoff, eref, gref, sref)
+
+   call get_dispersion_results(mol, d4, param, cutoff, energy, gradient, sigma, &
+      & energies=energies, sigmas=sigmas)
+
+   call check(error, energy, eref, thr=thr)
+   if (allocated(error)) return
+   call check(error, sum(energies), eref, thr=thr)
+   if (allocated(error)) return
+   if (any(abs(gradient - gref) > thr) .or. any(abs(sigma - sref) > thr)) then
+      call test_failed(error, "Gradient does not match")
+      return
+   end if
+   if (any(abs(sum(sigmas, dim=3) - sref) > thr)) then
+      call test_failed(error, "Atomic virials do not sum up to the virial")
+   end if
+
+end subroutine test_atomic_virials
+
+
+subroutine test_hessian_atoms(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   integer, parameter :: atoms(3) = [7, 2, 11]
+   real(wp), allocatable :: hessian(:, :, :, :), block(:, :, :, :)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "MB16-43", "09")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   allocate(hessian(3, mol%nat, 3, mol%nat), block(3, mol%nat, 3, size(atoms)))
+   call get_dispersion_hessian(mol, d4, param, realspace_cutoff(), hessian)
+   call get_dispersion_hessian(mol, d4, param, realspace_cutoff(), block, atoms=atoms)
+
+   if (any(abs(block - hessian(:, :, :, atoms)) > thr)) then
+      call test_failed(error, "Hessian block for selected atoms does not match")
+      return
+   end if
+
+end subroutine test_hessian_atoms
+
+
+subroutine test_hessian_columns(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param) :: param
+   integer, parameter :: chunk = 7
+   integer :: first, ncol
+   real(wp), allocatable :: hessian(:, :, :, :), columns(:, :, :), assembled(:, :, :)
+
+   param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.31183787_wp, a1 = 0.46169493_wp, a2 = 3.15711757_wp)
+
+   call get_structure(mol, "MB16-43", "09")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   allocate(hessian(3, mol%nat, 3, mol%nat), assembled(3, mol%nat, 3*mol%nat))
+   call get_dispersion_hessian(mol, d4, param, realspace_cutoff(), hessian)
+
+   do first = 1, 3*mol%nat, chunk
+      ncol = min(chunk, 3*mol%nat - first + 1)
+      allocate(columns(3, mol%nat, ncol))
+      call get_dispersion_hessian_columns(mol, d4, param, realspace_cutoff(), first, columns)
+      assembled(:, :, first:first+ncol-1) = columns
+      deallocate(columns)
+   end do
+
+   if (any(abs(assembled - reshape(hessian, shape(assembled))) > thr)) then
+      call test_failed(error, "Hessian assembled from columns does not match")
+      return
+   end if
+
+end subroutine test_hessian_columns
+
+
 subroutine test_pbed4_mb01(error)
 
    !> Error handling
@@ -20,6 +20,7 @@ module test_model
    use dftd4_model, only : dispersion_model, new_dispersion_model, d4_qmod
    use dftd4_model_d4, only : d4_model, new_d4_model
    use dftd4_model_d4s, only : d4s_model, new_d4s_model
+   use dftd4_partition, only : work_partition, new_work_partition
    use mctc_env, only : wp
    use mctc_env_testing, only : new_unittest, unittest_type, error_type, &
       & test_failed
@@ -65,6 +66,8 @@ subroutine collect_model(testsuite)
       & new_unittest("pol-D4s-mb09", test_pol_d4s_mb09), &
       & new_unittest("dpol-D4-mb10", test_dpol_d4_mb10), &
       & new_unittest("dpol-D4S-mb10", test_dpol_d4s_mb10), &
+      & new_unittest("c6-D4-partition", test_c6_d4_partition), &
+      & new_unittest("c6-D4S-partition", test_c6_d4s_partition), &
       & new_unittest("model-D4-error", test_d4_model_error, should_fail=.true.), &
       & new_unittest("model-D4S-error", test_d4s_model_error, should_fail=.true.), &
       & new_unittest("model-wrapper", test_model_wrapper), &
@@ -242,6 +245,62 @@ subroutine test_dgw_gen(error, mol, d4, with_cn, with_q, qat)
 end subroutine test_dgw_gen
 
 
+!> Partitioned C6 coefficients only contain the owned atom pairs and sum up to
+!> the complete C6 coefficients and derivatives
+subroutine test_c6_partition_gen(error, mol, d4)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Molecular structure data
+   type(structure_type), intent(in) :: mol
+
+   !> Dispersion model
+   class(dispersion_model), intent(in) :: d4
+
+   integer, parameter :: nparts = 3
+   integer :: part
+   type(work_partition) :: partition
+   real(wp), allocatable :: cn(:), q(:), gwvec(:, :, :), gwdcn(:, :, :), gwdq(:, :, :)
+   real(wp), allocatable :: c6(:, :), dc6dcn(:, :), dc6dq(:, :)
+   real(wp), allocatable :: c6p(:, :), dc6dcnp(:, :), dc6dqp(:, :)
+   real(wp), allocatable :: c6s(:, :), dc6dcns(:, :), dc6dqs(:, :)
+
+   allocate(cn(mol%nat), q(mol%nat), &
+      & gwvec(maxval(d4%ref), mol%nat, d4%ncoup), &
+      & gwdcn(maxval(d4%ref), mol%nat, d4%ncoup), &
+      & gwdq(maxval(d4%ref), mol%nat, d4%ncoup), &
+      & c6(mol%nat, mol%nat), dc6dcn(mol%nat, mol%nat), dc6dq(mol%nat, mol%nat), &
+      & c6p(mol%nat, mol%nat), dc6dcnp(mol%nat, mol%nat), dc6dqp(mol%nat, mol%nat))
+   cn(:) = 2.0_wp
+   q(:) = 0.1_wp
+
+   call d4%weight_references(mol, cn, q, gwvec, gwdcn, gwdq)
+   call d4%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+
+   allocate(c6s(mol%nat, mol%nat), dc6dcns(mol%nat, mol%nat), &
+      & dc6dqs(mol%nat, mol%nat), source=0.0_wp)
+   do part = 0, nparts - 1
+      call new_work_partition(error, partition, part, nparts)
+      if (allocated(error)) return
+      call d4%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6p, dc6dcnp, dc6dqp, partition)
+      if (count(c6p > 0.0_wp) >= count(c6 > 0.0_wp)) then
+         call test_failed(error, "Partitioned C6 coefficients contain all pairs")
+         return
+      end if
+      c6s(:, :) = c6s + c6p
+      dc6dcns(:, :) = dc6dcns + dc6dcnp
+      dc6dqs(:, :) = dc6dqs + dc6dqp
+   end do
+
+   if (any(abs(c6s - c6) > thr) .or. any(abs(dc6dcns - dc6dcn) > thr) &
+      & .or. any(abs(dc6dqs - dc6dq) > thr)) then
+      call test_failed(error, "Partitioned C6 coefficients do not match")
+   end if
+
+end subroutine test_c6_partition_gen
+
+
 subroutine test_pol_gen(error, mol, d4, ref, with_cn, with_q, qat)
 
    !> Error handling
@@ -464,7 +523,7 @@ subroutine test_gw_d4s_mb01(error)
 
    type(structure_type) :: mol
    type(d4s_model) :: d4s
-   real(wp), parameter :: ref(5, 16, 16) = reshape([&
+   real(wp), parameter :: ref(5, 16, 8) = reshape([&
       & 2.3131592204844E-01_wp, 5.4031280728148E-01_wp, 2.6137589903151E-01_wp, &
       & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 5.1809010783127E-01_wp, &
       & 4.8190989216873E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
@@ -545,219 +604,59 @@ subroutine test_gw_d4s_mb01(error)
       & 0.0000000000000E+00_wp, 3.9522919456175E-05_wp, 6.8492827950137E-01_wp, &
       & 2.3393071766261E-13_wp, 0.0000000000000E+00_wp, 1.3854678522329E-13_wp, &
       & 4.1660837709814E-06_wp, 1.0064444444547E+00_wp, 0.0000000000000E+00_wp, &
-      & 5.5310440465207E-02_wp, 8.7883262647393E-01_wp, 1.0298872576581E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 4.1485451554553E-02_wp, &
-      & 9.5851454844545E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 6.7032432969941E-05_wp, 1.0329252259896E-01_wp, &
-      & 3.9006942107954E-01_wp, 3.6487976107888E-01_wp, 0.0000000000000E+00_wp, &
-      & 2.9607006073691E-03_wp, 9.9703929939263E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 7.5207498914890E-02_wp, &
-      & 8.2630508485236E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 6.6472988033016E-02_wp, 9.3352701196698E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.5170748238388E-03_wp, 9.9748292517616E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.1199100233663E-05_wp, &
-      & 6.1735949348506E-02_wp, 5.2547467287298E-01_wp, 2.3534849766078E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.1545009180054E-08_wp, &
-      & 4.8156324470167E-03_wp, 6.8119098700326E-01_wp, 9.8640706987545E-08_wp, &
-      & 9.0609306620312E-02_wp, 9.0939069337969E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 6.6527647187693E-02_wp, &
-      & 9.3347235281231E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 5.0319522106180E-03_wp, 9.7236235992780E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.0833572554318E-11_wp, 3.0735372456843E-06_wp, &
-      & 8.7114485461151E-03_wp, 8.5918441677693E-01_wp, 1.0676321498807E-09_wp, &
-      & 4.8559648922814E-05_wp, 4.5302763715688E-02_wp, 8.3289153450766E-01_wp, &
-      & 1.2364799599275E-02_wp, 0.0000000000000E+00_wp, 4.8553772734271E-10_wp, &
-      & 1.2356257410943E-03_wp, 6.8399234763729E-01_wp, 5.1995420254894E-09_wp, &
-      & 1.2027896985957E-11_wp, 5.7304401546169E-07_wp, 2.4468959606775E-03_wp, &
-      & 1.0040005130011E+00_wp, 0.0000000000000E+00_wp, 6.0951918468791E-02_wp, &
-      & 8.6529295743687E-01_wp, 1.1079756841654E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 1.3336298784774E-02_wp, 9.8666370121523E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 3.1404764970412E-06_wp, 6.3956931077352E-02_wp, 4.7846317290481E-01_wp, &
-      & 2.9468368515225E-01_wp, 0.0000000000000E+00_wp, 3.7174949263315E-04_wp, &
-      & 9.9962825050737E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 4.4395780891660E-02_wp, 8.5383545436310E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.5290254001583E-02_wp, 9.7470974599842E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.9822583135455E-04_wp, &
-      & 9.9970177416865E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 5.6167960886507E-07_wp, 2.9078967459651E-02_wp, &
-      & 6.1859560324107E-01_wp, 1.5104287585421E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 4.9771287942905E-14_wp, 1.3962072360858E-04_wp, &
-      & 6.8484995485525E-01_wp, 1.6516463249478E-12_wp, 3.8575470395886E-02_wp, &
-      & 9.6142452960411E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.5318540756121E-02_wp, 9.7468145924388E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 1.2874045548253E-05_wp, 9.7726740456727E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 1.6273317494726E-10_wp, 2.3773118630915E-04_wp, &
-      & 8.6745414891661E-01_wp, 0.0000000000000E+00_wp, 2.3703664758231E-08_wp, &
-      & 4.8024934491719E-03_wp, 8.8424901114203E-01_wp, 4.9697715237582E-04_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.4066048552144E-05_wp, &
-      & 6.8494819902320E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 1.3920190449891E-06_wp, 1.0064472192320E+00_wp, &
-      & 0.0000000000000E+00_wp, 5.5310440465207E-02_wp, 8.7883262647393E-01_wp, &
-      & 1.0298872576581E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 4.1485451554553E-02_wp, 9.5851454844545E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 6.7032432969941E-05_wp, &
-      & 1.0329252259896E-01_wp, 3.9006942107954E-01_wp, 3.6487976107888E-01_wp, &
-      & 0.0000000000000E+00_wp, 2.9607006073691E-03_wp, 9.9703929939263E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 7.5207498914890E-02_wp, 8.2630508485236E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 6.6472988033016E-02_wp, &
-      & 9.3352701196698E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.5170748238388E-03_wp, 9.9748292517616E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.1199100233663E-05_wp, 6.1735949348506E-02_wp, 5.2547467287298E-01_wp, &
-      & 2.3534849766078E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 1.1545009180054E-08_wp, 4.8156324470167E-03_wp, 6.8119098700326E-01_wp, &
-      & 9.8640706987545E-08_wp, 9.0609306620312E-02_wp, 9.0939069337969E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 6.6527647187693E-02_wp, 9.3347235281231E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 5.0319522106180E-03_wp, &
-      & 9.7236235992780E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.0833572554318E-11_wp, &
-      & 3.0735372456843E-06_wp, 8.7114485461151E-03_wp, 8.5918441677693E-01_wp, &
-      & 1.0676321498807E-09_wp, 4.8559648922814E-05_wp, 4.5302763715688E-02_wp, &
-      & 8.3289153450766E-01_wp, 1.2364799599275E-02_wp, 0.0000000000000E+00_wp, &
-      & 4.8553772734271E-10_wp, 1.2356257410943E-03_wp, 6.8399234763729E-01_wp, &
-      & 5.1995420254894E-09_wp, 1.2027896985957E-11_wp, 5.7304401546169E-07_wp, &
-      & 2.4468959606775E-03_wp, 1.0040005130011E+00_wp, 0.0000000000000E+00_wp, &
-      & 5.5310440465207E-02_wp, 8.7883262647393E-01_wp, 1.0298872576581E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 4.1485451554553E-02_wp, &
-      & 9.5851454844545E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 6.7032432969941E-05_wp, 1.0329252259896E-01_wp, &
-      & 3.9006942107954E-01_wp, 3.6487976107888E-01_wp, 0.0000000000000E+00_wp, &
-      & 2.9607006073691E-03_wp, 9.9703929939263E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 7.5207498914890E-02_wp, &
-      & 8.2630508485236E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 6.6472988033016E-02_wp, 9.3352701196698E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.5170748238388E-03_wp, 9.9748292517616E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.1199100233663E-05_wp, &
-      & 6.1735949348506E-02_wp, 5.2547467287298E-01_wp, 2.3534849766078E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.1545009180054E-08_wp, &
-      & 4.8156324470167E-03_wp, 6.8119098700326E-01_wp, 9.8640706987545E-08_wp, &
-      & 9.0609306620312E-02_wp, 9.0939069337969E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 6.6527647187693E-02_wp, &
-      & 9.3347235281231E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 5.0319522106180E-03_wp, 9.7236235992780E-01_wp, &
+      & 6.0951918468791E-02_wp, 8.6529295743687E-01_wp, 1.1079756841654E-01_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.3336298784774E-02_wp, &
+      & 9.8666370121523E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 3.1404764970412E-06_wp, 6.3956931077352E-02_wp, &
+      & 4.7846317290481E-01_wp, 2.9468368515225E-01_wp, 0.0000000000000E+00_wp, &
+      & 3.7174949263315E-04_wp, 9.9962825050737E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 4.4395780891660E-02_wp, &
+      & 8.5383545436310E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 2.5290254001583E-02_wp, 9.7470974599842E-01_wp, &
       & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.0833572554318E-11_wp, 3.0735372456843E-06_wp, &
-      & 8.7114485461151E-03_wp, 8.5918441677693E-01_wp, 1.0676321498807E-09_wp, &
-      & 4.8559648922814E-05_wp, 4.5302763715688E-02_wp, 8.3289153450766E-01_wp, &
-      & 1.2364799599275E-02_wp, 0.0000000000000E+00_wp, 4.8553772734271E-10_wp, &
-      & 1.2356257410943E-03_wp, 6.8399234763729E-01_wp, 5.1995420254894E-09_wp, &
-      & 1.2027896985957E-11_wp, 5.7304401546169E-07_wp, 2.4468959606775E-03_wp, &
-      & 1.0040005130011E+00_wp, 0.0000000000000E+00_wp, 8.8802202146486E-02_wp, &
-      & 8.0146979806795E-01_wp, 1.4628116593891E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.2198992510853E-02_wp, 9.7780100748915E-01_wp, &
+      & 2.9822583135455E-04_wp, 9.9970177416865E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 5.6167960886507E-07_wp, &
+      & 2.9078967459651E-02_wp, 6.1859560324107E-01_wp, 1.5104287585421E-01_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 4.9771287942905E-14_wp, &
+      & 1.3962072360858E-04_wp, 6.8484995485525E-01_wp, 1.6516463249478E-12_wp, &
+      & 3.8575470395886E-02_wp, 9.6142452960411E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.5318540756121E-02_wp, &
+      & 9.7468145924388E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 1.2874045548253E-05_wp, 9.7726740456727E-01_wp, &
       & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 3.1404764970412E-06_wp, 6.3956931077352E-02_wp, 4.7846317290481E-01_wp, &
-      & 2.9468368515225E-01_wp, 0.0000000000000E+00_wp, 9.4397261326925E-04_wp, &
-      & 9.9905602738673E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.6273317494726E-10_wp, &
+      & 2.3773118630915E-04_wp, 8.6745414891661E-01_wp, 0.0000000000000E+00_wp, &
+      & 2.3703664758231E-08_wp, 4.8024934491719E-03_wp, 8.8424901114203E-01_wp, &
+      & 4.9697715237582E-04_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 1.4066048552144E-05_wp, 6.8494819902320E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.3920190449891E-06_wp, &
+      & 1.0064472192320E+00_wp, 0.0000000000000E+00_wp, 1.1619449180297E-01_wp, &
+      & 7.4292303143376E-01_wp, 1.7688691875381E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 4.5511447319703E-02_wp, 9.5448855268030E-01_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 9.2508392559746E-06_wp, 7.5824069699182E-02_wp, 4.4951921574350E-01_wp, &
+      & 3.1887288951654E-01_wp, 0.0000000000000E+00_wp, 3.5066919289813E-03_wp, &
+      & 9.9649330807102E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
       & 0.0000000000000E+00_wp, 4.4395780891660E-02_wp, 8.5383545436310E-01_wp, &
       & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 3.9032141252572E-02_wp, 9.6096785874743E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 7.7726046635812E-04_wp, &
-      & 9.9922273953364E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 5.6167960886507E-07_wp, 2.9078967459651E-02_wp, &
-      & 6.1859560324107E-01_wp, 1.5104287585421E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 8.6218571603764E-13_wp, 3.1641253888564E-04_wp, &
-      & 6.8471161857811E-01_wp, 2.0919541563050E-11_wp, 5.6611833802765E-02_wp, &
-      & 9.4338816619724E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 3.9070615176354E-02_wp, 9.6092938482365E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 1.2874045548253E-05_wp, 9.7726740456727E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.3913444097198E-09_wp, 6.3616927572147E-04_wp, &
-      & 8.6706543647995E-01_wp, 0.0000000000000E+00_wp, 1.9173135281474E-07_wp, &
-      & 8.9543641410655E-03_wp, 8.7950766885962E-01_wp, 1.2071886445160E-03_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 3.9522919456175E-05_wp, &
-      & 6.8492827950137E-01_wp, 2.3393071766261E-13_wp, 0.0000000000000E+00_wp, &
-      & 1.3854678522329E-13_wp, 4.1660837709814E-06_wp, 1.0064444444547E+00_wp, &
-      & 0.0000000000000E+00_wp, 1.1619449180297E-01_wp, 7.4292303143376E-01_wp, &
-      & 1.7688691875381E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 4.5511447319703E-02_wp, 9.5448855268030E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 9.2508392559746E-06_wp, &
-      & 7.5824069699182E-02_wp, 4.4951921574350E-01_wp, 3.1887288951654E-01_wp, &
-      & 0.0000000000000E+00_wp, 3.5066919289813E-03_wp, 9.9649330807102E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 4.4395780891660E-02_wp, 8.5383545436310E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 7.1925482699841E-02_wp, &
-      & 9.2807451730016E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.9954258724411E-03_wp, 9.9700457412756E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.0238008000468E-06_wp, 3.8055054539114E-02_wp, 5.9074525520210E-01_wp, &
-      & 1.7718982934717E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 3.4151558259365E-08_wp, 6.5639826011158E-03_wp, 6.7982280802516E-01_wp, &
-      & 2.5898101368240E-07_wp, 9.7140202686718E-02_wp, 9.0285979731328E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 7.1982878187917E-02_wp, 9.2801712181208E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.1772574193346E-03_wp, &
-      & 9.7612947599990E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 3.5689039339356E-13_wp, &
-      & 3.8192206935584E-07_wp, 4.0712983354820E-03_wp, 8.6371381723556E-01_wp, &
-      & 3.5979138804999E-11_wp, 9.7693789150509E-06_wp, 2.8536546460626E-02_wp, &
-      & 8.5530890313171E-01_wp, 6.3404470879011E-03_wp, 0.0000000000000E+00_wp, &
-      & 1.7396779713960E-09_wp, 1.8302935084816E-03_wp, 6.8352702270097E-01_wp, &
-      & 1.6312609722908E-08_wp, 0.0000000000000E+00_wp, 7.9041698936705E-09_wp, &
-      & 4.0780312005162E-04_wp, 1.0060406958243E+00_wp, 0.0000000000000E+00_wp, &
-      & 5.5310440465207E-02_wp, 8.7883262647393E-01_wp, 1.0298872576581E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 4.1485451554553E-02_wp, &
-      & 9.5851454844545E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 6.7032432969941E-05_wp, 1.0329252259896E-01_wp, &
-      & 3.9006942107954E-01_wp, 3.6487976107888E-01_wp, 0.0000000000000E+00_wp, &
-      & 2.9607006073691E-03_wp, 9.9703929939263E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 7.5207498914890E-02_wp, &
-      & 8.2630508485236E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 6.6472988033016E-02_wp, 9.3352701196698E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.5170748238388E-03_wp, 9.9748292517616E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.1199100233663E-05_wp, &
-      & 6.1735949348506E-02_wp, 5.2547467287298E-01_wp, 2.3534849766078E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.1545009180054E-08_wp, &
-      & 4.8156324470167E-03_wp, 6.8119098700326E-01_wp, 9.8640706987545E-08_wp, &
-      & 9.0609306620312E-02_wp, 9.0939069337969E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 6.6527647187693E-02_wp, &
-      & 9.3347235281231E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 5.0319522106180E-03_wp, 9.7236235992780E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.0833572554318E-11_wp, 3.0735372456843E-06_wp, &
-      & 8.7114485461151E-03_wp, 8.5918441677693E-01_wp, 1.0676321498807E-09_wp, &
-      & 4.8559648922814E-05_wp, 4.5302763715688E-02_wp, 8.3289153450766E-01_wp, &
-      & 1.2364799599275E-02_wp, 0.0000000000000E+00_wp, 4.8553772734271E-10_wp, &
-      & 1.2356257410943E-03_wp, 6.8399234763729E-01_wp, 5.1995420254894E-09_wp, &
-      & 1.2027896985957E-11_wp, 5.7304401546169E-07_wp, 2.4468959606775E-03_wp, &
-      & 1.0040005130011E+00_wp, 0.0000000000000E+00_wp, 5.5310440465207E-02_wp, &
-      & 8.7883262647393E-01_wp, 1.0298872576581E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 4.1485451554553E-02_wp, 9.5851454844545E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 6.7032432969941E-05_wp, 1.0329252259896E-01_wp, 3.9006942107954E-01_wp, &
-      & 3.6487976107888E-01_wp, 0.0000000000000E+00_wp, 2.9607006073691E-03_wp, &
-      & 9.9703929939263E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 7.5207498914890E-02_wp, 8.2630508485236E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 6.6472988033016E-02_wp, 9.3352701196698E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.5170748238388E-03_wp, &
-      & 9.9748292517616E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.1199100233663E-05_wp, 6.1735949348506E-02_wp, &
-      & 5.2547467287298E-01_wp, 2.3534849766078E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 1.1545009180054E-08_wp, 4.8156324470167E-03_wp, &
-      & 6.8119098700326E-01_wp, 9.8640706987545E-08_wp, 9.0609306620312E-02_wp, &
-      & 9.0939069337969E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 6.6527647187693E-02_wp, 9.3347235281231E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 5.0319522106180E-03_wp, 9.7236235992780E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.0833572554318E-11_wp, 3.0735372456843E-06_wp, 8.7114485461151E-03_wp, &
-      & 8.5918441677693E-01_wp, 1.0676321498807E-09_wp, 4.8559648922814E-05_wp, &
-      & 4.5302763715688E-02_wp, 8.3289153450766E-01_wp, 1.2364799599275E-02_wp, &
-      & 0.0000000000000E+00_wp, 4.8553772734271E-10_wp, 1.2356257410943E-03_wp, &
-      & 6.8399234763729E-01_wp, 5.1995420254894E-09_wp, 1.2027896985957E-11_wp, &
-      & 5.7304401546169E-07_wp, 2.4468959606775E-03_wp, 1.0040005130011E+00_wp, &
+      & 7.1925482699841E-02_wp, 9.2807451730016E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.9954258724411E-03_wp, &
+      & 9.9700457412756E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 2.0238008000468E-06_wp, 3.8055054539114E-02_wp, &
+      & 5.9074525520210E-01_wp, 1.7718982934717E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 3.4151558259365E-08_wp, 6.5639826011158E-03_wp, &
+      & 6.7982280802516E-01_wp, 2.5898101368240E-07_wp, 9.7140202686718E-02_wp, &
+      & 9.0285979731328E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 7.1982878187917E-02_wp, 9.2801712181208E-01_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 1.1772574193346E-03_wp, 9.7612947599990E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 3.5689039339356E-13_wp, 3.8192206935584E-07_wp, 4.0712983354820E-03_wp, &
+      & 8.6371381723556E-01_wp, 3.5979138804999E-11_wp, 9.7693789150509E-06_wp, &
+      & 2.8536546460626E-02_wp, 8.5530890313171E-01_wp, 6.3404470879011E-03_wp, &
+      & 0.0000000000000E+00_wp, 1.7396779713960E-09_wp, 1.8302935084816E-03_wp, &
+      & 6.8352702270097E-01_wp, 1.6312609722908E-08_wp, 0.0000000000000E+00_wp, &
+      & 7.9041698936705E-09_wp, 4.0780312005162E-04_wp, 1.0060406958243E+00_wp, &
       & 0.0000000000000E+00_wp, 1.7836181363501E-01_wp, 6.2456202118140E-01_wp, &
       & 2.3160354638897E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
       & 8.7002281543997E-02_wp, 9.1299771845600E-01_wp, 0.0000000000000E+00_wp, &
@@ -811,88 +710,35 @@ subroutine test_gw_d4s_mb01(error)
       & 4.5973534870136E-02_wp, 1.7733574164893E-13_wp, 1.2868664921572E-07_wp, &
       & 6.8690163375128E-03_wp, 6.7958369863349E-01_wp, 7.7071301908717E-07_wp, &
       & 2.5715775485838E-07_wp, 1.6957699914291E-04_wp, 2.6115927712490E-02_wp, &
-      & 9.8015581415428E-01_wp, 0.0000000000000E+00_wp, 1.5052252044350E-01_wp, &
-      & 6.7503900878048E-01_wp, 2.0966764053284E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 1.4123874345618E-01_wp, 8.5876125654382E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 3.2995570594716E-04_wp, 1.3239836014058E-01_wp, 3.3638195237351E-01_wp, &
-      & 4.0116925621724E-01_wp, 0.0000000000000E+00_wp, 2.7738482922597E-02_wp, &
-      & 9.7226151707740E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 1.2379486544581E-01_wp, 7.8289211602208E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 1.8811788794004E-01_wp, 8.1188211205996E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.5107682180162E-02_wp, &
-      & 9.7489231781984E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 1.3960579256771E-04_wp, 9.0196670358265E-02_wp, &
-      & 4.5739781308729E-01_wp, 2.9149367395236E-01_wp, 0.0000000000000E+00_wp, &
-      & 5.8317983398498E-12_wp, 1.3182770972301E-06_wp, 1.8538244187819E-02_wp, &
-      & 6.7044774462985E-01_wp, 6.6838194641483E-06_wp, 2.2640318425337E-01_wp, &
-      & 7.7359681574663E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 1.8821108711455E-01_wp, 8.1178891288545E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 1.0126387421950E-02_wp, 9.6738367035521E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.9953637089135E-12_wp, &
-      & 9.2422656035061E-08_wp, 2.2493337765938E-04_wp, 4.1001518442525E-02_wp, &
-      & 8.2747340204614E-01_wp, 1.1163506217946E-06_wp, 1.2540172388574E-03_wp, &
-      & 1.0999576750594E-01_wp, 7.3478924996110E-01_wp, 4.5973534870136E-02_wp, &
-      & 1.7733574164893E-13_wp, 1.2868664921572E-07_wp, 6.8690163375128E-03_wp, &
-      & 6.7958369863349E-01_wp, 7.7071301908717E-07_wp, 2.5715775485838E-07_wp, &
-      & 1.6957699914291E-04_wp, 2.6115927712490E-02_wp, 9.8015581415428E-01_wp, &
-      & 0.0000000000000E+00_wp, 1.1619449180297E-01_wp, 7.4292303143376E-01_wp, &
-      & 1.7688691875381E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 4.5511447319703E-02_wp, 9.5448855268030E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 9.2508392559746E-06_wp, &
-      & 7.5824069699182E-02_wp, 4.4951921574350E-01_wp, 3.1887288951654E-01_wp, &
-      & 0.0000000000000E+00_wp, 3.5066919289813E-03_wp, 9.9649330807102E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 4.4395780891660E-02_wp, 8.5383545436310E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 7.1925482699841E-02_wp, &
-      & 9.2807451730016E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.9954258724411E-03_wp, 9.9700457412756E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.0238008000468E-06_wp, 3.8055054539114E-02_wp, 5.9074525520210E-01_wp, &
-      & 1.7718982934717E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 3.4151558259365E-08_wp, 6.5639826011158E-03_wp, 6.7982280802516E-01_wp, &
-      & 2.5898101368240E-07_wp, 9.7140202686718E-02_wp, 9.0285979731328E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 7.1982878187917E-02_wp, 9.2801712181208E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.1772574193346E-03_wp, &
-      & 9.7612947599990E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 3.5689039339356E-13_wp, &
-      & 3.8192206935584E-07_wp, 4.0712983354820E-03_wp, 8.6371381723556E-01_wp, &
-      & 3.5979138804999E-11_wp, 9.7693789150509E-06_wp, 2.8536546460626E-02_wp, &
-      & 8.5530890313171E-01_wp, 6.3404470879011E-03_wp, 0.0000000000000E+00_wp, &
-      & 1.7396779713960E-09_wp, 1.8302935084816E-03_wp, 6.8352702270097E-01_wp, &
-      & 1.6312609722908E-08_wp, 0.0000000000000E+00_wp, 7.9041698936705E-09_wp, &
-      & 4.0780312005162E-04_wp, 1.0060406958243E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.1174800276996E-01_wp, 5.6964871898640E-01_wp, 2.5219928685690E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.4403797218710E-01_wp, &
-      & 7.5596202781290E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 4.8890988223564E-04_wp, 1.4079823595826E-01_wp, &
-      & 3.2239231943401E-01_wp, 4.0957756984420E-01_wp, 0.0000000000000E+00_wp, &
-      & 7.5862834744969E-02_wp, 9.2413716525503E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 1.5224097067826E-01_wp, &
-      & 7.5747542917585E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 2.9773509090075E-01_wp, 7.0226490909925E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 7.0607838000571E-02_wp, 9.2939216199943E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.2189803166994E-04_wp, &
-      & 9.8892646451660E-02_wp, 4.3831806676090E-01_wp, 3.0633584406942E-01_wp, &
-      & 0.0000000000000E+00_wp, 1.0892600979524E-09_wp, 1.9452547146752E-05_wp, &
-      & 3.9425621360989E-02_wp, 6.5404367987276E-01_wp, 7.3196915833069E-05_wp, &
-      & 3.3779631811082E-01_wp, 6.6220368188918E-01_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.9783635509721E-01_wp, &
-      & 7.0216364490279E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 0.0000000000000E+00_wp, 9.6336440102884E-03_wp, 9.6786521862972E-01_wp, &
-      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
-      & 2.4358117918347E-08_wp, 2.1339725696048E-05_wp, 3.5282099660186E-03_wp, &
-      & 1.0654366986150E-01_wp, 7.6039718337984E-01_wp, 9.5562006186987E-05_wp, &
-      & 9.4981643353880E-03_wp, 1.7700942131591E-01_wp, 6.0914264505196E-01_wp, &
-      & 9.7809437645041E-02_wp, 6.8362324068111E-11_wp, 3.0917858879577E-06_wp, &
-      & 1.8135933744590E-02_wp, 6.7075660296166E-01_wp, 1.3284665444268E-05_wp, &
-      & 2.8388831053016E-13_wp, 6.7329811561295E-08_wp, 9.9935157277430E-04_wp, &
-      & 1.0054489358913E+00_wp, 0.0000000000000E+00_wp], &
-      & [5, 16, 16])
+      & 9.8015581415428E-01_wp, 0.0000000000000E+00_wp, 2.1174800276996E-01_wp, &
+      & 5.6964871898640E-01_wp, 2.5219928685690E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 2.4403797218710E-01_wp, 7.5596202781290E-01_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 4.8890988223564E-04_wp, 1.4079823595826E-01_wp, 3.2239231943401E-01_wp, &
+      & 4.0957756984420E-01_wp, 0.0000000000000E+00_wp, 7.5862834744969E-02_wp, &
+      & 9.2413716525503E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 1.5224097067826E-01_wp, 7.5747542917585E-01_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 2.9773509090075E-01_wp, 7.0226490909925E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 7.0607838000571E-02_wp, &
+      & 9.2939216199943E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 2.2189803166994E-04_wp, 9.8892646451660E-02_wp, &
+      & 4.3831806676090E-01_wp, 3.0633584406942E-01_wp, 0.0000000000000E+00_wp, &
+      & 1.0892600979524E-09_wp, 1.9452547146752E-05_wp, 3.9425621360989E-02_wp, &
+      & 6.5404367987276E-01_wp, 7.3196915833069E-05_wp, 3.3779631811082E-01_wp, &
+      & 6.6220368188918E-01_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 2.9783635509721E-01_wp, 7.0216364490279E-01_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, &
+      & 9.6336440102884E-03_wp, 9.6786521862972E-01_wp, 0.0000000000000E+00_wp, &
+      & 0.0000000000000E+00_wp, 0.0000000000000E+00_wp, 2.4358117918347E-08_wp, &
+      & 2.1339725696048E-05_wp, 3.5282099660186E-03_wp, 1.0654366986150E-01_wp, &
+      & 7.6039718337984E-01_wp, 9.5562006186987E-05_wp, 9.4981643353880E-03_wp, &
+      & 1.7700942131591E-01_wp, 6.0914264505196E-01_wp, 9.7809437645041E-02_wp, &
+      & 6.8362324068111E-11_wp, 3.0917858879577E-06_wp, 1.8135933744590E-02_wp, &
+      & 6.7075660296166E-01_wp, 1.3284665444268E-05_wp, 2.8388831053016E-13_wp, &
+      & 6.7329811561295E-08_wp, 9.9935157277430E-04_wp, 1.0054489358913E+00_wp, &
+      & 0.0000000000000E+00_wp], &
+      & [5, 16, 8])
 
    call get_structure(mol, "MB16-43", "01")
    call new_d4s_model(error, d4s, mol)
@@ -1398,6 +1244,38 @@ subroutine test_dpol_d4s_mb10(error)
 end subroutine test_dpol_d4s_mb10
 
 
+subroutine test_c6_d4_partition(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+
+   call get_structure(mol, "MB16-43", "01")
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+   call test_c6_partition_gen(error, mol, d4)
+
+end subroutine test_c6_d4_partition
+
+
+subroutine test_c6_d4s_partition(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4s_model) :: d4s
+
+   call get_structure(mol, "MB16-43", "01")
+   call new_d4s_model(error, d4s, mol)
+   if (allocated(error)) return
+   call test_c6_partition_gen(error, mol, d4s)
+
+end subroutine test_c6_d4s_partition
+
+
 subroutine test_d4_model_error(error)
 
    !> Error handling
@@ -16,12 +16,14 @@
 
 module test_periodic
    use dftd4, only : d4_model, d4s_model, damping_param, dispersion_model, &
-      & get_dispersion, new_d4_model, new_d4s_model, rational_damping_param, &
-      & realspace_cutoff
+      & get_dispersion, get_pair_cutoffs, new_d4_model, new_d4s_model, rational_damping_param, &
+      & realspace_cutoff, symmetry_type, detect_symmetry, new_work_partition, work_partition, &
+      & get_lattice_points
+   use dftd4_utils, only : wrap_to_central_cell
    use mctc_env, only : wp
    use mctc_env_testing, only : new_unittest, unittest_type, error_type, check, &
       & test_failed
-   use mctc_io, only : structure_type
+   use mctc_io, only : structure_type, new
    use mstore, only : get_structure
    implicit none
    private
@@ -54,7 +56,16 @@ subroutine collect_periodic(testsuite)
       & new_unittest("TPSS-D4S", test_tpssd4s_ammonia), &
       & new_unittest("TPSS-D4S+ATM", test_tpssd4satm_ammonia), &
       & new_unittest("SCAN-D4", test_scand4_anthracene), &
-      & new_unittest("SCAN-D4S", test_scand4s_anthracene) &
+      & new_unittest("SCAN-D4S", test_scand4s_anthracene), &
+      & new_unittest("tail-correction", test_tail_ammonia), &
+      & new_unittest("tail-correction-grad", test_tail_grad_ammonia), &
+      & new_unittest("tail-correction-sigma", test_tail_sigma_ammonia), &
+      & new_unittest("cutoff-tolerance", test_tolerance_ammonia), &
+      & new_unittest("cutoff-tolerance-grad", test_tolerance_grad_ammonia), &
+      & new_unittest("mixed-precision", test_mixed_ammonia), &
+      & new_unittest("symmetry", test_symmetry_mmm), &
+      & new_unittest("pair-table-kernel", test_pair_kernel), &
+      & new_unittest("triple-kernel", test_triple_kernel) &
       & ]
 
 end subroutine collect_periodic
@@ -89,7 +100,7 @@ subroutine test_dftd4_gen(error, mol, d4, param, ref)
 end subroutine test_dftd4_gen
 
 
-subroutine test_numgrad(error, mol, d4, param)
+subroutine test_numgrad(error, mol, d4, param, rcut)
 
    !> Error handling
    type(error_type), allocatable, intent(out) :: error
@@ -103,25 +114,31 @@ subroutine test_numgrad(error, mol, d4, param)
    !> Damping parameters
    class(damping_param), intent(in) :: param
 
+   !> Real space cutoff, defaults to the cutoff used for all tests
+   type(realspace_cutoff), intent(in), optional :: rcut
+
    integer :: iat, ic
    real(wp) :: energy, er, el, sigma(3, 3)
    real(wp), allocatable :: gradient(:, :), numgrad(:, :)
    real(wp), parameter :: step = 1.0e-6_wp
+   type(realspace_cutoff) :: cut
 
+   cut = cutoff
+   if (present(rcut)) cut = rcut
    allocate(gradient(3, mol%nat), numgrad(3, mol%nat))
 
    do iat = 1, mol%nat
       do ic = 1, 3
          mol%xyz(ic, iat) = mol%xyz(ic, iat) + step
-         call get_dispersion(mol, d4, param, cutoff, er)
+         call get_dispersion(mol, d4, param, cut, er)
          mol%xyz(ic, iat) = mol%xyz(ic, iat) - 2*step
-         call get_dispersion(mol, d4, param, cutoff, el)
+         call get_dispersion(mol, d4, param, cut, el)
          mol%xyz(ic, iat) = mol%xyz(ic, iat) + step
          numgrad(ic, iat) = 0.5_wp*(er - el)/step
       end do
    end do
 
-   call get_dispersion(mol, d4, param, cutoff, energy, gradient, sigma)
+   call get_dispersion(mol, d4, param, cut, energy, gradient, sigma)
 
    if (any(abs(gradient - numgrad) > thr2)) then
       call test_failed(error, "Gradient of dispersion energy does not match")
@@ -131,7 +148,7 @@ subroutine test_numgrad(error, mol, d4, param)
 end subroutine test_numgrad
 
 
-subroutine test_numsigma(error, mol, d4, param)
+subroutine test_numsigma(error, mol, d4, param, rcut)
 
    !> Error handling
    type(error_type), allocatable, intent(out) :: error
@@ -145,13 +162,19 @@ subroutine test_numsigma(error, mol, d4, param)
    !> Damping parameters
    class(damping_param), intent(in) :: param
 
+   !> Real space cutoff, defaults to the cutoff used for all tests
+   type(realspace_cutoff), intent(in), optional :: rcut
+
    integer :: ic, jc
    real(wp) :: energy, er, el, sigma(3, 3), eps(3, 3), numsigma(3, 3), lattice(3, 3)
    real(wp), allocatable :: gradient(:, :), xyz(:, :)
    real(wp), parameter :: unity(3, 3) = reshape(&
       & [1, 0, 0, 0, 1, 0, 0, 0, 1], [3, 3])
    real(wp), parameter :: step = 1.0e-7_wp
+   type(realspace_cutoff) :: cut
 
+   cut = cutoff
+   if (present(rcut)) cut = rcut
    allocate(gradient(3, mol%nat), xyz(3, mol%nat))
 
    eps(:, :) = unity
@@ -162,11 +185,11 @@ subroutine test_numsigma(error, mol, d4, param)
          eps(jc, ic) = eps(jc, ic) + step
          mol%xyz(:, :) = matmul(eps, xyz)
          mol%lattice(:, :) = matmul(eps, lattice)
-         call get_dispersion(mol, d4, param, cutoff, er)
+         call get_dispersion(mol, d4, param, cut, er)
          eps(jc, ic) = eps(jc, ic) - 2*step
          mol%xyz(:, :) = matmul(eps, xyz)
          mol%lattice(:, :) = matmul(eps, lattice)
-         call get_dispersion(mol, d4, param, cutoff, el)
+         call get_dispersion(mol, d4, param, cut, el)
          eps(jc, ic) = eps(jc, ic) + step
          mol%xyz(:, :) = xyz
          mol%lattice(:, :) = lattice
@@ -174,7 +197,7 @@ subroutine test_numsigma(error, mol, d4, param)
       end do
    end do
 
-   call get_dispersion(mol, d4, param, cutoff, energy, gradient, sigma)
+   call get_dispersion(mol, d4, param, cut, energy, gradient, sigma)
 
    if (any(abs(sigma - numsigma) > thr3)) then
       call test_failed(error, "Strain derivatives do not match")
@@ -358,4 +381,469 @@ subroutine test_scand4s_anthracene(error)
 
 end subroutine test_scand4s_anthracene
 
+subroutine test_tail_ammonia(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param), parameter :: param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 0.0_wp, alp = 16.0_wp, &
+      & s8 = 1.76596355_wp, a1 = 0.42822303_wp, a2 = 4.54257102_wp )
+   real(wp) :: ref, short, tail
+   real(wp) :: sigma_ref(3, 3), sigma_short(3, 3), sigma_tail(3, 3)
+   real(wp), allocatable :: gradient(:, :)
+
+   call get_structure(mol, "X23", "ammonia")
+   call new_d4_model(error, d4, mol)
+   allocate(gradient(3, mol%nat))
+
+   call get_dispersion(mol, d4, param, realspace_cutoff(), ref, gradient, sigma_ref)
+   call get_dispersion(mol, d4, param, realspace_cutoff(disp2=20.0_wp), short, &
+      & gradient, sigma_short)
+   call get_dispersion(mol, d4, param, realspace_cutoff(disp2=20.0_wp, tail=.true.), &
+      & tail, gradient, sigma_tail)
+
+   call check(error, abs(tail - ref) < 0.1_wp * abs(short - ref))
+   if (allocated(error)) then
+      print*, ref, short, tail
+      return
+   end if
+
+   call check(error, maxval(abs(sigma_tail - sigma_ref)) &
+      & < 0.1_wp * maxval(abs(sigma_short - sigma_ref)))
+   if (allocated(error)) then
+      print"(3es21.14)", sigma_tail - sigma_ref
+   end if
+
+end subroutine test_tail_ammonia
+
+subroutine test_tail_grad_ammonia(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param), parameter :: param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 0.0_wp, alp = 16.0_wp, &
+      & s8 = 1.76596355_wp, a1 = 0.42822303_wp, a2 = 4.54257102_wp )
+
+   call get_structure(mol, "X23", "ammonia")
+   call new_d4_model(error, d4, mol)
+   call test_numgrad(error, mol, d4, param, &
+      & realspace_cutoff(disp2=20.0_wp, width2=2.0_wp, tail=.true.))
+
+end subroutine test_tail_grad_ammonia
+
+subroutine test_tail_sigma_ammonia(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param), parameter :: param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 0.0_wp, alp = 16.0_wp, &
+      & s8 = 1.76596355_wp, a1 = 0.42822303_wp, a2 = 4.54257102_wp )
+
+   call get_structure(mol, "X23", "ammonia")
+   call new_d4_model(error, d4, mol)
+   call test_numsigma(error, mol, d4, param, &
+      & realspace_cutoff(disp2=20.0_wp, width2=2.0_wp, tail=.true.))
+
+end subroutine test_tail_sigma_ammonia
+
+subroutine test_tolerance_ammonia(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param), parameter :: param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.76596355_wp, a1 = 0.42822303_wp, a2 = 4.54257102_wp )
+   real(wp), parameter :: tolerance = 1.0e-4_wp
+   real(wp) :: ref, energy, error2, error3
+   real(wp), allocatable :: disp2(:, :), disp3(:, :)
+
+   call get_structure(mol, "X23", "ammonia")
+   call new_d4_model(error, d4, mol)
+   allocate(disp2(mol%nid, mol%nid), disp3(mol%nid, mol%nid))
+
+   call get_dispersion(mol, d4, param, realspace_cutoff(), ref)
+   call get_pair_cutoffs(mol, d4, param, realspace_cutoff(tolerance=tolerance), &
+      & disp2, disp3, error2, error3)
+   call get_dispersion(mol, d4, param, realspace_cutoff(tolerance=tolerance), energy)
+
+   call check(error, error2 <= tolerance .and. error3 <= tolerance)
+   if (allocated(error)) then
+      print*, error2, error3
+      return
+   end if
+
+   call check(error, maxval(disp2) < 60.0_wp)
+   if (allocated(error)) return
+
+   call check(error, abs(energy - ref) <= mol%nat * (error2 + error3))
+   if (allocated(error)) then
+      print*, ref, energy, mol%nat * (error2 + error3)
+   end if
+
+end subroutine test_tolerance_ammonia
+
+subroutine test_tolerance_grad_ammonia(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param), parameter :: param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 0.0_wp, alp = 16.0_wp, &
+      & s8 = 1.76596355_wp, a1 = 0.42822303_wp, a2 = 4.54257102_wp )
+
+   call get_structure(mol, "X23", "ammonia")
+   call new_d4_model(error, d4, mol)
+   call test_numgrad(error, mol, d4, param, &
+      & realspace_cutoff(width2=2.0_wp, tolerance=1.0e-4_wp))
+
+end subroutine test_tolerance_grad_ammonia
+
+subroutine test_mixed_ammonia(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(rational_damping_param), parameter :: param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.76596355_wp, a1 = 0.42822303_wp, a2 = 4.54257102_wp )
+   real(wp) :: energy, mixed_energy, sigma(3, 3), mixed_sigma(3, 3)
+   real(wp), allocatable :: gradient(:, :), mixed_gradient(:, :)
+
+   call get_structure(mol, "X23", "ammonia")
+   call new_d4_model(error, d4, mol)
+   allocate(gradient(3, mol%nat), mixed_gradient(3, mol%nat))
+
+   call get_dispersion(mol, d4, param, cutoff, energy, gradient, sigma)
+   call get_dispersion(mol, d4, param, cutoff, mixed_energy, mixed_gradient, &
+      & mixed_sigma, mixed=.true.)
+
+   ! Single precision distances give relative energy errors of about 1e-6
+   call check(error, abs(mixed_energy - energy) < 1.0e-5_wp * abs(energy))
+   if (allocated(error)) then
+      print*, energy, mixed_energy
+      return
+   end if
+
+   call check(error, maxval(abs(mixed_gradient - gradient)) < 1.0e-7_wp &
+      & .and. maxval(abs(mixed_sigma - sigma)) < 1.0e-7_wp)
+
+end subroutine test_mixed_ammonia
+
+subroutine test_symmetry_mmm(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+   type(d4_model) :: d4
+   type(symmetry_type) :: sym
+   type(work_partition) :: partition
+   type(rational_damping_param), parameter :: param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.76596355_wp, a1 = 0.42822303_wp, a2 = 4.54257102_wp )
+   real(wp), parameter :: lattice(3, 3) = reshape([ &
+      & 8.1_wp, 0.0_wp, 0.0_wp, 0.0_wp, 9.3_wp, 0.0_wp, 0.0_wp, 0.0_wp, 10.7_wp], [3, 3])
+   real(wp), parameter :: site(3, 2) = reshape([ &
+      & 0.12_wp, 0.21_wp, 0.33_wp, 0.30_wp, 0.15_wp, 0.20_wp], [3, 2])
+   integer :: iat, isp, iop
+   real(wp) :: frac(3, 16), energy, sym_energy, part_energy
+   real(wp) :: sigma(3, 3), sym_sigma(3, 3), part_sigma(3, 3)
+   real(wp), allocatable :: gradient(:, :), sym_gradient(:, :), part_gradient(:, :)
+
+   ! Orbits of two atoms on general positions of an orthorhombic mmm cell
+   do isp = 1, 2
+      do iop = 0, 7
+         iat = 8*(isp-1) + iop + 1
+         frac(:, iat) = merge(-site(:, isp), site(:, isp), btest(iop, [0, 1, 2]))
+      end do
+   end do
+   call new(mol, [spread(6, 1, 8), spread(1, 1, 8)], matmul(lattice, frac), &
+      & lattice=lattice)
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   call detect_symmetry(error, sym, mol)
+   if (allocated(error)) return
+   call check(error, sym%nsym, 8)
+   if (allocated(error)) return
+   call check(error, sym%nuniq, 2)
+   if (allocated(error)) return
+
+   allocate(gradient(3, mol%nat), sym_gradient(3, mol%nat), part_gradient(3, mol%nat))
+   call get_dispersion(mol, d4, param, cutoff, energy, gradient, sigma)
+   call get_dispersion(mol, d4, param, cutoff, sym_energy, sym_gradient, &
+      & sym_sigma, symmetry=sym)
+
+   call check(error, sym_energy, energy, thr=thr)
+   if (allocated(error)) return
+
+   call check(error, maxval(abs(sym_gradient - gradient)) < thr &
+      & .and. maxval(abs(sym_sigma - sigma)) < thr)
+   if (allocated(error)) return
+
+   ! The symmetry-unique atoms can be distributed over a work partition
+   call new_work_partition(error, partition, 1, 2)
+   if (allocated(error)) return
+   call get_dispersion(mol, d4, param, cutoff, part_energy, part_gradient, &
+      & part_sigma, partition=partition, symmetry=sym)
+   call new_work_partition(error, partition, 0, 2)
+   if (allocated(error)) return
+   call get_dispersion(mol, d4, param, cutoff, sym_energy, sym_gradient, &
+      & sym_sigma, partition=partition, symmetry=sym)
+
+   call check(error, sym_energy + part_energy, energy, thr=thr)
+   if (allocated(error)) return
+
+   call check(error, maxval(abs(sym_gradient + part_gradient - gradient)) < thr &
+      & .and. maxval(abs(sym_sigma + part_sigma - sigma)) < thr)
+   if (allocated(error)) return
+
+   ! The same crystal in a skewed, non-reduced cell has the same symmetry
+   call new(mol, [spread(6, 1, 8), spread(1, 1, 8)], matmul(lattice, frac), &
+      & lattice=matmul(lattice, reshape([1, 0, 0, 2, 1, 0, -1, 3, 1], [3, 3])*1.0_wp))
+   call detect_symmetry(error, sym, mol)
+   if (allocated(error)) return
+   call check(error, sym%nsym, 8)
+   if (allocated(error)) return
+   call check(error, sym%nuniq, 2)
+   if (allocated(error)) return
+
+   call get_dispersion(mol, d4, param, cutoff, energy, gradient, sigma)
+   call get_dispersion(mol, d4, param, cutoff, sym_energy, sym_gradient, &
+      & sym_sigma, symmetry=sym)
+   call check(error, sym_energy, energy, thr=thr)
+   if (allocated(error)) return
+
+   call check(error, maxval(abs(sym_gradient - gradient)) < thr &
+      & .and. maxval(abs(sym_sigma - sigma)) < thr)
+
+end subroutine test_symmetry_mmm
+
+subroutine test_pair_kernel(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+
+   call get_structure(mol, "X23", "ammonia")
+   call check_pair_kernel(error, mol, 0.0_wp)
+   if (allocated(error)) return
+   call check_pair_kernel(error, mol, 2.0_wp)
+   if (allocated(error)) return
+
+   call get_structure(mol, "MB16-43", "01")
+   call check_pair_kernel(error, mol, 0.0_wp)
+   if (allocated(error)) return
+   call check_pair_kernel(error, mol, 2.0_wp)
+
+end subroutine test_pair_kernel
+
+!> Compare the tabulated pair kernel against the atom-resolved evaluation,
+!> which evaluates every image of every pair directly
+subroutine check_pair_kernel(error, mol, width)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Molecular structure data
+   type(structure_type), intent(in) :: mol
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   type(d4_model) :: d4
+   type(rational_damping_param), parameter :: param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 0.0_wp, alp = 16.0_wp, &
+      & s8 = 1.76596355_wp, a1 = 0.42822303_wp, a2 = 4.54257102_wp )
+   integer :: iat, mref
+   real(wp) :: sigma(3, 3)
+   real(wp), allocatable :: cn(:), q(:), gwvec(:, :, :), gwdcn(:, :, :), gwdq(:, :, :)
+   real(wp), allocatable :: c6(:, :), dc6dcn(:, :), dc6dq(:, :), lattr(:, :)
+   real(wp), allocatable :: energy(:), dEdcn(:), dEdq(:), gradient(:, :)
+   real(wp), allocatable :: ref_energy(:), ref_dEdcn(:), ref_dEdq(:), ref_gradient(:, :)
+   real(wp), allocatable :: ref_sigma(:, :, :)
+
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   mref = maxval(d4%ref)
+   allocate(cn(mol%nat), q(mol%nat))
+   cn(:) = [(1.0_wp + 0.5_wp*sin(real(iat, wp)), iat = 1, mol%nat)]
+   q(:) = [(0.1_wp*cos(real(iat, wp)), iat = 1, mol%nat)]
+   allocate(gwvec(mref, mol%nat, d4%ncoup), gwdcn(mref, mol%nat, d4%ncoup), &
+      & gwdq(mref, mol%nat, d4%ncoup))
+   call d4%weight_references(mol, cn, q, gwvec, gwdcn, gwdq)
+   allocate(c6(mol%nat, mol%nat), dc6dcn(mol%nat, mol%nat), dc6dq(mol%nat, mol%nat))
+   call d4%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff%disp2, lattr)
+
+   allocate(energy(mol%nat), dEdcn(mol%nat), dEdq(mol%nat), gradient(3, mol%nat), &
+      & source=0.0_wp)
+   sigma(:, :) = 0.0_wp
+   call param%get_dispersion2(mol, lattr, cutoff%disp2, width, d4%r4r2, c6, &
+      & dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma)
+
+   allocate(ref_energy(mol%nat), ref_dEdcn(mol%nat), ref_dEdq(mol%nat), &
+      & ref_gradient(3, mol%nat), ref_sigma(3, 3, mol%nat), source=0.0_wp)
+   call param%get_atomic_dispersion2(mol, lattr, cutoff%disp2, width, d4%r4r2, c6, &
+      & dc6dcn, dc6dq, [(iat, iat = 1, mol%nat)], ref_energy, ref_dEdcn, ref_dEdq, &
+      & ref_gradient, ref_sigma)
+
+   call check(error, maxval(abs(energy - ref_energy)) < thr &
+      & .and. maxval(abs(dEdcn - ref_dEdcn)) < thr &
+      & .and. maxval(abs(dEdq - ref_dEdq)) < thr)
+   if (allocated(error)) then
+      print*, maxval(abs(energy - ref_energy)), maxval(abs(dEdcn - ref_dEdcn)), &
+         & maxval(abs(dEdq - ref_dEdq))
+      return
+   end if
+
+   call check(error, maxval(abs(gradient - ref_gradient)) < thr &
+      & .and. maxval(abs(sigma - sum(ref_sigma, 3))) < thr)
+   if (allocated(error)) then
+      print*, maxval(abs(gradient - ref_gradient)), maxval(abs(sigma - sum(ref_sigma, 3)))
+      return
+   end if
+
+   ! The energy only path shares the pair table with the derivatives
+   ref_energy(:) = energy
+   energy(:) = 0.0_wp
+   call param%get_dispersion2(mol, lattr, cutoff%disp2, width, d4%r4r2, c6, &
+      & energy=energy)
+   call check(error, maxval(abs(energy - ref_energy)) < thr)
+
+end subroutine check_pair_kernel
+
+
+subroutine test_triple_kernel(error)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   type(structure_type) :: mol
+
+   call get_structure(mol, "X23", "formamide")
+   call check_triple_kernel(error, mol, 0.0_wp)
+   if (allocated(error)) return
+   call check_triple_kernel(error, mol, 2.0_wp)
+   if (allocated(error)) return
+
+   ! A skewed cell requires images of the partners beyond the lattice points
+   ! around the reference cell
+   call new(mol, mol%num(mol%id), mol%xyz, lattice=matmul(mol%lattice, &
+      & reshape([1, 0, 0, 2, 1, 0, -1, 3, 1], [3, 3])*1.0_wp))
+   call wrap_to_central_cell(mol%xyz, mol%lattice, mol%periodic)
+   call check_triple_kernel(error, mol, 2.0_wp)
+   if (allocated(error)) return
+
+   call get_structure(mol, "X23", "ammonia")
+   call check_triple_kernel(error, mol, 2.0_wp)
+
+end subroutine test_triple_kernel
+
+!> Compare the atom-resolved three-body evaluation for a split selection of atoms
+!> against the complete three-body dispersion
+subroutine check_triple_kernel(error, mol, width)
+
+   !> Error handling
+   type(error_type), allocatable, intent(out) :: error
+
+   !> Molecular structure data
+   type(structure_type), intent(in) :: mol
+
+   !> Width of smooth cutoff
+   real(wp), intent(in) :: width
+
+   type(d4_model) :: d4
+   type(rational_damping_param), parameter :: param = rational_damping_param(&
+      & s6 = 1.0_wp, s9 = 1.0_wp, alp = 16.0_wp, &
+      & s8 = 1.76596355_wp, a1 = 0.42822303_wp, a2 = 4.54257102_wp )
+   integer :: iat, mref, part
+   integer, allocatable :: atoms(:)
+   real(wp) :: sigma(3, 3)
+   real(wp), allocatable :: cn(:), q(:), gwvec(:, :, :), gwdcn(:, :, :), gwdq(:, :, :)
+   real(wp), allocatable :: c6(:, :), dc6dcn(:, :), dc6dq(:, :), lattr(:, :)
+   real(wp), allocatable :: energy(:), dEdcn(:), dEdq(:), gradient(:, :)
+   real(wp), allocatable :: ref_energy(:), ref_dEdcn(:), ref_dEdq(:), ref_gradient(:, :)
+   real(wp), allocatable :: ref_sigma(:, :, :)
+   real(wp), allocatable :: atm_energy(:), atm_dEdcn(:), atm_dEdq(:), atm_gradient(:, :)
+   real(wp), allocatable :: atm_sigma(:, :, :)
+
+   call new_d4_model(error, d4, mol)
+   if (allocated(error)) return
+
+   mref = maxval(d4%ref)
+   allocate(cn(mol%nat), q(mol%nat))
+   cn(:) = [(1.0_wp + 0.5_wp*sin(real(iat, wp)), iat = 1, mol%nat)]
+   q(:) = [(0.1_wp*cos(real(iat, wp)), iat = 1, mol%nat)]
+   allocate(gwvec(mref, mol%nat, d4%ncoup), gwdcn(mref, mol%nat, d4%ncoup), &
+      & gwdq(mref, mol%nat, d4%ncoup))
+   call d4%weight_references(mol, cn, q, gwvec, gwdcn, gwdq)
+   allocate(c6(mol%nat, mol%nat), dc6dcn(mol%nat, mol%nat), dc6dq(mol%nat, mol%nat))
+   call d4%get_atomic_c6(mol, gwvec, gwdcn, gwdq, c6, dc6dcn, dc6dq)
+
+   call get_lattice_points(mol%periodic, mol%lattice, cutoff%disp3, lattr)
+
+   allocate(energy(mol%nat), dEdcn(mol%nat), dEdq(mol%nat), gradient(3, mol%nat), &
+      & source=0.0_wp)
+   sigma(:, :) = 0.0_wp
+   call param%get_dispersion3(mol, lattr, cutoff%disp3, width, d4%r4r2, c6, &
+      & dc6dcn, dc6dq, energy, dEdcn, dEdq, gradient, sigma)
+
+   ! Every atom is selected in exactly one of the parts, the parts complement
+   ! each other to the complete three-body dispersion
+   allocate(ref_energy(mol%nat), ref_dEdcn(mol%nat), ref_dEdq(mol%nat), &
+      & ref_gradient(3, mol%nat), ref_sigma(3, 3, mol%nat), source=0.0_wp)
+   do part = 0, 1
+      atoms = pack([(iat, iat = 1, mol%nat)], [(modulo(iat, 2) == part, iat = 1, mol%nat)])
+      allocate(atm_energy(size(atoms)), atm_dEdcn(size(atoms)), atm_dEdq(size(atoms)), &
+         & atm_gradient(3, size(atoms)), atm_sigma(3, 3, size(atoms)), source=0.0_wp)
+      call param%get_atomic_dispersion3(mol, lattr, cutoff%disp3, width, d4%r4r2, c6, &
+         & dc6dcn, dc6dq, atoms, atm_energy, atm_dEdcn, atm_dEdq, atm_gradient, &
+         & atm_sigma)
+      ref_energy(atoms) = atm_energy
+      ref_dEdcn(atoms) = atm_dEdcn
+      ref_dEdq(atoms) = atm_dEdq
+      ref_gradient(:, atoms) = atm_gradient
+      ref_sigma(:, :, atoms) = atm_sigma
+      deallocate(atm_energy, atm_dEdcn, atm_dEdq, atm_gradient, atm_sigma)
+   end do
+
+   call check(error, maxval(abs(energy - ref_energy)) < thr &
+      & .and. maxval(abs(dEdcn - ref_dEdcn)) < thr &
+      & .and. maxval(abs(dEdq - ref_dEdq)) < thr)
+   if (allocated(error)) then
+      print*, maxval(abs(energy - ref_energy)), maxval(abs(dEdcn - ref_dEdcn)), &
+         & maxval(abs(dEdq - ref_dEdq))
+      return
+   end if
+
+   call check(error, maxval(abs(gradient - ref_gradient)) < thr &
+      & .and. maxval(abs(sigma - sum(ref_sigma, 3))) < thr)
+   if (allocated(error)) then
+      print*, maxval(abs(gradient - ref_gradient)), maxval(abs(sigma - sum(ref_sigma, 3)))
+      return
+   end if
+
+end subroutine check_triple_kernel
+
+
 end module test_periodic